@@ -0,0 +1,298 @@
+"""Record/replay snapshot of the remote state read by forked test runs.
+
+A forking dev node (ganache --fork, anvil --fork-url) pulls code, balances and
+storage from its upstream one request at a time. `SnapshotProxy` sits between
+the node and the upstream:
+
+ - record: requests are forwarded to the upstream with block tags pinned to
+   the snapshot block, and every response is kept in the snapshot file
+ - replay: requests are answered from the snapshot file only, no network
+
+Swap fixtures (e.g. `buy_usdc`) are cached with `SnapshotSession.cached_balance`:
+the resulting token balance is recorded once and written straight into the
+token storage on later runs.
+
+Set `FORK_SNAPSHOT=<file>` to replay, plus `FORK_SNAPSHOT_RECORD=1` to record
+through the fork upstream of the brownie network (see tests/conftest.py of the
+tokenizer and withdrawal modules, which put this directory on `sys.path`):
+
+    FORK_SNAPSHOT=tests/snapshots/polygon.json.gz FORK_SNAPSHOT_RECORD=1 brownie test --network polygon-main-fork
+    FORK_SNAPSHOT=tests/snapshots/polygon.json.gz brownie test --network polygon-main-fork
+
+Or serve a snapshot to a node started by hand:
+
+    python brownie-shared/fork_snapshot.py record <file> <upstream url>
+    python brownie-shared/fork_snapshot.py replay <file>
+"""
+import gzip
+import json
+import os
+import threading
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+from eth_utils import keccak
+
+TIMEOUT = 60
+# confirmations below the upstream head for a new snapshot, so the fork block is final
+CONFIRMATIONS = 16
+PINNED_TAGS = ("latest", "pending", "safe", "finalized")
+# state of an account the recording never touched, as the upstream would return it
+STATE_DEFAULTS = {
+    "eth_getStorageAt": "0x" + "00" * 32,
+    "eth_getCode": "0x",
+    "eth_getBalance": "0x0",
+    "eth_getTransactionCount": "0x0",
+}
+# how ganache >= 7, anvil and hardhat name the cheatcodes
+SET_CODE = ("evm_setAccountCode", "anvil_setCode", "hardhat_setCode")
+SET_STORAGE = ("evm_setAccountStorageAt", "anvil_setStorageAt", "hardhat_setStorageAt")
+BALANCE_SLOTS = range(20)
+
+
+class Snapshot:
+    """Recorded responses at one block, stored as gzipped JSON."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        if self.path.exists():
+            with gzip.open(self.path, "rt") as fp:
+                data = json.load(fp)
+        else:
+            data = {"block": None, "responses": {}, "balances": {}}
+        self.block = data["block"]
+        self.responses = data["responses"]
+        self.balances = data["balances"]
+        self.changed = False
+
+    def save(self):
+        if not self.changed:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with self.lock, gzip.open(tmp, "wt") as fp:
+            json.dump({"block": self.block, "responses": self.responses, "balances": self.balances}, fp, sort_keys=True)
+        os.replace(tmp, self.path)
+        self.changed = False
+
+    def pin(self, params):
+        return [hex(self.block) if p in PINNED_TAGS else p for p in params]
+
+    @staticmethod
+    def key(method, params):
+        # hex values are case insensitive
+        return json.dumps([method, params], separators=(",", ":")).lower()
+
+    def get(self, key):
+        return self.responses.get(key)
+
+    def put(self, key, result):
+        with self.lock:
+            self.responses[key] = result
+            self.changed = True
+
+
+class SnapshotProxy(ThreadingHTTPServer):
+    """JSON-RPC endpoint for the forking node, records when `upstream` is set."""
+
+    daemon_threads = True
+
+    def __init__(self, snapshot, upstream=None, port=0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.snapshot = snapshot
+        self.upstream = upstream
+        self.session = requests.Session()
+        self.misses = set()  # state reads answered with a default in replay
+        if upstream is not None and snapshot.block is None:
+            head = int(self._forward("eth_blockNumber", []), 16)
+            snapshot.block = head - CONFIRMATIONS
+            snapshot.changed = True
+        if snapshot.block is None:
+            raise ValueError("{} does not exist, record it first".format(snapshot.path))
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def _forward(self, method, params):
+        payload = {"jsonrpc": "2.0", "id": 1, "method": method, "params": params}
+        response = self.session.post(self.upstream, json=payload, timeout=TIMEOUT)
+        response.raise_for_status()
+        body = response.json()
+        if "error" in body:
+            raise _Error(body["error"])
+        return body["result"]
+
+    def answer(self, method, params):
+        if method == "eth_blockNumber":
+            return hex(self.snapshot.block)
+        params = self.snapshot.pin(params)
+        key = self.snapshot.key(method, params)
+        result = self.snapshot.get(key)
+        if result is not None:
+            return result
+        if self.upstream is None:
+            if method in STATE_DEFAULTS:
+                self.misses.add(key)
+                return STATE_DEFAULTS[method]
+            raise _Error({"code": -32000, "message": "{} not in snapshot".format(key)})
+        result = self._forward(method, params)
+        if result is not None:
+            self.snapshot.put(key, result)
+        return result
+
+
+class _Error(Exception):
+    def __init__(self, error):
+        super().__init__(error.get("message"))
+        self.error = error
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if isinstance(body, list):
+            reply = [self._reply(item) for item in body]
+        else:
+            reply = self._reply(body)
+        raw = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _reply(self, item):
+        reply = {"jsonrpc": "2.0", "id": item.get("id")}
+        try:
+            reply["result"] = self.server.answer(item["method"], item.get("params", []))
+        except _Error as e:
+            reply["error"] = e.error
+        except requests.RequestException as e:
+            reply["error"] = {"code": -32603, "message": str(e)}
+        return reply
+
+    def log_message(self, *args):
+        pass
+
+
+def _cheatcode(web3, methods, params, what):
+    for method in methods:
+        response = web3.provider.make_request(method, params)
+        if "error" not in response:
+            return
+    raise RuntimeError("local node does not support setting account {}".format(what))
+
+
+def set_code(web3, address, code):
+    _cheatcode(web3, SET_CODE, [address, code], "code")
+
+
+def set_storage(web3, address, slot, value):
+    slot, value = "0x" + slot.to_bytes(32, "big").hex(), "0x" + value.to_bytes(32, "big").hex()
+    _cheatcode(web3, SET_STORAGE, [address, slot, value], "storage")
+
+
+def balance_slot(web3, token, account, balance):
+    """Storage slot of `balances[account]`, found by matching the value in the first mapping slots"""
+    key = bytes.fromhex(account[2:].rjust(64, "0"))
+    for slot in BALANCE_SLOTS:
+        word = slot.to_bytes(32, "big")
+        # solidity hashes key then slot, vyper slot then key
+        for location in (keccak(key + word), keccak(word + key)):
+            location = int.from_bytes(location, "big")
+            if int.from_bytes(web3.eth.get_storage_at(token, location), "big") == balance:
+                return location
+    raise LookupError("balance slot of {} not found".format(token))
+
+
+class SnapshotSession:
+    """The proxy of a test session and the cached fixture results."""
+
+    def __init__(self, proxy=None):
+        self.proxy = proxy
+        self.web3 = None  # set once brownie is connected
+
+    @property
+    def snapshot(self):
+        return None if self.proxy is None else self.proxy.snapshot
+
+    @property
+    def recording(self):
+        return self.proxy is not None and self.proxy.upstream is not None
+
+    def cached_balance(self, name, token, account, acquire):
+        """Run `acquire()` (e.g. a swap) once, replay its effect on `token.balanceOf(account)` afterwards"""
+        if self.proxy is None:
+            return acquire()
+        web3 = self.web3
+        address, account = str(token), str(account)
+        cached = self.snapshot.balances.get(name)
+        if cached is not None and not self.recording:
+            set_storage(web3, address, int(cached["slot"], 16), int(cached["balance"], 16))
+            return None
+        result = acquire()
+        balance = token.balanceOf(account)
+        self.snapshot.balances[name] = {
+            "token": address, "account": account,
+            "slot": hex(balance_slot(web3, address, account, balance)), "balance": hex(balance),
+        }
+        self.snapshot.changed = True
+        return result
+
+    def close(self):
+        if self.proxy is not None:
+            self.snapshot.save()
+            self.proxy.shutdown()
+            self.proxy.server_close()
+            if self.proxy.misses:
+                warnings.warn("{} state reads were not in {}, record it again".format(
+                    len(self.proxy.misses), self.snapshot.path))
+
+
+def use_snapshot(networks, network_id, path, record=False):
+    """Point the fork of brownie network `network_id` at a snapshot proxy.
+
+    `networks` is brownie's `CONFIG.networks`; it is edited before brownie
+    launches the node. Returns an inactive `SnapshotSession` for a network
+    that does not fork.
+    """
+    settings = networks.get(network_id, {}).get("cmd_settings") or {}
+    fork = settings.get("fork")
+    if not fork:
+        return SnapshotSession()
+    if fork in networks:
+        # what brownie does when resolving a fork network id
+        settings.setdefault("chain_id", int(networks[fork]["chainid"]))
+        networks[network_id]["chainid"] = networks[fork]["chainid"]
+        fork = networks[fork]["host"]
+    upstream = os.path.expandvars(fork) if record else None
+    proxy = SnapshotProxy(Snapshot(path), upstream).start()
+    settings["fork"] = proxy.url
+    return SnapshotSession(proxy)
+
+
+def main(command, path, upstream=None, port=8549):
+    """Serve a snapshot to a node started by hand, e.g. `ganache --fork http://127.0.0.1:8549`"""
+    proxy = SnapshotProxy(Snapshot(path), upstream if command == "record" else None, int(port))
+    print("serving {} at block {} on {}".format(path, proxy.snapshot.block, proxy.url))
+    try:
+        proxy.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.snapshot.save()
+        if proxy.misses:
+            print("{} state reads were not in the snapshot".format(len(proxy.misses)))
+
+
+if __name__ == "__main__":
+    import sys
+    main(*sys.argv[1:])
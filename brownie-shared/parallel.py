@@ -0,0 +1,107 @@
+"""Helpers for running the brownie suites sharded across xdist workers.
+
+    brownie test -n 4 [--gas] [--network polygon-main-fork]
+
+Brownie schedules whole test modules on a worker (so module scoped fixtures
+deploy once per worker) and launches one dev node per worker on the network
+port + worker id. With `FORK_SNAPSHOT` set every worker forks from its own
+proxy over the same snapshot file (see fork_snapshot.py); recording
+has to run on a single process.
+
+Test results and coverage are merged by brownie. The gas profile is not, so
+workers save theirs to `build/gas-<worker>.json` and the controller merges
+them into the terminal report and `reports/gas.json`.
+
+Used by the tests/conftest.py of the tokenizer and withdrawal modules, brownie
+is only imported inside the functions.
+"""
+import json
+
+import pytest
+
+
+def is_worker(config):
+    return hasattr(config, "workerinput")
+
+
+def is_controller(config):
+    return not is_worker(config) and bool(config.getoption("numprocesses", None))
+
+
+def worker_id(config):
+    return config.workerinput["workerid"] if is_worker(config) else None
+
+
+def check_record(config, record):
+    if record and (is_worker(config) or is_controller(config)):
+        raise pytest.UsageError("FORK_SNAPSHOT_RECORD=1 cannot run with xdist workers, record with a single process")
+
+
+def merge_gas(profiles):
+    """Merge brownie gas profiles (`{"Contract.fn": {avg, high, low, count, count_success, avg_success}}`)"""
+    merged = {}
+    for profile in profiles:
+        for name, gas in profile.items():
+            total = merged.get(name)
+            if total is None:
+                merged[name] = dict(gas)
+                continue
+            count = total["count"] + gas["count"]
+            success = total["count_success"] + gas["count_success"]
+            total.update(
+                avg=(total["avg"] * total["count"] + gas["avg"] * gas["count"]) // count,
+                high=max(total["high"], gas["high"]),
+                low=min(total["low"], gas["low"]),
+                count=count,
+                avg_success=(
+                    (total["avg_success"] * total["count_success"] + gas["avg_success"] * gas["count_success"]) // success
+                    if success else 0
+                ),
+                count_success=success,
+            )
+    return merged
+
+
+def _project():
+    from brownie.project import get_loaded_projects
+    return get_loaded_projects()[0]
+
+
+def clear_worker_gas(config):
+    if is_controller(config):
+        for path in _project()._build_path.glob("gas-*.json"):
+            path.unlink()
+
+
+def save_worker_gas(config):
+    from brownie._config import CONFIG
+    from brownie.network.state import TxHistory
+
+    if is_worker(config) and CONFIG.argv["gas"]:
+        path = _project()._build_path / "gas-{}.json".format(worker_id(config))
+        path.write_text(json.dumps(TxHistory().gas_profile))
+
+
+def report_gas(terminalreporter, config):
+    """Gas profile section of the controller, merged from the worker files"""
+    from brownie._config import CONFIG
+    from brownie.network.state import TxHistory
+    from brownie.test import output
+
+    if not is_controller(config) or not CONFIG.argv["gas"]:
+        return
+    project = _project()
+    paths = sorted(project._build_path.glob("gas-*.json"))
+    merged = merge_gas(json.loads(path.read_text()) for path in paths)
+    for path in paths:
+        path.unlink()
+    # the controller sends no transactions, its profile only holds the merged values
+    profile = TxHistory().gas_profile
+    profile.clear()
+    profile.update(merged)
+    terminalreporter.section("Gas Profile")
+    for line in output._build_gas_profile_output():
+        terminalreporter.write_line(line)
+    reports = project._path / project._structure["reports"]
+    reports.mkdir(parents=True, exist_ok=True)
+    (reports / "gas.json").write_text(json.dumps(merged, indent=2, sort_keys=True))
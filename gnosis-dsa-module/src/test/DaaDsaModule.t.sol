@@ -114,6 +114,8 @@ contract DaaModuleTest is DSTest {
         (string[] memory targets, bytes[] memory data) = buildOnly();
         bytes32 hash = daaDsaModule.getTransactionHash(targets,data,0);
         emit log_bytes32(hash);
+        // same vector as src/test/test_signing_service.py (module_tx.transaction_hash)
+        assertEq(hash, 0x1b780658a24204761fc269a4176a6e250150beefed96842065d03de25571c686);
     }
 
     function testForwarding() public {
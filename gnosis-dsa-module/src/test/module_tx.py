@@ -0,0 +1,88 @@
+"""Off-chain reproduction of DaaDsaModule's EIP-712 transaction hash.
+
+Mirrors `getTransactionHash`/`encodeTransactionData` so owners can sign a cast
+without an eth_call, and `DOMAIN_SEPARATOR` so the hash can be checked against
+a deployed module.
+"""
+from dataclasses import dataclass
+
+from eth_utils import function_signature_to_4byte_selector, keccak, to_checksum_address
+
+try:
+    from eth_abi import decode, encode
+except ImportError:  # eth-abi < 4
+    from eth_abi import decode_abi as decode, encode_abi as encode
+
+
+MODULE_NAME = "DAA Module"
+MODULE_VERSION = "1"
+EIP712_DOMAIN_TYPEHASH = keccak(text="EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)")
+# keccak256("ModuleTx(string[] calldata _targetNames, string[] calldata _datas, uint256 _nonce)")
+MODULE_TX_TYPEHASH = bytes.fromhex("70f96b20d0f94e90121e640b822abdfe2918aa3b37ed19df9ac632a914413cbf")
+
+
+@dataclass
+class ModuleTx:
+    """A DSA cast waiting for owner signatures."""
+
+    targets: list
+    datas: list
+    nonce: int
+
+
+def domain_separator(chain_id, module):
+    """DOMAIN_SEPARATOR as set by `initialize` (`module` is the proxy address when proxied)."""
+    return keccak(encode(
+        ["bytes32", "bytes32", "bytes32", "uint256", "address"],
+        [EIP712_DOMAIN_TYPEHASH, keccak(text=MODULE_NAME), keccak(text=MODULE_VERSION), chain_id, to_checksum_address(module)],
+    ))
+
+
+def unpack_strings(targets):
+    return b"".join(t.encode() for t in targets)
+
+
+def unpack_bytes(datas):
+    return b"".join(_to_bytes(d) for d in datas)
+
+
+def _to_bytes(value):
+    if isinstance(value, str):
+        return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+    return bytes(value)
+
+
+def encode_transaction_data(targets, datas, nonce, separator):
+    """encodeTransactionData - the `data` passed to EIP-1271 contract signatures."""
+    struct_hash = keccak(encode(
+        ["bytes32", "bytes", "bytes", "uint256"],
+        [MODULE_TX_TYPEHASH, unpack_strings(targets), unpack_bytes(datas), nonce],
+    ))
+    return b"\x19\x01" + _to_bytes(separator) + struct_hash
+
+
+def transaction_hash(targets, datas, nonce, separator):
+    """getTransactionHash"""
+    return keccak(encode_transaction_data(targets, datas, nonce, separator))
+
+
+def _view(web3, module, signature, returns):
+    data = web3.eth.call({"to": to_checksum_address(module), "data": "0x" + function_signature_to_4byte_selector(signature).hex()})
+    return decode(returns, bytes(data))[0]
+
+
+def read_module(web3, module):
+    """Fetch `(DOMAIN_SEPARATOR, nonce)` of a deployed module."""
+    return (
+        _view(web3, module, "DOMAIN_SEPARATOR()", ["bytes32"]),
+        _view(web3, module, "nonce()", ["uint256"]),
+    )
+
+
+def check_domain(web3, module):
+    """Raise if the on-chain domain does not match the off-chain reproduction."""
+    onchain, _ = read_module(web3, module)
+    expected = domain_separator(web3.eth.chain_id, module)
+    if onchain != expected:
+        raise ValueError("DOMAIN_SEPARATOR mismatch: module initialized with another chain id or address")
+    return onchain
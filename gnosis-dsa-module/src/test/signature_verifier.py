@@ -0,0 +1,165 @@
+"""Pre-flight verifier matching DaaDsaModule.checkNSignatures.
+
+Takes the same `(dataHash, data, signatures, requiredSignatures)` inputs and
+returns the revert reason the module would raise, against a cached
+`getOwners()` snapshot, so a relayer can drop a bad bundle before paying for
+`executeTransaction`. Public key recovery is memoized; install `coincurve` so
+eth-keys uses the native backend.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+
+from eth_keys import keys
+from eth_utils import function_signature_to_4byte_selector, keccak, to_checksum_address
+
+from module_tx import encode_transaction_data, transaction_hash
+from signatures import signature_split
+
+try:
+    from eth_abi import encode
+except ImportError:  # eth-abi < 4
+    from eth_abi import encode_abi as encode
+
+
+THRESHOLD = 2  # DaaDsaModule.threshold, not settable
+EIP1271_MAGIC_VALUE = bytes.fromhex("20c13b0b")
+ZERO_ADDRESS = 0
+SENTINEL_ADDRESS = 1
+UINT256 = 2**256
+
+
+@dataclass
+class Verification:
+    ok: bool
+    reason: str = None
+    index: int = None
+    signers: tuple = ()
+
+
+@lru_cache(maxsize=65536)
+def ecrecover(message_hash, v, r, s):
+    """ecrecover precompile, returns the signer as int (0 when recovery fails)."""
+    if v not in (27, 28):
+        return ZERO_ADDRESS
+    try:
+        signature = keys.Signature(vrs=(v - 27, int.from_bytes(r, "big"), int.from_bytes(s, "big")))
+        public_key = signature.recover_public_key_from_msg_hash(message_hash)
+    except Exception:
+        return ZERO_ADDRESS
+    return int(public_key.to_canonical_address().hex(), 16)
+
+
+def eth_sign_hash(data_hash):
+    return keccak(b"\x19Ethereum Signed Message:\n32" + data_hash)
+
+
+def web3_contract_validator(web3):
+    """EIP-1271 check through an eth_call to `owner.isValidSignature(data, signature)`."""
+    selector = function_signature_to_4byte_selector("isValidSignature(bytes,bytes)")
+
+    def is_valid(owner, data, signature):
+        try:
+            result = web3.eth.call({"to": owner, "data": "0x" + (selector + encode(["bytes", "bytes"], [data, signature])).hex()})
+        except Exception:
+            return False
+        return bytes(result)[:4] == EIP1271_MAGIC_VALUE
+    return is_valid
+
+
+def check_n_signatures(data_hash, data, signatures, required, owners, sender=None, approved=(), contract_validator=None):
+    """Reproduce checkNSignatures.
+
+    `owners` is the safe's `getOwners()`, `sender` the msg.sender of the
+    execution, `approved` a set of `(owner, hash)` pairs from `approvedHashes`
+    and `contract_validator(owner, data, signature)` decides EIP-1271
+    signatures (rejected when not given).
+    """
+    data_hash = bytes(data_hash)
+    signatures = bytes(signatures)
+    owner_set = {int(o, 16) for o in owners}
+    sender = int(sender, 16) if sender else None
+    if len(signatures) < required * 65:
+        return Verification(False, "GS020")
+    last_owner = ZERO_ADDRESS
+    signers = []
+    for i in range(required):
+        v, r, s = signature_split(signatures, i)
+        if v == 0:
+            current_owner = int.from_bytes(r, "big") % 2**160
+            offset = int.from_bytes(s, "big")
+            if offset < required * 65:
+                return Verification(False, "GS021", i)
+            if offset + 32 >= UINT256:
+                return Verification(False, "Panic(0x11)", i)
+            if offset + 32 > len(signatures):
+                return Verification(False, "GS022", i)
+            length = int.from_bytes(signatures[offset:offset + 32], "big")
+            if offset + 32 + length >= UINT256:
+                return Verification(False, "Panic(0x11)", i)
+            if offset + 32 + length > len(signatures):
+                return Verification(False, "GS023", i)
+            contract_signature = signatures[offset + 32:offset + 32 + length]
+            owner = to_checksum_address(current_owner.to_bytes(20, "big"))
+            if contract_validator is None or not contract_validator(owner, bytes(data), contract_signature):
+                return Verification(False, "GS024", i)
+        elif v == 1:
+            current_owner = int.from_bytes(r, "big") % 2**160
+            owner = to_checksum_address(current_owner.to_bytes(20, "big"))
+            if sender != current_owner and (owner, data_hash) not in approved:
+                return Verification(False, "GS025", i)
+        elif v > 30:
+            current_owner = ecrecover(eth_sign_hash(data_hash), v - 4, r, s)
+        else:
+            current_owner = ecrecover(data_hash, v, r, s)
+        # require(currentOwner > lastOwner && isAuthorized(currentOwner) && currentOwner != address(0x1))
+        if current_owner <= last_owner:
+            return Verification(False, "GS026", i)
+        if current_owner not in owner_set:
+            return Verification(False, "Sender not authorized", i)
+        if current_owner == SENTINEL_ADDRESS:
+            return Verification(False, "GS026", i)
+        last_owner = current_owner
+        signers.append(to_checksum_address(current_owner.to_bytes(20, "big")))
+    return Verification(True, signers=tuple(signers))
+
+
+class SignatureVerifier:
+    """checkSignatures against a cached owners snapshot of one module.
+
+    Call `refresh` when the safe owners change (or on every new block when
+    the snapshot has to be exact); approvals from `ApproveHash` events can be
+    added with `approve`.
+    """
+
+    def __init__(self, separator, owners=(), contract_validator=None):
+        self.separator = separator
+        self.owners = list(owners)
+        self.approved = set()
+        self.contract_validator = contract_validator
+
+    def refresh(self, web3, safe):
+        selector = function_signature_to_4byte_selector("getOwners()")
+        result = bytes(web3.eth.call({"to": safe, "data": "0x" + selector.hex()}))
+        # abi encoded address[]: offset, length, items
+        length = int.from_bytes(result[32:64], "big")
+        self.owners = [to_checksum_address(result[64 + 32 * i + 12:96 + 32 * i]) for i in range(length)]
+        return self.owners
+
+    def approve(self, owner, approved_hash):
+        self.approved.add((to_checksum_address(owner), bytes(approved_hash)))
+
+    def verify(self, data_hash, data, signatures, sender=None, required=THRESHOLD):
+        return check_n_signatures(
+            data_hash, data, signatures, required, self.owners, sender, self.approved, self.contract_validator)
+
+    def verify_transaction(self, targets, datas, nonce, signatures, sender):
+        """Pre-flight of executeTransaction's authorization and signature checks."""
+        if int(sender, 16) not in {int(o, 16) for o in self.owners}:
+            return Verification(False, "Sender not authorized")
+        tx_hash = transaction_hash(targets, datas, nonce, self.separator)
+        data = encode_transaction_data(targets, datas, nonce, self.separator)
+        return self.verify(tx_hash, data, signatures, sender)
+
+    def verify_many(self, bundles, sender=None):
+        """Verify `(data_hash, data, signatures)` bundles, in order."""
+        return [self.verify(h, d, s, sender) for h, d, s in bundles]
@@ -1,7 +1,28 @@
 import eth_account
 from eth_account import Account
+from eth_keys import keys
 from hexbytes import HexBytes
-from web3 import Web3
+
+
+def sign_hash(private_key, message_hash):
+    """Sign a 32 bytes hash, returns the 65 bytes {bytes32 r}{bytes32 s}{uint8 v} signature (v in 27/28)."""
+    key = keys.PrivateKey(HexBytes(private_key))
+    signature = key.sign_msg_hash(bytes(HexBytes(message_hash)))
+    return signature.r.to_bytes(32, "big") + signature.s.to_bytes(32, "big") + bytes([signature.v + 27])
+
+
+def signature_split(signatures, pos):
+    """SignatureDecoder.signatureSplit - returns (v, r, s) of the signature at `pos`."""
+    offset = 65 * pos
+    r = signatures[offset:offset + 32]
+    s = signatures[offset + 32:offset + 64]
+    v = signatures[offset + 64]
+    return v, r, s
+
+
+def approved_hash_signature(owner):
+    """v == 1 signature for an owner that called approveHash (or is the executor)."""
+    return int(owner, 16).to_bytes(32, "big") + bytes(32) + b"\x01"
 
 
 def main():
@@ -10,12 +31,11 @@ def main():
     contract_transaction_hash = HexBytes(hex_message_hash)
     # example key
     account = Account.from_key('0x66e91912f68828c17ad3fee506b7580c4cd19c7946d450b4b0823ac73badc878')
-    signature = account.signHash(contract_transaction_hash)
-    hex_signature = signature.signature.hex()
+    signature = sign_hash(account.key, contract_transaction_hash)
+    hex_signature = signature.hex()
     print('account: ', account.address)
-    print('signature: ',signature.signature.hex())
+    print('signature: ', hex_signature)
 
-    sig = Web3.toBytes(hexstr=hex_signature)
-    v, hex_r, hex_s = Web3.toInt(sig[-1]), Web3.toHex(sig[:32]), Web3.toHex(sig[32:64])
-    ec_recover_args = (hex_message_hash, v, hex_r, hex_s)
-    print(ec_recover_args)
\ No newline at end of file
+    v, r, s = signature_split(signature, 0)
+    ec_recover_args = (hex_message_hash, v, '0x' + r.hex(), '0x' + s.hex())
+    print(ec_recover_args)
@@ -0,0 +1,73 @@
+"""Bulk owner signing for DaaDsaModule.executeTransaction.
+
+Hashes a batch of pending casts off-chain (see `module_tx.py`), signs every
+hash with every owner key on a process pool and packs one signature blob per
+cast, already ordered by owner address as `checkNSignatures` requires
+(`currentOwner > lastOwner`, otherwise GS026).
+
+    python signing_service.py <module> <chain id> <nonce> <key> [<key> ...]
+"""
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from eth_account import Account
+
+from module_tx import ModuleTx, domain_separator, transaction_hash
+from signatures import sign_hash
+
+
+def _sign_all(private_key, hashes):
+    # one task per key, so the key is sent to a worker once per batch
+    return [sign_hash(private_key, h) for h in hashes]
+
+
+def pack_signatures(signatures):
+    """Concatenate `{owner: signature}` in ascending owner order."""
+    ordered = sorted(signatures.items(), key=lambda item: int(item[0], 16))
+    return b"".join(signature for _, signature in ordered)
+
+
+def transaction_hashes(transactions, separator):
+    return [transaction_hash(tx.targets, tx.datas, tx.nonce, separator) for tx in transactions]
+
+
+def sign_transactions(transactions, private_keys, separator, processes=None, threshold=None):
+    """Sign each transaction with every key and return `(hash, signatures)` per transaction.
+
+    Only the first `threshold` signatures are checked by the module, so with a
+    threshold the lowest owner addresses are kept. Duplicate keys are signed once.
+    """
+    owners = {}
+    for key in private_keys:
+        owners[Account.from_key(key).address] = key
+    hashes = transaction_hashes(transactions, separator)
+    if processes == 1 or len(owners) == 1:
+        signed = [_sign_all(key, hashes) for key in owners.values()]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            signed = list(pool.map(_sign_all, owners.values(), [hashes] * len(owners)))
+    results = []
+    for i, tx_hash in enumerate(hashes):
+        by_owner = {owner: sigs[i] for owner, sigs in zip(owners, signed)}
+        if threshold is not None:
+            by_owner = dict(sorted(by_owner.items(), key=lambda item: int(item[0], 16))[:threshold])
+        results.append((tx_hash, pack_signatures(by_owner)))
+    return results
+
+
+def pending_transactions(casts, first_nonce):
+    """Assign consecutive nonces to `(targets, datas)` casts that will execute in order."""
+    return [ModuleTx(targets, datas, first_nonce + i) for i, (targets, datas) in enumerate(casts)]
+
+
+def main(module, chain_id, nonce, *private_keys):
+    # example: sign an empty cast for the given module and nonce
+    separator = domain_separator(int(chain_id), module)
+    transactions = pending_transactions([([], [])], int(nonce))
+    for tx_hash, signatures in sign_transactions(transactions, private_keys, separator):
+        print('hash: ', '0x' + tx_hash.hex())
+        print('signatures: ', '0x' + signatures.hex())
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
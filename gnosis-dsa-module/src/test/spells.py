@@ -0,0 +1,247 @@
+"""DSA spell builders and an offline DaaDsaModule.getConnectorData pre-check.
+
+Builders return `Spell(connector, data)` pairs for the connectors the module
+is used with (BASIC-A, AAVE-V2-A); `Cast` collects them into the
+`_targetNames`/`_datas` arrays of `executeTransaction`. Calldata is built from
+a template cached per connector method: the selector is hashed once and static
+arguments are written as plain 32 bytes words.
+
+`get_connector_data` reproduces `getConnectorData` and `whitelistedOpCheck`,
+including their reverts (AUTHORITY-A spells, BASIC-A withdrawals to anything
+but the safe, short or dirty calldata), and `precheck` adds the length checks
+of the DSA `cast`, so candidate casts can be rejected before they are signed.
+
+    from spells import Cast, basic_deposit, aave_deposit, precheck
+    cast = Cast([basic_deposit(dai, 10**18), aave_deposit(dai, 10**18)])
+    check = precheck(cast.targets, cast.datas, safe)
+"""
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from eth_utils import function_signature_to_4byte_selector, to_checksum_address
+
+from module_tx import ModuleTx, _to_bytes
+
+try:
+    from eth_abi import encode
+except ImportError:  # eth-abi < 4
+    from eth_abi import encode_abi as encode
+
+
+NATIVE = "0xEeeeeEeeeEeEeeEeEeEeeEEEeeeeEeeeeeeeEEeE"  # DaaDsaModule.native
+UINT256 = 2**256
+STATIC_TYPES = ("address", "uint256", "bool")
+
+# connector -> method -> argument types, as registered on the polygon InstaConnectorsV2
+CONNECTORS = {
+    "BASIC-A": {
+        "deposit": ("address", "uint256", "uint256", "uint256"),
+        "withdraw": ("address", "uint256", "address", "uint256", "uint256"),
+    },
+    "AAVE-V2-A": {
+        "deposit": ("address", "uint256", "uint256", "uint256"),
+        "withdraw": ("address", "uint256", "uint256", "uint256"),
+        "borrow": ("address", "uint256", "uint256", "uint256", "uint256"),
+        "payback": ("address", "uint256", "uint256", "uint256", "uint256"),
+        "enableCollateral": ("address[]",),
+        "swapBorrowRateMode": ("address", "uint256"),
+    },
+}
+BLACKLISTED = "AUTHORITY-A"  # whitelistedOpCheck
+BASIC_DEPOSIT = function_signature_to_4byte_selector("deposit(address,uint256,uint256,uint256)")
+BASIC_WITHDRAW = function_signature_to_4byte_selector("withdraw(address,uint256,address,uint256,uint256)")
+
+
+class SpellRevert(Exception):
+    """getConnectorData reverts; `reason` is None for a panic or an ABI decoding revert."""
+
+    def __init__(self, reason, message=None, index=None):
+        super().__init__(message or reason)
+        self.reason = reason
+        self.index = index  # position of the spell in the cast
+
+
+@dataclass(frozen=True)
+class Spell:
+    connector: str
+    data: bytes
+
+
+@dataclass
+class Cast:
+    spells: list = field(default_factory=list)
+
+    def add(self, spell):
+        self.spells.append(spell)
+        return self
+
+    @property
+    def targets(self):
+        return [s.connector for s in self.spells]
+
+    @property
+    def datas(self):
+        return [s.data for s in self.spells]
+
+    def module_tx(self, nonce):
+        return ModuleTx(self.targets, self.datas, nonce)
+
+
+@dataclass
+class CastCheck:
+    ok: bool
+    reason: str = None
+    index: int = None
+    # (token, amount) pulled from the safe by prepFunds, NATIVE for the chain's coin
+    pulls: tuple = ()
+
+
+###############
+# encoding
+
+def _word(type_, value):
+    if type_ == "address":
+        value = int(str(value), 16)
+        if value >> 160:
+            raise ValueError("{} is not an address".format(hex(value)))
+    elif type_ == "bool":
+        value = int(bool(value))
+    elif not 0 <= value < UINT256:
+        raise ValueError("{} out of uint256 range".format(value))
+    return value.to_bytes(32, "big")
+
+
+class Template:
+    """Calldata of one connector method, static arguments skip the ABI encoder."""
+
+    def __init__(self, method, types):
+        self.signature = "{}({})".format(method, ",".join(types))
+        self.selector = function_signature_to_4byte_selector(self.signature)
+        self.types = types
+        self.static = all(t in STATIC_TYPES for t in types)
+
+    def encode(self, args):
+        if len(args) != len(self.types):
+            raise TypeError("{} takes {} arguments".format(self.signature, len(self.types)))
+        if self.static:
+            return self.selector + b"".join(_word(t, a) for t, a in zip(self.types, args))
+        args = [[to_checksum_address(str(a)) for a in arg] if t == "address[]" else arg for t, arg in zip(self.types, args)]
+        return self.selector + encode(list(self.types), args)
+
+
+@lru_cache(maxsize=None)
+def template(connector, method):
+    return Template(method, CONNECTORS[connector][method])
+
+
+def spell(connector, method, *args):
+    return Spell(connector, template(connector, method).encode(args))
+
+
+def basic_deposit(token, amount, get_id=0, set_id=0):
+    """Pulled from the safe by prepFunds, then deposited in the DSA"""
+    return spell("BASIC-A", "deposit", token, amount, get_id, set_id)
+
+
+def basic_withdraw(token, amount, to, get_id=0, set_id=0):
+    """`to` must be the safe (NoExt)"""
+    return spell("BASIC-A", "withdraw", token, amount, to, get_id, set_id)
+
+
+def aave_deposit(token, amount, get_id=0, set_id=0):
+    return spell("AAVE-V2-A", "deposit", token, amount, get_id, set_id)
+
+
+def aave_withdraw(token, amount, get_id=0, set_id=0):
+    return spell("AAVE-V2-A", "withdraw", token, amount, get_id, set_id)
+
+
+def aave_borrow(token, amount, rate_mode=2, get_id=0, set_id=0):
+    return spell("AAVE-V2-A", "borrow", token, amount, rate_mode, get_id, set_id)
+
+
+def aave_payback(token, amount, rate_mode=2, get_id=0, set_id=0):
+    return spell("AAVE-V2-A", "payback", token, amount, rate_mode, get_id, set_id)
+
+
+def aave_enable_collateral(tokens):
+    return spell("AAVE-V2-A", "enableCollateral", list(tokens))
+
+
+def aave_swap_borrow_rate_mode(token, rate_mode):
+    return spell("AAVE-V2-A", "swapBorrowRateMode", token, rate_mode)
+
+
+###############
+# getConnectorData
+
+def _decode_address(body, word):
+    raw = body[32 * word:32 * word + 32]
+    if any(raw[:12]):
+        # the ABI decoder rejects dirty high bits
+        raise SpellRevert(None, "invalid address encoding")
+    return int.from_bytes(raw, "big")
+
+
+@lru_cache(maxsize=65536)
+def _spell_data(target, data, safe):
+    """`(token, amount)` of one spell, as getConnectorData's loop body"""
+    if target == BLACKLISTED.encode():
+        raise SpellRevert("NoAuth")
+    if target != b"BASIC-A":
+        return 0, 0
+    if len(data) < 4:
+        raise SpellRevert(None, "calldata slice out of bounds")
+    selector, body = data[:4], data[4:]
+    if selector == BASIC_DEPOSIT:
+        if len(body) < 128:
+            raise SpellRevert(None, "short deposit calldata")
+        return _decode_address(body, 0), int.from_bytes(body[32:64], "big")
+    if selector == BASIC_WITHDRAW:
+        if len(body) < 160:
+            raise SpellRevert(None, "short withdraw calldata")
+        _decode_address(body, 0)
+        if _decode_address(body, 2) != safe:
+            raise SpellRevert("NoExt")
+    return 0, 0
+
+
+def _target_bytes(target):
+    # connector ids are compared as abi.encodePacked(string), i.e. the utf-8 bytes
+    return target.encode() if isinstance(target, str) else bytes(target)
+
+
+def get_connector_data(targets, datas, safe):
+    """DaaDsaModule.getConnectorData: `(addresses, amounts)` or `SpellRevert`"""
+    safe = int(str(safe), 16)
+    addresses, amounts = [], []
+    for i, data in enumerate(datas):
+        if i >= len(targets):
+            raise SpellRevert(None, "array index out of bounds", i)
+        try:
+            token, amount = _spell_data(_target_bytes(targets[i]), _to_bytes(data), safe)
+        except SpellRevert as e:
+            e.index = i
+            raise
+        addresses.append(to_checksum_address(token.to_bytes(20, "big")))
+        amounts.append(amount)
+    return addresses, amounts
+
+
+def precheck(targets, datas, safe):
+    """The spell checks executeTransaction runs before the cast reaches the connectors"""
+    try:
+        addresses, amounts = get_connector_data(targets, datas, safe)
+    except SpellRevert as e:
+        return CastCheck(False, e.reason or "revert: {}".format(e), e.index)
+    # InstaImplementationM1.cast
+    if not targets:
+        return CastCheck(False, "1: length-invalid")
+    if len(targets) != len(datas):
+        return CastCheck(False, "1: array-length-invalid")
+    return CastCheck(True, pulls=tuple((a, v) for a, v in zip(addresses, amounts) if v > 0))
+
+
+def precheck_many(casts, safe):
+    """Pre-check `(targets, datas)` candidates, spells repeated across casts are decoded once"""
+    return [precheck(targets, datas, safe) for targets, datas in casts]
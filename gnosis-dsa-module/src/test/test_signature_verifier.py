@@ -0,0 +1,111 @@
+"""signature_verifier.check_n_signatures, one case per checkNSignatures branch and revert.
+
+    python -m pytest src/test
+"""
+from eth_account import Account
+import pytest
+
+from module_tx import domain_separator, encode_transaction_data, transaction_hash
+from signature_verifier import SignatureVerifier, check_n_signatures, eth_sign_hash
+from signatures import approved_hash_signature, sign_hash
+
+MODULE = "0xCe71065D4017F316EC606Fe4422e11eB2c47c246"
+SEPARATOR = domain_separator(137, MODULE)
+TARGETS, DATAS, NONCE = ["BASIC-A"], [b"\x12\x34"], 0
+DATA = encode_transaction_data(TARGETS, DATAS, NONCE, SEPARATOR)
+HASH = transaction_hash(TARGETS, DATAS, NONCE, SEPARATOR)
+# keys sorted by address, KEYS[0] has the lowest one
+KEYS = sorted(("0x" + bytes([i]).hex() * 32 for i in range(1, 5)), key=lambda k: int(Account.from_key(k).address, 16))
+OWNERS = [Account.from_key(k).address for k in KEYS]
+# an EIP-1271 owner below every EOA owner, so its signature comes first
+WALLET = "0x000000000000000000000000000000000000c0DE"
+MAGIC = b"wallet approves"
+
+###############
+
+def ecdsa(key, message_hash=HASH):
+    return sign_hash(key, message_hash)
+
+def eth_sign(key):
+    signature = sign_hash(key, eth_sign_hash(HASH))
+    return signature[:64] + bytes([signature[64] + 4])
+
+def contract(owner, offset):
+    return int(owner, 16).to_bytes(32, "big") + offset.to_bytes(32, "big") + b"\x00"
+
+def dynamic(payload):
+    return len(payload).to_bytes(32, "big") + payload
+
+def validator(owner, data, signature):
+    return owner == WALLET and data == DATA and signature == MAGIC
+
+def check(signatures, required=2, owners=OWNERS + [WALLET], **kwargs):
+    return check_n_signatures(HASH, DATA, signatures, required, owners, **kwargs)
+
+###############
+
+def test_ecrecover():
+    result = check(ecdsa(KEYS[0]) + ecdsa(KEYS[1]))
+    assert result.ok and result.signers == tuple(OWNERS[:2])
+
+def test_ethSign():
+    result = check(eth_sign(KEYS[0]) + ecdsa(KEYS[2]))
+    assert result.ok and result.signers == (OWNERS[0], OWNERS[2])
+    # v > 30 is recovered from the eth_sign prefixed hash only, a plain signature gives another address
+    result = check(ecdsa(KEYS[0])[:64] + bytes([ecdsa(KEYS[0])[64] + 4]) + ecdsa(KEYS[2]))
+    assert (result.reason, result.index) == ("Sender not authorized", 0)
+
+def test_approvedHash():
+    signatures = approved_hash_signature(OWNERS[0]) + ecdsa(KEYS[1])
+    # the executor's own approval
+    assert check(signatures, sender=OWNERS[0]).ok
+    # or a hash approved on chain
+    assert check(signatures, sender=OWNERS[3], approved={(OWNERS[0], HASH)}).ok
+    result = check(signatures, sender=OWNERS[3])
+    assert (result.ok, result.reason, result.index) == (False, "GS025", 0)
+
+def test_contractSignature():
+    signatures = contract(WALLET, 130) + ecdsa(KEYS[0]) + dynamic(MAGIC)
+    result = check(signatures, contract_validator=validator)
+    assert result.ok and result.signers == (WALLET, OWNERS[0])
+    assert check(signatures).reason == "GS024"
+    assert check(contract(WALLET, 130) + ecdsa(KEYS[0]) + dynamic(b"nope"), contract_validator=validator).reason == "GS024"
+
+@pytest.mark.parametrize("signatures,reason", [
+    # the offset points inside the static part
+    (contract(WALLET, 64) + ecdsa(KEYS[0]) + dynamic(MAGIC), "GS021"),
+    # no room for the length word
+    (contract(WALLET, 130) + ecdsa(KEYS[0]) + b"\x00" * 31, "GS022"),
+    # the length runs past the end
+    (contract(WALLET, 130) + ecdsa(KEYS[0]) + (len(MAGIC) + 1).to_bytes(32, "big") + MAGIC, "GS023"),
+])
+def test_contractSignatureBounds(signatures, reason):
+    result = check(signatures, contract_validator=validator)
+    assert (result.ok, result.reason, result.index) == (False, reason, 0)
+
+def test_tooShort():
+    assert check(ecdsa(KEYS[0]) + ecdsa(KEYS[1])[:64]).reason == "GS020"
+    assert check(ecdsa(KEYS[0]), required=1).ok
+
+def test_orderAndDuplicates():
+    descending = check(ecdsa(KEYS[1]) + ecdsa(KEYS[0]))
+    assert (descending.reason, descending.index) == ("GS026", 1)
+    duplicate = check(ecdsa(KEYS[0]) + ecdsa(KEYS[0]))
+    assert (duplicate.reason, duplicate.index) == ("GS026", 1)
+    # the sentinel of the owners list never signs
+    sentinel = "0x0000000000000000000000000000000000000001"
+    assert check(approved_hash_signature(sentinel) + ecdsa(KEYS[0]), owners=OWNERS + [sentinel], sender=sentinel).reason == "GS026"
+
+def test_notOwner():
+    outsider = "0x" + "09" * 32
+    result = check(ecdsa(KEYS[0]) + ecdsa(outsider))
+    assert (result.reason, result.index) == ("Sender not authorized", 1)
+    # a signature of another hash recovers to some other address
+    assert check(ecdsa(KEYS[0]) + ecdsa(KEYS[1], b"\x01" * 32)).reason in ("GS026", "Sender not authorized")
+
+def test_verifyTransaction():
+    verifier = SignatureVerifier(SEPARATOR, OWNERS)
+    signatures = ecdsa(KEYS[0]) + ecdsa(KEYS[1])
+    assert verifier.verify_transaction(TARGETS, DATAS, NONCE, signatures, OWNERS[3]).ok
+    assert verifier.verify_transaction(TARGETS, DATAS, NONCE, signatures, WALLET).reason == "Sender not authorized"
+    assert verifier.verify_transaction(TARGETS, DATAS, NONCE + 1, signatures, OWNERS[3]).ok is False
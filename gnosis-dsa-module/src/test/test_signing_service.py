@@ -0,0 +1,78 @@
+"""Off-chain hashing and signing helpers against the on-chain module.
+
+    python -m pytest src/test
+"""
+from eth_account import Account
+from eth_utils import keccak
+import pytest
+
+from module_tx import domain_separator, encode_transaction_data, transaction_hash
+from signature_verifier import check_n_signatures, ecrecover
+from signing_service import pack_signatures, pending_transactions, sign_transactions
+from signatures import signature_split
+
+try:
+    from eth_abi import encode
+except ImportError:  # eth-abi < 4
+    from eth_abi import encode_abi as encode
+
+# DaaDsaModuleTest.setUp: the module forge deploys from the test contract, initialized for chain 137
+MODULE = "0xCe71065D4017F316EC606Fe4422e11eB2c47c246"
+CHAIN_ID = 137
+DAI = "0x8f3Cf7ad23Cd3CaDbD9735AFf958023239c6A063"
+# testSignatureOffChain: signature of getTransactionHash(buildOnly(), 0) by SIGNER
+SIGNER = 0x6a2EB7F6734F4B79104A38Ad19F1c4311e5214c8
+SIGNATURE = bytes.fromhex(
+    "a66f29205ca109f2bdcf0bf60aaec19b05ee9ab59eac1aecae9247276f6b297b"
+    "5b4a935f1be87b43c4a90cf8c943f1a38261469db9e2d6ed2ae1d9256e3bccb51b"
+)
+# asserted on chain by testGetTransactionHash
+TX_HASH = bytes.fromhex("1b780658a24204761fc269a4176a6e250150beefed96842065d03de25571c686")
+KEYS = ["0x" + bytes([i]).hex() * 32 for i in range(1, 6)]
+
+###############
+
+def buildOnly():
+    data = keccak(text="deposit(address,uint256,uint256,uint256)")[:4] + encode(
+        ["address", "uint256", "uint256", "uint256"], [DAI, 10**18, 0, 0])
+    return ["BASIC-A", "AAVE-V2-A"], [data, data]
+
+@pytest.fixture
+def separator():
+    return domain_separator(CHAIN_ID, MODULE)
+
+###############
+
+def test_transactionHashMatchesModule(separator):
+    targets, datas = buildOnly()
+    tx_hash = transaction_hash(targets, datas, 0, separator)
+    assert tx_hash == TX_HASH == keccak(encode_transaction_data(targets, datas, 0, separator))
+    # the signature made for the on-chain hash recovers to its signer only with this hash
+    v, r, s = signature_split(SIGNATURE, 0)
+    assert ecrecover(tx_hash, v, r, s) == SIGNER
+    assert transaction_hash(targets, datas, 1, separator) != tx_hash
+    assert transaction_hash(targets, datas, 0, domain_separator(1, MODULE)) != tx_hash
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_signaturesSortedBySigner(separator, processes):
+    transactions = pending_transactions([buildOnly(), ([], [])], 7)
+    assert [tx.nonce for tx in transactions] == [7, 8]
+    signed = sign_transactions(transactions, KEYS[::-1] + KEYS[:1], separator, processes=processes)
+    for tx, (tx_hash, signatures) in zip(transactions, signed):
+        assert tx_hash == transaction_hash(tx.targets, tx.datas, tx.nonce, separator)
+        # duplicate keys are signed once
+        assert len(signatures) == 65 * len(KEYS)
+        signers = [ecrecover(tx_hash, *signature_split(signatures, i)) for i in range(len(KEYS))]
+        assert signers == sorted(int(Account.from_key(k).address, 16) for k in KEYS)
+        owners = [Account.from_key(k).address for k in KEYS]
+        assert check_n_signatures(tx_hash, b"", signatures, len(KEYS), owners).ok
+
+def test_thresholdKeepsLowestSigners(separator):
+    [(tx_hash, signatures)] = sign_transactions(pending_transactions([buildOnly()], 0), KEYS, separator, threshold=2)
+    lowest = sorted(int(Account.from_key(k).address, 16) for k in KEYS)[:2]
+    assert [ecrecover(tx_hash, *signature_split(signatures, i)) for i in range(2)] == lowest
+    assert len(signatures) == 130
+
+def test_packSignatures():
+    signatures = {"0x" + "bb" * 20: b"\x02" * 65, "0x" + "0a" * 20: b"\x01" * 65, "0x" + "Ab" * 20: b"\x03" * 65}
+    assert pack_signatures(signatures) == b"\x01" * 65 + b"\x03" * 65 + b"\x02" * 65
@@ -0,0 +1,98 @@
+"""spells encoders against eth_abi, and the getConnectorData pre-check reverts.
+
+    python -m pytest src/test
+"""
+from eth_utils import function_signature_to_4byte_selector
+import pytest
+
+import spells
+from spells import (
+    Cast, aave_borrow, aave_deposit, aave_enable_collateral, aave_payback, aave_swap_borrow_rate_mode, aave_withdraw,
+    basic_deposit, basic_withdraw, get_connector_data, precheck, precheck_many, spell,
+)
+
+try:
+    from eth_abi import encode
+except ImportError:  # eth-abi < 4
+    from eth_abi import encode_abi as encode
+
+SAFE = "0x213997398DdD5BBd98309428fa3Ae017D5570603"
+DAI = "0x8f3Cf7ad23Cd3CaDbD9735AFf958023239c6A063"
+WETH = "0x7ceB23fD6bC0adD59E62ac25578270cFf1b9f619"
+OUTSIDER = "0x4A35582a710E1F4b2030A3F826DA20BfB6703C09"
+
+###############
+
+def abi(signature, *args):
+    types = signature[signature.index("(") + 1:-1].split(",")
+    return function_signature_to_4byte_selector(signature) + encode(types, list(args))
+
+###############
+
+@pytest.mark.parametrize("built,expected", [
+    (basic_deposit(DAI, 10**18), ("BASIC-A", abi("deposit(address,uint256,uint256,uint256)", DAI, 10**18, 0, 0))),
+    (basic_withdraw(DAI, 5, SAFE, 1, 2),
+     ("BASIC-A", abi("withdraw(address,uint256,address,uint256,uint256)", DAI, 5, SAFE, 1, 2))),
+    (aave_deposit(WETH, 2**256 - 1), ("AAVE-V2-A", abi("deposit(address,uint256,uint256,uint256)", WETH, 2**256 - 1, 0, 0))),
+    (aave_withdraw(WETH, 7, 3, 4), ("AAVE-V2-A", abi("withdraw(address,uint256,uint256,uint256)", WETH, 7, 3, 4))),
+    (aave_borrow(DAI, 9), ("AAVE-V2-A", abi("borrow(address,uint256,uint256,uint256,uint256)", DAI, 9, 2, 0, 0))),
+    (aave_payback(DAI, 9, 1), ("AAVE-V2-A", abi("payback(address,uint256,uint256,uint256,uint256)", DAI, 9, 1, 0, 0))),
+    (aave_enable_collateral([DAI, WETH.lower()]), ("AAVE-V2-A", abi("enableCollateral(address[])", [DAI, WETH]))),
+    (aave_swap_borrow_rate_mode(DAI, 1), ("AAVE-V2-A", abi("swapBorrowRateMode(address,uint256)", DAI, 1))),
+])
+def test_encodingMatchesAbi(built, expected):
+    assert (built.connector, built.data) == expected
+
+def test_encodingRejectsBadArguments():
+    with pytest.raises(ValueError):
+        basic_deposit(DAI, 2**256)
+    with pytest.raises(ValueError):
+        basic_deposit("0x" + "11" * 21, 1)
+    with pytest.raises(TypeError):
+        spell("BASIC-A", "deposit", DAI, 1)
+
+def test_precheckPulls():
+    cast = Cast([basic_deposit(DAI, 10**18), aave_deposit(DAI, 10**18), basic_withdraw(DAI, 1, SAFE)])
+    check = precheck(cast.targets, cast.datas, SAFE)
+    # only BASIC-A deposits pull funds from the safe
+    assert check.ok and check.pulls == ((DAI, 10**18),)
+    addresses, amounts = get_connector_data(cast.targets, cast.datas, SAFE)
+    assert amounts == [10**18, 0, 0] and addresses[0] == DAI
+
+def test_precheckNoAuth():
+    check = precheck(["BASIC-A", "AUTHORITY-A"], [basic_deposit(DAI, 1).data, b"\x00" * 36], SAFE)
+    assert (check.ok, check.reason, check.index) == (False, "NoAuth", 1)
+
+def test_precheckNoExt():
+    check = precheck(["BASIC-A", "BASIC-A"], [basic_deposit(DAI, 1).data, basic_withdraw(DAI, 1, OUTSIDER).data], SAFE)
+    assert (check.ok, check.reason, check.index) == (False, "NoExt", 1)
+
+@pytest.mark.parametrize("data", [
+    b"\x12",
+    basic_deposit(DAI, 1).data[:-1],
+    basic_withdraw(DAI, 1, SAFE).data[:100],
+    # dirty high bits in the token address
+    basic_deposit(DAI, 1).data[:4] + b"\x01" + basic_deposit(DAI, 1).data[5:],
+])
+def test_precheckBadCalldata(data):
+    check = precheck(["BASIC-A"], [data], SAFE)
+    assert not check.ok and check.reason.startswith("revert:") and check.index == 0
+
+def test_precheckCastLengths():
+    assert precheck([], [], SAFE).reason == "1: length-invalid"
+    assert precheck(["BASIC-A", "AAVE-V2-A"], [basic_deposit(DAI, 1).data], SAFE).reason == "1: array-length-invalid"
+    # more datas than targets reverts inside getConnectorData
+    assert precheck(["BASIC-A"], [basic_deposit(DAI, 1).data] * 2, SAFE).index == 1
+
+def test_failuresAreNotCached():
+    spells._spell_data.cache_clear()
+    bad = basic_withdraw(DAI, 1, OUTSIDER).data
+    for _ in range(2):
+        # lru_cache does not store exceptions, the revert is raised again
+        assert precheck(["BASIC-A"], [bad], SAFE).reason == "NoExt"
+    # the same spell is fine for a safe it withdraws to
+    assert precheck(["BASIC-A"], [bad], OUTSIDER).ok
+    good = basic_deposit(DAI, 3).data
+    checks = precheck_many([(["BASIC-A"], [good]), (["BASIC-A"], [bad]), (["BASIC-A"], [good])], SAFE)
+    assert [c.ok for c in checks] == [True, False, True]
+    assert spells._spell_data.cache_info().hits >= 1
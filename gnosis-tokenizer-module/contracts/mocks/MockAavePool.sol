@@ -0,0 +1,254 @@
+// SPDX-License-Identifier: unlicensed
+pragma solidity >=0.7.5 <0.9.0;
+pragma abicoder v2;
+
+/// @title Mock Aave Math - WadRayMath and MathUtils of Aave v2
+library MockAaveMath {
+
+    uint256 internal constant RAY = 1e27;
+    uint256 internal constant HALF_RAY = RAY / 2;
+    uint256 internal constant SECONDS_PER_YEAR = 365 days;
+
+    function rayMul(uint256 a, uint256 b) internal pure returns (uint256) {
+        return (a * b + HALF_RAY) / RAY;
+    }
+
+    function rayDiv(uint256 a, uint256 b) internal pure returns (uint256) {
+        return (a * RAY + b / 2) / b;
+    }
+
+    function linearInterest(uint256 rate, uint256 lastUpdate) internal view returns (uint256) {
+        return rate * (block.timestamp - lastUpdate) / SECONDS_PER_YEAR + RAY;
+    }
+
+    function compoundedInterest(uint256 rate, uint256 lastUpdate) internal view returns (uint256) {
+        uint256 exp = block.timestamp - lastUpdate;
+        if (exp == 0) {
+            return RAY;
+        }
+        uint256 expMinusTwo = exp > 2 ? exp - 2 : 0;
+        uint256 ratePerSecond = rate / SECONDS_PER_YEAR;
+        uint256 basePowerTwo = rayMul(ratePerSecond, ratePerSecond);
+        uint256 basePowerThree = rayMul(basePowerTwo, ratePerSecond);
+        uint256 secondTerm = exp * (exp - 1) * basePowerTwo / 2;
+        uint256 thirdTerm = exp * (exp - 1) * expMinusTwo * basePowerThree / 6;
+        return RAY + ratePerSecond * exp + secondTerm + thirdTerm;
+    }
+}
+
+/// @title Mock Aave Token - scaled balances of an aToken or a variable debt token of MockAavePool.
+/// @dev Test only - emits the Aave v2 token events followed by scripts/nav_tracker.py, underlying tokens are not moved
+contract MockAaveToken {
+
+    MockAavePool public immutable pool;
+    address public immutable asset;
+    bool public immutable debt;
+
+    mapping(address => uint256) public scaledBalanceOf;
+
+    // AToken
+    event Mint(address indexed from, uint256 value, uint256 index);
+    event Burn(address indexed from, address indexed target, uint256 value, uint256 index);
+    event BalanceTransfer(address indexed from, address indexed to, uint256 value, uint256 index);
+    // VariableDebtToken
+    event Mint(address indexed from, address indexed onBehalfOf, uint256 value, uint256 index);
+    event Burn(address indexed user, uint256 amount, uint256 index);
+
+    constructor(MockAavePool _pool, address _asset, bool _debt) {
+        pool = _pool;
+        asset = _asset;
+        debt = _debt;
+    }
+
+    modifier onlyPool() {
+        require(msg.sender == address(pool), "only the pool");
+        _;
+    }
+
+    function balanceOf(address user) external view returns (uint256) {
+        uint256 index = debt ? pool.getReserveNormalizedVariableDebt(asset) : pool.getReserveNormalizedIncome(asset);
+        return MockAaveMath.rayMul(scaledBalanceOf[user], index);
+    }
+
+    function mint(address user, uint256 amount, uint256 index) external onlyPool {
+        scaledBalanceOf[user] += MockAaveMath.rayDiv(amount, index);
+        if (debt) {
+            emit Mint(user, user, amount, index);
+        } else {
+            emit Mint(user, amount, index);
+        }
+    }
+
+    function burn(address user, address target, uint256 amount, uint256 index) external onlyPool {
+        scaledBalanceOf[user] -= MockAaveMath.rayDiv(amount, index);
+        if (debt) {
+            emit Burn(user, amount, index);
+        } else {
+            emit Burn(user, target, amount, index);
+        }
+    }
+
+    function transfer(address to, uint256 amount) external returns (bool) {
+        require(!debt, "debt is not transferable");
+        uint256 index = pool.getReserveNormalizedIncome(asset);
+        uint256 scaled = MockAaveMath.rayDiv(amount, index);
+        scaledBalanceOf[msg.sender] -= scaled;
+        scaledBalanceOf[to] += scaled;
+        emit BalanceTransfer(msg.sender, to, amount, index);
+        return true;
+    }
+}
+
+/// @title Mock Aave Pool - Aave v2 LendingPool with settable rates.
+/// @dev Test only - indexes accrue like ReserveLogic on every action, stable debt is not supported
+contract MockAavePool {
+
+    // LendingPool.getReserveData, DataTypes.ReserveData
+    struct ReserveData {
+        uint256 configuration;
+        uint128 liquidityIndex;
+        uint128 variableBorrowIndex;
+        uint128 currentLiquidityRate;
+        uint128 currentVariableBorrowRate;
+        uint128 currentStableBorrowRate;
+        uint40 lastUpdateTimestamp;
+        address aTokenAddress;
+        address stableDebtTokenAddress;
+        address variableDebtTokenAddress;
+        address interestRateStrategyAddress;
+        uint8 id;
+    }
+
+    mapping(address => ReserveData) internal reserves;
+
+    event ReserveDataUpdated(
+        address indexed reserve,
+        uint256 liquidityRate,
+        uint256 stableBorrowRate,
+        uint256 variableBorrowRate,
+        uint256 liquidityIndex,
+        uint256 variableBorrowIndex
+    );
+
+    function initReserve(address asset, address aToken, address variableDebtToken) external {
+        ReserveData storage reserve = reserves[asset];
+        reserve.liquidityIndex = uint128(MockAaveMath.RAY);
+        reserve.variableBorrowIndex = uint128(MockAaveMath.RAY);
+        reserve.lastUpdateTimestamp = uint40(block.timestamp);
+        reserve.aTokenAddress = aToken;
+        reserve.variableDebtTokenAddress = variableDebtToken;
+    }
+
+    function getReserveData(address asset) external view returns (ReserveData memory) {
+        return reserves[asset];
+    }
+
+    function getReserveNormalizedIncome(address asset) public view returns (uint256) {
+        ReserveData storage reserve = reserves[asset];
+        if (reserve.lastUpdateTimestamp == block.timestamp) {
+            return reserve.liquidityIndex;
+        }
+        return MockAaveMath.rayMul(
+            MockAaveMath.linearInterest(reserve.currentLiquidityRate, reserve.lastUpdateTimestamp), reserve.liquidityIndex);
+    }
+
+    function getReserveNormalizedVariableDebt(address asset) public view returns (uint256) {
+        ReserveData storage reserve = reserves[asset];
+        if (reserve.lastUpdateTimestamp == block.timestamp) {
+            return reserve.variableBorrowIndex;
+        }
+        return MockAaveMath.rayMul(
+            MockAaveMath.compoundedInterest(reserve.currentVariableBorrowRate, reserve.lastUpdateTimestamp),
+            reserve.variableBorrowIndex);
+    }
+
+    /// @dev Accrue the indexes up to now, like ReserveLogic.updateState
+    function updateState(address asset) internal returns (ReserveData storage reserve) {
+        reserve = reserves[asset];
+        reserve.liquidityIndex = uint128(getReserveNormalizedIncome(asset));
+        reserve.variableBorrowIndex = uint128(getReserveNormalizedVariableDebt(asset));
+        reserve.lastUpdateTimestamp = uint40(block.timestamp);
+    }
+
+    function emitUpdate(address asset, ReserveData storage reserve) internal {
+        emit ReserveDataUpdated(
+            asset,
+            reserve.currentLiquidityRate,
+            reserve.currentStableBorrowRate,
+            reserve.currentVariableBorrowRate,
+            reserve.liquidityIndex,
+            reserve.variableBorrowIndex
+        );
+    }
+
+    function setRates(address asset, uint128 liquidityRate, uint128 variableBorrowRate) external {
+        ReserveData storage reserve = updateState(asset);
+        reserve.currentLiquidityRate = liquidityRate;
+        reserve.currentVariableBorrowRate = variableBorrowRate;
+        emitUpdate(asset, reserve);
+    }
+
+    function deposit(address asset, uint256 amount, address onBehalfOf, uint16) external {
+        ReserveData storage reserve = updateState(asset);
+        MockAaveToken(reserve.aTokenAddress).mint(onBehalfOf, amount, reserve.liquidityIndex);
+        emitUpdate(asset, reserve);
+    }
+
+    function withdraw(address asset, uint256 amount, address to) external returns (uint256) {
+        ReserveData storage reserve = updateState(asset);
+        MockAaveToken(reserve.aTokenAddress).burn(msg.sender, to, amount, reserve.liquidityIndex);
+        emitUpdate(asset, reserve);
+        return amount;
+    }
+
+    function borrow(address asset, uint256 amount, uint256, uint16, address onBehalfOf) external {
+        ReserveData storage reserve = updateState(asset);
+        MockAaveToken(reserve.variableDebtTokenAddress).mint(onBehalfOf, amount, reserve.variableBorrowIndex);
+        emitUpdate(asset, reserve);
+    }
+
+    function repay(address asset, uint256 amount, uint256, address onBehalfOf) external returns (uint256) {
+        ReserveData storage reserve = updateState(asset);
+        MockAaveToken(reserve.variableDebtTokenAddress).burn(onBehalfOf, onBehalfOf, amount, reserve.variableBorrowIndex);
+        emitUpdate(asset, reserve);
+        return amount;
+    }
+}
+
+/// @title Mock Aave Provider - addresses provider and protocol data provider of a MockAavePool.
+/// @dev Test only - the pool is immutable so the runtime code can be copied to the Registry addresses
+contract MockAaveProvider {
+
+    MockAavePool public immutable pool;
+
+    constructor(MockAavePool _pool) {
+        pool = _pool;
+    }
+
+    function getLendingPool() external view returns (address) {
+        return address(pool);
+    }
+
+    function getUserReserveData(address asset, address user)
+        external
+        view
+        returns (uint256, uint256, uint256, uint256, uint256, uint256, uint256, uint40, bool)
+    {
+        MockAavePool.ReserveData memory reserve = pool.getReserveData(asset);
+        if (reserve.aTokenAddress == address(0)) {
+            return (0, 0, 0, 0, 0, 0, 0, 0, false);
+        }
+        MockAaveToken variableDebt = MockAaveToken(reserve.variableDebtTokenAddress);
+        return (
+            MockAaveToken(reserve.aTokenAddress).balanceOf(user),
+            0,
+            variableDebt.balanceOf(user),
+            0,
+            variableDebt.scaledBalanceOf(user),
+            0,
+            reserve.currentLiquidityRate,
+            0,
+            true
+        );
+    }
+}
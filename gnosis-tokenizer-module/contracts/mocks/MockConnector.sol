@@ -0,0 +1,30 @@
+// SPDX-License-Identifier: unlicensed
+pragma solidity >=0.7.0 <0.9.0;
+
+import { Adaptor } from "../connectors/Adaptor.sol";
+
+/// @title Mock Connector - PositionManager connector with settable external positions.
+/// @dev Test only - stands in for AaveConnector on a local dev chain
+contract MockConnector is Adaptor {
+
+    mapping(address => mapping(address => uint)) public grossValues;
+    mapping(address => mapping(address => uint)) public grossDebts;
+
+    /// @dev Set the external position of a target
+    /// @param asset The address of the position asset
+    /// @param _target The address holding the position (e.g. the safe)
+    /// @param value The gross value of the position
+    /// @param debt The gross debt of the position
+    function setPosition(address asset, address _target, uint value, uint debt) external {
+        grossValues[asset][_target] = value;
+        grossDebts[asset][_target] = debt;
+    }
+
+    function getGrossValue(address asset, address _target) public override view returns (uint grossValue) {
+        return grossValues[asset][_target];
+    }
+
+    function getGrossDebt(address asset, address _target) public override view returns (uint grossDebt) {
+        return grossDebts[asset][_target];
+    }
+}
@@ -0,0 +1,27 @@
+// SPDX-License-Identifier: unlicensed
+pragma solidity >=0.7.0 <0.9.0;
+
+import "@openzeppelin/contracts/token/ERC20/ERC20.sol";
+
+/// @title Mock ERC20 - Freely mintable token for local dev chain tests.
+/// @dev Test only - decimals is immutable so the runtime code can be copied to a fixed address (e.g. USDC)
+contract MockERC20 is ERC20 {
+
+    uint8 immutable _decimals;
+
+    constructor(string memory name, string memory symbol, uint8 decimals_) ERC20(name, symbol){
+        _decimals = decimals_;
+    }
+
+    function mint(address account, uint256 amount) external {
+        _mint(account, amount);
+    }
+
+    function burn(address account, uint256 amount) external {
+        _burn(account, amount);
+    }
+
+    function decimals() public view override returns (uint8) {
+        return _decimals;
+    }
+}
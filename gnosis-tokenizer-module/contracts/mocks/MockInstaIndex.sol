@@ -0,0 +1,26 @@
+// SPDX-License-Identifier: unlicensed
+pragma solidity >=0.7.0 <0.9.0;
+
+/// @title Mock DSA - Instadapp account accepting any cast.
+/// @dev Test only - spells are not executed, so DaaDsaModule costs are measured on their own
+contract MockDsa {
+
+    event LogCast(address indexed origin, address indexed sender, uint256 value, string[] targetsNames);
+
+    function cast(string[] calldata _targetNames, bytes[] calldata, address _origin)
+        external
+        payable
+        returns (bytes32)
+    {
+        emit LogCast(_origin, msg.sender, msg.value, _targetNames);
+        return bytes32(0);
+    }
+}
+
+/// @title Mock Insta Index - builds a MockDsa per account
+contract MockInstaIndex {
+
+    function build(address, uint256, address) external returns (address) {
+        return address(new MockDsa());
+    }
+}
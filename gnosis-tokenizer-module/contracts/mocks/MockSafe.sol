@@ -0,0 +1,40 @@
+// SPDX-License-Identifier: unlicensed
+pragma solidity >=0.7.0 <0.9.0;
+
+import "../utils/Enum.sol";
+
+/// @title Mock Safe - Owners list and module calls of a Gnosis Safe, without signatures.
+/// @dev Test only - lets the owner count of the modules' isAuthorized scans be set freely
+contract MockSafe {
+
+    address[] private owners;
+    mapping(address => bool) public isModuleEnabled;
+
+    constructor(address[] memory _owners){
+        owners = _owners;
+    }
+
+    function getOwners() external view returns (address[] memory) {
+        return owners;
+    }
+
+    function setOwners(address[] memory _owners) external {
+        owners = _owners;
+    }
+
+    function enableModule(address module) external {
+        isModuleEnabled[module] = true;
+    }
+
+    /// @dev Same checks as GnosisSafe's ModuleManager for calls, delegate calls are not supported
+    function execTransactionFromModule(address to, uint256 value, bytes calldata data, Enum.Operation operation)
+        external
+        returns (bool success)
+    {
+        require(isModuleEnabled[msg.sender], "GS104");
+        require(operation == Enum.Operation.Call); // dev: delegate call not supported
+        (success, ) = to.call{value: value}(data);
+    }
+
+    receive() external payable {}
+}
@@ -0,0 +1,73 @@
+// SPDX-License-Identifier: unlicensed
+pragma solidity >=0.7.0 <0.9.0;
+
+/// @title Mock V3 Aggregator - Chainlink price feed with manually advanced rounds.
+/// @dev Test only - follows the AggregatorV3Interface used by OracleHandler
+contract MockV3Aggregator {
+
+    uint8 public decimals;
+    int256 public latestAnswer;
+    uint256 public latestTimestamp;
+    uint256 public latestRound;
+
+    mapping(uint256 => int256) public getAnswer;
+    mapping(uint256 => uint256) public getTimestamp;
+    mapping(uint256 => uint256) private getStartedAt;
+
+    // AggregatorInterface events, as emitted by the Chainlink aggregators behind the feed proxies
+    event AnswerUpdated(int256 indexed current, uint256 indexed roundId, uint256 updatedAt);
+    event NewRound(uint256 indexed roundId, address indexed startedBy, uint256 startedAt);
+
+    constructor(uint8 _decimals, int256 _initialAnswer){
+        decimals = _decimals;
+        updateAnswer(_initialAnswer);
+    }
+
+    /// @dev Start a new round with the given answer
+    /// @param _answer The new price
+    function updateAnswer(int256 _answer) public {
+        updateRoundData(uint80(latestRound + 1), _answer, block.timestamp, block.timestamp);
+    }
+
+    /// @dev Write an arbitrary round, used to simulate stale or out of order feeds
+    function updateRoundData(uint80 _roundId, int256 _answer, uint256 _timestamp, uint256 _startedAt) public {
+        latestRound = _roundId;
+        latestAnswer = _answer;
+        latestTimestamp = _timestamp;
+        getAnswer[latestRound] = _answer;
+        getTimestamp[latestRound] = _timestamp;
+        getStartedAt[latestRound] = _startedAt;
+        emit AnswerUpdated(_answer, latestRound, _timestamp);
+        emit NewRound(latestRound, msg.sender, _startedAt);
+    }
+
+    function getRoundData(uint80 _roundId)
+        external
+        view
+        returns (uint80 roundId, int256 answer, uint256 startedAt, uint256 updatedAt, uint80 answeredInRound)
+    {
+        return (_roundId, getAnswer[_roundId], getStartedAt[_roundId], getTimestamp[_roundId], _roundId);
+    }
+
+    function latestRoundData()
+        external
+        view
+        returns (uint80 roundId, int256 answer, uint256 startedAt, uint256 updatedAt, uint80 answeredInRound)
+    {
+        return (
+            uint80(latestRound),
+            getAnswer[latestRound],
+            getStartedAt[latestRound],
+            getTimestamp[latestRound],
+            uint80(latestRound)
+        );
+    }
+
+    function description() external pure returns (string memory) {
+        return "MockV3Aggregator";
+    }
+
+    function version() external pure returns (uint256) {
+        return 0;
+    }
+}
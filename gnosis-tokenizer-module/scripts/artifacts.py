@@ -0,0 +1,126 @@
+"""Locate compiled ABIs of the three module projects without loading brownie.
+
+Brownie writes `build/contracts/<Name>.json` and forge writes
+`out/<File>.sol/<Name>.json`; both keep the ABI under "abi".
+
+`cache_artifacts` copies the ABI and bytecode of compiled contracts to
+`build/cli-cache/<sha256>.json`, named by the hash of their content, with an
+index of the source file each entry was made from. `load_cached` reads the
+entry while its source is unchanged (or gone, e.g. on an on-call machine
+without the build output) and rebuilds it otherwise.
+"""
+import hashlib
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+REPO_ROOT = PROJECT_ROOT.parent
+# helpers shared by the brownie projects, imported with this directory on sys.path
+SHARED_ROOT = REPO_ROOT / "brownie-shared"
+
+ARTIFACTS = {
+    "DaaTokenizer": PROJECT_ROOT / "build/contracts/DaaTokenizer.json",
+    "TokenizedShare": PROJECT_ROOT / "build/contracts/TokenizedShare.json",
+    "OracleHandler": PROJECT_ROOT / "build/contracts/OracleHandler.json",
+    "PositionManager": PROJECT_ROOT / "build/contracts/PositionManager.json",
+    "ProxyHandler": PROJECT_ROOT / "build/contracts/ProxyHandler.json",
+    "AaveConnector": PROJECT_ROOT / "build/contracts/AaveConnector.json",
+    "DaaModule": REPO_ROOT / "gnosis-withdrawal-module/build/contracts/DaaModule.json",
+    "DaaDsaModule": REPO_ROOT / "gnosis-dsa-module/out/DaaDsaModule.sol/DaaDsaModule.json",
+}
+CACHE_DIR = PROJECT_ROOT / "build/cli-cache"
+
+
+def artifact_path(name):
+    """Known artifact, else a brownie build of this project, else a path"""
+    if name in ARTIFACTS:
+        return Path(ARTIFACTS[name])
+    build = PROJECT_ROOT / "build/contracts" / (name + ".json")
+    return build if build.exists() else Path(name)
+
+
+@lru_cache(maxsize=None)
+def load_artifact(name):
+    path = artifact_path(name)
+    if not path.exists():
+        raise FileNotFoundError("{} not compiled, expected {}".format(name, path))
+    with path.open() as fp:
+        return json.load(fp)
+
+
+def load_abi(name):
+    return load_artifact(name)["abi"]
+
+
+def load_bytecode(name):
+    """Deployment bytecode as 0x hex, forge keeps it under bytecode.object"""
+    return _hex(load_artifact(name)["bytecode"])
+
+
+def _hex(bytecode):
+    if isinstance(bytecode, dict):
+        bytecode = bytecode["object"]
+    return "0x" + bytecode[2:] if bytecode.startswith("0x") else "0x" + bytecode
+
+
+###############
+# content-hashed cache
+
+def _write(path, text):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def _index(cache_dir):
+    index = Path(cache_dir) / "index.json"
+    return json.loads(index.read_text()) if index.exists() else {}
+
+
+def cache_artifacts(names=None, cache_dir=CACHE_DIR):
+    """Cache `names` (default: every compiled contract of `ARTIFACTS`), returns `{name: hash}`"""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    names = [n for n in ARTIFACTS if artifact_path(n).exists()] if names is None else names
+    index = _index(cache_dir)
+    for name in names:
+        path = artifact_path(name)
+        if not path.exists():
+            raise FileNotFoundError("{} not compiled and not cached, expected {}".format(name, path))
+        with path.open() as fp:
+            artifact = json.load(fp)
+        slim = {
+            "abi": artifact["abi"],
+            "bytecode": _hex(artifact.get("bytecode", "")),
+            "deployedBytecode": _hex(artifact.get("deployedBytecode", "")),
+        }
+        text = json.dumps(slim, sort_keys=True, separators=(",", ":"))
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        entry = cache_dir / (digest + ".json")
+        if not entry.exists():
+            _write(entry, text)
+        stat = path.stat()
+        index[name] = {"hash": digest, "source": str(path), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    _write(cache_dir / "index.json", json.dumps(index, indent=2, sort_keys=True))
+    return {name: index[name]["hash"] for name in names}
+
+
+def load_cached(name, cache_dir=CACHE_DIR):
+    """`{"abi", "bytecode", "deployedBytecode"}` of `name` from the cache, (re)built when stale"""
+    entry = _index(cache_dir).get(name)
+    if entry is not None:
+        source = Path(entry["source"])
+        if source.exists():
+            stat = source.stat()
+            if (stat.st_mtime_ns, stat.st_size) != (entry["mtime_ns"], entry["size"]):
+                entry = None
+    if entry is not None:
+        path = Path(cache_dir) / (entry["hash"] + ".json")
+        data = path.read_bytes() if path.exists() else b""
+        if hashlib.sha256(data).hexdigest() == entry["hash"]:
+            return json.loads(data)
+    # missing, stale or corrupted
+    cache_artifacts([name], cache_dir)
+    return load_cached(name, cache_dir)
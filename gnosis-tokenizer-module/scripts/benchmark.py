@@ -0,0 +1,284 @@
+"""Gas and wall time benchmarks of the module hot paths on a local dev chain.
+
+Measured paths:
+ - DaaTokenizer: deposit, redeem, calculateNav (gas of the call), withdrawToSafe
+ - DaaModule (withdrawal module): executeTransfer
+ - DaaDsaModule: executeTransaction, BASIC-A deposit spells cast on a MockDsa,
+   so only the module overhead (signatures, getConnectorData, pulls) is measured
+
+Every dimension is swept on its own around `DEFAULTS`: allowed assets, base
+currencies, PositionManager connectors, safe owners (the isAuthorized scans
+of getOwners) and spells. Each point is measured `repeat` times
+from the same chain snapshot, gas is deterministic and the median wall time
+is kept.
+
+Results go to `reports/benchmark.json`; with a baseline file every gas
+increase above `GAS_TOLERANCE` is reported as a regression and the script
+exits with status 1.
+
+    brownie run scripts/benchmark.py main [<baseline json>] [<output json>]
+
+The DaaModule and DaaDsaModule artifacts are loaded from the other projects,
+compile them first (`brownie compile`, `forge build`); a missing one is skipped.
+"""
+import json
+import sys
+import time
+from pathlib import Path
+from statistics import median
+
+from brownie import (
+    accounts, chain, web3, Contract, DaaTokenizer, MockConnector, MockERC20, MockInstaIndex, MockSafe,
+    MockV3Aggregator, OracleHandler, PositionManager, TokenizedShare,
+)
+
+from scripts.artifacts import PROJECT_ROOT, REPO_ROOT, load_abi, load_bytecode
+from scripts.fork_snapshot import set_code
+from scripts.rpc import encode, encode_call
+
+USDC = "0x2791Bca1f2de4661ED88A30C99A7a9449Aa84174"  # hardcoded in DaaTokenizer.initialize
+ZERO = "0x0000000000000000000000000000000000000000"
+OUTPUT = PROJECT_ROOT / "reports/benchmark.json"
+GAS_TOLERANCE = 0.02
+REPEAT = 3
+DSA_THRESHOLD = 2
+
+DEFAULTS = {"assets": 1, "bases": 1, "connectors": 1, "owners": 4, "spells": 1}
+SWEEPS = {
+    "assets": (1, 2, 4, 8),
+    "bases": (1, 2, 4),
+    "connectors": (1, 2, 4, 8),
+    "owners": (2, 4, 8, 16),
+    "spells": (1, 2, 4, 8),
+}
+# dimensions each group depends on
+GROUPS = {
+    "tokenizer": ("assets", "bases", "connectors"),
+    "authorized": ("owners",),
+    "dsa": ("owners", "spells"),
+}
+
+
+def points(group):
+    """Sweep points of a group, one dimension moved away from `DEFAULTS` at a time"""
+    seen = []
+    for dimension in GROUPS[group]:
+        for value in SWEEPS[dimension]:
+            params = dict(DEFAULTS, **{dimension: value})
+            if params not in seen:
+                seen.append(params)
+                yield params
+
+
+def point_key(params, group):
+    return ",".join("{}={}".format(d, params[d]) for d in GROUPS[group])
+
+
+def measure(run, repeat=REPEAT, profile=None, call=None):
+    """`run()` returns a tx receipt or a gas amount, state is reverted between runs.
+
+    `profile` is called once with the receipt of the first run, or with `call`
+    (`(sender, to, data)`) when `run()` measures the gas of a call.
+    """
+    gas, seconds, profiled = None, [], None
+    chain.snapshot()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        seconds.append(time.perf_counter() - start)
+        gas = result if isinstance(result, int) else result.gas_used
+        target = call if isinstance(result, int) else result
+        if profile is not None and profiled is None and target is not None:
+            profiled = profile(target)
+        chain.revert()
+    measured = {"gas": gas, "seconds": median(seconds)}
+    if profiled is not None:
+        measured["profile"] = profiled
+    return measured
+
+
+def owners_list(count):
+    # dev accounts first (they hold keys for the signatures), then plain addresses
+    keyed = [a.address for a in accounts[:min(count, len(accounts))]]
+    return keyed + [web3.to_checksum_address((0x1000 + i).to_bytes(20, "big")) for i in range(count - len(keyed))]
+
+
+def deploy_artifact(name, *args):
+    factory = web3.eth.contract(abi=load_abi(name), bytecode=load_bytecode(name))
+    tx_hash = factory.constructor(*args).transact({"from": accounts[0].address})
+    address = web3.eth.wait_for_transaction_receipt(tx_hash).contractAddress
+    return Contract.from_abi(name, address, load_abi(name))
+
+
+###############
+# fixtures
+
+def deploy_usdc(dev):
+    token = MockERC20.deploy("USD Coin", "USDC", 6, {'from': dev})
+    set_code(web3, USDC, web3.to_hex(web3.eth.get_code(token.address)))
+    return MockERC20.at(USDC)
+
+
+def deploy_fund(params, usdc, owners):
+    dev = accounts[0]
+    safe = MockSafe.deploy(owners, {'from': dev})
+    connectors = [MockConnector.deploy({'from': dev}) for _ in range(params["connectors"])]
+    tokenizer = DaaTokenizer.deploy({'from': dev})
+    tokenizedShare = TokenizedShare.deploy(tokenizer, {'from': dev})
+    oracleHandler = OracleHandler.deploy({'from': dev})
+    positionManager = PositionManager.deploy(
+        safe, ["MOCK{}".format(i) for i in range(len(connectors))], connectors, {'from': dev})
+    tokenizer.initialize(safe, {'from': dev})
+    tokenizer.setPositionManager(positionManager, {'from': dev})
+    tokenizer.setTokenizedShare(tokenizedShare, {'from': dev})
+    tokenizer.setOracleHandler(oracleHandler, {'from': dev})
+    bases = [usdc]
+    for i in range(params["bases"] - 1):
+        token = MockERC20.deploy("Base {}".format(i), "BASE{}".format(i), 6, {'from': dev})
+        tokenizer.addSupportedCurrency(token.symbol(), token, True, {'from': dev})
+        bases.append(token)
+    for i in range(params["assets"]):
+        token = MockERC20.deploy("Asset {}".format(i), "ASSET{}".format(i), 18, {'from': dev})
+        feed = MockV3Aggregator.deploy(8, (2000 + i) * 10**8, {'from': dev})
+        tokenizer.addSupportedCurrency(token.symbol(), token, False, {'from': dev})
+        oracleHandler.addTokenOracle(token, feed, {'from': dev})
+        token.mint(safe, 10**18, {'from': dev})
+        for connector in connectors:
+            connector.setPosition(token, safe, 10**17, 10**16, {'from': dev})
+    # a first depositor, so deposits and redemptions go through calculateNav
+    usdc.mint(accounts[1], 10**12, {'from': dev})
+    usdc.approve(tokenizer, 2**256 - 1, {'from': accounts[1]})
+    tokenizer.deposit("USDC", 1000 * 10**6, {'from': accounts[1]})
+    return tokenizer, safe, bases
+
+
+###############
+# groups
+
+def bench_tokenizer(params, usdc, repeat, profile=None):
+    tokenizer, safe, bases = deploy_fund(params, usdc, owners_list(DEFAULTS["owners"]))
+    shares = TokenizedShare.at(tokenizer._tokenizedShare()).balanceOf(accounts[1]) // 10
+    # the buffer sits in the last base currency, so _withdraw walks all of them
+    bases[-1].mint(tokenizer, 2 * tokenizer.calcBaseAmount(shares), {'from': accounts[0]})
+    return {
+        "DaaTokenizer.deposit": measure(
+            lambda: tokenizer.deposit("USDC", 100 * 10**6, {'from': accounts[1]}), repeat, profile),
+        "DaaTokenizer.redeem": measure(lambda: tokenizer.redeem(shares, {'from': accounts[1]}), repeat, profile),
+        "DaaTokenizer.calculateNav": measure(
+            lambda: tokenizer.calculateNav.estimate_gas(), repeat, profile,
+            call=(accounts[0].address, tokenizer.address, encode_call("calculateNav()"))),
+    }
+
+
+def bench_authorized(params, usdc, repeat, profile=None):
+    # both scans go through the whole owners list, whatever the sender's position
+    sender = accounts[1]
+    tokenizer, safe, _ = deploy_fund(DEFAULTS, usdc, owners_list(params["owners"]))
+    usdc.mint(tokenizer, 10 * 10**6, {'from': accounts[0]})
+    results = {
+        "DaaTokenizer.withdrawToSafe": measure(
+            lambda: tokenizer.withdrawToSafe(usdc, 10**6, {'from': sender}), repeat, profile),
+    }
+    try:
+        module = deploy_artifact("DaaModule", accounts[9].address, safe.address)
+    except FileNotFoundError as e:
+        print("skipping DaaModule: {}".format(e))
+        return results
+    safe.enableModule(module, {'from': accounts[0]})
+    usdc.mint(safe, 10 * 10**6, {'from': accounts[0]})
+    results["DaaModule.executeTransfer"] = measure(
+        lambda: module.executeTransfer(usdc, 10**6, {'from': sender}), repeat, profile)
+    return results
+
+
+def bench_dsa(params, usdc, repeat, profile=None):
+    helpers = str(REPO_ROOT / "gnosis-dsa-module/src/test")
+    if helpers not in sys.path:
+        sys.path.append(helpers)
+    from signatures import sign_hash
+    from signing_service import pack_signatures
+
+    try:
+        load_abi("DaaDsaModule")
+    except FileNotFoundError as e:
+        print("skipping DaaDsaModule: {}".format(e))
+        return {}
+    owners = owners_list(params["owners"])
+    safe = MockSafe.deploy(owners, {'from': accounts[0]})
+    module = deploy_artifact("DaaDsaModule")
+    module.initialize(safe, MockInstaIndex.deploy({'from': accounts[0]}), chain.id, {'from': accounts[0]})
+    safe.enableModule(module, {'from': accounts[0]})
+    module.createAccount(2, ZERO, {'from': accounts[0]})
+    usdc.mint(safe, 10**12, {'from': accounts[0]})
+    selector = web3.keccak(text="deposit(address,uint256,uint256,uint256)")[:4]
+    data = selector + encode(["address", "uint256", "uint256", "uint256"], [usdc.address, 10**6, 0, 0])
+    spells, datas = ["BASIC-A"] * params["spells"], [data] * params["spells"]
+    tx_hash = module.getTransactionHash(spells, datas, module.nonce())
+    # DaaDsaModule.threshold is fixed, extra signatures are never read
+    signers = accounts[:DSA_THRESHOLD]
+    signatures = pack_signatures({a.address: sign_hash(a.private_key, tx_hash) for a in signers})
+    return {
+        "DaaDsaModule.executeTransaction": measure(
+            lambda: module.executeTransaction(spells, datas, signatures, {'from': signers[0]}), repeat, profile),
+    }
+
+
+BENCHES = {"tokenizer": bench_tokenizer, "authorized": bench_authorized, "dsa": bench_dsa}
+
+
+def run(repeat=REPEAT, profile=None):
+    """`{path: {point: {"gas", "seconds"}}}` for every group and sweep point, plus "profile"
+    when `profile` is given (see `measure` and scripts/profiler.py)"""
+    usdc = deploy_usdc(accounts[0])
+    results = {}
+    for group, bench in BENCHES.items():
+        for params in points(group):
+            for path, value in bench(params, usdc, repeat, profile).items():
+                results.setdefault(path, {})[point_key(params, group)] = value
+    return results
+
+
+###############
+# reports
+
+def compare(results, baseline, tolerance=GAS_TOLERANCE):
+    """`(path, point, baseline gas, gas)` of every point whose gas grew by more than `tolerance`"""
+    regressions = []
+    for path, by_point in results.items():
+        for point, value in by_point.items():
+            old = baseline.get(path, {}).get(point)
+            if old is not None and value["gas"] > old["gas"] * (1 + tolerance):
+                regressions.append((path, point, old["gas"], value["gas"]))
+    return regressions
+
+
+def scaling(results):
+    """Gas added per unit of each swept dimension, `{path: {dimension: gas per unit}}`"""
+    slopes = {}
+    for path, by_point in results.items():
+        parsed = [(dict(kv.split("=") for kv in point.split(",")), value["gas"]) for point, value in by_point.items()]
+        for dimension in DEFAULTS:
+            # points where only this dimension moved away from the defaults
+            line = sorted(
+                (int(p[dimension]), gas) for p, gas in parsed
+                if dimension in p and all(int(v) == DEFAULTS[d] for d, v in p.items() if d != dimension)
+            )
+            if len(line) > 1 and line[-1][0] != line[0][0]:
+                slopes.setdefault(path, {})[dimension] = (line[-1][1] - line[0][1]) / (line[-1][0] - line[0][0])
+    return slopes
+
+
+def main(baseline=None, output=OUTPUT):
+    results = run()
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"chain_id": chain.id, "results": results}, indent=2, sort_keys=True))
+    for path, slopes in sorted(scaling(results).items()):
+        print("{}: {}".format(path, ", ".join("{:+.0f} gas per {}".format(g, d[:-1]) for d, g in sorted(slopes.items()))))
+    if baseline is None:
+        return
+    regressions = compare(results, json.loads(Path(baseline).read_text())["results"])
+    for path, point, old, new in regressions:
+        print("REGRESSION {} [{}]: {} -> {} gas ({:+.1%})".format(path, point, old, new, new / old - 1))
+    if regressions:
+        sys.exit(1)
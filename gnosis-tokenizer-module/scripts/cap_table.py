@@ -0,0 +1,304 @@
+"""Cap table of a fund's TokenizedShare at any block, with per holder valuation.
+
+`TokenizedShare` only exposes `balanceOf` and `totalSupply`, so the holders
+are rebuilt from its `Transfer` logs (mints from and burns to the zero
+address included). Every transfer is appended to fixed width columns (see
+scripts/event_indexer.py) with the holder as an id into a holder column, and
+every `checkpoint_every` transfers the balance of each holder id is written
+as one array. The balances at a block are those of the last checkpoint before
+it, plus a replay of at most `checkpoint_every` transfers.
+
+A statement joins the balances with `getPricePerShare()` of the tokenizer at
+that block, a holder is valued like `calcBaseAmount` does on redemption
+(`shares * price per share / 1e6`). `statements` walks its blocks in order
+and carries the balances from one block to the next, so month end statements
+over years of history need a single pass over the transfers; the prices of
+all blocks are read in one JSON-RPC batch.
+
+The checkpoint moves atomically after every synced window, like
+scripts/nav_history.py, so an interrupted sync resumes from the last window.
+Reorgs are not rolled back, keep `confirmations` above the chain's reorg depth.
+
+    brownie run scripts/cap_table.py main <store dir> <tokenizer> <from block> <block or YYYY-MM-DD> [...]
+"""
+import csv
+import json
+import os
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from eth_utils import to_checksum_address
+
+from scripts.artifacts import PROJECT_ROOT
+from scripts.event_indexer import Column
+from scripts.logs import get_logs
+from scripts.nav_tracker import TRANSFER, ZERO, _address
+from scripts.rpc import RPCError, batch_request, call_request, decode_result, request
+
+CHECKPOINT_EVERY = 5000  # transfers between two balance arrays
+WINDOW = 50_000
+OUTPUT = PROJECT_ROOT / "reports/cap_table"
+# column name, width; holders are ids into the holder column
+COLUMNS = (("block", 8), ("sender", 4), ("receiver", 4), ("value", 32))
+NO_HOLDER = 2**32 - 1  # the zero address of mints and burns
+PRICE_SCALE = 10**6
+
+
+@dataclass
+class Snapshot:
+    """Holders with a balance at `block`, valued when `price_per_share` is set"""
+
+    block: int
+    balances: dict = field(default_factory=dict)  # holder -> shares
+    price_per_share: int = None
+
+    @property
+    def total_supply(self):
+        return sum(self.balances.values())
+
+    def value(self, holder):
+        """Redemption value of `holder`, None when the price call reverted"""
+        if self.price_per_share is None:
+            return None
+        return self.balances.get(holder, 0) * self.price_per_share // PRICE_SCALE
+
+    def values(self):
+        return {holder: self.value(holder) for holder in self.balances}
+
+
+class CapTable:
+    """Transfers and balance checkpoints of the share of `tokenizer`, stored at `path`.
+
+    `from_block` must not be after the deployment of the share, balances start
+    at zero there.
+    """
+
+    def __init__(self, path, tokenizer, from_block=0, checkpoint_every=CHECKPOINT_EVERY, window=WINDOW,
+                 confirmations=0, chunk_size=2000, uri=None):
+        self.root = Path(path)
+        (self.root / "checkpoints").mkdir(parents=True, exist_ok=True)
+        self.tokenizer = to_checksum_address(str(tokenizer))
+        self.checkpoint_every = checkpoint_every
+        self.window = window
+        self.confirmations = confirmations
+        self.chunk_size = chunk_size
+        self.uri = uri
+        state = self.root / "state.json"
+        if state.exists():
+            self.state = json.loads(state.read_text())
+            if (self.state["tokenizer"], self.state["from_block"]) != (self.tokenizer, from_block):
+                raise ValueError("{} holds the cap table of another fund or from another block".format(path))
+        else:
+            share = decode_result(["address"], request(*call_request(self.tokenizer, "_tokenizedShare()"), uri))
+            self.state = {"tokenizer": self.tokenizer, "share": share, "from_block": from_block, "block": None,
+                          "rows": 0, "holders": 0, "checkpoints": []}
+        self.share = self.state["share"]
+        self.holder_column = Column(self.root / "holders.col", 20, self.state["holders"])
+        self.holders = [to_checksum_address(self.holder_column.get(i)) for i in range(self.state["holders"])]
+        self.ids = {holder: i for i, holder in enumerate(self.holders)}
+        self.columns = {name: Column(self.root / (name + ".col"), width, self.state["rows"]) for name, width in COLUMNS}
+        block = self.columns["block"]
+        self.blocks = array("Q", (int.from_bytes(block.get(i), "big") for i in range(self.state["rows"])))
+        # [row, block] of each balance array, row 0 is the empty cap table
+        self.checkpoints = [tuple(c) for c in self.state["checkpoints"]]
+        row, self.balances = self._checkpoint(len(self.checkpoints) - 1)
+        self._replay(self.balances, row, len(self.blocks))
+
+    @property
+    def block(self):
+        """Last synced block"""
+        return self.state["block"]
+
+    ###############
+    # storage
+
+    def _holder(self, address):
+        if address == ZERO:
+            return NO_HOLDER
+        if address not in self.ids:
+            self.ids[address] = len(self.holders)
+            self.holders.append(address)
+            self.holder_column.append(bytes.fromhex(address[2:]))
+            self.balances.append(0)
+        return self.ids[address]
+
+    def _checkpoint(self, index):
+        """`(row, balances)` of a checkpoint, index -1 is the empty cap table"""
+        if index < 0:
+            return 0, [0] * len(self.holders)
+        row, _ = self.checkpoints[index]
+        data = (self.root / "checkpoints" / "{}.bin".format(row)).read_bytes()
+        balances = [int.from_bytes(data[i:i + 32], "big") for i in range(0, len(data), 32)]
+        return row, balances + [0] * (len(self.holders) - len(balances))
+
+    def _replay(self, balances, start, end):
+        sender, receiver, value = (self.columns[name].data for name in ("sender", "receiver", "value"))
+        for row in range(start, end):
+            amount = int.from_bytes(value[32 * row:32 * row + 32], "big")
+            source = int.from_bytes(sender[4 * row:4 * row + 4], "big")
+            target = int.from_bytes(receiver[4 * row:4 * row + 4], "big")
+            if source != NO_HOLDER:
+                balances[source] -= amount
+            if target != NO_HOLDER:
+                balances[target] += amount
+        return balances
+
+    def _save_checkpoint(self, block):
+        """Balance array after the last appended transfer, listed in the state by the next commit"""
+        rows = len(self.blocks)
+        path = self.root / "checkpoints" / "{}.bin".format(rows)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(b"".join(b.to_bytes(32, "big") for b in self.balances))
+        os.replace(tmp, path)
+        self.checkpoints.append((rows, block))
+
+    def _commit(self, block):
+        rows = len(self.blocks)
+        self.holder_column.flush()
+        for column in self.columns.values():
+            column.flush()
+        self.state.update(block=block, rows=rows, holders=len(self.holders), checkpoints=self.checkpoints)
+        tmp = self.root / "state.json.tmp"
+        tmp.write_text(json.dumps(self.state))
+        os.replace(tmp, self.root / "state.json")
+
+    ###############
+    # sync
+
+    def sync(self, to_block=None):
+        """Append the transfers up to `to_block` (default head minus confirmations), returns their number"""
+        if to_block is None:
+            to_block = int(request("eth_blockNumber", [], self.uri), 16) - self.confirmations
+        start = self.state["from_block"] if self.block is None else self.block + 1
+        added = 0
+        for low in range(start, to_block + 1, self.window):
+            high = min(low + self.window - 1, to_block)
+            for log in get_logs(self.share, [TRANSFER], low, high, self.chunk_size, self.uri):
+                topics = log["topics"]
+                source, target = self._holder(_address(topics[1])), self._holder(_address(topics[2]))
+                amount = int(log["data"], 16)
+                self.columns["block"].append(int(log["blockNumber"], 16).to_bytes(8, "big"))
+                self.columns["sender"].append(source.to_bytes(4, "big"))
+                self.columns["receiver"].append(target.to_bytes(4, "big"))
+                self.columns["value"].append(amount.to_bytes(32, "big"))
+                self.blocks.append(int(log["blockNumber"], 16))
+                if source != NO_HOLDER:
+                    self.balances[source] -= amount
+                if target != NO_HOLDER:
+                    self.balances[target] += amount
+                added += 1
+                # checked per transfer, a busy window gets as many checkpoints as it needs
+                if len(self.blocks) - (self.checkpoints[-1][0] if self.checkpoints else 0) >= self.checkpoint_every:
+                    self._save_checkpoint(self.blocks[-1])
+            self._commit(high)
+        return added
+
+    ###############
+    # snapshots
+
+    def _check(self, block):
+        if self.block is None or not self.state["from_block"] <= block <= self.block:
+            raise ValueError("block {} is outside the synced range {}-{}".format(
+                block, self.state["from_block"], self.block))
+
+    def _snapshot(self, block, balances):
+        return Snapshot(block, {self.holders[i]: b for i, b in enumerate(balances) if b})
+
+    def snapshot(self, block):
+        """Balances at `block`: the last checkpoint before it plus a replay"""
+        self._check(block)
+        end = bisect_right(self.blocks, block)
+        row, balances = self._checkpoint(bisect_right(self.checkpoints, (end, float("inf"))) - 1)
+        return self._snapshot(block, self._replay(balances, row, end))
+
+    def snapshots(self, blocks):
+        """Snapshots at `blocks` in block order, the balances are carried from one block to the next"""
+        result = []
+        row, balances = 0, None
+        for block in sorted(blocks):
+            self._check(block)
+            end = bisect_right(self.blocks, block)
+            index = bisect_right(self.checkpoints, (end, float("inf"))) - 1
+            if balances is None or (index >= 0 and self.checkpoints[index][0] > row):
+                row, balances = self._checkpoint(index)
+            self._replay(balances, row, end)
+            row = end
+            result.append(self._snapshot(block, balances))
+        return result
+
+    def prices(self, blocks):
+        """`{block: getPricePerShare()}`, None where the call reverts"""
+        results = batch_request([call_request(self.tokenizer, "getPricePerShare()", (), b) for b in blocks], self.uri)
+        return {
+            b: None if isinstance(r, RPCError) or r in ("0x", None) else int(r, 16) for b, r in zip(blocks, results)}
+
+    def statements(self, blocks):
+        """Valued snapshots at `blocks`"""
+        snapshots = self.snapshots(blocks)
+        prices = self.prices([s.block for s in snapshots])
+        for snapshot in snapshots:
+            snapshot.price_per_share = prices[snapshot.block]
+        return snapshots
+
+    def verify(self, block):
+        """Holders whose stored balance differs from `balanceOf` at `block`, `{holder: (stored, onchain)}`"""
+        snapshot = self.snapshot(block)
+        results = batch_request(
+            [call_request(self.share, "balanceOf(address)", [h], block) for h in self.holders], self.uri)
+        mismatches = {}
+        for holder, result in zip(self.holders, results):
+            onchain = None if isinstance(result, RPCError) else int(result, 16)
+            if onchain != snapshot.balances.get(holder, 0):
+                mismatches[holder] = (snapshot.balances.get(holder, 0), onchain)
+        return mismatches
+
+
+###############
+
+def block_at(timestamp, uri=None):
+    """Last block mined at or before `timestamp`"""
+    def mined(number):
+        return int(request("eth_getBlockByNumber", [hex(number), False], uri)["timestamp"], 16)
+
+    low, high = 0, int(request("eth_blockNumber", [], uri), 16)
+    if mined(high) <= timestamp:
+        return high
+    while low < high:
+        middle = (low + high + 1) // 2
+        if mined(middle) <= timestamp:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def month_end(date, uri=None):
+    """Last block of the UTC day `date` (YYYY-MM-DD)"""
+    day = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return block_at(int((day + timedelta(days=1)).timestamp()) - 1, uri)
+
+
+def write_statement(snapshot, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", newline="") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["holder", "shares", "value"])
+        for holder, shares in sorted(snapshot.balances.items(), key=lambda item: -item[1]):
+            value = snapshot.value(holder)
+            writer.writerow([holder, shares, "" if value is None else value])
+
+
+def main(path, tokenizer, from_block, *points):
+    table = CapTable(path, tokenizer, int(from_block))
+    table.sync()
+    blocks = [month_end(p) if "-" in p else int(p) for p in points]
+    for statement in table.statements(blocks):
+        output = OUTPUT / "{}_{}.csv".format(table.tokenizer, statement.block)
+        write_statement(statement, output)
+        print("block {}: {} holders, {} shares, price per share {} -> {}".format(
+            statement.block, len(statement.balances), statement.total_supply, statement.price_per_share, output))
+    return table
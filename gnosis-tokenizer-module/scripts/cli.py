@@ -0,0 +1,333 @@
+"""Fast-start command line for on-call operations, without the brownie project.
+
+`brownie run` loads the project, its compiler settings and web3 before the
+first line of a script runs. This CLI reads ABIs and bytecode from the
+content-hashed artifact cache (see scripts/artifacts.py, `cache` fills it from
+the build output) and speaks JSON-RPC through scripts/rpc.py. Each command
+imports what it needs when it runs: eth_account only to sign, the DSA signing
+helpers only for `sign`, aiohttp only for `relay`.
+
+Transactions are signed locally with `--key` (0x hex, or `env:<VAR>` to read
+it from the environment) or sent by an account unlocked on the node with
+`--from`. Each one waits for its receipt and a revert stops the command.
+
+    python -m scripts.cli [--rpc <url>] cache [<name> ...]
+    python -m scripts.cli deploy <name> [<constructor arg> ...] --key env:DEPLOYER_KEY
+    python -m scripts.cli wire-proxy <implementation> <safe> [--position-manager <a>] [--tokenized-share <a>] [--oracle-handler <a>] --key ...
+    python -m scripts.cli nav <tokenizer> [<tokenizer> ...] [--block <n>]
+    python -m scripts.cli sign --hash <0x hash> --key ...
+    python -m scripts.cli sign --casts <casts json> --module <a> --nonce <n> [--chain-id <id>] --key ... [--key ...]
+    python -m scripts.cli relay <operations json> --key ... [--key ...]
+
+`--rpc` defaults to $RPC_URL, then http://127.0.0.1:8545. Arrays and tuples
+of constructor arguments are given as JSON.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+DEFAULT_RPC = "http://127.0.0.1:8545"
+GAS_MARGIN = 1.2
+POLL_INTERVAL = 0.5
+RECEIPT_TIMEOUT = 300
+DSA_HELPERS = Path(__file__).resolve().parents[2] / "gnosis-dsa-module/src/test"
+
+
+class TransactionFailed(Exception):
+    """A transaction reverted or was not mined in time."""
+
+
+class Signer:
+    """Sender of the CLI transactions, `private_key` is None for an account unlocked on the node"""
+
+    def __init__(self, address, private_key=None):
+        self.address = address
+        self.private_key = private_key
+
+    @classmethod
+    def from_key(cls, key):
+        from eth_account import Account
+
+        if key.startswith("env:"):
+            key = os.environ[key[4:]]
+        return cls(Account.from_key(key).address, key)
+
+    def __str__(self):
+        return self.address
+
+
+def signers(args):
+    from eth_utils import to_checksum_address
+
+    result = [Signer.from_key(k) for k in args.key or ()]
+    result += [Signer(to_checksum_address(a)) for a in getattr(args, "sender", None) or ()]
+    if not result:
+        raise SystemExit("{}: --key or --from is required".format(args.command))
+    return result
+
+
+###############
+# transactions
+
+def _argument(abi_type, value):
+    """Constructor argument from the command line, `value` is a string or parsed JSON"""
+    from eth_utils import to_checksum_address
+
+    if abi_type.endswith("]"):
+        items = json.loads(value) if isinstance(value, str) else value
+        return [_argument(abi_type[:abi_type.rindex("[")], item) for item in items]
+    if abi_type.startswith("("):
+        return json.loads(value) if isinstance(value, str) else value
+    if not isinstance(value, str):
+        return value
+    if abi_type.startswith(("uint", "int")):
+        return int(value, 0)
+    if abi_type == "bool":
+        return value.lower() in ("1", "true", "yes")
+    if abi_type == "address":
+        return to_checksum_address(value)
+    if abi_type.startswith("bytes"):
+        return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+    return value
+
+
+def deploy_data(name, args=(), cache_dir=None):
+    """Bytecode of the cached artifact `name` followed by its encoded constructor arguments"""
+    from scripts.artifacts import CACHE_DIR, load_cached
+    from scripts.rpc import encode
+
+    artifact = load_cached(name, cache_dir or CACHE_DIR)
+    constructor = next((item for item in artifact["abi"] if item["type"] == "constructor"), {"inputs": []})
+    types = [i["type"] for i in constructor["inputs"]]
+    if len(args) != len(types):
+        raise SystemExit("{} takes {} constructor arguments ({}), got {}".format(
+            name, len(types), ", ".join(types), len(args)))
+    values = [_argument(t, a) for t, a in zip(types, args)]
+    return artifact["bytecode"] + (encode(types, values).hex() if types else "")
+
+
+def send(uri, signer, to, data, value=0):
+    """Send and wait for the receipt, raises `TransactionFailed` on a revert"""
+    from scripts.rpc import RPCError, batch_request, request
+
+    tx = {"from": signer.address, "data": data, "value": hex(value)}
+    if to is not None:
+        tx["to"] = to
+    gas = int(int(request("eth_estimateGas", [tx], uri), 16) * GAS_MARGIN)
+    if signer.private_key is None:
+        tx_hash = request("eth_sendTransaction", [dict(tx, gas=hex(gas))], uri)
+    else:
+        from eth_account import Account
+
+        results = batch_request([
+            ("eth_getTransactionCount", [signer.address, "pending"]),
+            ("eth_gasPrice", []),
+            ("eth_chainId", []),
+        ], uri)
+        for result in results:
+            if isinstance(result, RPCError):
+                raise result
+        nonce, gas_price, chain_id = (int(r, 16) for r in results)
+        unsigned = {"data": data, "value": value, "gas": gas, "gasPrice": gas_price, "nonce": nonce, "chainId": chain_id}
+        if to is not None:
+            unsigned["to"] = to
+        signed = Account.sign_transaction(unsigned, signer.private_key)
+        raw = getattr(signed, "raw_transaction", None) or signed.rawTransaction
+        tx_hash = request("eth_sendRawTransaction", ["0x" + bytes(raw).hex()], uri)
+    deadline = time.monotonic() + RECEIPT_TIMEOUT
+    while True:
+        receipt = request("eth_getTransactionReceipt", [tx_hash], uri)
+        if receipt is not None:
+            break
+        if time.monotonic() > deadline:
+            raise TransactionFailed("{} not mined after {}s".format(tx_hash, RECEIPT_TIMEOUT))
+        time.sleep(POLL_INTERVAL)
+    if int(receipt["status"], 16) != 1:
+        raise TransactionFailed("{} reverted".format(tx_hash))
+    return receipt
+
+
+def _deploy(uri, signer, name, args=(), cache_dir=None):
+    from eth_utils import to_checksum_address
+
+    receipt = send(uri, signer, None, deploy_data(name, args, cache_dir))
+    address = to_checksum_address(receipt["contractAddress"])
+    print("{} deployed at {} (gas used {})".format(name, address, int(receipt["gasUsed"], 16)))
+    return address
+
+
+def _call(uri, signer, to, signature, args=()):
+    from scripts.rpc import encode_call
+
+    receipt = send(uri, signer, to, encode_call(signature, args))
+    print("{} {} (gas used {})".format(signature.split("(")[0], receipt["transactionHash"], int(receipt["gasUsed"], 16)))
+    return receipt
+
+
+###############
+# commands
+
+def cmd_cache(args):
+    from scripts.artifacts import cache_artifacts
+
+    hashes = cache_artifacts(args.names or None, args.cache_dir)
+    for name, digest in hashes.items():
+        print("{} {}".format(name, digest))
+    return hashes
+
+
+def cmd_deploy(args):
+    return _deploy(args.rpc, signers(args)[0], args.name, args.args, args.cache_dir)
+
+
+def cmd_wire_proxy(args):
+    """Same wiring as scripts/deploy.py: proxy, initialize, then the optional setters"""
+    from eth_utils import to_checksum_address
+
+    signer = signers(args)[0]
+    proxy = _deploy(args.rpc, signer, "ProxyHandler", [args.implementation], args.cache_dir)
+    _call(args.rpc, signer, proxy, "initialize(address)", [to_checksum_address(args.safe)])
+    for signature, address in (
+        ("setPositionManager(address)", args.position_manager),
+        ("setTokenizedShare(address)", args.tokenized_share),
+        ("setOracleHandler(address)", args.oracle_handler),
+    ):
+        if address:
+            _call(args.rpc, signer, proxy, signature, [to_checksum_address(address)])
+    print("proxy {} owned by {}".format(proxy, signer.address))
+    return proxy
+
+
+def cmd_nav(args):
+    from scripts.nav_engine import NavEngine
+
+    results = NavEngine(args.tokenizers, args.rpc).navs(args.block)
+    for result in results:
+        if result.error:
+            print("{}: reverted ({})".format(result.tokenizer, result.error))
+        else:
+            print("{}: nav {} shares {} price per share {}".format(
+                result.tokenizer, result.nav, result.total_supply, result.price_per_share))
+    return results
+
+
+def cmd_sign(args):
+    if str(DSA_HELPERS) not in sys.path:
+        sys.path.append(str(DSA_HELPERS))
+    keys = [os.environ[k[4:]] if k.startswith("env:") else k for k in args.key]
+    if args.hash:
+        from signatures import sign_hash
+
+        signatures = ["0x" + sign_hash(key, args.hash).hex() for key in keys]
+        for signature in signatures:
+            print(signature)
+        return signatures
+    if not (args.casts and args.module and args.nonce is not None):
+        raise SystemExit("sign: --hash, or --casts with --module and --nonce")
+    from module_tx import domain_separator
+    from signing_service import pending_transactions, sign_transactions
+
+    chain_id = args.chain_id
+    if chain_id is None:
+        from scripts.rpc import request
+
+        chain_id = int(request("eth_chainId", [], args.rpc), 16)
+    casts = [(c["targets"], c["datas"]) for c in json.loads(Path(args.casts).read_text())]
+    transactions = pending_transactions(casts, args.nonce)
+    signed = sign_transactions(transactions, keys, domain_separator(chain_id, args.module), processes=1,
+                               threshold=args.threshold)
+    result = [
+        {"nonce": tx.nonce, "hash": "0x" + tx_hash.hex(), "signatures": "0x" + signatures.hex()}
+        for tx, (tx_hash, signatures) in zip(transactions, signed)
+    ]
+    print(json.dumps(result, indent=2))
+    return result
+
+
+def cmd_relay(args):
+    import asyncio
+
+    from scripts.relayer import Relayer, load_operations
+
+    keys = signers(args)
+    operations = load_operations(args.operations)
+
+    async def run():
+        async with Relayer(keys, args.rpc) as relayer:
+            return relayer, await asyncio.gather(*[relayer.relay(op) for op in operations])
+
+    relayer, results = asyncio.run(run())
+    for r in results:
+        print("{} {} {}".format(r.operation.kind, r.hash or "-", "ok" if r.status else r.error or "reverted"))
+    print(json.dumps(relayer.metrics(), indent=2))
+    return results
+
+
+###############
+
+def parser():
+    from scripts.artifacts import CACHE_DIR
+
+    root = argparse.ArgumentParser(prog="python -m scripts.cli", description=__doc__.split("\n")[0])
+    root.add_argument("--rpc", default=os.environ.get("RPC_URL", DEFAULT_RPC))
+    root.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    commands = root.add_subparsers(dest="command", required=True)
+    sender = argparse.ArgumentParser(add_help=False)
+    sender.add_argument("--key", action="append", help="0x private key or env:<VAR>")
+    sender.add_argument("--from", dest="sender", action="append", help="account unlocked on the node")
+
+    command = commands.add_parser("cache", help="cache compiled artifacts")
+    command.add_argument("names", nargs="*")
+    command.set_defaults(run=cmd_cache)
+
+    command = commands.add_parser("deploy", parents=[sender], help="deploy a cached artifact")
+    command.add_argument("name")
+    command.add_argument("args", nargs="*")
+    command.set_defaults(run=cmd_deploy)
+
+    command = commands.add_parser("wire-proxy", parents=[sender], help="deploy and wire a tokenizer proxy")
+    command.add_argument("implementation")
+    command.add_argument("safe")
+    command.add_argument("--position-manager")
+    command.add_argument("--tokenized-share")
+    command.add_argument("--oracle-handler")
+    command.set_defaults(run=cmd_wire_proxy)
+
+    command = commands.add_parser("nav", help="NAV, shares and price per share of tokenizers")
+    command.add_argument("tokenizers", nargs="+")
+    command.add_argument("--block", type=int)
+    command.set_defaults(run=cmd_nav)
+
+    command = commands.add_parser("sign", help="sign a hash or DaaDsaModule casts")
+    command.add_argument("--key", action="append", required=True, help="0x private key or env:<VAR>")
+    command.add_argument("--hash")
+    command.add_argument("--casts", help='JSON [{"targets": [...], "datas": [...]}]')
+    command.add_argument("--module")
+    command.add_argument("--nonce", type=int)
+    command.add_argument("--chain-id", type=int)
+    command.add_argument("--threshold", type=int)
+    command.set_defaults(run=cmd_sign)
+
+    command = commands.add_parser("relay", parents=[sender], help="relay module operations")
+    command.add_argument("operations")
+    command.set_defaults(run=cmd_relay)
+    return root
+
+
+def main(argv=None):
+    from requests import RequestException
+
+    from scripts.rpc import RPCError
+
+    args = parser().parse_args(argv)
+    try:
+        return args.run(args)
+    except (RPCError, RequestException, TransactionFailed, FileNotFoundError) as e:
+        raise SystemExit("{}: {}".format(args.command, e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+"""Deploy and wire tokenizers for many safes from a manifest.
+
+`scripts/deploy.py` deploys one fund and waits for every receipt. Here the
+same steps (ProxyHandler, PositionManager, TokenizedShare deployments,
+`initialize`, `setPositionManager`, `setTokenizedShare`, `setOracleHandler`,
+`addSupportedCurrency`) are planned for every safe as a dependency graph and
+sent without waiting:
+
+ - nonces are assigned locally and contract addresses are derived from
+   `(sender, nonce)`, so a step can use the address of a deployment that is
+   not mined yet. Transactions of one sender are mined in nonce order, a step
+   is sent as soon as its dependencies are mined or sent by the same sender
+ - one `DaaTokenizer` implementation and one `OracleHandler` are shared by all
+   the funds, each safe gets its own `ProxyHandler` in front of the
+   implementation; connectors given as an artifact name are deployed once
+ - safes are spread over the senders, every transaction of a fund comes from
+   the same sender (it owns the tokenizer and the proxy)
+ - each wave of transactions is sent as one JSON-RPC batch, receipts are
+   polled in batches as well
+
+Progress is written to a JSON file before every wave is sent (nonce, signed
+transaction and predicted address of each step) and after each receipt, so a
+run killed at any point is resumed by running it again: mined steps are
+skipped, pending ones are broadcast again with the same nonce, and a step
+that reverted or whose nonce was used by another transaction is planned again
+with the steps depending on it.
+
+Manifest (JSON):
+
+    {
+        "connectors": {"AAVE": "0x1D69...", "MOCK": "MockConnector"},
+        "currencies": [{"ticker": "WETH", "token": "0x7ceB...", "base": false}],
+        "oracles": {"0x7ceB...": "0xF968..."},
+        "safes": ["0x2139...", {"safe": "0x...", "currencies": [...]}]
+    }
+
+`connectors` and `currencies` can be overridden per safe; `oracleHandler` and
+`implementation` can point at deployed contracts instead of new ones.
+
+    brownie run scripts/deploy_fleet.py main <manifest> [<progress json>] [<output json>]
+"""
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from eth_account import Account
+from eth_utils import keccak, to_checksum_address
+
+from scripts.artifacts import PROJECT_ROOT, load_abi, load_bytecode
+from scripts.rpc import RPCError, batch_request, encode, encode_call, request
+
+GAS_LIMITS = {
+    "DaaTokenizer": 6_000_000,
+    "OracleHandler": 2_000_000,
+    "ProxyHandler": 1_000_000,
+    "PositionManager": 2_000_000,
+    "TokenizedShare": 3_000_000,
+    "AaveConnector": 3_000_000,
+    "MockConnector": 1_000_000,
+    "call": 300_000,
+}
+MAX_PENDING = 64  # unconfirmed transactions per sender
+POLL_INTERVAL = 1
+PROGRESS = PROJECT_ROOT / "reports/deploy_progress.json"
+OUTPUT = PROJECT_ROOT / "reports/deployments.json"
+SHARED = "shared"
+
+
+class DeployError(Exception):
+    """Steps reverted, the progress file keeps them for the next run."""
+
+    def __init__(self, failed):
+        super().__init__("{} steps reverted: {}".format(len(failed), ", ".join(sorted(failed))))
+        self.failed = failed
+
+
+@dataclass(frozen=True)
+class Ref:
+    """Address deployed by another step"""
+    step: str
+
+
+@dataclass
+class Step:
+    id: str
+    sender: str
+    contract: str  # artifact deployed, or the ABI of the called contract
+    signature: str = None  # None for a deployment
+    to: object = None  # address or Ref of the called contract
+    args: tuple = ()
+    after: tuple = ()  # dependencies that are not arguments
+    deps: tuple = field(init=False)
+
+    def __post_init__(self):
+        refs = [a.step for a in _flatten(self.args) if isinstance(a, Ref)]
+        if isinstance(self.to, Ref):
+            refs.insert(0, self.to.step)
+        self.deps = tuple(dict.fromkeys(refs + list(self.after)))
+
+    @property
+    def deploys(self):
+        return self.signature is None
+
+
+def _flatten(args):
+    for arg in args:
+        if isinstance(arg, (list, tuple)):
+            yield from _flatten(arg)
+        else:
+            yield arg
+
+
+def create_address(sender, nonce):
+    """Address of the contract deployed by `sender` at `nonce`, keccak(rlp([sender, nonce]))"""
+    if nonce == 0:
+        encoded_nonce = b"\x80"
+    elif nonce < 0x80:
+        encoded_nonce = bytes([nonce])
+    else:
+        raw = nonce.to_bytes((nonce.bit_length() + 7) // 8, "big")
+        encoded_nonce = bytes([0x80 + len(raw)]) + raw
+    payload = b"\x94" + bytes.fromhex(sender[2:]) + encoded_nonce
+    return to_checksum_address(keccak(bytes([0xc0 + len(payload)]) + payload)[12:])
+
+
+###############
+# plan
+
+def _currencies(entries):
+    return [(c["ticker"], to_checksum_address(c["token"]), bool(c.get("base", False))) for c in entries]
+
+
+def plan(manifest, senders):
+    """Steps of the manifest, every dependency listed before the steps using it"""
+    senders = [to_checksum_address(str(s)) for s in senders]
+    owner = senders[0]
+    steps = []
+    shared = {}
+
+    def shared_contract(key, name):
+        if key in manifest:
+            return to_checksum_address(manifest[key])
+        step_id = "{}:{}".format(SHARED, key)
+        steps.append(Step(step_id, owner, name))
+        return Ref(step_id)
+
+    def connector(name, value):
+        if value.startswith("0x"):
+            return to_checksum_address(value)
+        if value not in shared:
+            shared[value] = shared_contract("connector:{}".format(value), value)
+        return shared[value]
+
+    implementation = shared_contract("implementation", "DaaTokenizer")
+    oracle_handler = shared_contract("oracleHandler", "OracleHandler")
+    for token, feed in sorted(manifest.get("oracles", {}).items()):
+        steps.append(Step(
+            "{}:oracle:{}".format(SHARED, to_checksum_address(token)), owner, "OracleHandler",
+            "addTokenOracle(address,address)", oracle_handler, (to_checksum_address(token), to_checksum_address(feed)),
+        ))
+
+    for i, entry in enumerate(manifest["safes"]):
+        if isinstance(entry, str):
+            entry = {"safe": entry}
+        safe = to_checksum_address(entry["safe"])
+        sender = senders[i % len(senders)]
+        connectors = entry.get("connectors", manifest.get("connectors", {}))
+        names = sorted(connectors)
+        addresses = [connector(name, connectors[name]) for name in names]
+
+        def step_id(name):
+            return "{}:{}".format(safe, name)
+
+        proxy = Ref(step_id("proxy"))
+        initialize = step_id("initialize")
+        steps += [
+            Step(proxy.step, sender, "ProxyHandler", args=(implementation,)),
+            Step(step_id("positionManager"), sender, "PositionManager", args=(safe, names, addresses)),
+            Step(step_id("tokenizedShare"), sender, "TokenizedShare", args=(proxy,)),
+            Step(initialize, sender, "DaaTokenizer", "initialize(address)", proxy, (safe,)),
+            Step(step_id("setPositionManager"), sender, "DaaTokenizer", "setPositionManager(address)", proxy,
+                 (Ref(step_id("positionManager")),), (initialize,)),
+            Step(step_id("setTokenizedShare"), sender, "DaaTokenizer", "setTokenizedShare(address)", proxy,
+                 (Ref(step_id("tokenizedShare")),), (initialize,)),
+            Step(step_id("setOracleHandler"), sender, "DaaTokenizer", "setOracleHandler(address)", proxy,
+                 (oracle_handler,), (initialize,)),
+        ]
+        for ticker, token, base in _currencies(entry.get("currencies", manifest.get("currencies", []))):
+            steps.append(Step(
+                step_id("currency:{}".format(ticker)), sender, "DaaTokenizer",
+                "addSupportedCurrency(string,address,bool)", proxy, (ticker, token, base), (initialize,),
+            ))
+    return steps
+
+
+###############
+# progress
+
+class Progress:
+    """`{step id: {"sender", "nonce", "address", "hash", "tx", "status"}}` in a JSON file.
+
+    status is "pending" once a nonce is assigned, then "mined" or "failed";
+    the transaction is only kept while it may have to be broadcast again.
+    """
+
+    def __init__(self, path, chain_id):
+        self.path = Path(path)
+        data = json.loads(self.path.read_text()) if self.path.exists() else {"chain_id": chain_id, "steps": {}}
+        if data["chain_id"] != chain_id:
+            raise ValueError("{} was written on chain {}, not {}".format(self.path, data["chain_id"], chain_id))
+        self.chain_id = chain_id
+        self.steps = data["steps"]
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"chain_id": self.chain_id, "steps": self.steps}, separators=(",", ":")))
+        os.replace(tmp, self.path)
+
+    def status(self, step_id):
+        record = self.steps.get(step_id)
+        return None if record is None else record["status"]
+
+
+###############
+# orchestrator
+
+class FleetDeployer:
+    """Sends the steps of `plan`, see the module docstring.
+
+    `senders` are brownie accounts: local accounts sign the transactions,
+    accounts unlocked on the node (dev chain) go through eth_sendTransaction.
+    """
+
+    def __init__(self, steps, senders, progress=PROGRESS, gas_price=None, gas_limits=None,
+                 max_pending=MAX_PENDING, poll_interval=POLL_INTERVAL, uri=None):
+        self.steps = {step.id: step for step in steps}
+        self.order = [step.id for step in steps]
+        self.keys = {to_checksum_address(str(s)): getattr(s, "private_key", None) for s in senders}
+        self.gas_price = gas_price
+        self.gas_limits = dict(GAS_LIMITS, **(gas_limits or {}))
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.uri = uri
+        self.chain_id = int(request("eth_chainId", [], uri), 16)
+        self.progress = Progress(progress, self.chain_id)
+        self.nonces = {}
+
+    def _request(self, method, params):
+        return request(method, params, self.uri)
+
+    def _record(self, step_id):
+        return self.progress.steps.get(step_id)
+
+    def address(self, value):
+        if isinstance(value, Ref):
+            return self._record(value.step)["address"]
+        if isinstance(value, (list, tuple)):
+            return [self.address(v) for v in value]
+        return value
+
+    def _dependents(self, step_ids):
+        """`step_ids` and every step depending on them, transitively"""
+        found = set(step_ids)
+        for step_id in self.order:
+            if any(dep in found for dep in self.steps[step_id].deps):
+                found.add(step_id)
+        return found
+
+    def _recover(self):
+        """Settle the steps a previous run left pending, forget the ones that have to run again"""
+        # nonces are read before the receipts, a transaction mined in between is broadcast again harmlessly
+        counts = dict(zip(self.keys, batch_request(
+            [("eth_getTransactionCount", [sender, "latest"]) for sender in self.keys], self.uri)))
+        self._poll([s for s, r in self.progress.steps.items() if r["status"] == "pending"])
+        reset, rebroadcast = set(), []
+        for step_id, record in self.progress.steps.items():
+            if step_id not in self.steps or record["sender"] not in counts:
+                continue
+            if record["status"] == "failed":
+                reset.add(step_id)
+            elif record["status"] == "pending":
+                if record["nonce"] < int(counts[record["sender"]], 16):
+                    # the nonce is used but not by this transaction
+                    reset.add(step_id)
+                else:
+                    rebroadcast.append(step_id)
+        reset = self._dependents(reset)
+        for step_id in reset:
+            self.progress.steps.pop(step_id, None)
+        rebroadcast = sorted((s for s in rebroadcast if s not in reset), key=lambda s: self._record(s)["nonce"])
+        for step_id in rebroadcast:
+            self._broadcast([step_id], rebroadcast=True)
+        for sender, count in counts.items():
+            used = [r["nonce"] for r in self.progress.steps.values() if r["sender"] == sender]
+            self.nonces[sender] = max([int(count, 16)] + [n + 1 for n in used])
+        self.progress.save()
+
+    def _ready(self):
+        """Steps that can be sent now, in plan order"""
+        in_flight = {}
+        for record in self.progress.steps.values():
+            if record["status"] == "pending":
+                in_flight[record["sender"]] = in_flight.get(record["sender"], 0) + 1
+        ready = []
+        for step_id in self.order:
+            step = self.steps[step_id]
+            if self._record(step_id) is not None or in_flight.get(step.sender, 0) >= self.max_pending:
+                continue
+            statuses = [(self._record(d) or {}).get("status") for d in step.deps]
+            senders = [(self._record(d) or {}).get("sender") for d in step.deps]
+            if all(status == "mined" or (status == "pending" and sender == step.sender)
+                   for status, sender in zip(statuses, senders)):
+                # assign the nonce now so the steps after it see the predicted address
+                self._assign(step)
+                ready.append(step_id)
+                in_flight[step.sender] = in_flight.get(step.sender, 0) + 1
+        return ready
+
+    def _assign(self, step):
+        nonce = self.nonces[step.sender]
+        self.nonces[step.sender] = nonce + 1
+        if step.deploys:
+            abi = next((item for item in load_abi(step.contract) if item["type"] == "constructor"), {"inputs": []})
+            types = [i["type"] for i in abi["inputs"]]
+            data = load_bytecode(step.contract) + (encode(types, self.address(list(step.args))).hex() if types else "")
+            to, address, gas = None, create_address(step.sender, nonce), self.gas_limits.get(step.contract)
+        else:
+            data = encode_call(step.signature, self.address(list(step.args)))
+            to, address, gas = self.address(step.to), None, self.gas_limits["call"]
+        tx = {"from": step.sender, "nonce": nonce, "gas": gas or self.gas_limits["call"], "value": 0,
+              "data": data, "gasPrice": self.gas_price, "chainId": self.chain_id}
+        if to is not None:
+            tx["to"] = to
+        key = self.keys[step.sender]
+        record = {"sender": step.sender, "nonce": nonce, "address": address, "hash": None, "status": "pending"}
+        if key is None:
+            record["tx"] = tx
+        else:
+            signed = Account.sign_transaction({k: v for k, v in tx.items() if k != "from"}, key)
+            raw = getattr(signed, "raw_transaction", None) or signed.rawTransaction
+            record["tx"] = "0x" + bytes(raw).hex()
+            record["hash"] = "0x" + bytes(signed.hash).hex()
+        self.progress.steps[step.id] = record
+
+    def _broadcast(self, step_ids, rebroadcast=False):
+        calls = []
+        for step_id in step_ids:
+            tx = self._record(step_id)["tx"]
+            if isinstance(tx, str):
+                calls.append(("eth_sendRawTransaction", [tx]))
+            else:
+                calls.append(("eth_sendTransaction", [{
+                    k: hex(v) if isinstance(v, int) else v for k, v in tx.items() if k != "chainId"}]))
+        for step_id, result in zip(step_ids, batch_request(calls, self.uri)):
+            if isinstance(result, RPCError):
+                if rebroadcast:
+                    # "already known", or mined in the meantime, the receipt poll settles it
+                    continue
+                raise result
+            self._record(step_id)["hash"] = result
+
+    def _poll(self, step_ids):
+        """Record the receipts of the mined steps among `step_ids`"""
+        step_ids = [s for s in step_ids if self._record(s)["hash"]]
+        receipts = batch_request(
+            [("eth_getTransactionReceipt", [self._record(s)["hash"]]) for s in step_ids], self.uri)
+        settled = []
+        for step_id, receipt in zip(step_ids, receipts):
+            if receipt is None or isinstance(receipt, RPCError):
+                continue
+            record = self._record(step_id)
+            record["status"] = "mined" if int(receipt["status"], 16) == 1 else "failed"
+            # settled transactions are never sent again, this keeps the file small
+            record.pop("tx", None)
+            record["block"] = int(receipt["blockNumber"], 16)
+            if receipt.get("contractAddress"):
+                record["address"] = to_checksum_address(receipt["contractAddress"])
+            settled.append(step_id)
+        return settled
+
+    def run(self):
+        """Send every step, returns `addresses()`; raises `DeployError` once the pending steps settle after a revert"""
+        self._recover()
+        if self.gas_price is None:
+            self.gas_price = int(self._request("eth_gasPrice", []), 16)
+        while True:
+            failed = [s for s in self.order if self.progress.status(s) == "failed"]
+            wave = [] if failed else self._ready()
+            if wave:
+                # nonces and signed transactions are on disk before anything is sent
+                self.progress.save()
+                self._broadcast(wave)
+                self.progress.save()
+            pending = [s for s in self.order if self.progress.status(s) == "pending"]
+            settled = self._poll(pending)
+            if settled:
+                self.progress.save()
+            if len(settled) == len(pending) and (failed or all(self.progress.status(s) == "mined" for s in self.order)):
+                if failed:
+                    raise DeployError(failed)
+                return self.addresses()
+            if not wave and not settled:
+                time.sleep(self.poll_interval)
+
+    def addresses(self):
+        """`{safe or "shared": {contract: address}}` of the mined deployments"""
+        result = {}
+        for step_id in self.order:
+            record = self._record(step_id)
+            if self.steps[step_id].deploys and record and record["status"] == "mined":
+                group, name = step_id.split(":", 1)
+                result.setdefault(group, {})[name] = record["address"]
+        return result
+
+
+def deploy_fleet(manifest, senders, progress=PROGRESS, **kwargs):
+    return FleetDeployer(plan(manifest, senders), senders, progress, **kwargs).run()
+
+
+def main(manifest, progress=PROGRESS, output=OUTPUT):
+    from brownie import accounts, config
+
+    dev = accounts.from_mnemonic(config["wallets"]["from_mnemonic"])
+    manifest = json.loads(Path(manifest).read_text())
+    start = time.perf_counter()
+    addresses = deploy_fleet(manifest, [dev], progress)
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(addresses, indent=2, sort_keys=True))
+    print("{} safes deployed in {:.0f}s, addresses in {}".format(
+        len(addresses) - (SHARED in addresses), time.perf_counter() - start, output))
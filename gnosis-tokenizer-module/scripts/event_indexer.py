@@ -0,0 +1,324 @@
+"""Streaming indexer for the module events, backed by a local columnar store.
+
+Indexed events:
+ - DaaTokenizer: DepositReceived, Withdrawal
+ - DaaModule (withdrawal module): ExecuteTransfer
+ - DaaDsaModule: TransactionExecuted, ApproveHash, AccountCreated
+
+Logs are pulled in block range chunks, decoded with the compiled ABIs and
+committed chunk by chunk. The store keeps one fixed width file per column, the
+last indexed block and the hashes of the most recent blocks; on restart it
+resumes from that checkpoint and a changed block hash rolls the store back to
+the fork point.
+
+    brownie run scripts/event_indexer.py main <store dir> tokenizer:<address> dsa:<address> ...
+"""
+import json
+import os
+import time
+from bisect import bisect_right
+from pathlib import Path
+
+from eth_utils import to_checksum_address
+
+from scripts.artifacts import load_abi
+from scripts.logs import CHUNK_SIZE, EventDecoder, get_logs
+from scripts.rpc import Batch, RPCError, batch_request, block_tag, request
+
+KINDS = {
+    "tokenizer": ("DaaTokenizer", ("DepositReceived", "Withdrawal")),
+    "withdrawal": ("DaaModule", ("ExecuteTransfer",)),
+    "dsa": ("DaaDsaModule", ("TransactionExecuted", "ApproveHash", "AccountCreated")),
+}
+# getter returning the safe of the emitting contract, for events without a `safe` arg
+SAFE_GETTERS = {"tokenizer": "_safe()", "withdrawal": "_safe()", "dsa": "safe()"}
+
+REORG_DEPTH = 64
+NO_ADDRESS = 2**32 - 1
+
+
+def _width(type_):
+    if type_ == "address":
+        return 4  # id in the store's address dictionary
+    if type_ == "bool":
+        return 1
+    if type_.startswith("uint") or type_.startswith("int"):
+        return int(type_.lstrip("uint") or 256) // 8
+    if type_.startswith("bytes") and type_ != "bytes":
+        return int(type_[5:])
+    raise TypeError("unsupported column type {}".format(type_))
+
+
+class Column:
+    """Fixed width values kept in memory and appended to a file on flush."""
+
+    def __init__(self, path, width, rows):
+        self.path = path
+        self.width = width
+        self.data = bytearray(path.read_bytes()[:rows * width] if path.exists() else b"")
+        self.flushed = len(self.data)
+
+    def __len__(self):
+        return len(self.data) // self.width
+
+    def append(self, raw):
+        self.data += raw
+
+    def get(self, row):
+        return bytes(self.data[row * self.width:(row + 1) * self.width])
+
+    def truncate(self, rows):
+        del self.data[rows * self.width:]
+        self.flushed = min(self.flushed, len(self.data))
+
+    def flush(self):
+        mode = "r+b" if self.path.exists() else "wb"
+        with self.path.open(mode) as fp:
+            fp.seek(self.flushed)
+            fp.write(self.data[self.flushed:])
+            fp.truncate(len(self.data))
+        self.flushed = len(self.data)
+
+
+class Table:
+    """One event type: block/log position columns, emitter, safe and the event args."""
+
+    BASE_COLUMNS = [("block", "uint64"), ("log_index", "uint32"), ("tx_hash", "bytes32"), ("emitter", "address"), ("safe", "address")]
+
+    def __init__(self, root, name, schema, rows):
+        self.name = name
+        self.schema = schema
+        directory = root / name
+        directory.mkdir(parents=True, exist_ok=True)
+        self.columns = {col: Column(directory / (col + ".col"), _width(type_), rows) for col, type_ in schema}
+        self.blocks = [int.from_bytes(self.columns["block"].get(i), "big") for i in range(rows)]
+        self.by_safe = {}
+        for i in range(rows):
+            self.by_safe.setdefault(self.columns["safe"].get(i), []).append(i)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def truncate_after(self, block):
+        rows = bisect_right(self.blocks, block)
+        for col in self.columns.values():
+            col.truncate(rows)
+        del self.blocks[rows:]
+        for key, ids in self.by_safe.items():
+            self.by_safe[key] = [i for i in ids if i < rows]
+
+
+class ColumnStore:
+    def __init__(self, path):
+        self.root = Path(path)
+        self.root.mkdir(parents=True, exist_ok=True)
+        checkpoint = self.root / "checkpoint.json"
+        self.state = json.loads(checkpoint.read_text()) if checkpoint.exists() else {
+            "block": None, "hashes": [], "rows": {}, "schemas": {}, "addresses": 0}
+        self.addresses = Column(self.root / "addresses.col", 20, self.state["addresses"])
+        self.address_ids = {self.addresses.get(i): i for i in range(len(self.addresses))}
+        self.tables = {
+            name: Table(self.root, name, [tuple(c) for c in schema], self.state["rows"].get(name, 0))
+            for name, schema in self.state["schemas"].items()
+        }
+
+    @property
+    def block(self):
+        return self.state["block"]
+
+    def table(self, name, inputs):
+        if name not in self.tables:
+            schema = Table.BASE_COLUMNS + [(i["name"], i["type"]) for i in inputs if i["name"] != "safe"]
+            self.state["schemas"][name] = schema
+            self.tables[name] = Table(self.root, name, schema, 0)
+        return self.tables[name]
+
+    def address_id(self, address):
+        raw = bytes.fromhex(address[2:])
+        if raw not in self.address_ids:
+            self.address_ids[raw] = len(self.addresses)
+            self.addresses.append(raw)
+        return self.address_ids[raw]
+
+    def encode(self, type_, value):
+        if type_ == "address":
+            return (NO_ADDRESS if value is None else self.address_id(value)).to_bytes(4, "big")
+        if type_ == "bool":
+            return bytes([bool(value)])
+        if type_.startswith("int"):
+            return (value % 2**(8 * _width(type_))).to_bytes(_width(type_), "big")
+        if type_.startswith("uint"):
+            return value.to_bytes(_width(type_), "big")
+        return bytes(value)
+
+    def decode(self, type_, raw):
+        if type_ == "address":
+            i = int.from_bytes(raw, "big")
+            return None if i == NO_ADDRESS else to_checksum_address(self.addresses.get(i))
+        if type_ == "bool":
+            return bool(raw[0])
+        if type_.startswith("uint"):
+            return int.from_bytes(raw, "big")
+        if type_.startswith("int"):
+            return int.from_bytes(raw, "big", signed=True)
+        return "0x" + raw.hex()
+
+    def insert(self, name, row):
+        table = self.tables[name]
+        i = len(table)
+        for col, type_ in table.schema:
+            table.columns[col].append(self.encode(type_, row.get(col)))
+        table.blocks.append(row["block"])
+        table.by_safe.setdefault(table.columns["safe"].get(i), []).append(i)
+
+    def rows(self, name, safe=None, from_block=0, to_block=None):
+        table = self.tables.get(name)
+        if table is None:
+            return []
+        if safe is not None:
+            key = self.address_ids.get(bytes.fromhex(str(safe)[2:]))
+            ids = table.by_safe.get(None if key is None else key.to_bytes(4, "big"), [])
+        else:
+            ids = range(len(table))
+        to_block = float("inf") if to_block is None else to_block
+        rows = []
+        for i in ids:
+            if from_block <= table.blocks[i] <= to_block:
+                rows.append({col: self.decode(type_, table.columns[col].get(i)) for col, type_ in table.schema})
+        return rows
+
+    def rollback(self, block):
+        """Drop every row above `block`."""
+        for table in self.tables.values():
+            table.truncate_after(block)
+        self.state["hashes"] = [h for h in self.state["hashes"] if h[0] <= block]
+        self.state["block"] = block
+
+    def commit(self, block, hashes):
+        """Flush the columns, then atomically move the checkpoint to `block`."""
+        for table in self.tables.values():
+            for col in table.columns.values():
+                col.flush()
+        self.addresses.flush()
+        known = dict(self.state["hashes"])
+        known.update(hashes)
+        self.state["hashes"] = sorted(known.items())[-REORG_DEPTH:]
+        self.state["block"] = block
+        self.state["rows"] = {name: len(table) for name, table in self.tables.items()}
+        self.state["addresses"] = len(self.addresses)
+        tmp = self.root / "checkpoint.json.tmp"
+        tmp.write_text(json.dumps(self.state))
+        os.replace(tmp, self.root / "checkpoint.json")
+
+
+class EventIndexer:
+    """Index the events of `sources` (`{address: kind}`) into a ColumnStore.
+
+    `abis` overrides the compiled artifact per kind (e.g. `{"tokenizer": DaaTokenizer.abi}`)
+    and `safes` the safe of an emitter; otherwise it is read from the contract.
+    """
+
+    def __init__(self, path, sources, start_block=0, abis=None, safes=None, confirmations=0, chunk_size=CHUNK_SIZE, uri=None):
+        self.store = ColumnStore(path)
+        self.sources = {to_checksum_address(str(a)): kind for a, kind in sources.items()}
+        self.start_block = start_block
+        self.confirmations = confirmations
+        self.chunk_size = chunk_size
+        self.uri = uri
+        abis = abis or {}
+        kinds = set(self.sources.values())
+        self.decoder = EventDecoder(*[abis.get(kind) or load_abi(KINDS[kind][0]) for kind in kinds])
+        names = {name for kind in kinds for name in KINDS[kind][1]}
+        self.topics = self.decoder.topics(names)
+        self.safes = {to_checksum_address(str(a)): to_checksum_address(str(s)) for a, s in (safes or {}).items()}
+        self._resolve_safes()
+
+    def _resolve_safes(self):
+        batch = Batch(uri=self.uri)
+        missing = [a for a in self.sources if a not in self.safes]
+        reads = [batch.call(a, SAFE_GETTERS[self.sources[a]], returns=("address",)) for a in missing]
+        values = batch.execute()
+        for address, i in zip(missing, reads):
+            if not isinstance(values[i], RPCError):
+                self.safes[address] = values[i]
+
+    def _block_hashes(self, numbers):
+        results = batch_request([("eth_getBlockByNumber", [block_tag(n), False]) for n in numbers], self.uri)
+        return {n: (None if isinstance(r, RPCError) or r is None else r["hash"]) for n, r in zip(numbers, results)}
+
+    def check_reorg(self):
+        """Roll back to the last block whose hash is unchanged, returns the fork block or None."""
+        stored = self.store.state["hashes"]
+        if not stored:
+            return None
+        current = self._block_hashes([n for n, _ in stored])
+        if current[stored[-1][0]] == stored[-1][1]:
+            return None
+        fork = stored[0][0] - 1
+        for number, stored_hash in reversed(stored):
+            if current[number] == stored_hash:
+                fork = number
+                break
+        self.store.rollback(fork)
+        return fork
+
+    def sync(self, to_block=None):
+        """Index up to `to_block` (default head minus confirmations), returns the number of new rows."""
+        self.check_reorg()
+        if to_block is None:
+            to_block = int(request("eth_blockNumber", [], self.uri), 16) - self.confirmations
+        from_block = self.start_block if self.store.block is None else self.store.block + 1
+        if from_block > to_block:
+            return 0
+        added = 0
+        # one chunk at a time, each committed with the checkpoint so a crashed backfill resumes from the last chunk
+        for low in range(from_block, to_block + 1, self.chunk_size):
+            high = min(low + self.chunk_size - 1, to_block)
+            for log in get_logs(list(self.sources), [self.topics], low, high, self.chunk_size, self.uri):
+                added += self._insert(log)
+            window = range(max(low, to_block - REORG_DEPTH + 1), high + 1)
+            self.store.commit(high, self._block_hashes(list(window)) if window else {})
+        return added
+
+    def _insert(self, log):
+        decoded = self.decoder.decode(log)
+        emitter = to_checksum_address(log["address"])
+        if decoded is None or emitter not in self.sources:
+            return 0
+        name, args = decoded
+        inputs = self.decoder.events[log["topics"][0]]["inputs"]
+        self.store.table(name, inputs)
+        row = dict(args)
+        row.update({
+            "block": int(log["blockNumber"], 16),
+            "log_index": int(log["logIndex"], 16),
+            "tx_hash": bytes.fromhex(log["transactionHash"][2:]),
+            "emitter": emitter,
+            "safe": args.get("safe", self.safes.get(emitter)),
+        })
+        self.store.insert(name, row)
+        return 1
+
+    def run(self, poll_interval=2):
+        while True:
+            self.sync()
+            time.sleep(poll_interval)
+
+    def share_issuance(self, safe):
+        """Shares minted on deposit (+) and burned on redemption (-), in block order."""
+        history = [
+            (r["block"], r["log_index"], r["sharesIssued"], r) for r in self.store.rows("DepositReceived", safe)
+        ] + [
+            (r["block"], r["log_index"], -r["nOfShares"], r) for r in self.store.rows("Withdrawal", safe)
+        ]
+        return [(block, shares, row) for block, _, shares, row in sorted(history, key=lambda h: h[:2])]
+
+    def withdrawal_ledger(self, safe):
+        """Tokenizer redemptions and withdrawal module transfers of a safe, in block order."""
+        rows = self.store.rows("Withdrawal", safe) + self.store.rows("ExecuteTransfer", safe)
+        return sorted(rows, key=lambda r: (r["block"], r["log_index"]))
+
+
+def main(path, *sources):
+    indexer = EventIndexer(path, dict(reversed(s.split(":", 1)) for s in sources))
+    indexer.run()
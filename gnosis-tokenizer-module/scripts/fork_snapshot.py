@@ -0,0 +1,29 @@
+"""Record/replay snapshot of the remote state read by forked test runs.
+
+The proxy is shared with gnosis-withdrawal-module and lives in
+brownie-shared/fork_snapshot.py, this module puts it on `sys.path` for the
+tokenizer scripts and tests.
+"""
+import sys
+
+from scripts.artifacts import SHARED_ROOT
+
+if str(SHARED_ROOT) not in sys.path:
+    sys.path.append(str(SHARED_ROOT))
+
+from fork_snapshot import (  # noqa: E402
+    SET_CODE,
+    SET_STORAGE,
+    Snapshot,
+    SnapshotProxy,
+    SnapshotSession,
+    balance_slot,
+    set_code,
+    set_storage,
+    use_snapshot,
+)
+
+__all__ = [
+    "SET_CODE", "SET_STORAGE", "Snapshot", "SnapshotProxy", "SnapshotSession",
+    "balance_slot", "set_code", "set_storage", "use_snapshot",
+]
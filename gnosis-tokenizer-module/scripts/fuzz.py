@@ -0,0 +1,478 @@
+"""Differential fuzzer of DaaTokenizer against scripts/tokenizer_model.py.
+
+Random operation sequences (deposits and redemptions of every currency,
+withdrawToSafe, token mints/burns, share transfers, oracle answers and
+connector positions) are applied to the reference model and to a fund on
+the dev chain. After every operation the outcome (success or revert) and
+the full observation (NAV, price per share, share supply and balances, token
+balances of the users, safe and tokenizer) must match to the wei.
+
+The fund is deployed once; each sequence runs from an `evm_snapshot` and is
+rolled back with `evm_revert`. Transactions are sent with raw
+`eth_sendTransaction` requests (no brownie transaction objects), operations
+the model expects to revert are only checked with `eth_call`, and the
+receipts and per block observations of a whole sequence are read in one
+batch. A divergence is shrunk (truncated, operations removed, arguments
+simplified) before it is reported.
+
+    brownie run scripts/fuzz.py main <sequences> <length> <seed>
+"""
+import json
+import random
+import time
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+from brownie import (
+    DaaTokenizer,
+    MockConnector,
+    MockERC20,
+    MockSafe,
+    MockV3Aggregator,
+    OracleHandler,
+    PositionManager,
+    TokenizedShare,
+    accounts,
+)
+
+from scripts.artifacts import PROJECT_ROOT
+from scripts.benchmark import deploy_usdc
+from scripts.quotes import QuoteError
+from scripts.rpc import Batch, RPCError, batch_request, encode_call, request
+from scripts.tokenizer_model import REVERT, FundConfig, TokenizerModel
+
+OUTPUT = PROJECT_ROOT / "reports/fuzz.json"
+GAS = 2_000_000
+MAX_UINT = 2**256 - 1
+MAX_SHRINK_CHECKS = 400
+
+WEIGHTS = {
+    "deposit": 30,
+    "redeem": 20,
+    "mint": 15,
+    "setPrice": 10,
+    "setPosition": 10,
+    "burn": 5,
+    "transferShares": 5,
+    "withdrawToSafe": 5,
+}
+
+
+@dataclass(frozen=True)
+class Op:
+    kind: str
+    sender: str
+    args: tuple
+
+    def __str__(self):
+        return "{}({}) from {}".format(self.kind, ", ".join(str(a) for a in self.args), self.sender)
+
+
+@dataclass
+class Divergence:
+    index: int
+    op: Op
+    field: object  # "outcome" or an observation key
+    model: object
+    chain: object
+
+    def __str__(self):
+        return "op {} {}: {} model {} chain {}".format(self.index, self.op, self.field, self.model, self.chain)
+
+
+###############
+# fund
+
+def deploy_fixture():
+    """Fund with USDC and USDT as base currencies, WETH and an 8 decimals token priced by feeds, one connector"""
+    dev = accounts[0]
+    owners = [accounts[0].address, accounts[4].address]
+    users = [a.address for a in accounts[1:4]]
+    usdc = deploy_usdc(dev)
+    safe = MockSafe.deploy(owners, {'from': dev})
+    connector = MockConnector.deploy({'from': dev})
+    tokenizer = DaaTokenizer.deploy({'from': dev})
+    tokenizedShare = TokenizedShare.deploy(tokenizer, {'from': dev})
+    oracleHandler = OracleHandler.deploy({'from': dev})
+    positionManager = PositionManager.deploy(safe, ["MOCK"], [connector], {'from': dev})
+    tokenizer.initialize(safe, {'from': dev})
+    tokenizer.setPositionManager(positionManager, {'from': dev})
+    tokenizer.setTokenizedShare(tokenizedShare, {'from': dev})
+    tokenizer.setOracleHandler(oracleHandler, {'from': dev})
+    usdt = MockERC20.deploy("Tether USD", "USDT", 6, {'from': dev})
+    tokenizer.addSupportedCurrency("USDT", usdt, True, {'from': dev})
+    tickers = {"USDC": usdc.address, "USDT": usdt.address}
+    feeds = {}
+    for symbol, decimals, price in (("WETH", 18, 2000), ("WBTC", 8, 30000)):
+        token = MockERC20.deploy(symbol, symbol, decimals, {'from': dev})
+        feed = MockV3Aggregator.deploy(8, price * 10**8, {'from': dev})
+        tokenizer.addSupportedCurrency(symbol, token, False, {'from': dev})
+        oracleHandler.addTokenOracle(token, feed, {'from': dev})
+        tickers[symbol] = token.address
+        feeds[token.address] = (feed.address, 8)
+    decimals = {}
+    for token in tickers.values():
+        token = MockERC20.at(token)
+        decimals[token.address] = token.decimals()
+        for user in users:
+            token.mint(user, 10**6 * 10**decimals[token.address], {'from': dev})
+            token.approve(tokenizer, MAX_UINT, {'from': user})
+    return FundConfig(
+        tokenizer=tokenizer.address, safe=safe.address, tokenized_share=tokenizedShare.address,
+        connector=connector.address, owners=owners, users=users, tickers=tickers,
+        assets=list(tickers.values()), base_currencies=[usdc.address, usdt.address],
+        decimals=decimals, feeds=feeds,
+    )
+
+
+def observation_keys(config):
+    keys = ["nav", "pps", "supply"]
+    keys += [("shares", user) for user in config.users]
+    keys += [("balance", token, holder) for token in config.decimals for holder in config.holders]
+    return keys
+
+
+def observe_into(batch, config):
+    """Queue the reads of `observation_keys` on `batch`, at `batch.block`"""
+    batch.call(config.tokenizer, "calculateNav()")
+    batch.call(config.tokenizer, "getPricePerShare()")
+    batch.call(config.tokenized_share, "totalSupply()")
+    for user in config.users:
+        batch.call(config.tokenized_share, "balanceOf(address)", [user])
+    for token in config.decimals:
+        for holder in config.holders:
+            batch.call(token, "balanceOf(address)", [holder])
+
+
+def observe_many(config, blocks, uri=None):
+    """The chain side of `TokenizerModel.observe` at each of `blocks`, in one batch"""
+    batch = Batch("latest", uri)
+    for block in blocks:
+        # Batch.call reads the block tag when the call is queued
+        batch.block = block
+        observe_into(batch, config)
+    values = batch.execute()
+    keys = observation_keys(config)
+    observations = []
+    for start in range(0, len(values), len(keys)):
+        observation = {}
+        for key, value in zip(keys, values[start:start + len(keys)]):
+            if isinstance(value, RPCError):
+                if key not in ("nav", "pps"):
+                    raise value
+                value = REVERT
+            observation[key] = value
+        observations.append(observation)
+    return observations
+
+
+def read_model(config, uri=None):
+    """`TokenizerModel` of the fund as it is on chain"""
+    batch = Batch("latest", uri)
+    rounds = {
+        token: batch.call(feed, "latestRoundData()", returns=("uint80", "int256", "uint256", "uint256", "uint80"))
+        for token, (feed, _) in config.feeds.items()
+    }
+    positions = {
+        token: (
+            batch.call(config.connector, "grossValues(address,address)", [token, config.safe]),
+            batch.call(config.connector, "grossDebts(address,address)", [token, config.safe]),
+        )
+        for token in config.assets
+    }
+    values = batch.execute()
+    answers = {token: values[i][1] for token, i in rounds.items()}
+    positions = {token: (values[v], values[d]) for token, (v, d) in positions.items()}
+    return TokenizerModel.from_observation(config, observe_many(config, ["latest"], uri)[0], answers, positions)
+
+
+def transaction(config, op):
+    """`(to, calldata)` of an operation"""
+    kind, args = op.kind, op.args
+    if kind == "deposit":
+        return config.tokenizer, encode_call("deposit(string,uint256)", args)
+    if kind == "redeem":
+        return config.tokenizer, encode_call("redeem(uint256)", args)
+    if kind == "withdrawToSafe":
+        return config.tokenizer, encode_call("withdrawToSafe(address,uint256)", args)
+    if kind in ("mint", "burn"):
+        return args[0], encode_call("{}(address,uint256)".format(kind), args[1:])
+    if kind == "transferShares":
+        return config.tokenized_share, encode_call("transfer(address,uint256)", args)
+    if kind == "setPrice":
+        return config.feeds[args[0]][0], encode_call("updateAnswer(int256)", args[1:])
+    if kind == "setPosition":
+        token, value, debt = args
+        return config.connector, encode_call("setPosition(address,address,uint256,uint256)", [token, config.safe, value, debt])
+    raise ValueError("unknown operation {}".format(kind))
+
+
+def apply(model, op):
+    """Apply `op` to the model, False if it reverts"""
+    kind, args = op.kind, op.args
+    try:
+        if kind == "deposit":
+            model.deposit(op.sender, *args)
+        elif kind == "redeem":
+            model.redeem(op.sender, *args)
+        elif kind == "withdrawToSafe":
+            model.withdraw_to_safe(op.sender, *args)
+        elif kind == "mint":
+            model.mint(*args)
+        elif kind == "burn":
+            model.burn(*args)
+        elif kind == "transferShares":
+            model.transfer_shares(op.sender, *args)
+        elif kind == "setPrice":
+            model.set_price(*args)
+        elif kind == "setPosition":
+            model.set_position(*args)
+        else:
+            raise ValueError("unknown operation {}".format(kind))
+    except QuoteError:
+        return False
+    return True
+
+
+###############
+# generation
+
+class Generator:
+    """Random operations, amounts are biased towards the boundaries of the current model state"""
+
+    def __init__(self, config, rng):
+        self.config = config
+        self.rng = rng
+        self.kinds = list(WEIGHTS)
+        self.weights = list(WEIGHTS.values())
+
+    def amount(self, available, decimals):
+        rng = self.rng
+        unit = 10**decimals
+        return rng.choice([
+            0, 1, available, available + 1, available - 1 if available else 0,
+            rng.randint(0, available), rng.randint(0, available),
+            unit * rng.choice((1, 10, 1000)), rng.randint(1, 10**6 * unit),
+        ])
+
+    def op(self, model):
+        rng, config = self.rng, self.config
+        kind = rng.choices(self.kinds, self.weights)[0]
+        user = rng.choice(config.users)
+        admin = config.owners[0]
+        if kind == "deposit":
+            ticker = rng.choice(list(config.tickers))
+            token = config.tickers[ticker]
+            return Op(kind, user, (ticker, self.amount(model.balance(token, user), config.decimals[token])))
+        if kind == "redeem":
+            holders = [u for u in config.users if model.shares.get(u, 0)]
+            user = rng.choice(holders) if holders else user
+            return Op(kind, user, (self.amount(model.shares.get(user, 0), 6),))
+        if kind == "withdrawToSafe":
+            token = rng.choice(config.assets)
+            sender = rng.choice(config.owners + [user])
+            return Op(kind, sender, (token, self.amount(model.balance(token, config.tokenizer), config.decimals[token])))
+        if kind == "mint":
+            # most mints fund the base currency buffer of the tokenizer, redemptions are paid from it
+            if rng.random() < 0.6:
+                token, holder = rng.choice(config.base_currencies), config.tokenizer
+            else:
+                token, holder = rng.choice(config.assets), rng.choice([config.tokenizer, config.safe, user])
+            return Op(kind, admin, (token, holder, self.amount(10**8 * 10**config.decimals[token], config.decimals[token])))
+        if kind == "burn":
+            token = rng.choice(config.assets)
+            holder = rng.choice([config.tokenizer, config.safe, user])
+            return Op(kind, admin, (token, holder, self.amount(model.balance(token, holder), config.decimals[token])))
+        if kind == "transferShares":
+            receiver = rng.choice(config.users)
+            return Op(kind, user, (receiver, self.amount(model.shares.get(user, 0), 6)))
+        if kind == "setPrice":
+            token = rng.choice(list(config.feeds))
+            answer = model.answers[token]
+            return Op(kind, admin, (token, rng.choice([
+                0, 1, -1, answer + 1, answer - 1, answer * 2, answer // 3, rng.randint(1, 10**13),
+            ])))
+        token = rng.choice(config.assets)
+        unit = 10**config.decimals[token]
+        value = rng.choice([0, rng.randint(0, 10**4 * unit)])
+        # a debt above the value makes every NAV read revert until the position is set again
+        debt = value + 1 if rng.random() < 0.1 else rng.choice([0, value, rng.randint(0, value)])
+        return Op("setPosition", admin, (token, value, debt))
+
+    def sequence(self, model, length):
+        model = model.copy()
+        ops = []
+        for _ in range(length):
+            op = self.op(model)
+            apply(model, op)
+            ops.append(op)
+        return ops
+
+
+###############
+
+def _simpler(value):
+    """Candidates closer to zero than `value`, simplest first"""
+    sign = -1 if value < 0 else 1
+    magnitude = abs(value)
+    candidates = [0, 1, 10 ** (len(str(magnitude)) - 1), magnitude // 2, magnitude - 1]
+    seen = []
+    for c in candidates:
+        if c < magnitude and sign * c not in seen:
+            seen.append(sign * c)
+    return seen
+
+
+class Fuzzer:
+    def __init__(self, config, seed=0, uri=None):
+        self.config = config
+        self.uri = uri
+        self.rng = random.Random(seed)
+        self.generator = Generator(config, self.rng)
+        self.model = read_model(config, uri)
+        self.checks = 0
+        self.ops = 0
+        self._snapshot = request("evm_snapshot", [], uri)
+
+    def _rollback(self):
+        request("evm_revert", [self._snapshot], self.uri)
+        self._snapshot = request("evm_snapshot", [], self.uri)
+
+    def close(self):
+        """Back to the state the fuzzer started from"""
+        request("evm_revert", [self._snapshot], self.uri)
+
+    def _chain(self, ops, expected):
+        """Outcome per operation, and the observation after every successful one"""
+        outcomes = []
+        for op, ok in zip(ops, expected):
+            to, data = transaction(self.config, op)
+            params = {"from": op.sender, "to": to, "data": data, "gas": hex(GAS)}
+            if ok:
+                result = batch_request([("eth_sendTransaction", [params])], self.uri)[0]
+            else:
+                result = batch_request([("eth_call", [params, "latest"])], self.uri)[0]
+                result = result if isinstance(result, RPCError) else False
+            outcomes.append(result)
+        hashes = [o for o in outcomes if isinstance(o, str)]
+        receipts = batch_request([("eth_getTransactionReceipt", [h]) for h in hashes], self.uri)
+        receipts = dict(zip(hashes, receipts))
+        results = []
+        for outcome in outcomes:
+            if outcome is False:
+                # expected to revert and the call succeeded
+                results.append((True, None))
+            elif isinstance(outcome, RPCError):
+                results.append((False, None))
+            else:
+                receipt = receipts[outcome]
+                if isinstance(receipt, RPCError) or receipt is None or int(receipt["status"], 16) != 1:
+                    results.append((False, None))
+                else:
+                    results.append((True, int(receipt["blockNumber"], 16)))
+        # observations are read at the block of each operation, all in one batch
+        blocks = [block for _, block in results if block is not None]
+        observations = dict(zip(blocks, observe_many(self.config, blocks, self.uri)))
+        self.ops += len(ops)
+        return [(ok, observations.get(block)) for ok, block in results]
+
+    def check(self, ops):
+        """First divergence of `ops` between the model and the chain, None if they agree"""
+        self.checks += 1
+        model = self.model.copy()
+        expected = []
+        observations = []
+        for op in ops:
+            expected.append(apply(model, op))
+            observations.append(model.observe() if expected[-1] else None)
+        try:
+            actual = self._chain(ops, expected)
+        finally:
+            self._rollback()
+        for i, (op, ok, want, (got_ok, got)) in enumerate(zip(ops, expected, observations, actual)):
+            if ok != got_ok:
+                return Divergence(i, op, "outcome", ok, got_ok)
+            if want is None or got is None:
+                continue
+            for key, value in want.items():
+                if got[key] != value:
+                    return Divergence(i, op, key, value, got[key])
+        return None
+
+    def shrink(self, ops, divergence, max_checks=MAX_SHRINK_CHECKS):
+        """Smaller sequence with a divergence: truncated, operations removed, then arguments simplified"""
+        budget = self.checks + max_checks
+        ops = ops[:divergence.index + 1]
+        chunk = max(len(ops) // 2, 1)
+        while chunk >= 1:
+            i = 0
+            while i < len(ops) and self.checks < budget:
+                found = self.check(ops[:i] + ops[i + chunk:])
+                if found:
+                    ops, divergence = (ops[:i] + ops[i + chunk:])[:found.index + 1], found
+                else:
+                    i += chunk
+            chunk //= 2
+        improved = True
+        while improved and self.checks < budget:
+            improved = False
+            for i, op in enumerate(ops):
+                for j, arg in enumerate(op.args):
+                    if not isinstance(arg, int) or isinstance(arg, bool):
+                        continue
+                    for simpler in _simpler(arg):
+                        args = op.args[:j] + (simpler,) + op.args[j + 1:]
+                        candidate = ops[:i] + [replace(op, args=args)] + ops[i + 1:]
+                        found = self.check(candidate)
+                        if found:
+                            ops, divergence, improved = candidate[:found.index + 1], found, True
+                            break
+                    if improved or self.checks >= budget:
+                        break
+                if improved or self.checks >= budget:
+                    break
+        return ops, divergence
+
+    def run(self, sequences, length, max_divergences=1):
+        """Fuzz `sequences` random sequences, returns the shrunk `(ops, divergence)` found and the throughput"""
+        start = time.time()
+        found = []
+        generated = 0
+        for generated in range(1, sequences + 1):
+            ops = self.generator.sequence(self.model, length)
+            divergence = self.check(ops)
+            if divergence:
+                found.append(self.shrink(ops, divergence))
+                if len(found) >= max_divergences:
+                    break
+        seconds = time.time() - start
+        return found, {
+            "sequences": generated, "checks": self.checks, "operations": self.ops,
+            "seconds": round(seconds, 3), "sequences_per_minute": round(generated * 60 / seconds) if seconds else None,
+        }
+
+
+def main(sequences=1000, length=20, seed=0, output=OUTPUT):
+    config = deploy_fixture()
+    fuzzer = Fuzzer(config, int(seed))
+    try:
+        found, stats = fuzzer.run(int(sequences), int(length))
+    finally:
+        fuzzer.close()
+    print("{sequences} sequences ({checks} checks, {operations} operations) in {seconds}s, {sequences_per_minute} per minute".format(**stats))
+    for ops, divergence in found:
+        print("divergence: {}".format(divergence))
+        for op in ops:
+            print("  {}".format(op))
+    report = {
+        "stats": stats,
+        "divergences": [
+            {"divergence": str(divergence), "ops": [[op.kind, op.sender, list(op.args)] for op in ops]}
+            for ops, divergence in found
+        ],
+    }
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w") as fp:
+        json.dump(report, fp, indent=2)
+    return found
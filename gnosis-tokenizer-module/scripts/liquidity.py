@@ -0,0 +1,306 @@
+"""Redemption liquidity planner for the tokenizer buffer.
+
+`DaaTokenizer.redeem` pays `calcBaseAmount` out of the tokenizer's own base
+currency balances, greedily in `baseCurrencies` order, and reverts with "Not
+enough funds in tokenizer" when they fall short. `LiquidityPlanner` runs a
+queue of pending and forecast redemptions through the same math:
+
+ - each redemption is priced at the price per share left by the previous
+   ones (the fund's NAV drops by the base amount paid, the supply by the
+   shares burnt), exactly as the chain would execute the queue
+ - with distinct base currencies every redemption lowers the buffer by
+   exactly its base amount, so the queue succeeds as long as the buffer
+   covers the total demand; the minimal top-up is `demand - buffer`, taken
+   from the safe's base currency balances in `preference` order
+
+The per redemption base amounts and cumulative demand are cached: balance
+changes and buffer top-ups replan in O(base currencies), executed
+redemptions are dropped from the head, and only a change of NAV or supply,
+or an edit inside the queue, reprices the redemptions after it. `simulate`
+replays the queue with `withdraw_split` for the per currency payouts.
+
+`transactions` returns the top-ups as ERC20 transfers from the safe to the
+tokenizer, `safe_batch` in the Safe transaction builder JSON format.
+
+    brownie run scripts/liquidity.py main <tokenizer> <shares> [<shares> ...]
+"""
+import json
+from bisect import bisect_right
+from dataclasses import dataclass, field
+
+from brownie import web3
+from eth_utils import to_checksum_address
+
+from scripts.artifacts import PROJECT_ROOT
+from scripts.nav_engine import BASE_DECIMALS, NavEngine, fund_nav, price_per_share
+from scripts.quotes import QuoteError, base_amount, withdraw_split
+from scripts.rpc import encode_call
+
+OUTPUT = PROJECT_ROOT / "reports/liquidity_batch.json"
+
+
+@dataclass
+class Redemption:
+    shares: int
+    holder: str = None
+    forecast: bool = False
+
+
+@dataclass
+class TopUp:
+    token: str
+    amount: int
+
+
+@dataclass
+class Plan:
+    demand: int      # base amount of the whole queue
+    buffer: int      # base currency balances of the tokenizer
+    top_ups: list = field(default_factory=list)
+    # demand the safe cannot cover either, and the first redemption that would still revert for it
+    shortfall: int = 0
+    first_failure: int = None
+    # redemptions reverting whatever the buffer (no shares, more than the supply), not counted in the demand
+    reverts: dict = field(default_factory=dict)
+
+    @property
+    def total(self):
+        return sum(t.amount for t in self.top_ups)
+
+
+class LiquidityPlanner:
+    """Queue of redemptions against one fund.
+
+    `base_currencies` is the tokenizer's `baseCurrencies` list, `buffer` and
+    `safe_balances` map each of them to the tokenizer and safe balances.
+    `preference` orders the currencies top-ups are taken from, by default
+    `baseCurrencies` order (the order `_withdraw` drains the buffer).
+    """
+
+    def __init__(self, tokenizer, safe, nav, total_supply, base_currencies, buffer, safe_balances, preference=None):
+        self.tokenizer = to_checksum_address(str(tokenizer))
+        self.safe = to_checksum_address(str(safe))
+        self.nav = nav
+        self.total_supply = total_supply
+        self.base_currencies = list(base_currencies)
+        self.buffer = dict(buffer)
+        self.safe_balances = dict(safe_balances)
+        self.preference = list(dict.fromkeys(preference or self.base_currencies))
+        self.queue = []
+        # per priced redemption: base amount (None when it reverts), and the cumulative demand up to it,
+        # counted from `_paid` so that executed redemptions are dropped without rewriting the rest
+        self._amounts = []
+        self._demand = []
+        self._paid = 0
+        self._errors = {}
+        # nav and supply after the priced redemptions
+        self._after = (nav, total_supply)
+
+    @classmethod
+    def load(cls, tokenizer, block=None, preference=None, uri=None):
+        return cls.from_state(NavEngine([tokenizer], uri).fetch(block)[0], preference)
+
+    @classmethod
+    def from_state(cls, state, preference=None):
+        if state.error is not None:
+            raise QuoteError(None, state.error)
+        try:
+            nav = fund_nav(state)
+        except OverflowError as e:
+            raise QuoteError(None, str(e))
+        bases = set(state.base_currencies)
+        buffer = {a: b for a, b in zip(state.assets, state.tokenizer_balances) if a in bases}
+        safe_balances = {a: b for a, b in zip(state.assets, state.safe_balances) if a in bases}
+        return cls(state.tokenizer, state.safe, nav, state.total_supply, state.base_currencies, buffer, safe_balances, preference)
+
+    ###############
+    # queue
+
+    def extend(self, redemptions):
+        """Append redemptions (or share amounts) to the queue"""
+        self.queue.extend(r if isinstance(r, Redemption) else Redemption(r) for r in redemptions)
+
+    def insert(self, index, redemption):
+        self.queue.insert(index, redemption if isinstance(redemption, Redemption) else Redemption(redemption))
+        self._invalidate(index)
+
+    def remove(self, index):
+        """Drop a cancelled redemption, the ones after it are priced again"""
+        del self.queue[index]
+        self._invalidate(index)
+
+    def executed(self, count=1):
+        """The first `count` redemptions were sent on chain; the ones priced as reverting changed nothing, one
+        reverted for lack of buffer must be `remove`d instead"""
+        self._price(count)
+        redemptions = [(r, a) for r, a in zip(self.queue[:count], self._amounts) if a is not None]
+        for token, amount in self._split([a for _, a in redemptions], self.buffer).items():
+            self.buffer[token] -= amount
+        if count:
+            self.nav -= self._demand[count - 1] - self._paid
+            self._paid = self._demand[count - 1]
+        self.total_supply -= sum(r.shares for r, _ in redemptions)
+        del self.queue[:count]
+        del self._amounts[:count]
+        del self._demand[:count]
+        self._errors = {i - count: e for i, e in self._errors.items() if i >= count}
+
+    def update(self, nav=None, total_supply=None, buffer=None, safe_balances=None):
+        """New fund state; balances only change the plan, a new NAV or supply reprices the queue"""
+        if buffer is not None:
+            self.buffer.update(buffer)
+        if safe_balances is not None:
+            self.safe_balances.update(safe_balances)
+        if (nav is not None and nav != self.nav) or (total_supply is not None and total_supply != self.total_supply):
+            self.nav = self.nav if nav is None else nav
+            self.total_supply = self.total_supply if total_supply is None else total_supply
+            self._invalidate(0)
+
+    def refresh(self, block=None, uri=None):
+        """Update from a new read of the fund"""
+        state = NavEngine([self.tokenizer], uri).fetch(block)[0]
+        fresh = LiquidityPlanner.from_state(state)
+        self.update(fresh.nav, fresh.total_supply, fresh.buffer, fresh.safe_balances)
+
+    def top_up(self, token, amount):
+        """A transfer from the safe to the tokenizer was executed"""
+        self.safe_balances[token] -= amount
+        self.buffer[token] = self.buffer.get(token, 0) + amount
+
+    def _invalidate(self, index):
+        index = min(index, len(self._amounts))
+        supply = self.total_supply - sum(
+            r.shares for r, a in zip(self.queue[:index], self._amounts) if a is not None)
+        self._after = (self.nav - (self._demand[index - 1] - self._paid if index else 0), supply)
+        del self._amounts[index:]
+        del self._demand[index:]
+        self._errors = {i: e for i, e in self._errors.items() if i < index}
+
+    def _price(self, count=None):
+        """Price the queue up to `count` redemptions, from the last priced one"""
+        count = len(self.queue) if count is None else count
+        nav, supply = self._after
+        demand = self._demand[-1] if self._demand else self._paid
+        for i in range(len(self._amounts), count):
+            shares = self.queue[i].shares
+            try:
+                if shares <= 0:
+                    raise QuoteError(None, "number of shares to redeem must be > 0")
+                amount = base_amount(shares, price_per_share(nav, supply))
+                if shares > supply:
+                    raise QuoteError("ERC20: burn amount exceeds balance")
+            except QuoteError as e:
+                # reverts whatever the buffer, the rest of the queue is not affected
+                self._errors[i] = e
+                amount = None
+            else:
+                nav, supply, demand = nav - amount, supply - shares, demand + amount
+            self._amounts.append(amount)
+            self._demand.append(demand)
+        self._after = (nav, supply)
+
+    @property
+    def amounts(self):
+        """Base amount of each queued redemption"""
+        self._price()
+        return list(self._amounts)
+
+    @property
+    def demand(self):
+        self._price()
+        return self._demand[-1] - self._paid if self._demand else 0
+
+    ###############
+    # plan
+
+    def _distinct(self):
+        return len(set(self.base_currencies)) == len(self.base_currencies)
+
+    def plan(self):
+        """Minimal top-ups from the safe for the whole queue to go through"""
+        self._price()
+        buffer = sum(self.buffer.get(t, 0) for t in set(self.base_currencies))
+        plan = Plan(self.demand, buffer)
+        missing = max(self.demand - buffer, 0)
+        for token in self.preference:
+            if missing == 0:
+                break
+            amount = min(self.safe_balances.get(token, 0), missing)
+            if amount:
+                plan.top_ups.append(TopUp(token, amount))
+                missing -= amount
+        plan.shortfall = missing
+        if self._distinct():
+            # the buffer only runs dry on the first redemption taking the demand above it
+            first = bisect_right(self._demand, self._paid + buffer + plan.total)
+            plan.first_failure = first if first < len(self._demand) else None
+        else:
+            # a currency listed twice is counted twice by checkFundsAvailability, replay the splits
+            balances = dict(self.buffer)
+            for top_up in plan.top_ups:
+                balances[top_up.token] = balances.get(top_up.token, 0) + top_up.amount
+            plan.first_failure = self.simulate(balances)[1]
+        plan.reverts = dict(self._errors)
+        return plan
+
+    def _split(self, amounts, balances):
+        balances = dict(balances)
+        paid = {}
+        for amount in amounts:
+            for token, value in withdraw_split(amount, self.base_currencies, balances):
+                balances[token] -= value
+                paid[token] = paid.get(token, 0) + value
+        return paid
+
+    def simulate(self, balances=None):
+        """`(payouts, first_failure)`: the `withdraw_split` of each redemption (None when it reverts anyway)
+        until the buffer runs dry"""
+        self._price()
+        balances = dict(self.buffer if balances is None else balances)
+        payouts = []
+        for i, amount in enumerate(self._amounts):
+            if amount is None:
+                payouts.append(None)
+                continue
+            try:
+                split = withdraw_split(amount, self.base_currencies, balances)
+            except QuoteError:
+                return payouts, i
+            for token, value in split:
+                balances[token] -= value
+            payouts.append(split)
+        return payouts, None
+
+    def transactions(self, plan=None):
+        """Top-ups as `{"to", "value", "data"}` ERC20 transfers sent by the safe"""
+        plan = plan or self.plan()
+        return [
+            {"to": t.token, "value": "0", "data": encode_call("transfer(address,uint256)", [self.tokenizer, t.amount])}
+            for t in plan.top_ups
+        ]
+
+    def safe_batch(self, plan=None, chain_id=None):
+        """Safe transaction builder batch of the top-ups"""
+        return {
+            "version": "1.0",
+            "chainId": str(web3.eth.chain_id if chain_id is None else chain_id),
+            "meta": {"name": "Tokenizer buffer top-up", "description": "Base currencies for queued redemptions of {}".format(self.tokenizer)},
+            "createdFromSafeAddress": self.safe,
+            "transactions": self.transactions(plan),
+        }
+
+
+def main(tokenizer, *shares, output=OUTPUT):
+    planner = LiquidityPlanner.load(tokenizer)
+    planner.extend(int(s) for s in shares)
+    plan = planner.plan()
+    print("demand {} buffer {} price per share {}".format(
+        plan.demand, plan.buffer, price_per_share(planner.nav, planner.total_supply) if planner.total_supply else 10**BASE_DECIMALS))
+    for top_up in plan.top_ups:
+        print("top up {} {}".format(top_up.token, top_up.amount))
+    if plan.shortfall:
+        print("the safe is short of {}, redemption {} reverts".format(plan.shortfall, plan.first_failure))
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as fp:
+        json.dump(planner.safe_batch(plan), fp, indent=2)
+    return plan
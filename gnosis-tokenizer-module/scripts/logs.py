@@ -0,0 +1,68 @@
+"""Chunked eth_getLogs and ABI based event decoding."""
+from eth_utils import event_abi_to_log_topic, to_checksum_address
+
+from scripts.rpc import RPCError, batch_request, block_tag, decode
+
+CHUNK_SIZE = 2000
+
+
+def get_logs(addresses, topics, from_block, to_block, chunk_size=CHUNK_SIZE, uri=None):
+    """eth_getLogs over `[from_block, to_block]` in block range chunks.
+
+    All chunks go out in one batch; a chunk the node refuses (too many results)
+    is split in half and retried.
+    """
+    ranges = [(start, min(start + chunk_size - 1, to_block)) for start in range(from_block, to_block + 1, chunk_size)]
+    logs = []
+    while ranges:
+        params = [
+            {"address": addresses, "topics": topics, "fromBlock": block_tag(start), "toBlock": block_tag(end)}
+            for start, end in ranges
+        ]
+        retry = []
+        for (start, end), result in zip(ranges, batch_request([("eth_getLogs", [p]) for p in params], uri)):
+            if isinstance(result, RPCError):
+                if start == end:
+                    raise result
+                middle = (start + end) // 2
+                retry += [(start, middle), (middle + 1, end)]
+            else:
+                logs += result
+        ranges = retry
+    logs.sort(key=lambda log: (int(log["blockNumber"], 16), int(log["logIndex"], 16)))
+    return logs
+
+
+class EventDecoder:
+    """Decode raw logs with the events of one or more ABIs."""
+
+    def __init__(self, *abis):
+        self.events = {}
+        for abi in abis:
+            for item in abi:
+                if item["type"] == "event" and not item.get("anonymous"):
+                    self.events["0x" + event_abi_to_log_topic(item).hex()] = item
+
+    def topics(self, names=None):
+        return [t for t, e in self.events.items() if names is None or e["name"] in names]
+
+    def decode(self, log):
+        """Returns `(event_name, args)` or None for an unknown log."""
+        event = self.events.get(log["topics"][0])
+        if event is None:
+            return None
+        indexed = [i for i in event["inputs"] if i["indexed"]]
+        plain = [i for i in event["inputs"] if not i["indexed"]]
+        args = {}
+        for item, topic in zip(indexed, log["topics"][1:]):
+            args[item["name"]] = _decode_value(item["type"], decode([item["type"]], bytes.fromhex(topic[2:]))[0])
+        values = decode([i["type"] for i in plain], bytes.fromhex(log["data"][2:]))
+        for item, value in zip(plain, values):
+            args[item["name"]] = _decode_value(item["type"], value)
+        return event["name"], args
+
+
+def _decode_value(type_, value):
+    if type_ == "address":
+        return to_checksum_address(value)
+    return value
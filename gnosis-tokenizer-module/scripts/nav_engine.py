@@ -0,0 +1,317 @@
+"""Off-chain NAV engine mirroring DaaTokenizer.calculateNav across many tokenizers.
+
+Every balance, connector position and oracle round needed to price N funds is
+read in four JSON-RPC batches pinned to one block, whatever N is. NAV and
+price per share are then computed with the same integer math as the contract.
+
+    brownie run scripts/nav_engine.py main <tokenizer> [<tokenizer> ...]
+"""
+from dataclasses import dataclass, field
+
+from eth_utils import keccak, to_checksum_address
+
+from scripts.rpc import Batch, RPCError, request
+
+# DaaTokenizer storage layout (contracts/DaaTokenizer.sol), both sets and
+# arrays keep their length at the slot and their items at keccak(slot) + i
+ALLOWED_ASSETS_SLOT = 9
+BASE_CURRENCIES_SLOT = 11
+AUTHORIZED_TICKERS_SLOT = 12
+ERC20_CONTRACTS_SLOT = 13
+
+BASE_DECIMALS = 6
+UINT256 = 2**256
+
+
+def array_slot(slot):
+    return int.from_bytes(keccak(slot.to_bytes(32, "big")), "big")
+
+
+def mapping_slot(key, slot):
+    """Slot of `mapping[key]`, `key` being the abi.encodePacked bytes for strings or a 32 bytes word"""
+    return int.from_bytes(keccak(key + slot.to_bytes(32, "big")), "big")
+
+
+def word_to_address(word):
+    return to_checksum_address((word % 2**160).to_bytes(20, "big"))
+
+
+def _sdiv(a, b):
+    # solidity signed division truncates towards zero
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+def scale_price(price, price_decimals, decimals):
+    """OracleHandler.scalePrice"""
+    if price_decimals < decimals:
+        return price * 10 ** (decimals - price_decimals)
+    elif price_decimals > decimals:
+        return _sdiv(price, 10 ** (price_decimals - decimals))
+    return price
+
+
+def exchange_rate(answer, feed_decimals):
+    """OracleHandler.getExchangeRate for a given round answer"""
+    # uint(int) reinterprets a negative answer rather than reverting
+    return scale_price(answer, feed_decimals, BASE_DECIMALS) % UINT256
+
+
+def token_value_usd(amount, rate, token_decimals):
+    """DaaTokenizer.getTokenValueUsd, `rate` is None for base currencies"""
+    if rate is None:
+        return amount
+    value = rate * amount
+    if value >= UINT256:
+        raise OverflowError("getTokenValueUsd overflow")
+    return value // 10**token_decimals
+
+
+def price_per_share(nav, shares_outstanding):
+    """DaaTokenizer.getPricePerShare"""
+    if shares_outstanding == 0:
+        return 10**BASE_DECIMALS
+    return nav * 10**BASE_DECIMALS // shares_outstanding
+
+
+@dataclass
+class FundState:
+    """Everything calculateNav reads for one tokenizer at one block.
+
+    Per asset lists are aligned with `assets` (allowedAssets order). `rates`,
+    `decimals` and `feeds` are None for base currencies, which are valued 1:1.
+    """
+
+    tokenizer: str
+    block: int
+    safe: str = None
+    position_manager: str = None
+    tokenized_share: str = None
+    oracle_handler: str = None
+    assets: list = field(default_factory=list)
+    base_currencies: list = field(default_factory=list)
+    total_supply: int = 0
+    safe_balances: list = field(default_factory=list)
+    tokenizer_balances: list = field(default_factory=list)
+    positions: list = field(default_factory=list)
+    feeds: list = field(default_factory=list)
+    rounds: list = field(default_factory=list)
+    rates: list = field(default_factory=list)
+    decimals: list = field(default_factory=list)
+    error: str = None
+
+
+@dataclass
+class NavResult:
+    tokenizer: str
+    block: int
+    nav: int = None
+    price_per_share: int = None
+    total_supply: int = None
+    error: str = None
+
+
+def fund_nav(state):
+    """DaaTokenizer.calculateNav for a fetched state.
+
+    The position manager reports the safe's external positions, so as in the
+    contract they are added to both the safe and the tokenizer balances.
+    """
+    nav = 0
+    for balances in (state.safe_balances, state.tokenizer_balances):
+        for i in range(len(state.assets)):
+            amount = balances[i] + state.positions[i]
+            nav += token_value_usd(amount, state.rates[i], state.decimals[i])
+    return nav
+
+
+def calculate(states):
+    """Price a list of fund states, a failed read or overflow marks the fund as reverted."""
+    results = []
+    for state in states:
+        result = NavResult(state.tokenizer, state.block, total_supply=state.total_supply)
+        if state.error is None:
+            try:
+                result.nav = fund_nav(state)
+                result.price_per_share = price_per_share(result.nav, state.total_supply)
+            except OverflowError as e:
+                result.error = str(e)
+        else:
+            result.error = state.error
+        results.append(result)
+    return results
+
+
+class NavEngine:
+    """Batched reader and pricer for a set of DaaTokenizer (or proxy) addresses.
+
+    Token and feed decimals never change, so they are cached for the lifetime
+    of the engine; everything else is read again on each `fetch`.
+    """
+
+    def __init__(self, tokenizers, uri=None):
+        self.tokenizers = [to_checksum_address(str(t)) for t in tokenizers]
+        self.uri = uri
+        self.decimals = {}
+
+    def fetch(self, block=None):
+        if block is None:
+            block = int(request("eth_blockNumber", [], self.uri), 16)
+        states = [FundState(tokenizer, block) for tokenizer in self.tokenizers]
+        self._fetch_config(states, block)
+        self._fetch_assets(states, block)
+        self._fetch_balances(states, block)
+        self._fetch_rounds(states, block)
+        return states
+
+    def navs(self, block=None):
+        return calculate(self.fetch(block))
+
+    def reconcile(self, block=None):
+        """Compare the engine against on-chain calculateNav/getPricePerShare.
+
+        Returns `(engine_result, onchain_nav, onchain_price)` for every fund that
+        does not match to the wei, an empty list means the engine is exact.
+        """
+        if block is None:
+            block = int(request("eth_blockNumber", [], self.uri), 16)
+        results = self.navs(block)
+        batch = Batch(block, self.uri)
+        for tokenizer in self.tokenizers:
+            batch.call(tokenizer, "calculateNav()")
+            batch.call(tokenizer, "getPricePerShare()")
+        onchain = batch.execute()
+        mismatches = []
+        for i, result in enumerate(results):
+            nav, price = onchain[2 * i], onchain[2 * i + 1]
+            reverted = isinstance(nav, RPCError) or isinstance(price, RPCError)
+            if reverted != (result.error is not None):
+                mismatches.append((result, nav, price))
+            elif not reverted and (nav, price) != (result.nav, result.price_per_share):
+                mismatches.append((result, nav, price))
+        return mismatches
+
+    @staticmethod
+    def _fail(state, value, what):
+        if isinstance(value, RPCError) and state.error is None:
+            state.error = "{}: {}".format(what, value)
+        return isinstance(value, RPCError)
+
+    def _fetch_config(self, states, block):
+        batch = Batch(block, self.uri)
+        reads = []
+        for state in states:
+            t = state.tokenizer
+            reads.append((
+                batch.call(t, "_safe()", returns=("address",)),
+                batch.call(t, "_positionManager()", returns=("address",)),
+                batch.call(t, "_tokenizedShare()", returns=("address",)),
+                batch.call(t, "_oracleHandler()", returns=("address",)),
+                batch.storage(t, ALLOWED_ASSETS_SLOT),
+                batch.storage(t, BASE_CURRENCIES_SLOT),
+            ))
+        values = batch.execute()
+        for state, idx in zip(states, reads):
+            row = [values[i] for i in idx]
+            if any(self._fail(state, v, "config") for v in row):
+                continue
+            state.safe, state.position_manager, state.tokenized_share, state.oracle_handler = row[:4]
+            # lengths are kept as placeholders until the items are read
+            state.assets = [None] * row[4]
+            state.base_currencies = [None] * row[5]
+
+    def _fetch_assets(self, states, block):
+        batch = Batch(block, self.uri)
+        reads = []
+        for state in states:
+            if state.error:
+                reads.append(None)
+                continue
+            t = state.tokenizer
+            assets = [batch.storage(t, array_slot(ALLOWED_ASSETS_SLOT) + i) for i in range(len(state.assets))]
+            bases = [batch.storage(t, array_slot(BASE_CURRENCIES_SLOT) + i) for i in range(len(state.base_currencies))]
+            supply = batch.call(state.tokenized_share, "totalSupply()")
+            reads.append((assets, bases, supply))
+        values = batch.execute()
+        for state, idx in zip(states, reads):
+            if idx is None:
+                continue
+            assets, bases, supply = idx
+            if any(self._fail(state, values[i], "assets") for i in assets + bases + [supply]):
+                continue
+            state.assets = [word_to_address(values[i]) for i in assets]
+            state.base_currencies = [word_to_address(values[i]) for i in bases]
+            state.total_supply = values[supply]
+
+    def _fetch_balances(self, states, block):
+        batch = Batch(block, self.uri)
+        reads = []
+        for state in states:
+            if state.error:
+                reads.append(None)
+                continue
+            rows = []
+            for asset in state.assets:
+                is_base = asset in state.base_currencies
+                rows.append((
+                    batch.call(asset, "balanceOf(address)", [state.safe]),
+                    batch.call(asset, "balanceOf(address)", [state.tokenizer]),
+                    batch.call(state.position_manager, "getNetPositionValue(address)", [asset]),
+                    None if is_base else batch.call(state.oracle_handler, "priceFeeds(address)", [asset], ("address",)),
+                    None if is_base or asset in self.decimals else batch.call(asset, "decimals()", returns=("uint8",)),
+                ))
+            reads.append(rows)
+        values = batch.execute()
+        for state, rows in zip(states, reads):
+            if rows is None:
+                continue
+            for asset, (safe_bal, own_bal, position, feed, decimals) in zip(state.assets, rows):
+                row = [values[i] for i in (safe_bal, own_bal, position, feed, decimals) if i is not None]
+                if any(self._fail(state, v, asset) for v in row):
+                    break
+                state.safe_balances.append(values[safe_bal])
+                state.tokenizer_balances.append(values[own_bal])
+                state.positions.append(values[position])
+                state.feeds.append(None if feed is None else values[feed])
+                if decimals is not None:
+                    self.decimals[asset] = values[decimals]
+
+    def _fetch_rounds(self, states, block):
+        feeds = sorted({f for s in states if not s.error for f in s.feeds if f is not None})
+        batch = Batch(block, self.uri)
+        reads = {}
+        for feed in feeds:
+            reads[feed] = (
+                batch.call(feed, "latestRoundData()", returns=("uint80", "int256", "uint256", "uint256", "uint80")),
+                None if feed in self.decimals else batch.call(feed, "decimals()", returns=("uint8",)),
+            )
+        values = batch.execute()
+        for feed, (round_data, decimals) in reads.items():
+            if decimals is not None and not isinstance(values[decimals], RPCError):
+                self.decimals[feed] = values[decimals]
+        for state in states:
+            if state.error:
+                continue
+            for asset, feed in zip(state.assets, state.feeds):
+                if feed is None:
+                    state.rounds.append(None)
+                    state.rates.append(None)
+                    state.decimals.append(None)
+                    continue
+                round_data, decimals = reads[feed]
+                if self._fail(state, values[round_data], feed) or feed not in self.decimals:
+                    state.error = state.error or "{}: decimals".format(feed)
+                    break
+                state.rounds.append(values[round_data])
+                state.rates.append(exchange_rate(values[round_data][1], self.decimals[feed]))
+                state.decimals.append(self.decimals[asset])
+
+
+def main(*tokenizers):
+    engine = NavEngine(tokenizers)
+    for result in engine.navs():
+        if result.error:
+            print("{}: reverted ({})".format(result.tokenizer, result.error))
+        else:
+            print("{}: nav {} shares {} price per share {}".format(
+                result.tokenizer, result.nav, result.total_supply, result.price_per_share))
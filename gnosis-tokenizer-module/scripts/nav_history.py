@@ -0,0 +1,286 @@
+"""Historical NAV, shares outstanding and price per share of many funds.
+
+`NavBackfill` evaluates `calculateNav()`, `getTotalSharesOutstanding()` and
+`getPricePerShare()` against an archive node, but only at the blocks where a
+fund's NAV inputs may have changed; the value at any other block is the one
+of the last stored point before it. Change blocks are found the way
+scripts/nav_tracker.py follows funds live, with one set of eth_getLogs
+queries per block window:
+
+ - ERC20 `Transfer` of the allowed assets from/to the safe or the tokenizer
+ - `TokenizedShare` mints and burns
+ - `AnswerUpdated` of the aggregators behind the `OracleHandler` feeds
+ - Aave v2 `ReserveDataUpdated`, `Mint`, `Burn` and `BalanceTransfer`
+
+Connectors without events (e.g. `MockConnector`) are read at every block of
+the window and a block is evaluated when their value moved. Aave interest
+accrues between events and configuration setters emit nothing: funds with
+Aave positions (or that could not be indexed) are also sampled every
+`interval` blocks, a configuration change is only picked up at the next
+logged change.
+
+The historical calls of a window go out as JSON-RPC batches of `batch_size`
+points, `workers` batches in flight. Each fund's points are appended to
+fixed width columns (see scripts/event_indexer.py) and the checkpoint moves
+atomically after every window, so an interrupted backfill resumes from the
+last completed window. A point equal to the previous one is not stored.
+
+    brownie run scripts/nav_history.py main <store dir> <from block> <to block> <tokenizer> [<tokenizer> ...]
+"""
+import json
+import os
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from eth_utils import to_checksum_address
+
+from scripts.event_indexer import Column
+from scripts.nav_tracker import ANSWER_UPDATED, RESERVE_DATA_UPDATED, TRANSFER, ZERO, NavTracker, _address
+from scripts.rpc import RPCError, batch_request, call_request
+
+VIEWS = ("calculateNav()", "getTotalSharesOutstanding()", "getPricePerShare()")
+# column name, width; `reverted` has one bit per view
+COLUMNS = (("block", 8), ("nav", 32), ("total_supply", 32), ("price_per_share", 32), ("reverted", 1))
+
+
+@dataclass
+class Point:
+    """Values of a fund from `block` on, None for a reverting view"""
+
+    block: int
+    nav: int = None
+    total_supply: int = None
+    price_per_share: int = None
+
+    @property
+    def values(self):
+        return self.nav, self.total_supply, self.price_per_share
+
+
+class NavHistory:
+    """Local time series store, one directory of columns per fund."""
+
+    def __init__(self, path):
+        self.root = Path(path)
+        self.root.mkdir(parents=True, exist_ok=True)
+        checkpoint = self.root / "checkpoint.json"
+        self.state = json.loads(checkpoint.read_text()) if checkpoint.exists() else {
+            "from_block": None, "tokenizers": [], "block": None, "rows": {}}
+        self.columns = {}
+        self.blocks = {}
+        for tokenizer, rows in self.state["rows"].items():
+            self._open(tokenizer, rows)
+
+    @property
+    def block(self):
+        """Last block of the completed backfill"""
+        return self.state["block"]
+
+    @property
+    def tokenizers(self):
+        return list(self.state["tokenizers"])
+
+    def _open(self, tokenizer, rows):
+        directory = self.root / tokenizer
+        directory.mkdir(exist_ok=True)
+        self.columns[tokenizer] = {name: Column(directory / (name + ".col"), width, rows) for name, width in COLUMNS}
+        block = self.columns[tokenizer]["block"]
+        self.blocks[tokenizer] = [int.from_bytes(block.get(i), "big") for i in range(rows)]
+
+    def _point(self, tokenizer, row):
+        columns = self.columns[tokenizer]
+        reverted = columns["reverted"].get(row)[0]
+        values = [
+            None if reverted >> bit & 1 else int.from_bytes(columns[name].get(row), "big")
+            for bit, (name, _) in enumerate(COLUMNS[1:4])
+        ]
+        return Point(self.blocks[tokenizer][row], *values)
+
+    def last(self, tokenizer):
+        rows = len(self.blocks.get(tokenizer, ()))
+        return self._point(tokenizer, rows - 1) if rows else None
+
+    def append(self, tokenizer, point):
+        """Store `point` unless the fund already had these values, returns True when stored"""
+        if tokenizer not in self.columns:
+            self._open(tokenizer, 0)
+        last = self.last(tokenizer)
+        if last is not None and (point.block <= last.block or point.values == last.values):
+            return False
+        columns = self.columns[tokenizer]
+        columns["block"].append(point.block.to_bytes(8, "big"))
+        reverted = 0
+        for bit, (name, value) in enumerate(zip(("nav", "total_supply", "price_per_share"), point.values)):
+            reverted |= (value is None) << bit
+            columns[name].append((value or 0).to_bytes(32, "big"))
+        columns["reverted"].append(bytes([reverted]))
+        self.blocks[tokenizer].append(point.block)
+        return True
+
+    def commit(self, block):
+        """Flush the columns, then atomically move the checkpoint to `block`."""
+        for columns in self.columns.values():
+            for column in columns.values():
+                column.flush()
+        self.state["block"] = block
+        self.state["rows"] = {t: len(blocks) for t, blocks in self.blocks.items()}
+        tmp = self.root / "checkpoint.json.tmp"
+        tmp.write_text(json.dumps(self.state))
+        os.replace(tmp, self.root / "checkpoint.json")
+
+    def series(self, tokenizer, from_block=0, to_block=None):
+        """Stored points of a fund, the first one is the value at `from_block`"""
+        tokenizer = to_checksum_address(str(tokenizer))
+        blocks = self.blocks.get(tokenizer, [])
+        start = max(bisect_right(blocks, from_block) - 1, 0)
+        end = len(blocks) if to_block is None else bisect_right(blocks, to_block)
+        return [self._point(tokenizer, i) for i in range(start, end)]
+
+    def at(self, tokenizer, block):
+        """Values of a fund at `block`, None outside the backfilled range"""
+        tokenizer = to_checksum_address(str(tokenizer))
+        if self.block is None or block > self.block:
+            return None
+        row = bisect_right(self.blocks.get(tokenizer, []), block) - 1
+        return self._point(tokenizer, row) if row >= 0 else None
+
+
+class NavBackfill:
+    """Backfill the history of `tokenizers` from `from_block` into a `NavHistory` at `path`.
+
+    `aave_connectors` is passed to `NavTracker`, `interval` samples the funds
+    whose NAV moves without events (None to only follow logs and polled
+    connectors).
+    """
+
+    def __init__(self, path, tokenizers, from_block, aave_connectors=None, interval=None, window=2000,
+                 workers=8, batch_size=100, chunk_size=2000, uri=None):
+        self.store = NavHistory(path)
+        self.tokenizers = [to_checksum_address(str(t)) for t in tokenizers]
+        stored = self.store.state
+        if stored["from_block"] is None:
+            stored["from_block"], stored["tokenizers"] = from_block, self.tokenizers
+        elif (stored["from_block"], stored["tokenizers"]) != (from_block, self.tokenizers):
+            raise ValueError("{} holds a backfill of other funds or from another block".format(path))
+        self.from_block = from_block
+        self.aave_connectors = aave_connectors
+        self.interval = interval
+        self.window = window
+        self.workers = workers
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.uri = uri
+        self.tracker = None
+        self.polled = {}      # id(track) -> polled connector values at the end of the last window
+        self.evaluated = 0    # points read from the chain, for monitoring
+
+    def seed(self, block):
+        """Index the configuration of the funds at `block`, the end of the range"""
+        self.tracker = NavTracker(self.tokenizers, self.aave_connectors, chunk_size=self.chunk_size, uri=self.uri)
+        self.tracker.seed(block)
+        self.index = {id(t): i for i, t in enumerate(self.tracker.tracks)}
+        self.polled = {}
+
+    def run(self, to_block):
+        """Backfill up to `to_block`, returns the number of new points"""
+        start = self.from_block if self.store.block is None else self.store.block + 1
+        if start > to_block:
+            return 0
+        self.seed(to_block)
+        added = 0
+        with ThreadPoolExecutor(self.workers) as pool:
+            for low in range(start, to_block + 1, self.window):
+                high = min(low + self.window - 1, to_block)
+                points = sorted(self._changes(low, high, pool), key=lambda p: (p[1], p[0]))
+                for (fund, block), values in zip(points, self._evaluate(points, pool)):
+                    added += self.store.append(self.tokenizers[fund], Point(block, *values))
+                self.store.commit(high)
+        return added
+
+    ###############
+    # change detection
+
+    def _changes(self, low, high, pool):
+        """`{(fund index, block)}` to evaluate in `[low, high]`"""
+        points = {(i, low) for i, t in enumerate(self.tokenizers) if self.store.last(t) is None}
+        for log in self.tracker._logs(low, high):
+            block = int(log["blockNumber"], 16)
+            points |= {(i, block) for i in self._funds(log)}
+        points |= self._polled_changes(low, high, pool)
+        if self.interval:
+            first = low + (self.from_block - low) % self.interval
+            silent = [i for i, t in enumerate(self.tracker.tracks) if t.state.error is not None or t.aave]
+            points |= {(i, block) for i in silent for block in range(first, high + 1, self.interval)}
+        return points
+
+    def _funds(self, log):
+        tracker = self.tracker
+        topics = log["topics"]
+        emitter = to_checksum_address(log["address"])
+        if topics[0] == TRANSFER:
+            sender, receiver = _address(topics[1]), _address(topics[2])
+            tracks = list(tracker.shares.get(emitter, ())) if ZERO in (sender, receiver) else []
+            tracks += [t for holder in (sender, receiver) for t, _, _ in tracker.holders.get((emitter, holder), ())]
+        elif topics[0] == ANSWER_UPDATED:
+            tracks = [t for t, _, _ in tracker.feeds.get(emitter, ())]
+        else:
+            if topics[0] == RESERVE_DATA_UPDATED:
+                asset, holders = _address(topics[1]), None
+            else:
+                # an Aave token event, a non holder topic only adds a point
+                asset, holders = tracker.aave_tokens[emitter], {_address(topic) for topic in topics[1:]}
+            tracks = [
+                t for t in tracker.tracks
+                if t.state.error is None and t.aave and asset in t.state.assets and (holders is None or t.holder in holders)
+            ]
+        return {self.index[id(t)] for t in tracks}
+
+    def _polled_changes(self, low, high, pool):
+        tracks = [t for t in self.tracker.tracks if t.state.error is None and t.polled]
+        if not tracks:
+            return set()
+        blocks = list(range(low, high + 1))
+        if not self.polled and low > 0:
+            blocks.insert(0, low - 1)
+        step = max(self.batch_size // sum(len(t.polled) * len(t.state.assets) for t in tracks), 1)
+        chunks = [blocks[i:i + step] for i in range(0, len(blocks), step)]
+        values = {}
+        for chunk in pool.map(lambda blocks: self.tracker._read_polled(tracks, blocks), chunks):
+            values.update(chunk)
+        if not self.polled and low > 0:
+            self.polled = dict(values[low - 1])
+        changes = set()
+        for block in range(low, high + 1):
+            for track in tracks:
+                key = id(track)
+                if key in self.polled and values[block][key] != self.polled[key]:
+                    changes.add((self.index[key], block))
+                self.polled[key] = values[block][key]
+        return changes
+
+    ###############
+    # evaluation
+
+    def _read(self, points):
+        calls = [call_request(self.tokenizers[i], view, (), block) for i, block in points for view in VIEWS]
+        results = [None if isinstance(r, RPCError) or r in ("0x", None) else int(r, 16)
+                   for r in batch_request(calls, self.uri)]
+        return [tuple(results[3 * k:3 * k + 3]) for k in range(len(points))]
+
+    def _evaluate(self, points, pool):
+        """`(nav, total supply, price per share)` of every `(fund index, block)`"""
+        chunks = [points[i:i + self.batch_size] for i in range(0, len(points), self.batch_size)]
+        self.evaluated += len(points)
+        return [values for chunk in pool.map(self._read, chunks) for values in chunk]
+
+
+def main(path, from_block, to_block, *tokenizers, interval=None):
+    backfill = NavBackfill(path, tokenizers, int(from_block), interval=interval and int(interval))
+    added = backfill.run(int(to_block))
+    print("{} points stored, {} evaluated".format(added, backfill.evaluated))
+    for tokenizer in backfill.tokenizers:
+        last = backfill.store.last(tokenizer)
+        print("{}: {} points, last {}".format(tokenizer, len(backfill.store.series(tokenizer)), last))
+    return backfill.store
@@ -0,0 +1,571 @@
+"""Incremental NAV tracker, publishing NAV and price per share of many funds on every block.
+
+Each fund is seeded once with `NavEngine` (see scripts/nav_engine.py), then
+kept up to date from logs instead of reading every asset again:
+
+ - ERC20 `Transfer` of the allowed assets from/to the safe or the tokenizer
+ - `TokenizedShare` mints and burns (`Transfer` from/to the zero address)
+ - `AnswerUpdated` of the Chainlink aggregators behind the `OracleHandler` feeds
+ - Aave v2 positions behind `AaveConnector.getGrossValue`/`getGrossDebt`: the
+   scaled aToken and variable debt balances follow `Mint`, `Burn` and
+   `BalanceTransfer`, the reserve indexes follow `ReserveDataUpdated`, and
+   `balanceOf` is recomputed with the pool's interest math at each block time
+
+Other connectors (e.g. `MockConnector`) have no events; their
+`getNetAssetValue` is read once per block, in one batch for all funds.
+
+NAV is only recomputed for a fund whose balances, supply, rates or Aave
+positions changed in the block, the previous result is published otherwise.
+Configuration setters have no events: the tokenizer's configuration slots are
+checked once per `step` and a changed fund is seeded again. Balances moving
+without a `Transfer` (rebasing tokens) are only caught by `reconcile`.
+
+    brownie run scripts/nav_tracker.py main <tokenizer> [<tokenizer> ...]
+"""
+import time
+from dataclasses import dataclass, field, replace
+
+from eth_utils import keccak, to_checksum_address
+
+from scripts.artifacts import load_artifact
+from scripts.logs import get_logs
+from scripts.nav_engine import NavEngine, NavResult, calculate, exchange_rate
+from scripts.rpc import Batch, RPCError, batch_request, block_tag, call_request, request
+from scripts.state_reader import read_states
+
+# Registry.aaveAddressProvider, on polygon
+AAVE_ADDRESSES_PROVIDER = "0xd05e3E715d945B59290df0ae8eF85c1BdB684744"
+# DaaTokenizer slots changed by the setters: _positionManager, _tokenizedShare,
+# _oracleHandler, allowedAssets and baseCurrencies lengths
+CONFIG_SLOTS = (3, 4, 5, 9, 11)
+ZERO = "0x0000000000000000000000000000000000000000"
+
+RAY = 10**27
+HALF_RAY = RAY // 2
+SECONDS_PER_YEAR = 365 * 24 * 3600
+
+# LendingPool.getReserveData, ReserveData is a static struct
+RESERVE_DATA = (
+    "uint256", "uint128", "uint128", "uint128", "uint128", "uint128", "uint40",
+    "address", "address", "address", "address", "uint8",
+)
+
+
+def _topic(signature):
+    return "0x" + keccak(text=signature).hex()
+
+
+TRANSFER = _topic("Transfer(address,address,uint256)")
+ANSWER_UPDATED = _topic("AnswerUpdated(int256,uint256,uint256)")
+RESERVE_DATA_UPDATED = _topic("ReserveDataUpdated(address,uint256,uint256,uint256,uint256,uint256)")
+A_MINT = _topic("Mint(address,uint256,uint256)")
+A_BURN = _topic("Burn(address,address,uint256,uint256)")
+BALANCE_TRANSFER = _topic("BalanceTransfer(address,address,uint256,uint256)")
+DEBT_MINT = _topic("Mint(address,address,uint256,uint256)")
+DEBT_BURN = _topic("Burn(address,uint256,uint256)")
+# position of the holder topic in the Aave events
+AAVE_FROM_TOPICS = [A_MINT, A_BURN, BALANCE_TRANSFER, DEBT_BURN]
+AAVE_TO_TOPICS = [BALANCE_TRANSFER, DEBT_MINT]
+
+
+###############
+# Aave v2 math (WadRayMath, MathUtils, ReserveLogic)
+
+def ray_mul(a, b):
+    return (a * b + HALF_RAY) // RAY
+
+
+def ray_div(a, b):
+    return (a * RAY + b // 2) // b
+
+
+def linear_interest(rate, last_update, timestamp):
+    return rate * (timestamp - last_update) // SECONDS_PER_YEAR + RAY
+
+
+def compounded_interest(rate, last_update, timestamp):
+    exp = timestamp - last_update
+    if exp == 0:
+        return RAY
+    exp_minus_two = exp - 2 if exp > 2 else 0
+    rate_per_second = rate // SECONDS_PER_YEAR
+    base_power_two = ray_mul(rate_per_second, rate_per_second)
+    base_power_three = ray_mul(base_power_two, rate_per_second)
+    second_term = exp * (exp - 1) * base_power_two // 2
+    third_term = exp * (exp - 1) * exp_minus_two * base_power_three // 6
+    return RAY + rate_per_second * exp + second_term + third_term
+
+
+@dataclass
+class Reserve:
+    """Aave reserve of an asset, as of its last `ReserveDataUpdated`."""
+
+    a_token: str
+    debt_token: str
+    liquidity_index: int
+    variable_index: int
+    liquidity_rate: int
+    variable_rate: int
+    updated_at: int
+
+    def normalized_income(self, timestamp):
+        if timestamp == self.updated_at:
+            return self.liquidity_index
+        return ray_mul(linear_interest(self.liquidity_rate, self.updated_at, timestamp), self.liquidity_index)
+
+    def normalized_debt(self, timestamp):
+        if timestamp == self.updated_at:
+            return self.variable_index
+        return ray_mul(compounded_interest(self.variable_rate, self.updated_at, timestamp), self.variable_index)
+
+
+@dataclass
+class AavePosition:
+    """Scaled aToken and variable debt balances of a holder."""
+
+    scaled_value: int = 0
+    scaled_debt: int = 0
+
+    def net(self, reserve, timestamp):
+        """getGrossValue - getGrossDebt, None when Adaptor.getNetAssetValue underflows"""
+        value = ray_mul(self.scaled_value, reserve.normalized_income(timestamp))
+        debt = ray_mul(self.scaled_debt, reserve.normalized_debt(timestamp)) if self.scaled_debt else 0
+        return value - debt if value >= debt else None
+
+
+@dataclass
+class FundTrack:
+    """A fund's `FundState` and what its positions are made of."""
+
+    state: object
+    config: tuple = ()
+    holder: str = None  # PositionManager._safe, the target of the connectors
+    connectors: list = field(default_factory=list)
+    aave: int = 0       # Aave connectors of the position manager
+    polled: list = field(default_factory=list)  # non Aave connectors
+    polled_values: list = field(default_factory=list)  # per asset sum of the polled connectors
+    position_error: str = None
+    result: NavResult = None
+
+
+def _address(topic):
+    return to_checksum_address("0x" + topic[-40:])
+
+
+def _words(data):
+    raw = bytes.fromhex(data[2:])
+    return [int.from_bytes(raw[i:i + 32], "big") for i in range(0, len(raw), 32)]
+
+
+def _padded(addresses):
+    return ["0x" + a[2:].lower().rjust(64, "0") for a in addresses]
+
+
+class NavTracker:
+    """Incremental NAV of a set of tokenizers.
+
+    `aave_connectors` lists the connectors to follow through Aave events; by
+    default a connector running the compiled `AaveConnector` code is one.
+    """
+
+    def __init__(self, tokenizers, aave_connectors=None, confirmations=0, chunk_size=2000, uri=None):
+        self.engine = NavEngine(tokenizers, uri)
+        self.aave_connectors = None if aave_connectors is None else {to_checksum_address(str(c)) for c in aave_connectors}
+        self.confirmations = confirmations
+        self.chunk_size = chunk_size
+        self.uri = uri
+        self.tracks = []
+        self.block = None
+        self.block_hash = None
+        self.timestamp = None
+        self.pool = None
+        self.reserves = {}     # asset -> Reserve, None when not listed on Aave
+        self.positions = {}    # (asset, holder) -> AavePosition
+        self.emitters = {}     # feed -> aggregator emitting AnswerUpdated
+        self.connectors = {}   # connector -> True when followed through Aave events
+        self.recomputed = 0    # NAV computations, for monitoring
+
+    @property
+    def tokenizers(self):
+        return self.engine.tokenizers
+
+    def _head(self):
+        return int(request("eth_blockNumber", [], self.uri), 16) - self.confirmations
+
+    ###############
+    # seeding
+
+    def seed(self, block=None, funds=None):
+        """Read the full state of `funds` (indexes, all by default) at `block`"""
+        if block is None:
+            block = self._head()
+        funds = range(len(self.tokenizers)) if funds is None else funds
+        engine = NavEngine([self.tokenizers[i] for i in funds], self.uri)
+        engine.decimals = self.engine.decimals
+        states = engine.fetch(block)
+        if not self.tracks:
+            self.tracks = [None] * len(self.tokenizers)
+        for i, state in zip(funds, states):
+            self.tracks[i] = FundTrack(state)
+        live = [self.tracks[i] for i in funds if self.tracks[i].state.error is None]
+        managers = read_states([("PositionManager", t.state.position_manager) for t in live], block=block, uri=self.uri)
+        for track, manager in zip(live, managers):
+            track.holder = manager.safe
+            track.connectors = manager.connectors_list
+            if manager.error:
+                track.state.error = "position manager: {}".format(manager.error)
+        live = [t for t in live if t.state.error is None]
+        self._classify({c for t in live for c in t.connectors})
+        for track in live:
+            track.aave = sum(self.connectors[c] for c in track.connectors)
+            track.polled = [c for c in track.connectors if not self.connectors[c]]
+        self._seed_sources(live, block)
+        header = self._headers([block])[block]
+        self.block, self.block_hash, self.timestamp = block, header["hash"], int(header["timestamp"], 16)
+        self._seed_config(live, block)
+        polled = self._read_polled(live, [block])
+        for track in live:
+            track.polled_values = polled[block][id(track)]
+            self._update_positions(track, self.timestamp)
+        for i in funds:
+            self.tracks[i].result = self._price(self.tracks[i], block)
+        self._index()
+        return [t.result for t in self.tracks]
+
+    def _classify(self, connectors):
+        new = sorted(c for c in connectors if c not in self.connectors)
+        if not new:
+            return
+        if self.aave_connectors is not None:
+            self.connectors.update({c: c in self.aave_connectors for c in new})
+            return
+        try:
+            compiled = load_artifact("AaveConnector")["deployedBytecode"]
+        except FileNotFoundError:
+            compiled = None
+        compiled = None if not compiled else compiled.lower().replace("0x", "")
+        codes = batch_request([("eth_getCode", [c, "latest"]) for c in new], self.uri)
+        for connector, code in zip(new, codes):
+            self.connectors[connector] = (
+                compiled is not None and not isinstance(code, RPCError) and code[2:].lower() == compiled
+            )
+
+    def _seed_sources(self, live, block):
+        """Reserves and scaled balances of the Aave positions, aggregators of the feeds"""
+        aave = [t for t in live if t.aave]
+        if aave and self.pool is None:
+            self.pool = self._call(block, AAVE_ADDRESSES_PROVIDER, "getLendingPool()", returns=("address",))
+        batch = Batch(block, self.uri)
+        reserves = {
+            a: batch.call(self.pool, "getReserveData(address)", [a], RESERVE_DATA)
+            for a in sorted({a for t in aave for a in t.state.assets}) if a not in self.reserves
+        }
+        feeds = {
+            f: batch.call(f, "aggregator()", returns=("address",))
+            for f in sorted({f for t in live for f in t.state.feeds if f is not None}) if f not in self.emitters
+        }
+        values = batch.execute()
+        for asset, i in reserves.items():
+            data = values[i]
+            if isinstance(data, RPCError) or int(data[7], 16) == 0:
+                self.reserves[asset] = None  # not listed, getUserReserveData returns zeros
+                continue
+            self.reserves[asset] = Reserve(data[7], data[9], data[1], data[2], data[3], data[4], data[6])
+        for feed, i in feeds.items():
+            # the feed is its own aggregator when it is not a proxy (e.g. MockV3Aggregator)
+            self.emitters[feed] = feed if isinstance(values[i], RPCError) else values[i]
+        batch = Batch(block, self.uri)
+        reads = {}
+        for track in aave:
+            for asset in track.state.assets:
+                reserve = self.reserves[asset]
+                if reserve is not None and (asset, track.holder) not in reads:
+                    reads[asset, track.holder] = (
+                        batch.call(reserve.a_token, "scaledBalanceOf(address)", [track.holder]),
+                        batch.call(reserve.debt_token, "scaledBalanceOf(address)", [track.holder]),
+                    )
+        values = batch.execute()
+        for key, (value, debt) in reads.items():
+            if isinstance(values[value], RPCError) or isinstance(values[debt], RPCError):
+                raise RuntimeError("scaledBalanceOf of {} failed".format(key))
+            self.positions[key] = AavePosition(values[value], values[debt])
+
+    def _seed_config(self, live, block):
+        values = self._config(live, block)
+        for track, config in zip(live, values):
+            track.config = config
+
+    def _config(self, tracks, block):
+        batch = Batch(block, self.uri)
+        reads = [[batch.storage(t.state.tokenizer, slot) for slot in CONFIG_SLOTS] for t in tracks]
+        values = batch.execute()
+        return [tuple(values[i] for i in idx) for idx in reads]
+
+    def _call(self, block, to, signature, args=(), returns=("uint256",)):
+        batch = Batch(block, self.uri)
+        batch.call(to, signature, args, returns)
+        value = batch.execute()[0]
+        if isinstance(value, RPCError):
+            raise value
+        return value
+
+    def _index(self):
+        """Lookup tables from log emitters and holders to the tracked funds"""
+        self.holders = {}     # (token, holder) -> [(track, balances list, asset index)]
+        self.shares = {}      # tokenized share -> [track]
+        self.feeds = {}       # aggregator -> [(track, asset index, feed)]
+        self.aave_tokens = {}  # aToken or debt token -> asset
+        for track in self.tracks:
+            state = track.state
+            if state.error is not None:
+                continue
+            for i, asset in enumerate(state.assets):
+                self.holders.setdefault((asset, state.safe), []).append((track, state.safe_balances, i))
+                self.holders.setdefault((asset, state.tokenizer), []).append((track, state.tokenizer_balances, i))
+                if state.feeds[i] is not None:
+                    self.feeds.setdefault(self.emitters[state.feeds[i]], []).append((track, i, state.feeds[i]))
+                reserve = self.reserves.get(asset) if track.aave else None
+                if reserve is not None:
+                    self.aave_tokens[reserve.a_token] = asset
+                    self.aave_tokens[reserve.debt_token] = asset
+            self.shares.setdefault(state.tokenized_share, []).append(track)
+
+    ###############
+    # positions and pricing
+
+    def _read_polled(self, tracks, blocks):
+        """`{block: {id(track): per asset sum}}` of the connectors without events"""
+        reads, calls = [], []
+        for block in blocks:
+            for track in tracks:
+                for connector in track.polled:
+                    for i, asset in enumerate(track.state.assets):
+                        reads.append((block, id(track), i))
+                        calls.append(call_request(
+                            connector, "getNetAssetValue(address,address)", [asset, track.holder], block))
+        results = {block: {id(t): [0] * len(t.state.assets) for t in tracks} for block in blocks}
+        for (block, key, i), raw in zip(reads, batch_request(calls, self.uri) if calls else []):
+            sums = results[block][key]
+            if isinstance(raw, RPCError) or raw in ("0x", None):
+                sums[i] = None  # getNetPositionValue reverts
+            elif sums[i] is not None:
+                sums[i] += int(raw, 16)
+        return results
+
+    def _update_positions(self, track, timestamp):
+        """Recompute `state.positions`, returns True when they changed"""
+        state = track.state
+        positions, error = [], None
+        for i, asset in enumerate(state.assets):
+            total = track.polled_values[i]
+            if total is None:
+                error = "{}: getNetAssetValue reverted".format(asset)
+                total = 0
+            reserve = self.reserves.get(asset) if track.aave else None
+            if reserve is not None:
+                net = self.positions[asset, track.holder].net(reserve, timestamp)
+                if net is None:
+                    error = "{}: Aave debt above the deposits".format(asset)
+                    net = 0
+                total += net * track.aave
+            positions.append(total)
+        changed = positions != state.positions or error != track.position_error
+        state.positions, track.position_error = positions, error
+        return changed
+
+    def _price(self, track, block):
+        self.recomputed += 1
+        track.state.block = block
+        result = calculate([track.state])[0]
+        if result.error is None and track.position_error is not None:
+            result = NavResult(result.tokenizer, block, total_supply=result.total_supply, error=track.position_error)
+        return result
+
+    ###############
+    # logs
+
+    def _headers(self, blocks):
+        results = batch_request([("eth_getBlockByNumber", [block_tag(b), False]) for b in blocks], self.uri)
+        headers = {}
+        for block, header in zip(blocks, results):
+            if isinstance(header, RPCError) or header is None:
+                raise RuntimeError("block {} not available".format(block))
+            headers[block] = header
+        return headers
+
+    def _logs(self, from_block, to_block):
+        holders = sorted({holder for _, holder in self.holders})
+        tokens = sorted({token for token, _ in self.holders})
+        aave_holders = sorted({t.holder for t in self.tracks if t.state.error is None and t.aave})
+        queries = []
+        if tokens:
+            queries += [(tokens, [TRANSFER, _padded(holders)]), (tokens, [TRANSFER, None, _padded(holders)])]
+        if self.shares:
+            shares = sorted(self.shares)
+            queries += [(shares, [TRANSFER, _padded([ZERO])]), (shares, [TRANSFER, None, _padded([ZERO])])]
+        if self.feeds:
+            queries.append((sorted(self.feeds), [ANSWER_UPDATED]))
+        if self.aave_tokens:
+            reserves = sorted(set(self.aave_tokens.values()))
+            queries += [
+                ([self.pool], [RESERVE_DATA_UPDATED, _padded(reserves)]),
+                (sorted(self.aave_tokens), [AAVE_FROM_TOPICS, _padded(aave_holders)]),
+                (sorted(self.aave_tokens), [AAVE_TO_TOPICS, None, _padded(aave_holders)]),
+            ]
+        by_position = {}
+        for addresses, topics in queries:
+            for log in get_logs(addresses, topics, from_block, to_block, self.chunk_size, self.uri):
+                # a transfer between two tracked holders matches both queries
+                by_position[int(log["blockNumber"], 16), int(log["logIndex"], 16)] = log
+        return [by_position[k] for k in sorted(by_position)]
+
+    def _apply(self, log, dirty, skip):
+        topic = log["topics"][0]
+        emitter = to_checksum_address(log["address"])
+        if topic == TRANSFER:
+            sender, receiver = _address(log["topics"][1]), _address(log["topics"][2])
+            value = _words(log["data"])[0]
+            for track in self.shares.get(emitter, ()) if ZERO in (sender, receiver) else ():
+                track.state.total_supply += value if sender == ZERO else -value
+                dirty.add(id(track))
+            for holder, sign in ((sender, -1), (receiver, 1)):
+                for track, balances, i in self.holders.get((emitter, holder), ()):
+                    balances[i] += sign * value
+                    dirty.add(id(track))
+        elif topic == ANSWER_UPDATED:
+            answer = int(log["topics"][1], 16)
+            answer -= 2**256 if answer >> 255 else 0
+            for track, i, feed in self.feeds.get(emitter, ()):
+                track.state.rates[i] = exchange_rate(answer, self.engine.decimals[feed])
+                dirty.add(id(track))
+        elif topic == RESERVE_DATA_UPDATED:
+            liquidity_rate, _, variable_rate, liquidity_index, variable_index = _words(log["data"])
+            reserve = self.reserves[_address(log["topics"][1])]
+            reserve.liquidity_rate, reserve.variable_rate = liquidity_rate, variable_rate
+            reserve.liquidity_index, reserve.variable_index = liquidity_index, variable_index
+            reserve.updated_at = self._block_time
+        else:
+            self._apply_aave(topic, emitter, log)
+        dirty -= skip
+
+    def _apply_aave(self, topic, emitter, log):
+        asset = self.aave_tokens[emitter]
+        value, index = _words(log["data"])
+        scaled = ray_div(value, index)
+        topics = log["topics"]
+        if topic == BALANCE_TRANSFER:
+            moves = [(topics[1], -scaled), (topics[2], scaled)]
+        elif topic == DEBT_MINT:
+            moves = [(topics[2], scaled)]
+        else:
+            moves = [(topics[1], scaled if topic == A_MINT else -scaled)]
+        debt = emitter == self.reserves[asset].debt_token
+        for holder, delta in moves:
+            position = self.positions.get((asset, _address(holder)))
+            if position is None:
+                continue
+            if debt:
+                position.scaled_debt += delta
+            else:
+                position.scaled_value += delta
+
+    ###############
+
+    def step(self, to_block=None):
+        """Follow the chain up to `to_block`, returns `[(block, [NavResult])]` for every new block"""
+        if self.block is None:
+            raise RuntimeError("seed the tracker first")
+        if to_block is None:
+            to_block = self._head()
+        if to_block <= self.block:
+            return []
+        blocks = list(range(self.block + 1, to_block + 1))
+        headers = self._headers(blocks)
+        if headers[blocks[0]]["parentHash"] != self.block_hash:
+            # reorg below the last published block
+            return [(to_block, self.seed(to_block))]
+        live = [t for t in self.tracks if t.state.error is None]
+        changed = {
+            id(t) for t, config in zip(live, self._config(live, to_block)) if config != t.config
+        }
+        logs = self._logs(blocks[0], to_block)
+        polled = self._read_polled([t for t in live if t.polled and id(t) not in changed], blocks)
+        published = []
+        position = 0
+        for block in blocks:
+            self._block_time = int(headers[block]["timestamp"], 16)
+            dirty = set()
+            while position < len(logs) and int(logs[position]["blockNumber"], 16) == block:
+                self._apply(logs[position], dirty, changed)
+                position += 1
+            for track in live:
+                if id(track) in changed:
+                    continue
+                if track.polled:
+                    track.polled_values = polled[block][id(track)]
+                if (track.polled or track.aave) and self._update_positions(track, self._block_time):
+                    dirty.add(id(track))
+            results = []
+            for track in self.tracks:
+                if id(track) in dirty:
+                    track.result = self._price(track, block)
+                results.append(replace(track.result, block=block))
+            published.append((block, results))
+        self.block, self.block_hash, self.timestamp = to_block, headers[to_block]["hash"], self._block_time
+        if changed:
+            funds = [i for i, t in enumerate(self.tracks) if id(t) in changed]
+            self.seed(to_block, funds)
+            published[-1] = (to_block, [t.result for t in self.tracks])
+        return published
+
+    def reconcile(self, reseed=False):
+        """Compare the tracked NAV with on-chain calculateNav/getPricePerShare at the last block.
+
+        Returns `(result, onchain nav, onchain price, drift)` for every fund that
+        does not match, drift being tracked minus on-chain NAV (None when only
+        one side reverts). Drifting funds are seeded again with `reseed`.
+        """
+        batch = Batch(self.block, self.uri)
+        for tokenizer in self.tokenizers:
+            batch.call(tokenizer, "calculateNav()")
+            batch.call(tokenizer, "getPricePerShare()")
+        onchain = batch.execute()
+        drifts = []
+        for i, track in enumerate(self.tracks):
+            result, nav, price = track.result, onchain[2 * i], onchain[2 * i + 1]
+            reverted = isinstance(nav, RPCError) or isinstance(price, RPCError)
+            if reverted != (result.error is not None):
+                drifts.append((i, result, nav, price, None))
+            elif not reverted and (nav, price) != (result.nav, result.price_per_share):
+                drifts.append((i, result, nav, price, result.nav - nav))
+        if reseed and drifts:
+            self.seed(self.block, [d[0] for d in drifts])
+        return [d[1:] for d in drifts]
+
+    def run(self, publish, poll_interval=2, reconcile_every=None):
+        """Publish `(block, results)` forever, reconciling every `reconcile_every` steps"""
+        if self.block is None:
+            self.seed()
+            publish(self.block, [t.result for t in self.tracks])
+        steps = 0
+        while True:
+            for block, results in self.step():
+                publish(block, results)
+            steps += 1
+            if reconcile_every and steps % reconcile_every == 0:
+                for result, nav, price, drift in self.reconcile(reseed=True):
+                    print("{} drifted by {} at block {} (on-chain nav {})".format(result.tokenizer, drift, result.block, nav))
+            time.sleep(poll_interval)
+
+
+def main(*tokenizers):
+    tracker = NavTracker(tokenizers)
+
+    def publish(block, results):
+        for result in results:
+            if result.block == block and result.error:
+                print("{} {}: reverted ({})".format(block, result.tokenizer, result.error))
+            else:
+                print("{} {}: nav {} price per share {}".format(block, result.tokenizer, result.nav, result.price_per_share))
+
+    tracker.run(publish, reconcile_every=100)
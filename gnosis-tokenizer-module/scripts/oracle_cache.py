@@ -0,0 +1,180 @@
+"""Oracle price cache for OracleHandler.getExchangeRate consumers.
+
+OracleHandler reads `latestRoundData()` and `decimals()` on every call and
+drops `updatedAt`/`answeredInRound`. The cache keeps the last round of every
+feed and the scaled rate per (token, round):
+
+ - `decimals()` of a feed is read once and kept forever
+ - a round is trusted for `ttl` seconds, then all tracked feeds are checked
+   again in one batch; the rates are only recomputed when the round changed
+ - `max_staleness` (seconds since `updatedAt`) and an `answeredInRound` behind
+   the round id make reads raise `StalePriceError`
+
+`scale_price`, `get_exchange_rate`, `get_eth_latest_price` and
+`get_derived_price` reproduce the contract results exactly.
+"""
+import time
+from dataclasses import dataclass
+
+from eth_utils import to_checksum_address
+
+from scripts.nav_engine import _sdiv, exchange_rate, scale_price
+from scripts.rpc import Batch, RPCError
+
+WETH = "0x7ceB23fD6bC0adD59E62ac25578270cFf1b9f619"  # OracleHandler.WETH, on polygon
+ROUND_DATA = ("uint80", "int256", "uint256", "uint256", "uint80")
+
+
+class StalePriceError(Exception):
+    pass
+
+
+@dataclass
+class Round:
+    round_id: int
+    answer: int
+    started_at: int
+    updated_at: int
+    answered_in_round: int
+
+
+class OracleCache:
+    """Cached view of one OracleHandler's feeds.
+
+    `clock` returns the current chain time used for the staleness policy (wall
+    clock by default), `ttl` is measured on the local monotonic clock.
+    """
+
+    def __init__(self, oracle_handler, ttl=2.0, max_staleness=None, clock=time.time, weth=WETH, uri=None):
+        self.oracle_handler = to_checksum_address(str(oracle_handler))
+        self.weth = weth
+        self.ttl = ttl
+        self.max_staleness = max_staleness
+        self.clock = clock
+        self.uri = uri
+        self.feeds = {}       # token -> feed
+        self.decimals = {}    # feed -> decimals, never invalidated
+        self.rounds = {}      # feed -> Round
+        self.rates = {}       # (token, round id) -> scaled rate
+        self.watched = set()  # feeds read directly through get_derived_price
+        self.requests = 0     # batches sent, for monitoring
+        self._checked = None
+
+    def invalidate(self):
+        """Force the next read to check for new rounds (e.g. on a new block)."""
+        self._checked = None
+
+    def _expired(self):
+        return self._checked is None or time.monotonic() - self._checked >= self.ttl
+
+    def _batch(self, build):
+        batch = Batch(uri=self.uri)
+        reads = build(batch)
+        self.requests += 1
+        return reads, batch.execute()
+
+    def refresh(self, tokens=(), feeds=()):
+        """Check every tracked feed (plus `tokens`/`feeds`) for a new round, in one or two batches."""
+        tokens = {to_checksum_address(str(t)) for t in tokens} | set(self.feeds)
+        self.watched |= {to_checksum_address(str(f)) for f in feeds}
+        known = {f for f in self.watched if f in self.decimals}
+
+        def build(batch):
+            return (
+                {
+                    token: (
+                        batch.call(self.oracle_handler, "priceFeeds(address)", [token], ("address",)),
+                        batch.call(self.feeds[token], "latestRoundData()", returns=ROUND_DATA) if token in self.feeds else None,
+                    )
+                    for token in tokens
+                },
+                {feed: batch.call(feed, "latestRoundData()", returns=ROUND_DATA) for feed in known},
+            )
+        (token_reads, feed_reads), values = self._batch(build)
+        new_feeds = self.watched - known
+        for token, (feed_read, round_read) in token_reads.items():
+            feed = values[feed_read]
+            if isinstance(feed, RPCError):
+                raise feed
+            if self.feeds.get(token) != feed or round_read is None:
+                # new token or the feed was replaced through addTokenOracle
+                self.feeds[token] = feed
+                new_feeds.add(feed)
+            else:
+                self._store_round(feed, values[round_read])
+        for feed, round_read in feed_reads.items():
+            self._store_round(feed, values[round_read])
+        if new_feeds:
+            def build_feeds(batch):
+                return {
+                    feed: (
+                        batch.call(feed, "latestRoundData()", returns=ROUND_DATA),
+                        None if feed in self.decimals else batch.call(feed, "decimals()", returns=("uint8",)),
+                    )
+                    for feed in new_feeds
+                }
+            reads, values = self._batch(build_feeds)
+            for feed, (round_read, decimals_read) in reads.items():
+                if decimals_read is not None and not isinstance(values[decimals_read], RPCError):
+                    self.decimals[feed] = values[decimals_read]
+                self._store_round(feed, values[round_read])
+        self._checked = time.monotonic()
+
+    def _store_round(self, feed, value):
+        if isinstance(value, RPCError):
+            # keep the feed unpriced, reads raise like the contract would revert
+            self.rounds.pop(feed, None)
+            return
+        current = Round(*value)
+        previous = self.rounds.get(feed)
+        if previous is None or previous.round_id != current.round_id or previous.answer != current.answer:
+            self.rounds[feed] = current
+            self.rates = {key: rate for key, rate in self.rates.items() if self.feeds.get(key[0]) != feed}
+
+    def _round(self, token):
+        token = to_checksum_address(str(token))
+        if token not in self.feeds or self._expired():
+            self.refresh([token])
+        feed = self.feeds[token]
+        if feed not in self.rounds or feed not in self.decimals:
+            raise RPCError({"message": "feed {} of {} cannot be read".format(feed, token)})
+        current = self.rounds[feed]
+        self._check_staleness(feed, current)
+        return token, feed, current
+
+    def _check_staleness(self, feed, current):
+        if current.answered_in_round < current.round_id:
+            raise StalePriceError("{} round {} answered in {}".format(feed, current.round_id, current.answered_in_round))
+        if self.max_staleness is not None and self.clock() - current.updated_at > self.max_staleness:
+            raise StalePriceError("{} last updated at {}".format(feed, current.updated_at))
+
+    def latest_round(self, token):
+        return self._round(token)[2]
+
+    def get_exchange_rate(self, token):
+        """OracleHandler.getExchangeRate"""
+        token, feed, current = self._round(token)
+        key = (token, current.round_id)
+        if key not in self.rates:
+            self.rates[key] = exchange_rate(current.answer, self.decimals[feed])
+        return self.rates[key]
+
+    def get_eth_latest_price(self):
+        """OracleHandler.getETHLatestPrice"""
+        return self.latest_round(self.weth).answer
+
+    def get_derived_price(self, base, quote, decimals):
+        """OracleHandler.getDerivedPrice, `base` and `quote` are feed addresses"""
+        if not 0 < decimals <= 18:
+            raise ValueError("Invalid _decimals")
+        feeds = [to_checksum_address(str(f)) for f in (base, quote)]
+        if self._expired() or any(f not in self.rounds or f not in self.decimals for f in feeds):
+            self.refresh(feeds=feeds)
+        prices = []
+        for feed in feeds:
+            if feed not in self.rounds or feed not in self.decimals:
+                raise RPCError({"message": "feed {} cannot be read".format(feed)})
+            current = self.rounds[feed]
+            self._check_staleness(feed, current)
+            prices.append(scale_price(current.answer, self.decimals[feed], decimals))
+        return _sdiv(prices[0] * 10**decimals, prices[1])
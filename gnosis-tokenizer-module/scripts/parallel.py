@@ -0,0 +1,28 @@
+"""Helpers for running the brownie suites sharded across xdist workers.
+
+The helpers are shared with gnosis-withdrawal-module and live in
+brownie-shared/parallel.py, this module puts them on `sys.path` for the
+tokenizer conftest and tests.
+"""
+import sys
+
+from scripts.artifacts import SHARED_ROOT
+
+if str(SHARED_ROOT) not in sys.path:
+    sys.path.append(str(SHARED_ROOT))
+
+from parallel import (  # noqa: E402
+    check_record,
+    clear_worker_gas,
+    is_controller,
+    is_worker,
+    merge_gas,
+    report_gas,
+    save_worker_gas,
+    worker_id,
+)
+
+__all__ = [
+    "check_record", "clear_worker_gas", "is_controller", "is_worker",
+    "merge_gas", "report_gas", "save_worker_gas", "worker_id",
+]
@@ -0,0 +1,400 @@
+"""Opcode level gas profiles of transactions and calls, by source line and function.
+
+A transaction (`debug_traceTransaction`) or a call (`debug_traceCall`, or a
+transaction sent from an `evm_snapshot` on nodes without it, e.g. ganache)
+is traced opcode by opcode on a local node. Every step is charged its own
+gas (a CALL is charged the gas its callee did not use) and mapped back to
+the source with the compiler source maps of the contract running it:
+
+ - brownie artifacts carry a `pcMap` (pc -> source offset and function)
+ - forge artifacts are decoded from `deployedBytecode.sourceMap`, functions
+   are found in the artifact's AST
+
+Contracts are recognized by the metadata hash at the end of their runtime
+code, so immutables and constructor arguments do not matter.
+
+A `Profile` sums gas and SLOAD/SSTORE/CALL counts per function and per
+source line, plus folded stacks (external frames, then internal functions
+entered by jumps) that flamegraph.pl, inferno or speedscope read directly.
+Reports are JSON with sorted keys so two commits can be compared with
+`diff`, which lists the functions and lines whose gas moved.
+
+`main` profiles every benchmark point of scripts/benchmark.py (the assets,
+owners and spells sweeps) into `reports/profile`:
+
+    brownie run scripts/profiler.py main [<baseline dir>]
+"""
+import json
+import re
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from eth_utils import to_checksum_address
+
+from scripts.artifacts import ARTIFACTS, PROJECT_ROOT, REPO_ROOT, load_artifact
+from scripts.rpc import RPCError, batch_request, block_tag, request
+
+OUTPUT = PROJECT_ROOT / "reports/profile"
+COUNTED = ("SLOAD", "SSTORE", "CALL", "STATICCALL", "DELEGATECALL", "CALLCODE", "CREATE", "CREATE2")
+CALLS = ("CALL", "STATICCALL", "DELEGATECALL", "CALLCODE")
+TRACE_OPTIONS = {"disableStorage": True, "disableMemory": True, "enableReturnData": False}
+GAS = 10_000_000
+
+
+@dataclass
+class Location:
+    path: str = None
+    line: int = None
+    function: str = None
+
+
+###############
+# source maps
+
+def _instruction_pcs(bytecode):
+    """pc of each instruction, the index used by solc source maps"""
+    pcs, pc = [], 0
+    while pc < len(bytecode):
+        pcs.append(pc)
+        op = bytecode[pc]
+        pc += 1 + (op - 0x5f if 0x60 <= op <= 0x7f else 0)
+    return pcs
+
+
+def _decode_source_map(source_map):
+    """`(start, length, source index, jump)` per instruction, empty fields repeat the previous entry"""
+    entries, last = [], ["-1", "-1", "-1", "-"]
+    for item in source_map.split(";"):
+        fields = item.split(":")
+        last = [fields[i] if i < len(fields) and fields[i] != "" else last[i] for i in range(4)]
+        entries.append((int(last[0]), int(last[1]), int(last[2]), last[3]))
+    return entries
+
+
+def _metadata(code):
+    """CBOR metadata at the end of runtime code, unique per contract source"""
+    if len(code) < 2:
+        return None
+    length = int.from_bytes(code[-2:], "big") + 2
+    return bytes(code[-length:]) if length < len(code) else None
+
+
+def _functions(ast):
+    """`(start, end, "Contract.function")` of the functions and modifiers of a source unit AST"""
+    found = []
+
+    def walk(node, contract):
+        if isinstance(node, dict):
+            kind = node.get("nodeType")
+            if kind == "ContractDefinition":
+                contract = node["name"]
+            elif kind in ("FunctionDefinition", "ModifierDefinition"):
+                start, length, _ = (int(x) for x in node["src"].split(":"))
+                name = node.get("name") or node.get("kind", "fallback")
+                found.append((start, start + length, "{}.{}".format(contract, name)))
+            for value in node.values():
+                walk(value, contract)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value, contract)
+
+    walk(ast, None)
+    return found
+
+
+class Source:
+    """Line lookup of a source file, read from disk when it can be found"""
+
+    def __init__(self, path, roots):
+        self.path = path
+        self.newlines = None
+        for root in roots:
+            candidate = Path(root) / path
+            if candidate.is_file():
+                data = candidate.read_bytes()
+                self.newlines = [i for i, b in enumerate(data) if b == 0x0a]
+                break
+
+    def line(self, offset):
+        return None if self.newlines is None else bisect_right(self.newlines, offset - 1) + 1
+
+
+class SourceMap:
+    """pc -> `Location` of one compiled contract"""
+
+    def __init__(self, name, artifact, roots):
+        self.name = Path(name).stem
+        self.locations = {}
+        if "pcMap" in artifact:
+            self._from_pc_map(artifact, roots)
+        else:
+            self._from_source_map(artifact, roots)
+
+    @classmethod
+    def load(cls, name):
+        artifact = load_artifact(name)
+        path = Path(ARTIFACTS.get(name, name))
+        # brownie sources are relative to the project, forge ones to the foundry root
+        roots = [PROJECT_ROOT, REPO_ROOT] + [p for p in path.parents if (p / "foundry.toml").exists()]
+        return cls(name, artifact, roots)
+
+    @staticmethod
+    def runtime_code(artifact):
+        code = artifact.get("deployedBytecode") or ""
+        code = code["object"] if isinstance(code, dict) else code
+        return bytes.fromhex(code[2:] if code.startswith("0x") else code)
+
+    def _from_pc_map(self, artifact, roots):
+        paths = artifact.get("allSourcePaths", {})
+        sources = {}
+        for pc, entry in artifact["pcMap"].items():
+            path = paths.get(str(entry.get("path")))
+            line = None
+            if path is not None and entry.get("offset"):
+                source = sources.setdefault(path, Source(path, roots))
+                line = source.line(entry["offset"][0])
+            self.locations[int(pc)] = (Location(path, line, entry.get("fn") or self.name), entry.get("jump"))
+
+    def _from_source_map(self, artifact, roots):
+        code = artifact["deployedBytecode"]
+        ast = artifact.get("ast") or {}
+        path = ast.get("absolutePath")
+        index = artifact.get("id")
+        source = Source(path, roots) if path else None
+        functions = sorted(_functions(ast)) if ast else []
+        pcs = _instruction_pcs(self.runtime_code(artifact))
+        for pc, (start, length, file_index, jump) in zip(pcs, _decode_source_map(code["sourceMap"])):
+            if file_index != index or source is None or start < 0:
+                # another source unit (libraries, inherited contracts), no AST to resolve it
+                location = Location("<source {}>".format(file_index) if file_index >= 0 else None, None, self.name)
+            else:
+                enclosing = [f for f in functions if f[0] <= start < f[1]]
+                name = min(enclosing, key=lambda f: f[1] - f[0])[2] if enclosing else self.name
+                location = Location(path, source.line(start), name)
+            self.locations[pc] = (location, jump)
+
+    def locate(self, pc):
+        return self.locations.get(pc, (Location(function=self.name), None))
+
+
+###############
+# profiles
+
+@dataclass
+class Profile:
+    gas: int = 0
+    functions: dict = field(default_factory=dict)  # function -> {"gas", op counts}
+    lines: dict = field(default_factory=dict)      # "path:line" -> {"gas", "function", op counts}
+    folded: dict = field(default_factory=dict)     # "frame;frame;..." -> gas
+
+    def add(self, stack, location, op, gas):
+        self.gas += gas
+        function = self.functions.setdefault(location.function, {"gas": 0})
+        line = self.lines.setdefault(
+            "{}:{}".format(location.path, location.line) if location.path else location.function,
+            {"gas": 0, "function": location.function})
+        for entry in (function, line):
+            entry["gas"] += gas
+            if op in COUNTED:
+                entry[op] = entry.get(op, 0) + 1
+        key = ";".join(stack)
+        self.folded[key] = self.folded.get(key, 0) + gas
+
+    def to_json(self):
+        return {"gas": self.gas, "functions": self.functions, "lines": self.lines, "folded": self.folded}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["gas"], data["functions"], data["lines"], data["folded"])
+
+    def folded_text(self):
+        """Folded stacks, one `frame;frame;frame gas` line each"""
+        return "".join("{} {}\n".format(stack, gas) for stack, gas in sorted(self.folded.items()) if gas > 0)
+
+    def top(self, count=10, by="functions"):
+        return sorted(getattr(self, by).items(), key=lambda kv: -kv[1]["gas"])[:count]
+
+
+def diff(old, new, by="functions"):
+    """`(key, old gas, new gas)` of the functions (or lines) whose gas changed, largest change first"""
+    old, new = getattr(old, by), getattr(new, by)
+    rows = [
+        (key, old.get(key, {}).get("gas", 0), new.get(key, {}).get("gas", 0))
+        for key in set(old) | set(new)
+    ]
+    return sorted([r for r in rows if r[1] != r[2]], key=lambda r: (-abs(r[2] - r[1]), r[0]))
+
+
+def _word(value):
+    return int(value, 16) if isinstance(value, str) else value
+
+
+class Profiler:
+    """Profiles on the node at `uri`; `contracts` maps addresses to artifact names, other
+    contracts are recognized among the compiled artifacts by their metadata hash"""
+
+    def __init__(self, contracts=None, uri=None):
+        self.uri = uri
+        self.contracts = {to_checksum_address(str(a)): n for a, n in (contracts or {}).items()}
+        self.maps = {}
+        self.codes = {}      # address -> SourceMap or None
+        self._by_metadata = None
+
+    def _known(self):
+        if self._by_metadata is None:
+            self._by_metadata = {}
+            # the named artifacts of the three projects, then everything brownie compiled here (mocks)
+            candidates = list(ARTIFACTS) + [str(p) for p in sorted((PROJECT_ROOT / "build/contracts").rglob("*.json"))]
+            for name in candidates:
+                try:
+                    metadata = _metadata(SourceMap.runtime_code(load_artifact(name)))
+                except (FileNotFoundError, KeyError, ValueError):
+                    continue
+                if metadata is not None:
+                    self._by_metadata.setdefault(metadata, name)
+        return self._by_metadata
+
+    def _map(self, name):
+        if name not in self.maps:
+            self.maps[name] = SourceMap.load(name)
+        return self.maps[name]
+
+    def source_map(self, address, block="latest"):
+        address = to_checksum_address(address)
+        if address not in self.codes:
+            name = self.contracts.get(address)
+            if name is None:
+                code = bytes.fromhex(request("eth_getCode", [address, block_tag(block)], self.uri)[2:])
+                name = self._known().get(_metadata(code))
+            self.codes[address] = None if name is None else self._map(name)
+        return self.codes[address]
+
+    ###############
+
+    def profile_transaction(self, tx_hash):
+        tx = request("eth_getTransactionByHash", [tx_hash], self.uri)
+        trace = request("debug_traceTransaction", [tx_hash, TRACE_OPTIONS], self.uri)
+        block = int(tx["blockNumber"], 16)
+        return self.profile_trace(trace, tx["to"], block)
+
+    def profile_call(self, sender, to, data, value=0, block="latest"):
+        tx = {"from": sender, "to": to, "data": data, "value": hex(value), "gas": hex(GAS)}
+        trace = batch_request([("debug_traceCall", [tx, block_tag(block), TRACE_OPTIONS])], self.uri)[0]
+        if not isinstance(trace, RPCError):
+            return self.profile_trace(trace, to, block)
+        # no debug_traceCall (ganache): mine it from a snapshot
+        snapshot = request("evm_snapshot", [], self.uri)
+        try:
+            return self.profile_transaction(request("eth_sendTransaction", [tx], self.uri))
+        finally:
+            request("evm_revert", [snapshot], self.uri)
+
+    def profile_trace(self, trace, to, block="latest"):
+        """Profile of struct logs, `to` being the contract called by the transaction"""
+        steps = trace["structLogs"]
+        profile = Profile()
+        costs = self._costs(steps)
+        # per EVM frame: source map, internal functions entered by jumps, jump type of the last JUMP
+        frames = [[self.source_map(to, block) if to else None, None, None]]
+        pending = None  # code of the contract a CALL is entering
+        for i, step in enumerate(steps):
+            depth = step["depth"]
+            if i and depth > steps[i - 1]["depth"]:
+                frames.append([pending, None, None])
+            elif i and depth < steps[i - 1]["depth"]:
+                del frames[len(frames) - (steps[i - 1]["depth"] - depth):]
+            frame = frames[-1]
+            source_map, internal, last_jump = frame
+            if source_map is None:
+                location, jump = Location(function="<unknown>"), None
+            else:
+                location, jump = source_map.locate(step["pc"])
+            if internal is None:
+                internal = frame[1] = [source_map.name if source_map else location.function]
+            elif last_jump == "i":
+                internal.append(location.function)
+            elif last_jump == "o" and len(internal) > 1:
+                internal.pop()
+            frame[2] = jump if step["op"] == "JUMP" else None
+            stack = [f for _, names, _ in frames[:-1] for f in names] + internal
+            if location.function != stack[-1]:
+                stack = stack + [location.function]
+            profile.add(stack, location, step["op"], costs[i])
+            if step["op"] in CALLS:
+                address = (_word(step["stack"][-2]) & (2**160 - 1)).to_bytes(20, "big")
+                pending = self.source_map(to_checksum_address(address), block)
+            elif step["op"] in ("CREATE", "CREATE2"):
+                pending = None
+        return profile
+
+    @staticmethod
+    def _costs(steps):
+        """Gas of each step alone: a call is charged what its callee did not spend"""
+        costs = []
+        for i, step in enumerate(steps):
+            following = steps[i + 1] if i + 1 < len(steps) else None
+            if following is None or following["depth"] < step["depth"]:
+                costs.append(step["gasCost"])
+            elif following["depth"] == step["depth"]:
+                costs.append(step["gas"] - following["gas"])
+            else:
+                # entered a callee: find the step back in this frame
+                j = i + 1
+                while j < len(steps) and steps[j]["depth"] > step["depth"]:
+                    j += 1
+                callee = [s for s in steps[i + 1:j] if s["depth"] == step["depth"] + 1]
+                spent = callee[0]["gas"] - (callee[-1]["gas"] - callee[-1]["gasCost"])
+                after = steps[j]["gas"] if j < len(steps) else step["gas"] - step["gasCost"]
+                costs.append(step["gas"] - after - spent)
+        return costs
+
+
+###############
+
+def report_name(point):
+    """File name of a benchmark point, e.g. `DaaTokenizer.deposit[assets=1,bases=1]` ->
+    `DaaTokenizer.deposit-assets_1-bases_1`"""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", point.replace("=", "_")).strip("-")
+
+
+def save(profile, output, point):
+    """Write `<name>.json` and `<name>.folded` of `point` into `output`"""
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    name = report_name(point)
+    (output / (name + ".json")).write_text(json.dumps(profile.to_json(), indent=2, sort_keys=True))
+    (output / (name + ".folded")).write_text(profile.folded_text())
+
+
+def main(baseline=None, output=OUTPUT):
+    from scripts import benchmark
+
+    if baseline is not None and not Path(baseline).is_dir():
+        raise FileNotFoundError("baseline profile directory {} does not exist".format(baseline))
+    profiler = Profiler()
+
+    def hook(result):
+        # a receipt, or the (sender, to, data) of a measured call (calculateNav)
+        if isinstance(result, tuple):
+            return profiler.profile_call(*result)
+        return profiler.profile_transaction(result.txid)
+
+    results = benchmark.run(repeat=1, profile=hook)
+    for path, by_point in sorted(results.items()):
+        for point, value in sorted(by_point.items()):
+            profile = value.get("profile")
+            if profile is None:
+                continue
+            name = "{}[{}]".format(path, point)
+            save(profile, output, name)
+            hottest = ", ".join("{} {}".format(f, v["gas"]) for f, v in profile.top(3))
+            print("{}: {} gas, {}".format(name, profile.gas, hottest))
+            if baseline is None:
+                continue
+            old = Path(baseline) / (report_name(name) + ".json")
+            if not old.exists():
+                print("    WARNING no baseline profile {}".format(old))
+                continue
+            for key, before, after in diff(Profile.from_json(json.loads(old.read_text())), profile)[:5]:
+                print("    {}: {} -> {} ({:+d})".format(key, before, after, after - before))
@@ -0,0 +1,212 @@
+"""Deposit and redemption quotes for DaaTokenizer, without eth_call.
+
+A `Quoter` wraps one `FundState` snapshot (see scripts/nav_engine.py) and
+reproduces the integer math of:
+
+ - `deposit`: price per share before the transfer, `getTokenValueUsd` (1:1 for
+   base currencies, oracle rate otherwise), then `value * 10**6 / pricePerShare`
+ - `redeem`: `calcBaseAmount` and the greedy `_withdraw` split across
+   `baseCurrencies`, each limited by `checkFundsAvailability`
+
+NAV and price per share are computed once per snapshot, so a quote is a
+handful of integer operations. Call `refresh` (or load a new snapshot) on a
+new block.
+
+    brownie run scripts/quotes.py main <tokenizer> deposit USDC 1000000
+    brownie run scripts/quotes.py main <tokenizer> redeem 500000
+"""
+from dataclasses import dataclass, field
+
+from eth_utils import to_checksum_address
+
+from scripts.nav_engine import (
+    AUTHORIZED_TICKERS_SLOT, BASE_DECIMALS, ERC20_CONTRACTS_SLOT, UINT256,
+    NavEngine, fund_nav, mapping_slot, price_per_share, token_value_usd, word_to_address,
+)
+from scripts.rpc import Batch, RPCError
+
+TICKERS = ("USDC", "WETH")
+
+
+class QuoteError(Exception):
+    """The transaction would revert; `reason` is the revert string, None for a bare require or panic."""
+
+    def __init__(self, reason, message=None):
+        super().__init__(message or reason)
+        self.reason = reason
+
+
+@dataclass
+class DepositQuote:
+    ticker: str
+    token: str
+    amount: int
+    value_usd: int
+    price_per_share: int
+    shares: int
+
+
+@dataclass
+class RedeemQuote:
+    shares: int
+    price_per_share: int
+    base_amount: int
+    # (base currency, amount) in baseCurrencies order, zero amounts are not transferred
+    payouts: list = field(default_factory=list)
+
+
+def deposit_shares(value_usd, pps):
+    """Shares minted by DaaTokenizer.deposit for a USD value"""
+    if pps == 0:
+        raise QuoteError(None, "division by zero: price per share is 0")
+    if value_usd * 10**BASE_DECIMALS >= UINT256:
+        raise QuoteError(None, "deposit overflow")
+    return value_usd * 10**BASE_DECIMALS // pps
+
+
+def base_amount(shares, pps):
+    """DaaTokenizer.calcBaseAmount"""
+    if shares * pps >= UINT256:
+        raise QuoteError(None, "calcBaseAmount overflow")
+    return shares * pps // 10**BASE_DECIMALS
+
+
+def withdraw_split(amount, base_currencies, balances):
+    """DaaTokenizer._withdraw: amounts per base currency, `balances` maps token to tokenizer balance"""
+    split = []
+    left = amount
+    for token in base_currencies:
+        available = 0
+        if left > 0:
+            available = min(balances.get(token, 0), left)
+            left -= available
+        split.append((token, available))
+    if left:
+        raise QuoteError("Not enough funds in tokenizer")
+    # checkFundsAvailability reads the balance before any transfer, so a
+    # currency listed twice is counted twice and the second transfer fails
+    sent = {}
+    for token, available in split:
+        sent[token] = sent.get(token, 0) + available
+    if any(sent[token] > balances.get(token, 0) for token in sent):
+        raise QuoteError("ERC20: transfer amount exceeds balance")
+    return split
+
+
+def fetch_tickers(states, tickers, uri=None):
+    """`{ticker: token}` of the authorized `tickers` of each state, read from storage at the state's block"""
+    if not states:
+        return []
+    batch = Batch(states[0].block, uri)
+    reads = []
+    for state in states:
+        reads.append({
+            ticker: (
+                batch.storage(state.tokenizer, mapping_slot(ticker.encode(), AUTHORIZED_TICKERS_SLOT)),
+                batch.storage(state.tokenizer, mapping_slot(ticker.encode(), ERC20_CONTRACTS_SLOT)),
+            )
+            for ticker in tickers
+        })
+    values = batch.execute()
+    results = []
+    for idx in reads:
+        found = {}
+        for ticker, (authorized, token) in idx.items():
+            if isinstance(values[authorized], RPCError):
+                raise values[authorized]
+            if values[authorized] % 256:
+                found[ticker] = word_to_address(values[token])
+        results.append(found)
+    return results
+
+
+class Quoter:
+    """Quotes against one fund snapshot.
+
+    `tickers` maps the authorized tickers to their token (`_erc20Contracts`),
+    a ticker missing from it is quoted as `deposit` would revert.
+    """
+
+    def __init__(self, state, tickers, uri=None):
+        self.state = state
+        self.uri = uri
+        self.tickers = {ticker: to_checksum_address(str(t)) for ticker, t in tickers.items()}
+        self.error = state.error
+        self.nav = None
+        self.price_per_share = None
+        if self.error is None:
+            try:
+                self.nav = fund_nav(state)
+                self.price_per_share = price_per_share(self.nav, state.total_supply)
+            except OverflowError as e:
+                self.error = str(e)
+        elif state.total_supply == 0 and state.safe is not None and None not in state.assets:
+            # without shares getPricePerShare skips calculateNav, deposits go through
+            self.price_per_share = 10**BASE_DECIMALS
+        self.balances = dict(zip(state.assets, state.tokenizer_balances))
+        self._pricing = {
+            asset: (rate, decimals) for asset, rate, decimals in zip(state.assets, state.rates, state.decimals)
+        }
+
+    @classmethod
+    def load(cls, tokenizers, tickers=TICKERS, block=None, uri=None):
+        """One quoter per tokenizer, all read at the same block"""
+        states = NavEngine(tokenizers, uri).fetch(block)
+        return [cls(state, found, uri) for state, found in zip(states, fetch_tickers(states, tickers, uri))]
+
+    def refresh(self, block=None):
+        """A new quoter for the same fund and tickers at `block`"""
+        state = NavEngine([self.state.tokenizer], self.uri).fetch(block)[0]
+        return Quoter(state, self.tickers, self.uri)
+
+    def _check(self):
+        if self.price_per_share is None:
+            # calculateNav reverts, so do deposit and redeem
+            raise QuoteError(None, self.error)
+
+    def token_value_usd(self, token, amount):
+        """DaaTokenizer.getTokenValueUsd"""
+        return self._token_value(to_checksum_address(str(token)), amount)
+
+    def _token_value(self, token, amount):
+        if token in self.state.base_currencies:
+            return amount
+        if token not in self._pricing or self._pricing[token][0] is None:
+            raise QuoteError(None, "{} is not priced in the snapshot".format(token))
+        rate, decimals = self._pricing[token]
+        try:
+            return token_value_usd(amount, rate, decimals)
+        except OverflowError as e:
+            raise QuoteError(None, str(e))
+
+    def quote_deposit(self, ticker, amount):
+        if ticker not in self.tickers:
+            raise QuoteError(None, "currency not allowed: {}".format(ticker))
+        self._check()
+        token = self.tickers[ticker]
+        value = self._token_value(token, amount)
+        return DepositQuote(ticker, token, amount, value, self.price_per_share, deposit_shares(value, self.price_per_share))
+
+    def quote_redeem(self, shares, holder_shares=None):
+        """Payout of `redeem(shares)`, `holder_shares` checks the burn against the redeemer's balance"""
+        if shares <= 0:
+            raise QuoteError(None, "number of shares to redeem must be > 0")
+        self._check()
+        amount = base_amount(shares, self.price_per_share)
+        if shares > (self.state.total_supply if holder_shares is None else holder_shares):
+            raise QuoteError("ERC20: burn amount exceeds balance")
+        payouts = withdraw_split(amount, self.state.base_currencies, self.balances)
+        return RedeemQuote(shares, self.price_per_share, amount, payouts)
+
+
+def main(tokenizer, action, *args):
+    quoter = Quoter.load([tokenizer])[0]
+    try:
+        if action == "deposit":
+            quote = quoter.quote_deposit(args[0], int(args[1]))
+            print("deposit {} {}: {} shares at {} per share".format(quote.amount, quote.ticker, quote.shares, quote.price_per_share))
+        else:
+            quote = quoter.quote_redeem(int(args[0]))
+            print("redeem {} shares: {} paid as {}".format(quote.shares, quote.base_amount, quote.payouts))
+    except QuoteError as e:
+        print("reverts: {}".format(e))
@@ -0,0 +1,466 @@
+"""Asyncio relayer for DaaModule.executeTransfer and DaaDsaModule.executeTransaction.
+
+Both modules only take calls from an owner of their safe (`isAuthorized`), so
+every relayer key sends for the safes it owns. Operations are queued per key:
+
+ - the operations of a safe stick to one key while any of them is queued or
+   pending, so they are mined in submission order (DSA casts are signed for
+   consecutive module nonces); a new safe goes to its least loaded owner key
+ - nonces are assigned locally and up to `max_in_flight` transactions of a key
+   are pending at once, so throughput grows with the number of keys instead of
+   one transaction per block
+ - a transaction not mined after `bump_after` seconds is sent again with the
+   same nonce and the gas price raised by `FEE_BUMP` (nodes want at least
+   +10%), capped at `max_gas_price`; every hash sent for an operation is
+   watched, whichever gets mined settles it
+ - receipts and nonces of all keys are polled in one JSON-RPC batch every
+   `poll_interval`, over a pooled aiohttp session; a failed round is counted
+   and warned about, the next one picks the pending transactions up again
+
+Each operation resolves to a `Relayed` record with its queue and inclusion
+latency; `metrics()` summarizes them.
+
+    async with Relayer(keys) as relayer:
+        results = await asyncio.gather(*[relayer.relay(op) for op in operations])
+    print(relayer.metrics())
+
+    brownie run scripts/relayer.py main <operations json> [<number of keys>]
+"""
+import asyncio
+import json
+import math
+import time
+import warnings
+from dataclasses import dataclass, field
+from statistics import median
+
+from eth_account import Account
+from eth_utils import to_checksum_address
+
+try:
+    import aiohttp
+except ImportError:  # not a brownie dependency, only needed once a relayer starts
+    aiohttp = None
+
+from scripts.rpc import TIMEOUT, RPCError, call_request, decode_result, encode_call, endpoint
+
+MAX_IN_FLIGHT = 16
+BUMP_AFTER = 15
+FEE_BUMP = 1.125
+POLL_INTERVAL = 0.5
+CONNECTIONS = 8
+GAS_MARGIN = 1.2
+# used when the gas estimate fails because earlier operations of the safe are not mined yet
+DEFAULT_GAS = 1_000_000
+
+
+class AsyncRPC:
+    """JSON-RPC batches over one pooled aiohttp session, see `scripts.rpc.batch_request`."""
+
+    def __init__(self, uri=None, connections=CONNECTIONS):
+        self.uri = uri or endpoint()
+        self.connections = connections
+        self.session = None
+        self.requests = 0
+
+    async def open(self):
+        if aiohttp is None:
+            raise ImportError("the relayer needs aiohttp, install it with `pip install aiohttp`")
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connections), timeout=aiohttp.ClientTimeout(total=TIMEOUT))
+
+    async def close(self):
+        await self.session.close()
+
+    async def batch(self, calls):
+        if not calls:
+            return []
+        payload = [{"jsonrpc": "2.0", "id": i, "method": method, "params": params} for i, (method, params) in enumerate(calls)]
+        self.requests += 1
+        async with self.session.post(self.uri, json=payload) as response:
+            response.raise_for_status()
+            body = await response.json(content_type=None)
+        if isinstance(body, dict):
+            raise RPCError(body.get("error", body))
+        by_id = {item["id"]: item for item in body}
+        return [RPCError(by_id[i]["error"]) if "error" in by_id[i] else by_id[i]["result"] for i in range(len(calls))]
+
+    async def request(self, method, params):
+        result = (await self.batch([(method, params)]))[0]
+        if isinstance(result, RPCError):
+            raise result
+        return result
+
+
+@dataclass
+class Operation:
+    safe: str
+    to: str
+    data: str
+    kind: str = "call"
+    gas: int = None  # estimated when None
+    value: int = 0
+
+
+def execute_transfer(module, safe, token, amount):
+    """DaaModule.executeTransfer, `token` 0x0 for ether"""
+    return Operation(safe, module, encode_call("executeTransfer(address,uint96)", [token, amount]), "executeTransfer")
+
+
+def execute_transaction(module, safe, targets, datas, signatures):
+    """DaaDsaModule.executeTransaction, `signatures` packed as signing_service.pack_signatures does"""
+    data = encode_call("executeTransaction(string[],bytes[],bytes)", [list(targets), list(datas), bytes(signatures)])
+    return Operation(safe, module, data, "executeTransaction")
+
+
+@dataclass
+class Relayed:
+    operation: Operation
+    sender: str = None
+    nonce: int = None
+    hashes: list = field(default_factory=list)  # every hash sent, the last one has the highest price
+    gas: int = None
+    gas_price: int = None
+    hash: str = None  # the mined one
+    status: bool = None
+    block: int = None
+    gas_used: int = None
+    error: str = None
+    submitted: float = None
+    sent: float = None
+    last_sent: float = None
+    mined: float = None
+
+    @property
+    def queue_seconds(self):
+        return None if self.sent is None else self.sent - self.submitted
+
+    @property
+    def inclusion_seconds(self):
+        return None if self.mined is None or self.sent is None else self.mined - self.sent
+
+    @property
+    def latency(self):
+        return None if self.mined is None else self.mined - self.submitted
+
+
+class _Key:
+    def __init__(self, account, max_in_flight):
+        self.address = to_checksum_address(str(account))
+        self.private_key = getattr(account, "private_key", None)
+        self.nonce = None
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.in_flight = {}  # nonce -> (Relayed, future)
+        self.safes = {}      # safe -> operations queued or pending
+
+    @property
+    def load(self):
+        return self.queue.qsize() + len(self.in_flight)
+
+
+class Relayer:
+    """Relays `Operation`s with `keys` (brownie accounts), see the module docstring.
+
+    `owners` maps a safe to its owners, it is read with `getOwners()` for a
+    safe that is not in it. `gas_price` defaults to eth_gasPrice at start.
+    """
+
+    def __init__(self, keys, uri=None, owners=None, gas_price=None, max_gas_price=None, max_in_flight=MAX_IN_FLIGHT,
+                 bump_after=BUMP_AFTER, poll_interval=POLL_INTERVAL, connections=CONNECTIONS):
+        self.rpc = AsyncRPC(uri, connections)
+        self.max_in_flight = max_in_flight
+        self.keys = {k.address: k for k in (_Key(account, max_in_flight) for account in keys)}
+        self.owners = {
+            to_checksum_address(str(s)): {to_checksum_address(str(o)) for o in v} for s, v in (owners or {}).items()}
+        self.gas_price = gas_price
+        self.max_gas_price = max_gas_price
+        self.bump_after = bump_after
+        self.poll_interval = poll_interval
+        self.chain_id = None
+        self.routes = {}     # safe -> key address
+        self.relayed = []
+        self.replacements = 0
+        self.poll_errors = 0
+        self._tasks = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        if exc[0] is None:
+            await self.drain()
+        await self.close()
+
+    async def start(self):
+        await self.rpc.open()
+        calls = [("eth_chainId", []), ("eth_gasPrice", [])] + [
+            ("eth_getTransactionCount", [address, "pending"]) for address in self.keys]
+        results = await self.rpc.batch(calls)
+        for result in results:
+            if isinstance(result, RPCError):
+                raise result
+        self.chain_id = int(results[0], 16)
+        if self.gas_price is None:
+            self.gas_price = int(results[1], 16)
+        for key, count in zip(self.keys.values(), results[2:]):
+            key.nonce = int(count, 16)
+        self._tasks = [asyncio.create_task(self._worker(key)) for key in self.keys.values()]
+        self._tasks.append(asyncio.create_task(self._poller()))
+
+    async def drain(self):
+        """Wait until every submitted operation is settled"""
+        for key in self.keys.values():
+            await key.queue.join()
+        while any(key.in_flight for key in self.keys.values()):
+            await asyncio.sleep(self.poll_interval)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.rpc.close()
+
+    ###############
+    # submission
+
+    async def _owners(self, safe):
+        if safe not in self.owners:
+            raw = await self.rpc.request(*call_request(safe, "getOwners()"))
+            self.owners[safe] = {to_checksum_address(o) for o in decode_result(["address[]"], raw)}
+        return self.owners[safe]
+
+    async def _route(self, safe):
+        key = self.keys.get(self.routes.get(safe))
+        if key is not None and key.safes.get(safe):
+            return key
+        candidates = [self.keys[a] for a in self.keys if a in await self._owners(safe)]
+        if not candidates:
+            raise ValueError("no relayer key owns {}".format(safe))
+        key = min(candidates, key=lambda k: k.load)
+        self.routes[safe] = key.address
+        return key
+
+    async def submit(self, operation):
+        """Queue `operation`, returns a future resolving to its `Relayed` record"""
+        operation.safe, operation.to = to_checksum_address(operation.safe), to_checksum_address(operation.to)
+        key = await self._route(operation.safe)
+        relayed = Relayed(operation, key.address, submitted=time.monotonic())
+        future = asyncio.get_running_loop().create_future()
+        key.safes[operation.safe] = key.safes.get(operation.safe, 0) + 1
+        self.relayed.append(relayed)
+        key.queue.put_nowait((relayed, future))
+        return future
+
+    async def relay(self, operation):
+        return await (await self.submit(operation))
+
+    ###############
+    # sending
+
+    def _settle(self, key, relayed, future, error=None):
+        if error is not None:
+            relayed.error = str(error)
+            relayed.status = False
+        key.safes[relayed.operation.safe] -= 1
+        if relayed.nonce is not None and key.in_flight.pop(relayed.nonce, None) is not None:
+            key.slots.release()
+        if not future.done():
+            future.set_result(relayed)
+
+    async def _gas(self, key, operation):
+        if operation.gas is not None:
+            return operation.gas
+        tx = {"from": key.address, "to": operation.to, "data": operation.data, "value": hex(operation.value)}
+        try:
+            return int(int(await self.rpc.request("eth_estimateGas", [tx]), 16) * GAS_MARGIN)
+        except RPCError:
+            # an earlier operation of the safe may be what makes this one valid
+            if any(r.operation.safe == operation.safe for r, _ in key.in_flight.values()):
+                return DEFAULT_GAS
+            raise
+
+    def _transaction(self, key, relayed):
+        operation = relayed.operation
+        tx = {"nonce": relayed.nonce, "gas": relayed.gas, "gasPrice": relayed.gas_price, "to": operation.to,
+              "value": operation.value, "data": operation.data, "chainId": self.chain_id}
+        if key.private_key is None:
+            tx = {k: hex(v) if isinstance(v, int) else v for k, v in tx.items() if k != "chainId"}
+            return "eth_sendTransaction", [dict(tx, **{"from": key.address})]
+        signed = Account.sign_transaction(tx, key.private_key)
+        raw = getattr(signed, "raw_transaction", None) or signed.rawTransaction
+        return "eth_sendRawTransaction", ["0x" + bytes(raw).hex()]
+
+    async def _send(self, key, relayed):
+        result = (await self.rpc.batch([self._transaction(key, relayed)]))[0]
+        if isinstance(result, RPCError):
+            return result
+        relayed.hashes.append(result)
+        relayed.last_sent = time.monotonic()
+        if relayed.sent is None:
+            relayed.sent = relayed.last_sent
+        return None
+
+    async def _start(self, key, relayed):
+        """Send `relayed` with the next nonce of `key`, returns the error if it was not sent"""
+        try:
+            relayed.gas = await self._gas(key, relayed.operation)
+        except RPCError as e:
+            return e
+        relayed.nonce, relayed.gas_price = key.nonce, self.gas_price
+        error = await self._send(key, relayed)
+        if error is not None and "nonce" in str(error).lower():
+            # the key sent a transaction outside the relayer, take the node's nonce
+            key.nonce = int(await self.rpc.request("eth_getTransactionCount", [key.address, "pending"]), 16)
+            relayed.nonce = key.nonce
+            error = await self._send(key, relayed)
+        return error
+
+    async def _worker(self, key):
+        while True:
+            relayed, future = await key.queue.get()
+            await key.slots.acquire()
+            try:
+                error = await self._start(key, relayed)
+            except Exception as e:
+                # a bad operation or a failed request must not stop the queue of the key
+                error = e
+            if error is None:
+                key.nonce += 1
+                key.in_flight[relayed.nonce] = (relayed, future)
+            else:
+                relayed.nonce = None
+                key.slots.release()
+                self._settle(key, relayed, future, error)
+            key.queue.task_done()
+
+    ###############
+    # receipts and replacements
+
+    async def _poller(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                # a failed round (node timeout, batch error) is polled again, the pending operations stay in flight
+                self.poll_errors += 1
+                warnings.warn("relayer poll failed: {!r}".format(e))
+
+    async def poll(self):
+        """Settle mined operations and replace the stuck ones"""
+        keys = [key for key in self.keys.values() if key.in_flight]
+        if not keys:
+            return
+        pending = [(key, nonce, relayed) for key in keys for nonce, (relayed, _) in list(key.in_flight.items())]
+        # nonces are read before the receipts, so a nonce used by none of our hashes is really lost
+        calls = [("eth_getTransactionCount", [key.address, "latest"]) for key in keys]
+        calls += [("eth_getTransactionReceipt", [h]) for _, _, relayed in pending for h in relayed.hashes]
+        results = await self.rpc.batch(calls)
+        counts = {key.address: int(count, 16) for key, count in zip(keys, results) if not isinstance(count, RPCError)}
+        receipts = iter(results[len(keys):])
+        now = time.monotonic()
+        stuck = []
+        for key, nonce, relayed in pending:
+            receipt = None
+            for h in relayed.hashes:
+                found = next(receipts)
+                if found is not None and not isinstance(found, RPCError):
+                    receipt = found
+            if receipt is not None:
+                relayed.hash = receipt["transactionHash"]
+                relayed.status = int(receipt["status"], 16) == 1
+                relayed.block = int(receipt["blockNumber"], 16)
+                relayed.gas_used = int(receipt["gasUsed"], 16)
+                relayed.mined = now
+                self._settle(key, relayed, key.in_flight[nonce][1])
+            elif nonce < counts.get(key.address, 0):
+                self._settle(key, relayed, key.in_flight[nonce][1], "nonce {} used by another transaction".format(nonce))
+            elif now - relayed.last_sent >= self.bump_after:
+                stuck.append((key, relayed))
+        for key, relayed in stuck:
+            await self._bump(key, relayed)
+
+    async def _bump(self, key, relayed):
+        price = max(int(relayed.gas_price * FEE_BUMP) + 1, self.gas_price)
+        if self.max_gas_price is not None:
+            price = min(price, self.max_gas_price)
+        if price <= relayed.gas_price:
+            # at the cap, broadcast again in case the node dropped it
+            price = relayed.gas_price
+        previous = relayed.gas_price
+        relayed.gas_price = price
+        error = await self._send(key, relayed)
+        if error is None:
+            self.replacements += price > previous
+        else:
+            # e.g. underpriced for the node, raised again on the next round
+            relayed.last_sent = time.monotonic()
+
+    ###############
+    # metrics
+
+    def metrics(self):
+        """Counts and latency percentiles (seconds) of the settled operations"""
+        mined = [r for r in self.relayed if r.mined is not None]
+
+        def summary(values):
+            values = sorted(v for v in values if v is not None)
+            if not values:
+                return None
+            # nearest rank
+            return {"p50": median(values), "p95": values[math.ceil(0.95 * len(values)) - 1], "max": values[-1]}
+
+        by_key = {}
+        for r in mined:
+            by_key[r.sender] = by_key.get(r.sender, 0) + 1
+        return {
+            "submitted": len(self.relayed),
+            "mined": len(mined),
+            "reverted": sum(r.status is False and r.mined is not None for r in self.relayed),
+            "failed": sum(r.mined is None and r.error is not None for r in self.relayed),
+            "replacements": self.replacements,
+            "poll_errors": self.poll_errors,
+            "rpc_requests": self.rpc.requests,
+            "latency": summary(r.latency for r in mined),
+            "queue": summary(r.queue_seconds for r in mined),
+            "inclusion": summary(r.inclusion_seconds for r in mined),
+            "by_key": by_key,
+            "by_kind": {kind: summary(r.latency for r in mined if r.operation.kind == kind)
+                        for kind in sorted({r.operation.kind for r in mined})},
+        }
+
+
+def load_operations(path):
+    """`[{"kind": "executeTransfer", "module", "safe", "token", "amount"} | {"kind": "executeTransaction",
+    "module", "safe", "targets", "datas", "signatures"}]`, bytes as 0x hex"""
+    with open(path) as fp:
+        entries = json.load(fp)
+    operations = []
+    for e in entries:
+        if e["kind"] == "executeTransfer":
+            operations.append(execute_transfer(e["module"], e["safe"], e["token"], int(e["amount"])))
+        else:
+            datas = [bytes.fromhex(d[2:]) for d in e["datas"]]
+            operations.append(execute_transaction(
+                e["module"], e["safe"], e["targets"], datas, bytes.fromhex(e["signatures"][2:])))
+    return operations
+
+
+def main(operations, keys=1):
+    from brownie import accounts, config
+
+    relayer_keys = accounts.from_mnemonic(config["wallets"]["from_mnemonic"], count=int(keys))
+    relayer_keys = relayer_keys if isinstance(relayer_keys, list) else [relayer_keys]
+    operations = load_operations(operations)
+
+    async def run():
+        async with Relayer(relayer_keys) as relayer:
+            results = await asyncio.gather(*[relayer.relay(op) for op in operations])
+        return relayer, results
+
+    relayer, results = asyncio.run(run())
+    for r in results:
+        print("{} {} {}".format(r.operation.kind, r.hash or "-", "ok" if r.status else r.error or "reverted"))
+    print(json.dumps(relayer.metrics(), indent=2))
@@ -0,0 +1,164 @@
+"""Batched JSON-RPC helpers shared by the off-chain tooling scripts.
+
+Every read here goes out as a JSON-RPC batch (one HTTP round-trip per
+`BATCH_SIZE` requests) instead of one eth_call per getter.
+"""
+import requests
+from eth_utils import function_signature_to_4byte_selector, to_checksum_address
+
+try:
+    from eth_abi import decode, encode
+except ImportError:  # eth-abi < 4
+    from eth_abi import decode_abi as decode, encode_abi as encode
+
+
+BATCH_SIZE = 500
+TIMEOUT = 60
+
+_session = requests.Session()
+
+
+class RPCError(Exception):
+    """Error returned by the node for a single request of a batch."""
+
+    def __init__(self, error):
+        self.code = error.get("code")
+        self.data = error.get("data")
+        super().__init__(error.get("message", error))
+
+
+def endpoint():
+    # brownie is only loaded when no uri is given (scripts/cli.py always passes one)
+    from brownie import web3
+
+    return web3.provider.endpoint_uri
+
+
+def block_tag(block="latest"):
+    if isinstance(block, int):
+        return hex(block)
+    return block
+
+
+def batch_request(calls, uri=None, batch_size=BATCH_SIZE):
+    """Send `(method, params)` pairs as JSON-RPC batches.
+
+    Results are returned in the order of `calls`. A failed request (e.g. a
+    reverted eth_call) is returned as an `RPCError` instead of being raised, so
+    one bad entry does not sink the rest of the batch.
+    """
+    uri = uri or endpoint()
+    results = []
+    for start in range(0, len(calls), batch_size):
+        chunk = calls[start:start + batch_size]
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+            for i, (method, params) in enumerate(chunk)
+        ]
+        response = _session.post(uri, json=payload, timeout=TIMEOUT)
+        response.raise_for_status()
+        body = response.json()
+        if isinstance(body, dict):
+            # the node rejected the batch as a whole
+            raise RPCError(body.get("error", body))
+        by_id = {item["id"]: item for item in body}
+        for i in range(len(chunk)):
+            item = by_id[i]
+            if "error" in item:
+                results.append(RPCError(item["error"]))
+            else:
+                results.append(item["result"])
+    return results
+
+
+def request(method, params, uri=None):
+    """Send a single JSON-RPC request and raise on error."""
+    result = batch_request([(method, params)], uri)[0]
+    if isinstance(result, RPCError):
+        raise result
+    return result
+
+
+def _arg_types(signature):
+    inner = signature[signature.index("(") + 1:-1]
+    return [t for t in inner.split(",") if t]
+
+
+def encode_call(signature, args=()):
+    """ABI encode calldata for e.g. `encode_call("balanceOf(address)", [holder])`."""
+    data = function_signature_to_4byte_selector(signature)
+    types = _arg_types(signature)
+    if types:
+        data += encode(types, list(args))
+    return "0x" + data.hex()
+
+
+def decode_result(returns, data):
+    values = decode(list(returns), bytes.fromhex(data[2:]))
+    values = [to_checksum_address(v) if t == "address" else v for t, v in zip(returns, values)]
+    return values[0] if len(values) == 1 else tuple(values)
+
+
+def call_request(to, signature, args=(), block="latest"):
+    return ("eth_call", [{"to": to, "data": encode_call(signature, args)}, block_tag(block)])
+
+
+def storage_request(address, slot, block="latest"):
+    return ("eth_getStorageAt", [address, hex(slot), block_tag(block)])
+
+
+class Batch:
+    """Queue eth_call and eth_getStorageAt reads and send them as one batch.
+
+    `call`/`storage` return the position of the read in the list returned by
+    `execute`. Storage words are decoded to int, calls with their `returns`
+    types; failed reads are returned as `RPCError`.
+    """
+
+    def __init__(self, block="latest", uri=None):
+        self.block = block
+        self.uri = uri
+        self._requests = []
+        self._decoders = []
+
+    def __len__(self):
+        return len(self._requests)
+
+    def call(self, to, signature, args=(), returns=("uint256",)):
+        self._requests.append(call_request(to, signature, args, self.block))
+        self._decoders.append(lambda data: decode_result(returns, data))
+        return len(self._requests) - 1
+
+    def storage(self, address, slot):
+        self._requests.append(storage_request(address, slot, self.block))
+        self._decoders.append(lambda data: int(data, 16))
+        return len(self._requests) - 1
+
+    def execute(self):
+        if not self._requests:
+            return []
+        results = []
+        for decoder, raw in zip(self._decoders, batch_request(self._requests, self.uri)):
+            if isinstance(raw, RPCError):
+                results.append(raw)
+            elif raw in ("0x", None):
+                # call to an address without code, solidity reverts on the empty return data
+                results.append(RPCError({"message": "empty return data"}))
+            else:
+                try:
+                    results.append(decoder(raw))
+                except Exception as e:
+                    results.append(RPCError({"message": str(e)}))
+        return results
+
+
+def multicall(calls, block="latest", uri=None):
+    """Batch a list of `(to, signature, args, returns)` view calls.
+
+    Returns the decoded values in order (a single value is unwrapped); a call
+    that reverted is returned as an `RPCError`.
+    """
+    batch = Batch(block, uri)
+    for to, signature, args, returns in calls:
+        batch.call(to, signature, args, returns)
+    return batch.execute()
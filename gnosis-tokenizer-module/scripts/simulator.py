@@ -0,0 +1,362 @@
+"""Pre-flight simulation of module and tokenizer calls against a pinned block.
+
+`Simulator.simulate(calls)` predicts, for each candidate `Call` on its own,
+whether it reverts (and why), its gas use, the events it emits and the
+resulting balance changes, without sending anything. Two backends:
+
+ - `TraceBackend`: `debug_traceCall` with the call tracer against any node
+   that has it (geth, erigon, anvil), with geth style state overrides per
+   call; calls go out as JSON-RPC batches, `workers` batches in flight
+ - `ForkBackend`: a local dev node or fork (ganache, anvil, hardhat); each
+   call runs from an `evm_snapshot`, overrides are written with the
+   cheatcodes of scripts/fork_snapshot.py and the transaction is mined,
+   then rolled back. One call at a time, the node's state is global.
+
+Token movements (`pullFromSafe`/`prepFunds` of `DaaDsaModule.executeTransaction`,
+`_sendFunds` of `DaaTokenizer.redeem`, deposits) are summed from the ERC20
+`Transfer` logs into `deltas[holder][token]`; ether is keyed by `NATIVE` as
+the DSA module does. The trace backend follows every value transfer of the
+call tree, the fork backend reads the ether balances of the sender, the
+target and `Call.watch`, net of the transaction fee.
+
+Results are cached by block, sender, target, calldata, value and overrides,
+so alternatives evaluated again in the same block are free; `pin()` moves
+to a new block.
+
+    brownie run scripts/simulator.py main <calls json> [<block>]
+"""
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+
+from eth_utils import keccak, to_checksum_address
+
+from scripts.artifacts import load_abi
+from scripts.fork_snapshot import SET_CODE, SET_STORAGE
+from scripts.logs import EventDecoder
+from scripts.nav_tracker import TRANSFER, _address, _words
+from scripts.rpc import RPCError, batch_request, block_tag, decode_result, encode_call, request
+
+NATIVE = "0xEeeeeEeeeEeEeeEeEeEeeEEEeeeeEeeeeeeeEEeE"
+SET_BALANCE = ("evm_setAccountBalance", "anvil_setBalance", "hardhat_setBalance")
+IMPERSONATE = ("anvil_impersonateAccount", "hardhat_impersonateAccount")
+GAS = 10_000_000
+CACHE_SIZE = 4096
+WORKERS = 8
+BATCH_SIZE = 20
+ERROR_SELECTOR = "0x08c379a0"  # Error(string)
+PANIC_SELECTOR = "0x4e487b71"  # Panic(uint256)
+# contracts whose events are decoded, when compiled
+ABIS = ("DaaTokenizer", "TokenizedShare", "PositionManager", "DaaModule", "DaaDsaModule")
+ERC20_EVENTS = [
+    {"type": "event", "name": "Transfer", "anonymous": False, "inputs": [
+        {"name": "from", "type": "address", "indexed": True},
+        {"name": "to", "type": "address", "indexed": True},
+        {"name": "value", "type": "uint256", "indexed": False}]},
+    {"type": "event", "name": "Approval", "anonymous": False, "inputs": [
+        {"name": "owner", "type": "address", "indexed": True},
+        {"name": "spender", "type": "address", "indexed": True},
+        {"name": "value", "type": "uint256", "indexed": False}]},
+]
+
+
+@dataclass
+class Call:
+    """A transaction to simulate.
+
+    `overrides` are geth state overrides, `{address: {"balance", "nonce",
+    "code", "state", "stateDiff"}}`; `watch` adds addresses whose ether
+    balance the fork backend reads.
+    """
+
+    sender: str
+    to: str
+    data: str
+    value: int = 0
+    overrides: dict = None
+    label: str = None
+    watch: tuple = ()
+
+    def key(self, block):
+        overrides = json.dumps(self.overrides, sort_keys=True) if self.overrides else None
+        return block, self.sender.lower(), self.to.lower(), self.data.lower(), self.value, overrides
+
+
+@dataclass
+class Simulation:
+    call: Call
+    block: int
+    success: bool = None
+    gas_used: int = None
+    output: str = None           # return data, or revert data
+    revert_reason: str = None
+    logs: list = field(default_factory=list)
+    events: list = field(default_factory=list)  # (name, args) per log, None when not decoded
+    deltas: dict = field(default_factory=dict)  # holder -> token (NATIVE for ether) -> signed amount
+    error: str = None            # the simulation itself failed (node error)
+
+
+def deposit(tokenizer, sender, ticker, amount, **kwargs):
+    return Call(sender, tokenizer, encode_call("deposit(string,uint256)", [ticker, amount]), **kwargs)
+
+
+def redeem(tokenizer, sender, shares, **kwargs):
+    return Call(sender, tokenizer, encode_call("redeem(uint256)", [shares]), **kwargs)
+
+
+def execute_transaction(module, sender, targets, datas, signatures, **kwargs):
+    """DaaDsaModule.executeTransaction, see scripts/relayer.py for the signatures"""
+    data = encode_call("executeTransaction(string[],bytes[],bytes)", [list(targets), list(datas), bytes(signatures)])
+    return Call(sender, module, data, **kwargs)
+
+
+def balance_override(token, holder, amount, slot=0, vyper=False):
+    """stateDiff setting `balanceOf(holder)` of a token keeping `balances` at mapping `slot`
+    (0 for the OpenZeppelin ERC20, see `fork_snapshot.balance_slot` to find it)"""
+    key, word = bytes.fromhex(holder[2:].rjust(64, "0")), slot.to_bytes(32, "big")
+    location = keccak(word + key if vyper else key + word)
+    return {token: {"stateDiff": {"0x" + location.hex(): "0x" + amount.to_bytes(32, "big").hex()}}}
+
+
+def merge_overrides(*overrides):
+    """One override out of several, stateDiffs of the same account are merged"""
+    merged = {}
+    for override in overrides:
+        for address, fields in override.items():
+            account = merged.setdefault(address, {})
+            for name, value in fields.items():
+                account[name] = {**account.get(name, {}), **value} if isinstance(value, dict) else value
+    return merged
+
+
+def revert_reason(data):
+    """Reason string of `Error(string)`, `Panic(0x..)`, None for an empty or custom revert"""
+    if not data or len(data) < 10:
+        return None
+    if data[:10] == ERROR_SELECTOR:
+        return decode_result(("string",), "0x" + data[10:])
+    if data[:10] == PANIC_SELECTOR:
+        return "Panic({})".format(hex(decode_result(("uint256",), "0x" + data[10:])))
+    return None
+
+
+def _decoder():
+    abis = [ERC20_EVENTS]
+    for name in ABIS:
+        try:
+            abis.append(load_abi(name))
+        except FileNotFoundError:
+            pass
+    return EventDecoder(*abis)
+
+
+def _position(log, default):
+    """Subcalls made before a call tracer log, absent on older nodes"""
+    position = log.get("position", default)
+    return int(position, 16) if isinstance(position, str) else position
+
+
+def _add(deltas, holder, token, amount):
+    if amount:
+        tokens = deltas.setdefault(holder, {})
+        tokens[token] = tokens.get(token, 0) + amount
+
+
+class TraceBackend:
+    def __init__(self, uri=None, workers=WORKERS, batch_size=BATCH_SIZE):
+        self.uri = uri
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def _params(self, call, block):
+        tx = {"from": call.sender, "to": call.to, "data": call.data, "value": hex(call.value), "gas": hex(GAS)}
+        config = {"tracer": "callTracer", "tracerConfig": {"withLog": True}}
+        if call.overrides:
+            config["stateOverrides"] = call.overrides
+        return ("debug_traceCall", [tx, block_tag(block), config])
+
+    def _trace(self, chunk, block):
+        return batch_request([self._params(call, block) for call in chunk], self.uri)
+
+    def run(self, calls, block):
+        chunks = [calls[i:i + self.batch_size] for i in range(0, len(calls), self.batch_size)]
+        with ThreadPoolExecutor(self.workers) as pool:
+            traces = [t for chunk in pool.map(lambda c: self._trace(c, block), chunks) for t in chunk]
+        return [self._simulation(call, block, trace) for call, trace in zip(calls, traces)]
+
+    def _simulation(self, call, block, trace):
+        simulation = Simulation(call, block)
+        if isinstance(trace, RPCError):
+            simulation.error = str(trace)
+            return simulation
+        simulation.gas_used = int(trace["gasUsed"], 16)
+        simulation.output = trace.get("output", "0x")
+        simulation.success = "error" not in trace
+        if not simulation.success:
+            simulation.revert_reason = trace.get("revertReason") or revert_reason(simulation.output) or trace["error"]
+            return simulation
+        self._walk(trace, simulation)
+        return simulation
+
+    def _walk(self, frame, simulation):
+        """Logs and value transfers of the frames that did not revert, in execution order"""
+        if "error" in frame:
+            return
+        value = int(frame.get("value") or "0x0", 16)
+        if value and frame["type"] in ("CALL", "CREATE", "CREATE2", "SELFDESTRUCT"):
+            _add(simulation.deltas, to_checksum_address(frame["from"]), NATIVE, -value)
+            _add(simulation.deltas, to_checksum_address(frame["to"]), NATIVE, value)
+        calls, logs = frame.get("calls", []), frame.get("logs", [])
+        position = 0
+        for i, call in enumerate(calls + [None]):
+            while position < len(logs) and _position(logs[position], len(calls)) <= i:
+                simulation.logs.append(dict(logs[position], address=to_checksum_address(logs[position]["address"])))
+                position += 1
+            if call is not None:
+                self._walk(call, simulation)
+
+
+class ForkBackend:
+    def __init__(self, uri=None):
+        self.uri = uri
+
+    def _cheatcode(self, methods, params, what):
+        for method in methods:
+            if not isinstance(batch_request([(method, params)], self.uri)[0], RPCError):
+                return
+        raise RuntimeError("local node does not support setting account {}".format(what))
+
+    def _override(self, overrides):
+        for address, fields in (overrides or {}).items():
+            unsupported = set(fields) - {"balance", "code", "stateDiff"}
+            if unsupported:
+                raise ValueError("the fork backend cannot override {}".format(", ".join(sorted(unsupported))))
+            if "balance" in fields:
+                balance = fields["balance"]
+                self._cheatcode(SET_BALANCE, [address, balance if isinstance(balance, str) else hex(balance)], "balance")
+            if "code" in fields:
+                self._cheatcode(SET_CODE, [address, fields["code"]], "code")
+            for slot, value in fields.get("stateDiff", {}).items():
+                self._cheatcode(SET_STORAGE, [address, slot, value], "storage")
+
+    def _balances(self, addresses):
+        results = batch_request([("eth_getBalance", [a, "latest"]) for a in addresses], self.uri)
+        return {a: int(r, 16) for a, r in zip(addresses, results) if not isinstance(r, RPCError)}
+
+    def run(self, calls, block):
+        head = int(request("eth_blockNumber", [], self.uri), 16)
+        if block != head:
+            raise ValueError("the fork backend simulates at the local head {}, not at block {}".format(head, block))
+        return [self._run(call, block) for call in calls]
+
+    def _run(self, call, block):
+        simulation = Simulation(call, block)
+        snapshot = request("evm_snapshot", [], self.uri)
+        try:
+            self._override(call.overrides)
+            for method in IMPERSONATE:
+                if not isinstance(batch_request([(method, [call.sender])], self.uri)[0], RPCError):
+                    break
+            tx = {"from": call.sender, "to": call.to, "data": call.data, "value": hex(call.value), "gas": hex(GAS)}
+            result = batch_request([("eth_call", [tx, "latest"])], self.uri)[0]
+            if isinstance(result, RPCError):
+                simulation.success = False
+                data = result.data.get("data") if isinstance(result.data, dict) else result.data
+                simulation.output = data if isinstance(data, str) else None
+                simulation.revert_reason = revert_reason(simulation.output) or str(result)
+                # the gas a reverting transaction burns
+                tx_hash = batch_request([("eth_sendTransaction", [tx])], self.uri)[0]
+                if not isinstance(tx_hash, RPCError):
+                    receipt = request("eth_getTransactionReceipt", [tx_hash], self.uri)
+                    simulation.gas_used = int(receipt["gasUsed"], 16)
+                return simulation
+            watched = list(dict.fromkeys(to_checksum_address(a) for a in (call.sender, call.to) + tuple(call.watch)))
+            before = self._balances(watched)
+            receipt = request("eth_getTransactionReceipt", [request("eth_sendTransaction", [tx], self.uri)], self.uri)
+            after = self._balances(watched)
+            simulation.success = int(receipt["status"], 16) == 1
+            simulation.output = result
+            simulation.gas_used = int(receipt["gasUsed"], 16)
+            simulation.logs = [dict(log, address=to_checksum_address(log["address"])) for log in receipt["logs"]]
+            fee = simulation.gas_used * int(receipt.get("effectiveGasPrice") or "0x0", 16)
+            for address in watched:
+                spent = fee if address == to_checksum_address(call.sender) else 0
+                _add(simulation.deltas, address, NATIVE, after[address] - before[address] + spent)
+        except RPCError as e:
+            simulation.error = str(e)
+        finally:
+            request("evm_revert", [snapshot], self.uri)
+        return simulation
+
+
+class Simulator:
+    """Simulate calls at `block` (the head by default) with a backend and an LRU cache of `cache_size` results"""
+
+    def __init__(self, backend=None, block=None, cache_size=CACHE_SIZE, uri=None):
+        self.uri = uri
+        self.backend = backend or TraceBackend(uri)
+        self.decoder = _decoder()
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.hits = 0
+        self.simulated = 0
+        self.pin(block)
+
+    def pin(self, block=None):
+        """Simulate against `block` from now on, the head by default"""
+        self.block = int(request("eth_blockNumber", [], self.uri), 16) if block is None else block
+        return self.block
+
+    def simulate(self, calls):
+        """`Simulation` of every call, each on its own against the pinned block"""
+        keys = [call.key(self.block) for call in calls]
+        missing = OrderedDict((k, c) for k, c in zip(keys, calls) if k not in self.cache)
+        self.hits += len(calls) - len(missing)
+        self.simulated += len(missing)
+        fresh = {}
+        for key, simulation in zip(missing, self.backend.run(list(missing.values()), self.block) if missing else []):
+            fresh[key] = simulation
+            if simulation.error is None:
+                # node errors are not cached, the next attempt simulates again
+                self._decode(simulation)
+                self.cache[key] = simulation
+        results = []
+        for key, call in zip(keys, calls):
+            simulation = fresh.get(key) or self.cache[key]
+            if key in self.cache:
+                self.cache.move_to_end(key)
+            results.append(simulation if simulation.call is call else replace(simulation, call=call))
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return results
+
+    def _decode(self, simulation):
+        for log in simulation.logs:
+            try:
+                decoded = self.decoder.decode(log)
+            except Exception:
+                decoded = None  # e.g. an ERC721 Transfer, the token id is indexed
+            simulation.events.append(decoded)
+            if log["topics"][0] == TRANSFER and len(log["topics"]) == 3:
+                amount = _words(log["data"])[0]
+                _add(simulation.deltas, _address(log["topics"][1]), log["address"], -amount)
+                _add(simulation.deltas, _address(log["topics"][2]), log["address"], amount)
+
+
+def main(path, block=None):
+    with open(path) as fp:
+        calls = [Call(**c) for c in json.load(fp)]
+    simulator = Simulator(block=None if block is None else int(block))
+    for simulation in simulator.simulate(calls):
+        call = simulation.call
+        name = call.label or "{} -> {}".format(call.sender, call.to)
+        if simulation.error:
+            print("{}: simulation failed ({})".format(name, simulation.error))
+        elif simulation.success:
+            print("{}: ok, {} gas, {} events".format(name, simulation.gas_used, len(simulation.logs)))
+            for holder, tokens in simulation.deltas.items():
+                print("    {} {}".format(holder, tokens))
+        else:
+            print("{}: reverts ({}), {} gas".format(name, simulation.revert_reason, simulation.gas_used))
+    return simulator
@@ -0,0 +1,430 @@
+"""Storage layout aware state reader for DaaTokenizer, DaaDsaModule, PositionManager and proxies.
+
+The full state of a module is read with batched eth_getStorageAt calls and
+decoded with the compiler's storage layout (solc `storageLayout` format) instead
+of one eth_call per getter:
+
+ - value types are unpacked from their slot and offset
+ - dynamic arrays and `EnumerableSet`s read their length, then their items
+ - mappings, nested ones included, are read for the keys given by the caller
+   (e.g. `{"approvedHashes": [(owner, hash)]}`, `{"_erc20Contracts": ["USDC"]}`)
+
+Reads of every instance run side by side: a round sends one batch with every
+slot known so far (fixed variables, lengths, mapping entries, ERC1967 slots),
+the next one the array items. A few hundred instances take two batches.
+
+Storage is read at the given address, so a `ProxyHandler` is read with the
+layout of its implementation; the ERC1967 implementation and admin slots are
+read in the same batch and reported on the state. The proxy's own `Ownable`
+owner shares slot 0 with `DaaTokenizer.owner`, as for the `owner()` getter.
+
+The layout comes from the artifact when the compiler emitted it (forge with
+`extra_output = ["storageLayout"]`); brownie does not, so the layouts of the
+contracts below are kept in `LAYOUTS` and must follow their declarations.
+
+    brownie run scripts/state_reader.py main DaaTokenizer <address> [<address> ...]
+"""
+import re
+from dataclasses import dataclass, field, fields
+from functools import lru_cache
+
+from eth_utils import keccak, to_checksum_address
+
+from scripts.artifacts import load_artifact
+from scripts.rpc import Batch, RPCError, request
+
+# ERC1967: bytes32(uint256(keccak256("eip1967.proxy.implementation")) - 1), same for admin
+IMPLEMENTATION_SLOT = 0x360894a13ba1a3210667c828492db98dca3e2076cc3735a920a3ca505d382bbc
+ADMIN_SLOT = 0xb53127684a568b3173ae13b9f8a6016e243e63b6e8ee1178d6a717850b5d6103
+SETS = re.compile(r"t_struct\((AddressSet|Bytes32Set|UintSet)\)")
+
+
+def _var(label, slot, type_, offset=0):
+    return {"label": label, "slot": str(slot), "offset": offset, "type": type_}
+
+
+def _type(label, encoding, size, **extra):
+    return dict(label=label, encoding=encoding, numberOfBytes=str(size), **extra)
+
+
+TYPES = {
+    "t_address": _type("address", "inplace", 20),
+    "t_bool": _type("bool", "inplace", 1),
+    "t_uint256": _type("uint256", "inplace", 32),
+    "t_bytes32": _type("bytes32", "inplace", 32),
+    "t_enum(LiquidityPool)": _type("enum PositionManager.LiquidityPool", "inplace", 1),
+    "t_string_memory_ptr": _type("string", "bytes", 32),
+    "t_array(t_address)dyn_storage": _type("address[]", "dynamic_array", 32, base="t_address"),
+    "t_array(t_bytes32)dyn_storage": _type("bytes32[]", "dynamic_array", 32, base="t_bytes32"),
+    "t_array(t_enum(LiquidityPool))dyn_storage": _type(
+        "enum PositionManager.LiquidityPool[]", "dynamic_array", 32, base="t_enum(LiquidityPool)"),
+    "t_mapping(t_bytes32,t_uint256)": _type(
+        "mapping(bytes32 => uint256)", "mapping", 32, key="t_bytes32", value="t_uint256"),
+    "t_mapping(t_string_memory_ptr,t_bool)": _type(
+        "mapping(string => bool)", "mapping", 32, key="t_string_memory_ptr", value="t_bool"),
+    "t_mapping(t_string_memory_ptr,t_address)": _type(
+        "mapping(string => address)", "mapping", 32, key="t_string_memory_ptr", value="t_address"),
+    "t_mapping(t_string_memory_ptr,t_array(t_enum(LiquidityPool))dyn_storage)": _type(
+        "mapping(string => enum PositionManager.LiquidityPool[])", "mapping", 32,
+        key="t_string_memory_ptr", value="t_array(t_enum(LiquidityPool))dyn_storage"),
+    "t_mapping(t_address,t_mapping(t_bytes32,t_uint256))": _type(
+        "mapping(address => mapping(bytes32 => uint256))", "mapping", 32,
+        key="t_address", value="t_mapping(t_bytes32,t_uint256)"),
+    "t_struct(Set)_storage": _type("struct EnumerableSet.Set", "inplace", 64, members=[
+        _var("_values", 0, "t_array(t_bytes32)dyn_storage"),
+        _var("_indexes", 1, "t_mapping(t_bytes32,t_uint256)"),
+    ]),
+    "t_struct(AddressSet)_storage": _type("struct EnumerableSet.AddressSet", "inplace", 64, members=[
+        _var("_inner", 0, "t_struct(Set)_storage"),
+    ]),
+}
+
+# contract and interface typed variables are kept as plain addresses
+LAYOUTS = {
+    "DaaTokenizer": {"types": TYPES, "storage": [
+        _var("owner", 0, "t_address"),
+        _var("_whitelisted", 1, "t_address"),
+        _var("_safe", 2, "t_address"),
+        _var("_positionManager", 3, "t_address"),
+        _var("_tokenizedShare", 4, "t_address"),
+        _var("_oracleHandler", 5, "t_address"),
+        _var("_spenders", 6, "t_struct(AddressSet)_storage"),
+        _var("initialized", 8, "t_bool"),
+        _var("allowedAssets", 9, "t_struct(AddressSet)_storage"),
+        _var("baseCurrencies", 11, "t_array(t_address)dyn_storage"),
+        _var("_AuthorizedCurrencyTickers", 12, "t_mapping(t_string_memory_ptr,t_bool)"),
+        _var("_erc20Contracts", 13, "t_mapping(t_string_memory_ptr,t_address)"),
+    ]},
+    "DaaDsaModule": {"types": TYPES, "storage": [
+        _var("safe", 0, "t_address"),
+        _var("account", 1, "t_address"),
+        _var("instaIndex", 2, "t_address"),
+        _var("native", 3, "t_address"),
+        _var("nonce", 4, "t_uint256"),
+        _var("threshold", 5, "t_uint256"),
+        _var("initialized", 6, "t_bool"),
+        _var("DOMAIN_SEPARATOR", 7, "t_bytes32"),
+        _var("approvedHashes", 8, "t_mapping(t_address,t_mapping(t_bytes32,t_uint256))"),
+    ]},
+    "PositionManager": {"types": TYPES, "storage": [
+        _var("poolsByCurrency", 0, "t_mapping(t_string_memory_ptr,t_array(t_enum(LiquidityPool))dyn_storage)"),
+        _var("_erc20Contracts", 1, "t_mapping(t_string_memory_ptr,t_address)"),
+        _var("_connectors", 2, "t_mapping(t_string_memory_ptr,t_address)"),
+        _var("_connectorsList", 3, "t_struct(AddressSet)_storage"),
+        _var("_safe", 5, "t_address"),
+    ]},
+}
+
+
+@lru_cache(maxsize=None)
+def load_layout(name):
+    """Storage layout of a contract, from its artifact when compiled with one"""
+    try:
+        layout = load_artifact(name).get("storageLayout")
+    except FileNotFoundError:
+        layout = None
+    if layout:
+        return layout
+    if name not in LAYOUTS:
+        raise ValueError("no storage layout for {}, compile it with storageLayout output".format(name))
+    return LAYOUTS[name]
+
+
+@dataclass
+class ModuleState:
+    """Decoded storage of one contract; `values` holds every variable by its label."""
+
+    contract: str
+    address: str
+    block: int
+    implementation: str = None  # ERC1967 slots, None when not a proxy
+    admin: str = None
+    values: dict = field(default_factory=dict)
+    error: str = None
+
+
+@dataclass
+class TokenizerState(ModuleState):
+    owner: str = None
+    whitelisted: str = None
+    safe: str = None
+    position_manager: str = None
+    tokenized_share: str = None
+    oracle_handler: str = None
+    spenders: list = field(default_factory=list)
+    initialized: bool = False
+    allowed_assets: list = field(default_factory=list)
+    base_currencies: list = field(default_factory=list)
+    authorized_currency_tickers: dict = field(default_factory=dict)
+    erc20_contracts: dict = field(default_factory=dict)
+
+
+@dataclass
+class DsaModuleState(ModuleState):
+    safe: str = None
+    account: str = None
+    insta_index: str = None
+    native: str = None
+    nonce: int = 0
+    threshold: int = 0
+    initialized: bool = False
+    domain_separator: str = None
+    # {(owner, hash): approved} for the keys asked for
+    approved_hashes: dict = field(default_factory=dict)
+
+
+@dataclass
+class PositionManagerState(ModuleState):
+    pools_by_currency: dict = field(default_factory=dict)
+    erc20_contracts: dict = field(default_factory=dict)
+    connectors: dict = field(default_factory=dict)  # by connector name, for the names asked for
+    connectors_list: list = field(default_factory=list)
+    safe: str = None
+
+
+STATES = {"DaaTokenizer": TokenizerState, "DaaDsaModule": DsaModuleState, "PositionManager": PositionManagerState}
+
+
+def field_name(label):
+    """`_positionManager` -> `position_manager`, `DOMAIN_SEPARATOR` -> `domain_separator`"""
+    return re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", label.strip("_")).lower()
+
+
+###############
+# slots and words
+
+def _word(value):
+    return value.to_bytes(32, "big")
+
+
+def _data_slot(slot):
+    return int.from_bytes(keccak(_word(slot)), "big")
+
+
+def encode_key(key, key_type):
+    """Mapping key as hashed by solidity: packed bytes for strings and bytes, a 32 bytes word otherwise"""
+    if key_type.startswith(("t_string", "t_bytes_")):
+        return key.encode() if isinstance(key, str) else bytes(key)
+    if key_type.startswith("t_bytes"):
+        # bytesN is left aligned
+        raw = bytes.fromhex(key[2:]) if isinstance(key, str) else bytes(key)
+        return raw.ljust(32, b"\0")
+    if not isinstance(key, int):
+        key = int(str(key), 16)  # addresses, brownie accounts and contracts
+    return _word(key % 2**256)
+
+
+def mapping_slot(slot, path, key_types):
+    for key, key_type in zip(path, key_types):
+        slot = int.from_bytes(keccak(encode_key(key, key_type) + _word(slot)), "big")
+    return slot
+
+
+def decode_value(word, type_label, offset, size):
+    value = (word >> 8 * offset) % 2 ** (8 * size)
+    if type_label == "t_bool":
+        return bool(value)
+    if type_label.startswith(("t_address", "t_contract")):
+        return to_checksum_address(value.to_bytes(20, "big"))
+    if type_label.startswith("t_int"):
+        return value - 2 ** (8 * size) if value >> (8 * size - 1) else value
+    if type_label.startswith("t_bytes"):
+        return "0x" + value.to_bytes(size, "big").hex()
+    return value  # uints and enums
+
+
+###############
+# decoders
+#
+# A decoder is a generator yielding the list of slots it needs next and
+# receiving their words, its return value is the decoded variable.
+
+def _parallel(decoders):
+    """Run decoders side by side, one read per round for all of them"""
+    results = [None] * len(decoders)
+    pending = {}
+    for i, decoder in enumerate(decoders):
+        try:
+            pending[i] = next(decoder)
+        except StopIteration as e:
+            results[i] = e.value
+    while pending:
+        order = list(pending.items())
+        words = yield [slot for _, slots in order for slot in slots]
+        start = 0
+        for i, slots in order:
+            chunk, start = words[start:start + len(slots)], start + len(slots)
+            try:
+                pending[i] = decoders[i].send(chunk)
+            except StopIteration as e:
+                results[i] = e.value
+                del pending[i]
+    return results
+
+
+class _Decoder:
+    def __init__(self, layout, keys):
+        self.types = layout["types"]
+        self.keys = keys
+
+    def variable(self, var, base=0):
+        return self.decode(var["type"], base + int(var["slot"]), var.get("offset", 0), var["label"])
+
+    def decode(self, type_label, slot, offset=0, label=None):
+        info = self.types[type_label]
+        encoding = info["encoding"]
+        if encoding == "mapping":
+            return self.mapping(type_label, slot, label)
+        if encoding == "dynamic_array":
+            return self.array(info, slot)
+        if encoding == "bytes":
+            return self.dynamic_bytes(type_label, slot)
+        if "members" in info:
+            return self.struct(type_label, info, slot)
+        if "base" in info:
+            return self.static_array(type_label, info, slot)
+        return self.inplace(type_label, slot, offset, int(info["numberOfBytes"]))
+
+    def inplace(self, type_label, slot, offset, size):
+        (word,) = yield [slot]
+        return decode_value(word, type_label, offset, size)
+
+    def struct(self, type_label, info, slot):
+        values = yield from _parallel([self.variable(m, slot) for m in info["members"]])
+        struct = {m["label"]: v for m, v in zip(info["members"], values)}
+        if SETS.match(type_label):
+            # EnumerableSet: the items of the inner Set
+            kind = SETS.match(type_label).group(1)
+            items = [int(v, 16) for v in struct["_inner"]["_values"]]
+            if kind == "AddressSet":
+                return [to_checksum_address(v.to_bytes(32, "big")[12:]) for v in items]
+            return items if kind == "UintSet" else ["0x" + _word(v).hex() for v in items]
+        return struct
+
+    def items(self, base_label, start, length):
+        base = self.types[base_label]
+        size = int(base["numberOfBytes"])
+        if size <= 16 and base["encoding"] == "inplace" and "members" not in base:
+            # small value types are packed, several per slot
+            per_slot = 32 // size
+            decoders = [
+                self.inplace(base_label, start + i // per_slot, (i % per_slot) * size, size) for i in range(length)
+            ]
+        else:
+            slots = (size + 31) // 32
+            decoders = [self.decode(base_label, start + i * slots) for i in range(length)]
+        return (yield from _parallel(decoders))
+
+    def array(self, info, slot):
+        (length,) = yield [slot]
+        return (yield from self.items(info["base"], _data_slot(slot), length))
+
+    def static_array(self, type_label, info, slot):
+        length = int(re.search(r"\)(\d+)_storage$", type_label).group(1))
+        return (yield from self.items(info["base"], slot, length))
+
+    def dynamic_bytes(self, type_label, slot):
+        (word,) = yield [slot]
+        if word % 2 == 0:
+            # short: data and length * 2 in the same slot
+            raw = _word(word)[:(word % 256) // 2]
+        else:
+            length = (word - 1) // 2
+            start = _data_slot(slot)
+            words = yield [start + i for i in range((length + 31) // 32)]
+            raw = b"".join(_word(w) for w in words)[:length]
+        return raw.decode(errors="replace") if type_label.startswith("t_string") else "0x" + raw.hex()
+
+    def mapping(self, type_label, slot, label):
+        key_types = []
+        while self.types[type_label]["encoding"] == "mapping":
+            key_types.append(self.types[type_label]["key"])
+            type_label = self.types[type_label]["value"]
+        paths = [k if isinstance(k, tuple) else (k,) for k in self.keys.get(label, ())]
+        if any(len(path) != len(key_types) for path in paths):
+            raise ValueError("{} takes {} keys".format(label, len(key_types)))
+        values = yield from _parallel([self.decode(type_label, mapping_slot(slot, p, key_types)) for p in paths])
+        return {key: value for key, value in zip(self.keys.get(label, ()), values)}
+
+
+def _read(layout, keys):
+    """Decoder of a whole contract: `(implementation, admin, {label: value})`"""
+    decoder = _Decoder(layout, keys)
+    values = yield from _parallel(
+        [decoder.inplace("t_address", IMPLEMENTATION_SLOT, 0, 20), decoder.inplace("t_address", ADMIN_SLOT, 0, 20)]
+        + [decoder.variable(var) for var in layout["storage"]]
+    )
+    implementation, admin = (None if int(a, 16) == 0 else a for a in values[:2])
+    return implementation, admin, {var["label"]: v for var, v in zip(layout["storage"], values[2:])}
+
+
+###############
+
+class StateReader:
+    """Batched storage reader for `(contract name, address)` instances.
+
+    `keys` gives the mapping keys to read, `{label: [key or (key, key, ...)]}`
+    for every instance, or a function of the instance address returning one.
+    """
+
+    def __init__(self, instances, keys=None, uri=None):
+        self.instances = [(name, to_checksum_address(str(address))) for name, address in instances]
+        self.keys = keys or {}
+        self.uri = uri
+
+    def fetch(self, block=None):
+        if block is None:
+            block = int(request("eth_blockNumber", [], self.uri), 16)
+        states, pending = [], {}
+        for i, (name, address) in enumerate(self.instances):
+            states.append(STATES.get(name, ModuleState)(name, address, block))
+            keys = self.keys(address) if callable(self.keys) else self.keys
+            reader = _read(load_layout(name), keys)
+            pending[i] = (reader, next(reader))
+        while pending:
+            batch = Batch(block, self.uri)
+            positions, reads = {}, {}
+            for i, (_, slots) in pending.items():
+                address = states[i].address
+                for slot in slots:
+                    # packed variables share their slot
+                    if (address, slot) not in positions:
+                        positions[address, slot] = batch.storage(address, slot)
+                reads[i] = [positions[address, slot] for slot in slots]
+            values = batch.execute()
+            for i, idx in reads.items():
+                reader, _ = pending.pop(i)
+                words = [values[j] for j in idx]
+                error = next((w for w in words if isinstance(w, RPCError)), None)
+                if error is not None:
+                    states[i].error = "storage: {}".format(error)
+                    reader.close()
+                    continue
+                try:
+                    pending[i] = (reader, reader.send(words))
+                except StopIteration as e:
+                    self._fill(states[i], *e.value)
+        return states
+
+    @staticmethod
+    def _fill(state, implementation, admin, values):
+        state.implementation, state.admin, state.values = implementation, admin, values
+        typed = {f.name for f in fields(state)} - {f.name for f in fields(ModuleState)}
+        for label, value in values.items():
+            if field_name(label) in typed:
+                setattr(state, field_name(label), value)
+
+
+def read_states(instances, keys=None, block=None, uri=None):
+    return StateReader(instances, keys, uri).fetch(block)
+
+
+def main(contract, *addresses):
+    for state in read_states([(contract, address) for address in addresses]):
+        if state.error:
+            print("{}: {}".format(state.address, state.error))
+            continue
+        if state.implementation:
+            print("{}: proxy of {} (admin {})".format(state.address, state.implementation, state.admin))
+        for label, value in state.values.items():
+            print("{} {}: {}".format(state.address, label, value))
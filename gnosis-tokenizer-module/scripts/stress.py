@@ -0,0 +1,321 @@
+"""Vectorized stress tests of fund NAV, price per share and Aave health factor.
+
+`snapshot` reads every fund once (balances, positions and rates through
+`NavEngine`, gross collateral and debt of each `PositionManager` connector,
+Aave liquidation thresholds) into per fund x asset matrices. `evaluate`
+then prices any number of price shock scenarios at once with NumPy:
+
+ - NAV: `shocks @ values.T`, where `values` holds the unshocked
+   `getTokenValueUsd` of the safe and tokenizer balances plus the net
+   positions, as summed by `calculateNav`
+ - price per share: `nav * 10**6 / totalSupply` (not floored)
+ - health factor: sum of collateral x liquidation threshold over the sum of
+   debt, both in USD, `inf` without debt
+
+Values are USD with 6 decimals, integers below 2**53 are exact in float64,
+so the unshocked NAV matches `calculateNav` to the wei for funds under about
+9bn USD (`Snapshot.exact` flags the others). The integer `nav` and
+`price_per_share` of `fund_nav` are kept on the snapshot, `check_baseline`
+compares both against the chain.
+
+Shocks are multiplicative price moves per asset (`scenarios x assets`):
+`correlated_shocks` draws lognormal moves from volatilities and a
+correlation matrix, `parallel_shocks` moves every non base asset by the same
+amounts. Funds are evaluated in chunks, so the report of hundreds of funds
+under tens of thousands of scenarios stays within a few hundred MB.
+
+    brownie run scripts/stress.py main <tokenizer> [<tokenizer> ...]
+"""
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError as e:  # not a brownie dependency
+    raise ImportError("scripts/stress.py needs numpy, install it with `pip install numpy`") from e
+
+from scripts.artifacts import PROJECT_ROOT
+from scripts.nav_engine import BASE_DECIMALS, NavEngine, fund_nav, price_per_share, token_value_usd
+from scripts.rpc import Batch, RPCError, request
+from scripts.state_reader import read_states
+
+OUTPUT = PROJECT_ROOT / "reports/stress.json"
+# Registry.aaveProvider, on polygon
+AAVE_DATA_PROVIDER = "0x7551b5D2763519d4e37e8B81929D336De671d46d"
+RESERVE_CONFIGURATION = ("uint256",) * 5 + ("bool",) * 5
+EXACT = 2**53
+
+SCENARIOS = 20000
+VOLATILITY = 0.1  # standard deviation of the log price move over the horizon
+CORRELATION = 0.7
+QUANTILES = (0.01, 0.05, 0.5)
+FUND_CHUNK = 64
+
+
+@dataclass
+class Snapshot:
+    """Per fund x asset matrices of one block; rows follow `tokenizers`, columns `assets`"""
+
+    block: int
+    tokenizers: list
+    assets: list
+    base: np.ndarray         # (A,) bool, base currencies of any fund are valued 1:1
+    values: np.ndarray       # (F, A) USD, balances plus net positions of the safe and the tokenizer
+    collateral: np.ndarray   # (F, A) USD, gross value of the connectors
+    debt: np.ndarray         # (F, A) USD, gross debt of the connectors
+    thresholds: np.ndarray   # (A,) liquidation threshold, 0 when the asset is not collateral
+    total_supply: np.ndarray  # (F,)
+    nav: list = field(default_factory=list)              # exact calculateNav, None when it reverts
+    price_per_share: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+    exact: np.ndarray = None  # (F,) bool, the float64 unshocked NAV is exact
+
+    @property
+    def live(self):
+        return np.array([e is None for e in self.errors], dtype=bool)
+
+
+@dataclass
+class Evaluation:
+    """Scenario x fund results of `evaluate`"""
+
+    nav: np.ndarray
+    price_per_share: np.ndarray
+    health_factor: np.ndarray
+
+
+###############
+# snapshot
+
+def snapshot(tokenizers, block=None, thresholds=None, uri=None):
+    """Read the funds at `block`; `thresholds` maps assets to liquidation thresholds and skips the Aave reads"""
+    if block is None:
+        block = int(request("eth_blockNumber", [], uri), 16)
+    engine = NavEngine(tokenizers, uri)
+    states = engine.fetch(block)
+    assets = sorted({a for s in states if s.error is None for a in s.assets})
+    column = {a: i for i, a in enumerate(assets)}
+    shape = (len(states), len(assets))
+    values, collateral, debt = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    base = np.zeros(len(assets), dtype=bool)
+    errors = [s.error for s in states]
+    live = [i for i, s in enumerate(states) if s.error is None]
+    gross = _gross_positions([states[i] for i in live], block, uri)
+    navs, prices = [None] * len(states), [None] * len(states)
+    for i, rows in zip(live, gross):
+        if isinstance(rows, str):
+            errors[i] = rows
+            continue
+        state = states[i]
+        try:
+            navs[i] = fund_nav(state)
+            for j, asset in enumerate(state.assets):
+                rate, decimals = state.rates[j], state.decimals[j]
+                a = column[asset]
+                base[a] |= rate is None
+                values[i, a] = sum(
+                    token_value_usd(balances[j] + state.positions[j], rate, decimals)
+                    for balances in (state.safe_balances, state.tokenizer_balances)
+                )
+                value, owed = rows[j]
+                collateral[i, a] = token_value_usd(value, rate, decimals)
+                debt[i, a] = token_value_usd(owed, rate, decimals)
+        except OverflowError as e:
+            errors[i], navs[i] = str(e), None
+            values[i], collateral[i], debt[i] = 0, 0, 0
+            continue
+        prices[i] = price_per_share(navs[i], state.total_supply)
+    if thresholds is None:
+        thresholds = _thresholds(assets, block, uri)
+    return Snapshot(
+        block=block, tokenizers=list(engine.tokenizers), assets=assets, base=base,
+        values=values, collateral=collateral, debt=debt,
+        thresholds=np.array([thresholds.get(a, 0.0) for a in assets], dtype=float),
+        total_supply=np.array([float(s.total_supply) for s in states]),
+        nav=navs, price_per_share=prices, errors=errors,
+        exact=np.array([n is not None and n < EXACT for n in navs], dtype=bool),
+    )
+
+
+def _gross_positions(states, block, uri):
+    """Per state, `(gross value, gross debt)` summed over the connectors for each asset, or an error"""
+    managers = read_states([("PositionManager", s.position_manager) for s in states], block=block, uri=uri)
+    batch = Batch(block, uri)
+    reads = []
+    for state, manager in zip(states, managers):
+        if manager.error:
+            reads.append("position manager: {}".format(manager.error))
+            continue
+        reads.append([
+            [(
+                batch.call(c, "getGrossValue(address,address)", [asset, manager.safe]),
+                batch.call(c, "getGrossDebt(address,address)", [asset, manager.safe]),
+            ) for c in manager.connectors_list]
+            for asset in state.assets
+        ])
+    values = batch.execute()
+    results = []
+    for idx in reads:
+        if isinstance(idx, str):
+            results.append(idx)
+            continue
+        rows = []
+        for connectors in idx:
+            failed = [values[i] for pair in connectors for i in pair if isinstance(values[i], RPCError)]
+            if failed:
+                rows = "connector: {}".format(failed[0])
+                break
+            rows.append((sum(values[v] for v, _ in connectors), sum(values[d] for _, d in connectors)))
+        results.append(rows)
+    return results
+
+
+def _thresholds(assets, block, uri):
+    """Aave v2 liquidation thresholds, 0 for an asset that is not listed or not usable as collateral"""
+    batch = Batch(block, uri)
+    reads = [batch.call(AAVE_DATA_PROVIDER, "getReserveConfigurationData(address)", [a], RESERVE_CONFIGURATION) for a in assets]
+    values = batch.execute()
+    thresholds = {}
+    for asset, i in zip(assets, reads):
+        config = values[i]
+        if isinstance(config, RPCError) or not config[5]:
+            continue
+        thresholds[asset] = config[2] / 10**4
+    return thresholds
+
+
+###############
+# scenarios
+
+def correlated_shocks(snapshot, count=SCENARIOS, volatility=VOLATILITY, correlation=CORRELATION, seed=None):
+    """Lognormal price moves of the non base assets, `volatility` and `correlation` are scalars or per asset arrays"""
+    assets = len(snapshot.assets)
+    vols = np.broadcast_to(np.asarray(volatility, dtype=float), (assets,)).copy()
+    vols[snapshot.base] = 0.0
+    corr = np.asarray(correlation, dtype=float)
+    if corr.ndim == 0:
+        corr = np.full((assets, assets), float(corr))
+        np.fill_diagonal(corr, 1.0)
+    cholesky = np.linalg.cholesky(corr)
+    normal = np.random.default_rng(seed).standard_normal((count, assets)) @ cholesky.T
+    # the mean move is 1
+    return np.exp(normal * vols - vols**2 / 2)
+
+
+def parallel_shocks(snapshot, moves):
+    """One scenario per move (e.g. -0.3 for a 30% drop) applied to every non base asset"""
+    moves = np.asarray(moves, dtype=float)
+    shocks = np.ones((len(moves), len(snapshot.assets)))
+    shocks[:, ~snapshot.base] += moves[:, None]
+    return shocks
+
+
+def asset_shocks(snapshot, moves):
+    """A single scenario from `{asset: move}`, other assets unchanged"""
+    shocks = np.ones((1, len(snapshot.assets)))
+    for asset, move in moves.items():
+        shocks[0, snapshot.assets.index(asset)] += move
+    return shocks
+
+
+###############
+# evaluation
+
+def evaluate(snapshot, shocks, funds=None):
+    """NAV, price per share and health factor of `funds` (row indexes, all by default) for every scenario"""
+    funds = slice(None) if funds is None else funds
+    values = snapshot.values[funds]
+    supply = snapshot.total_supply[funds]
+    nav = shocks @ values.T
+    pps = np.full_like(nav, float(10**BASE_DECIMALS))
+    issued = supply > 0
+    pps[:, issued] = nav[:, issued] * 10**BASE_DECIMALS / supply[issued]
+    borrowing = shocks @ (snapshot.collateral[funds] * snapshot.thresholds).T
+    owed = shocks @ snapshot.debt[funds].T
+    hf = np.full_like(nav, np.inf)
+    np.divide(borrowing, owed, out=hf, where=owed > 0)
+    return Evaluation(nav, pps, hf)
+
+
+def report(snapshot, shocks, quantiles=QUANTILES, chunk=FUND_CHUNK):
+    """Per fund distribution of NAV, price per share and health factor, and of the total NAV"""
+    funds = []
+    total = np.zeros(len(shocks))
+    live = np.flatnonzero(snapshot.live)
+    baseline = evaluate(snapshot, np.ones((1, len(snapshot.assets))), live)
+    for start in range(0, len(live), chunk):
+        rows = live[start:start + chunk]
+        result = evaluate(snapshot, shocks, rows)
+        total += result.nav.sum(axis=1)
+        nav_q = np.quantile(result.nav, quantiles, axis=0)
+        pps_q = np.quantile(result.price_per_share, quantiles, axis=0)
+        hf_min = result.health_factor.min(axis=0)
+        liquidated = (result.health_factor < 1).mean(axis=0)
+        worst = result.nav.argmin(axis=0)
+        for k, row in enumerate(rows):
+            nav0 = float(baseline.nav[0, start + k])
+            funds.append({
+                "tokenizer": snapshot.tokenizers[row],
+                "nav": snapshot.nav[row],
+                "price_per_share": snapshot.price_per_share[row],
+                "health_factor": _finite(baseline.health_factor[0, start + k]),
+                "nav_quantiles": {str(q): float(v) for q, v in zip(quantiles, nav_q[:, k])},
+                "price_per_share_quantiles": {str(q): float(v) for q, v in zip(quantiles, pps_q[:, k])},
+                "value_at_risk": {str(q): nav0 - float(v) for q, v in zip(quantiles, nav_q[:, k]) if q < 0.5},
+                "min_health_factor": _finite(hf_min[k]),
+                "liquidation_probability": float(liquidated[k]),
+                "worst_scenario": int(worst[k]),
+            })
+    failed = [
+        {"tokenizer": t, "error": e} for t, e in zip(snapshot.tokenizers, snapshot.errors) if e is not None
+    ]
+    total_q = np.quantile(total, quantiles) if len(shocks) else []
+    return {
+        "block": snapshot.block,
+        "scenarios": len(shocks),
+        "nav": sum(n for n in snapshot.nav if n is not None),
+        "nav_quantiles": {str(q): float(v) for q, v in zip(quantiles, total_q)},
+        "funds": funds,
+        "failed": failed,
+    }
+
+
+def _finite(value):
+    return None if np.isinf(value) else float(value)
+
+
+def check_baseline(snapshot, uri=None):
+    """`(tokenizer, engine nav, onchain nav, engine price, onchain price)` of every fund not matching the chain"""
+    batch = Batch(snapshot.block, uri)
+    reads = [(batch.call(t, "calculateNav()"), batch.call(t, "getPricePerShare()")) for t in snapshot.tokenizers]
+    values = batch.execute()
+    unshocked = evaluate(snapshot, np.ones((1, len(snapshot.assets))))
+    mismatches = []
+    for row, (nav_i, pps_i) in enumerate(reads):
+        onchain = (values[nav_i], values[pps_i])
+        reverted = any(isinstance(v, RPCError) for v in onchain)
+        engine = (snapshot.nav[row], snapshot.price_per_share[row])
+        if reverted != (snapshot.errors[row] is not None):
+            mismatches.append((snapshot.tokenizers[row], engine[0], onchain[0], engine[1], onchain[1]))
+        elif not reverted and (engine != onchain or (snapshot.exact[row] and unshocked.nav[0, row] != onchain[0])):
+            mismatches.append((snapshot.tokenizers[row], unshocked.nav[0, row], onchain[0], engine[1], onchain[1]))
+    return mismatches
+
+
+def main(*tokenizers, output=OUTPUT):
+    state = snapshot(tokenizers)
+    shocks = np.vstack([parallel_shocks(state, [-0.5, -0.3, -0.1]), correlated_shocks(state)])
+    result = report(state, shocks)
+    for fund in result["funds"]:
+        print("{tokenizer}: nav {nav} price per share {price_per_share} health factor {health_factor}".format(**fund))
+        print("  1% nav {} 1% var {} min health factor {} liquidation probability {:.2%}".format(
+            fund["nav_quantiles"]["0.01"], fund["value_at_risk"]["0.01"],
+            fund["min_health_factor"], fund["liquidation_probability"]))
+    for fund in result["failed"]:
+        print("{tokenizer}: reverted ({error})".format(**fund))
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w") as fp:
+        json.dump(result, fp, indent=2)
+    return result
@@ -0,0 +1,231 @@
+"""Executable reference model of a DaaTokenizer fund.
+
+`TokenizerModel` holds the state the tokenizer reads or writes (ERC20
+balances of the tracked holders, TokenizedShare balances and supply, oracle
+answers and connector positions) and applies the same operations with the
+same integer math:
+
+ - `deposit`: price per share before the transfer, `getTokenValueUsd`, shares
+   minted as `value * 10**6 / pricePerShare`
+ - `redeem`: `calcBaseAmount`, burn, then the greedy `_withdraw` split across
+   `baseCurrencies` out of the tokenizer balances
+ - `withdrawToSafe`, and the mock environment calls moving the NAV: token
+   mints/burns/transfers, share transfers, `MockV3Aggregator.updateAnswer`
+   and `MockConnector.setPosition`
+
+NAV uses `fund_nav` (scripts/nav_engine.py), the split and share math come
+from scripts/quotes.py. An operation that would revert raises `QuoteError`
+and leaves the model untouched; overflow and underflow are checked as
+solidity 0.8 does.
+
+`observe()` returns the values compared against the chain by the
+differential fuzzer (scripts/fuzz.py).
+"""
+from dataclasses import dataclass, field
+
+from scripts.nav_engine import BASE_DECIMALS, UINT256, FundState, exchange_rate, fund_nav, scale_price
+from scripts.quotes import QuoteError, base_amount, deposit_shares, withdraw_split
+
+REVERT = "revert"
+
+
+@dataclass
+class FundConfig:
+    """Addresses and static configuration of a deployed fund"""
+
+    tokenizer: str
+    safe: str
+    tokenized_share: str
+    connector: str
+    owners: list
+    users: list
+    tickers: dict        # ticker -> token
+    assets: list         # allowedAssets order
+    base_currencies: list
+    decimals: dict       # token -> decimals
+    feeds: dict = field(default_factory=dict)  # token -> (feed, feed decimals), non base assets
+
+    @property
+    def holders(self):
+        return list(self.users) + [self.safe, self.tokenizer]
+
+
+def _add(a, b):
+    if a + b >= UINT256:
+        raise QuoteError(None, "arithmetic overflow")
+    return a + b
+
+
+def _sub(a, b, reason=None):
+    if b > a:
+        raise QuoteError(reason, "arithmetic underflow")
+    return a - b
+
+
+class TokenizerModel:
+    def __init__(self, config, balances, shares, total_supply, answers, positions):
+        self.config = config
+        self.balances = dict(balances)    # (token, holder) -> amount
+        self.shares = dict(shares)        # holder -> amount
+        self.total_supply = total_supply
+        self.answers = dict(answers)      # token -> latest feed answer (int256)
+        self.positions = dict(positions)  # token -> (gross value, gross debt) of the safe
+        self.spenders = set()             # _spenders only ever grows
+
+    @classmethod
+    def from_observation(cls, config, observation, answers, positions):
+        balances = {
+            (token, holder): observation[("balance", token, holder)]
+            for token in config.decimals for holder in config.holders
+        }
+        shares = {user: observation[("shares", user)] for user in config.users}
+        return cls(config, balances, shares, observation["supply"], answers, positions)
+
+    def copy(self):
+        model = TokenizerModel(self.config, self.balances, self.shares, self.total_supply, self.answers, self.positions)
+        model.spenders = set(self.spenders)
+        return model
+
+    ###############
+    # views
+
+    def balance(self, token, holder):
+        return self.balances.get((token, holder), 0)
+
+    def rate(self, token):
+        _, feed_decimals = self.config.feeds[token]
+        return exchange_rate(self.answers[token], feed_decimals)
+
+    def token_value_usd(self, token, amount):
+        if token in self.config.base_currencies:
+            return amount
+        value = self.rate(token) * amount
+        if value >= UINT256:
+            raise QuoteError(None, "getTokenValueUsd overflow")
+        return value // 10**self.config.decimals[token]
+
+    def state(self):
+        """`FundState` as NavEngine would read it, for `fund_nav`"""
+        config = self.config
+        positions = []
+        for asset in config.assets:
+            value, debt = self.positions.get(asset, (0, 0))
+            # Adaptor.getNetAssetValue
+            positions.append(_sub(value, debt))
+        safe_balances = [self.balance(a, config.safe) for a in config.assets]
+        tokenizer_balances = [self.balance(a, config.tokenizer) for a in config.assets]
+        for balances in (safe_balances, tokenizer_balances):
+            for balance, position in zip(balances, positions):
+                _add(balance, position)  # addExternalAssetsNominal
+        base = set(config.base_currencies)
+        return FundState(
+            config.tokenizer, None, safe=config.safe, assets=list(config.assets),
+            base_currencies=list(config.base_currencies), total_supply=self.total_supply,
+            safe_balances=safe_balances, tokenizer_balances=tokenizer_balances, positions=positions,
+            rates=[None if a in base else self.rate(a) for a in config.assets],
+            decimals=[config.decimals[a] for a in config.assets],
+        )
+
+    def calculate_nav(self):
+        try:
+            nav = fund_nav(self.state())
+        except OverflowError as e:
+            raise QuoteError(None, str(e))
+        if nav >= UINT256:
+            raise QuoteError(None, "calculateNav overflow")
+        return nav
+
+    def price_per_share(self):
+        if self.total_supply == 0:
+            return 10**BASE_DECIMALS
+        nav = self.calculate_nav()
+        if nav * 10**BASE_DECIMALS >= UINT256:
+            raise QuoteError(None, "getPricePerShare overflow")
+        return nav * 10**BASE_DECIMALS // self.total_supply
+
+    def observe(self):
+        """`{"nav", "pps", "supply", ("shares", user), ("balance", token, holder)}`, REVERT for a reverting view"""
+        observation = {"supply": self.total_supply}
+        for name, view in (("nav", self.calculate_nav), ("pps", self.price_per_share)):
+            try:
+                observation[name] = view()
+            except QuoteError:
+                observation[name] = REVERT
+        for user in self.config.users:
+            observation[("shares", user)] = self.shares.get(user, 0)
+        for token in self.config.decimals:
+            for holder in self.config.holders:
+                observation[("balance", token, holder)] = self.balance(token, holder)
+        return observation
+
+    ###############
+    # operations, nothing is written before every check passed
+
+    def _move(self, token, sender, receiver, amount):
+        if self.balance(token, sender) < amount:
+            raise QuoteError("ERC20: transfer amount exceeds balance")
+        if sender != receiver:
+            self.balances[(token, sender)] = self.balance(token, sender) - amount
+            self.balances[(token, receiver)] = self.balance(token, receiver) + amount
+
+    def deposit(self, sender, ticker, amount):
+        if ticker not in self.config.tickers:
+            raise QuoteError(None, "currency not allowed")
+        pps = self.price_per_share()
+        token = self.config.tickers[ticker]
+        if self.balance(token, sender) < amount:
+            raise QuoteError("ERC20: transfer amount exceeds balance")
+        shares = deposit_shares(self.token_value_usd(token, amount), pps)
+        self._move(token, sender, self.config.safe, amount)
+        self.shares[sender] = self.shares.get(sender, 0) + shares
+        self.total_supply += shares
+        return shares
+
+    def redeem(self, sender, shares):
+        if shares == 0:
+            raise QuoteError(None, "number of shares to redeem must be > 0")
+        amount = base_amount(shares, self.price_per_share())
+        if self.shares.get(sender, 0) < shares:
+            raise QuoteError("ERC20: burn amount exceeds balance")
+        tokenizer = self.config.tokenizer
+        balances = {t: self.balance(t, tokenizer) for t in self.config.base_currencies}
+        payouts = withdraw_split(amount, self.config.base_currencies, balances)
+        self.shares[sender] -= shares
+        self.total_supply -= shares
+        for token, paid in payouts:
+            if paid > 0:
+                self._move(token, tokenizer, sender, paid)
+        return payouts
+
+    def withdraw_to_safe(self, sender, token, amount):
+        spenders = self.spenders | set(self.config.owners)
+        if sender not in spenders:
+            raise QuoteError("Sender not authorized")
+        self._move(token, self.config.tokenizer, self.config.safe, amount)
+        self.spenders = spenders
+
+    def mint(self, token, holder, amount):
+        self.balances[(token, holder)] = _add(self.balance(token, holder), amount)
+
+    def burn(self, token, holder, amount):
+        self.balances[(token, holder)] = _sub(self.balance(token, holder), amount, "ERC20: burn amount exceeds balance")
+
+    def transfer(self, token, sender, receiver, amount):
+        self._move(token, sender, receiver, amount)
+
+    def transfer_shares(self, sender, receiver, amount):
+        if self.shares.get(sender, 0) < amount:
+            raise QuoteError("ERC20: transfer amount exceeds balance")
+        self.shares[sender] = self.shares.get(sender, 0) - amount
+        self.shares[receiver] = self.shares.get(receiver, 0) + amount
+
+    def set_price(self, token, answer):
+        self.answers[token] = answer
+
+    def set_position(self, token, value, debt):
+        self.positions[token] = (value, debt)
+
+
+def feed_answer(price_usd, feed_decimals=8):
+    """Feed answer for a USD price with 6 decimals, the inverse of `scale_price` to 6 decimals"""
+    return scale_price(price_usd, BASE_DECIMALS, feed_decimals)
@@ -2,6 +2,8 @@ from brownie import accounts, interface, Contract, ProxyHandler,DaaTokenizer, ch
 from brownie.test import given, strategy
 import pytest, math
 
+from scripts.quotes import Quoter
+
 
 # @given(amount=strategy('uint256', max_value=10**18))
 
@@ -58,8 +60,9 @@ def uniswap_usdc_exchange(interface):
     yield interface.IUniswapV2Exchange('0xa5E0829CaCEd8fFDD4De3c43696c57F7D7A678ff')
 
 @pytest.fixture(scope="module",autouse=True)
-def buy_usdc(accounts, usdc, uniswap_usdc_exchange):
-    uniswap_usdc_exchange.swapExactETHForTokens(
+def buy_usdc(accounts, usdc, uniswap_usdc_exchange, forkSnapshot):
+    # the swap runs once when recording, replays only set the resulting balance
+    forkSnapshot.cached_balance("buy_usdc", usdc, accounts[0], lambda: uniswap_usdc_exchange.swapExactETHForTokens(
         1,  # minimum amount of tokens to purchase
         ['0x0d500B1d8E8eF31E21C99d1Db9A6444d3ADf1270','0x2791bca1f2de4661ed88a30c99a7a9449aa84174'],
         accounts[0],
@@ -68,11 +71,11 @@ def buy_usdc(accounts, usdc, uniswap_usdc_exchange):
             'from': accounts[5],
             'value': "99 ether"
         }
-    )
+    ))
 
 @pytest.fixture(scope="module",autouse=True)
-def buy_weth(accounts, usdc, uniswap_usdc_exchange):
-    uniswap_usdc_exchange.swapExactETHForTokens(
+def buy_weth(accounts, weth, uniswap_usdc_exchange, forkSnapshot):
+    forkSnapshot.cached_balance("buy_weth", weth, accounts[1], lambda: uniswap_usdc_exchange.swapExactETHForTokens(
         1,  # minimum amount of tokens to purchase
         ['0x0d500B1d8E8eF31E21C99d1Db9A6444d3ADf1270','0x7ceB23fD6bC0adD59E62ac25578270cFf1b9f619'],
         accounts[1],
@@ -81,7 +84,7 @@ def buy_weth(accounts, usdc, uniswap_usdc_exchange):
             'from': accounts[7],
             'value': "99 ether"
         }
-    )
+    ))
 
 ###############
 
@@ -155,8 +158,10 @@ def test_wethDeposit(weth,gnosisSafe, tokenizedShare,oracleHandler,daaTokenizer)
     scaledPrice = oracleHandler.scalePrice(ethPrice,8,6)
     amountToDeposit = 10**18 * amountToDepositUsd / scaledPrice # around 10 usd in eth
     expectedShares = amountToDepositUsd / pricePerShare * 10**6
+    quote = Quoter.load([daaTokenizer])[0].quote_deposit("WETH", int(amountToDeposit))
     sharesIssued = daaTokenizer.deposit("WETH", amountToDeposit, {"from": accounts[1]})
     assert sharesIssued.return_value == math.floor(expectedShares) or sharesIssued.return_value == math.floor(expectedShares)-1
+    assert sharesIssued.return_value == quote.shares
     assert tokenizedShare.balanceOf(accounts[1]) == sharesIssued.return_value    
 
 def test_externalPositionNav(daaTokenizer,usdc,gnosisSafe,tokenizedShare, aaveConnector):
@@ -0,0 +1,126 @@
+from brownie import accounts, chain, web3, TokenizedShare
+import pytest
+
+from scripts import event_indexer
+from scripts.benchmark import ZERO, deploy_artifact
+from scripts.event_indexer import EventIndexer
+from scripts.rpc import encode
+
+pytestmark = pytest.mark.require_network("development")
+
+###############
+
+@pytest.fixture(scope="module")
+def funds(deployFund):
+    return [deployFund(accounts[8], withWeth=False), deployFund(accounts[9], withWeth=False)]
+
+def redeem(tokenizer, mockUsdc, shares, sender=None):
+    sender = sender or accounts[1]
+    # the buffer for the redemption is provided by the safe
+    mockUsdc.mint(tokenizer, tokenizer.calcBaseAmount(shares), {'from': accounts[0]})
+    return tokenizer.redeem(shares, {'from': sender})
+
+def approvedHash(owner):
+    # v = 1: the owner approved the hash or sends the transaction
+    return bytes(12) + bytes.fromhex(owner.address[2:]) + bytes(32) + b"\x01"
+
+###############
+
+def test_indexDepositsAndWithdrawals(funds, mockUsdc, tmp_path, deposit):
+    start = chain.height + 1
+    first = deposit(funds[0], mockUsdc, 10 * 10**6)
+    deposit(funds[1], mockUsdc, 20 * 10**6)
+    redeem(funds[0], mockUsdc, first.return_value // 2)
+    indexer = EventIndexer(tmp_path, {f.address: "tokenizer" for f in funds}, start_block=start, chunk_size=2)
+    assert indexer.sync() == 4
+    history = indexer.share_issuance(accounts[8])
+    assert [shares for _, shares, _ in history] == [first.return_value, -(first.return_value // 2)]
+    assert sum(shares for _, shares, _ in history) == TokenizedShare.at(funds[0]._tokenizedShare()).totalSupply()
+    ledger = indexer.withdrawal_ledger(accounts[8])
+    assert len(ledger) == 1 and ledger[0]["withdrawer"] == accounts[1]
+    assert indexer.store.rows("DepositReceived", accounts[9])[0]["amount"] == 20 * 10**6
+    assert indexer.sync() == 0
+
+def test_resumeFromCheckpoint(funds, mockUsdc, tmp_path, deposit):
+    start = chain.height + 1
+    deposit(funds[0], mockUsdc, 10 * 10**6)
+    EventIndexer(tmp_path, {funds[0].address: "tokenizer"}, start_block=start).sync()
+    deposit(funds[0], mockUsdc, 5 * 10**6)
+    # a new process picks up from the stored checkpoint
+    indexer = EventIndexer(tmp_path, {funds[0].address: "tokenizer"}, start_block=start)
+    assert len(indexer.store.rows("DepositReceived")) == 1
+    assert indexer.sync() == 1
+    assert [r["amount"] for r in indexer.store.rows("DepositReceived", accounts[8])] == [10 * 10**6, 5 * 10**6]
+
+def test_reorgRollback(funds, mockUsdc, tmp_path, deposit):
+    start = chain.height + 1
+    deposit(funds[0], mockUsdc, 10 * 10**6)
+    indexer = EventIndexer(tmp_path, {funds[0].address: "tokenizer"}, start_block=start)
+    deposit(funds[0], mockUsdc, 7 * 10**6)
+    assert indexer.sync() == 2
+    # drop the last deposit from the chain and build a different block at its height
+    chain.undo()
+    chain.mine(2)
+    indexer.sync()
+    assert [r["amount"] for r in indexer.store.rows("DepositReceived")] == [10 * 10**6]
+
+def test_crashResumesFromLastChunk(funds, mockUsdc, tmp_path, monkeypatch, deposit):
+    start = chain.height + 1
+    for amount in (1, 2, 3):
+        deposit(funds[0], mockUsdc, amount * 10**6)
+    calls = []
+
+    def crashing(*args):
+        # the process dies while pulling the second chunk
+        calls.append(args)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return get_logs(*args)
+
+    get_logs = event_indexer.get_logs
+    monkeypatch.setattr(event_indexer, "get_logs", crashing)
+    with pytest.raises(KeyboardInterrupt):
+        EventIndexer(tmp_path, {funds[0].address: "tokenizer"}, start_block=start, chunk_size=3).sync()
+    monkeypatch.undo()
+    # the first chunk was committed with its checkpoint
+    indexer = EventIndexer(tmp_path, {funds[0].address: "tokenizer"}, start_block=start, chunk_size=3)
+    # a deposit is three blocks (mint, approve, deposit)
+    assert indexer.store.block == start + 2
+    assert [r["amount"] for r in indexer.store.rows("DepositReceived")] == [10**6]
+    assert indexer.sync() == 2
+    assert [r["amount"] for r in indexer.store.rows("DepositReceived")] == [10**6, 2 * 10**6, 3 * 10**6]
+
+def test_indexModuleEvents(MockSafe, MockInstaIndex, mockUsdc, tmp_path):
+    owners = accounts[2:4]
+    safe = MockSafe.deploy(owners, {'from': accounts[0]})
+    try:
+        withdrawal = deploy_artifact("DaaModule", accounts[9].address, safe.address)
+        dsa = deploy_artifact("DaaDsaModule")
+    except FileNotFoundError as e:
+        pytest.skip(str(e))
+    start = chain.height + 1
+    mockUsdc.mint(safe, 10**9, {'from': accounts[0]})
+    safe.enableModule(withdrawal, {'from': accounts[0]})
+    withdrawal.executeTransfer(mockUsdc, 10**6, {'from': owners[0]})
+    dsa.initialize(safe, MockInstaIndex.deploy({'from': accounts[0]}), chain.id, {'from': accounts[0]})
+    safe.enableModule(dsa, {'from': accounts[0]})
+    dsa.createAccount(2, ZERO, {'from': accounts[0]})
+    selector = web3.keccak(text="deposit(address,uint256,uint256,uint256)")[:4]
+    spells = ["BASIC-A"]
+    datas = [selector + encode(["address", "uint256", "uint256", "uint256"], [mockUsdc.address, 10**6, 0, 0])]
+    tx_hash = dsa.getTransactionHash(spells, datas, dsa.nonce())
+    dsa.approveHash(tx_hash, {'from': owners[1]})
+    signatures = b"".join(approvedHash(o) for o in sorted(owners, key=lambda o: int(o.address, 16)))
+    dsa.executeTransaction(spells, datas, signatures, {'from': owners[0]})
+
+    indexer = EventIndexer(tmp_path, {withdrawal.address: "withdrawal", dsa.address: "dsa"}, start_block=start, chunk_size=2)
+    assert indexer.sync() == 4
+    [transfer] = indexer.withdrawal_ledger(safe)
+    assert (transfer["token"], transfer["from"], transfer["to"], transfer["value"]) == (
+        mockUsdc.address, owners[0], accounts[9], 10**6)
+    [created] = indexer.store.rows("AccountCreated", safe)
+    assert created["dsaAccount"] == dsa.account() and created["version"] == 2
+    [approved] = indexer.store.rows("ApproveHash", safe)
+    assert approved["approvedHash"] == str(tx_hash) and approved["owner"] == owners[1]
+    [executed] = indexer.store.rows("TransactionExecuted", safe)
+    assert executed["txHash"] == str(tx_hash) and executed["emitter"] == dsa.address
@@ -0,0 +1,64 @@
+from brownie import accounts, chain, MockV3Aggregator, OracleHandler
+import pytest
+
+from scripts.oracle_cache import OracleCache, StalePriceError
+
+pytestmark = pytest.mark.require_network("development")
+
+###############
+
+@pytest.fixture(scope="module")
+def oracleHandler(mockWeth, ethFeed):
+    oracleHandler = OracleHandler.deploy({'from': accounts[0]})
+    oracleHandler.addTokenOracle(mockWeth, ethFeed, {'from': accounts[0]})
+    return oracleHandler
+
+@pytest.fixture(scope="module")
+def maticFeed():
+    return MockV3Aggregator.deploy(18, 8 * 10**17, {'from': accounts[0]})
+
+###############
+
+def test_exchangeRate(oracleHandler, mockWeth):
+    cache = OracleCache(oracleHandler, ttl=60, weth=mockWeth)
+    assert cache.get_exchange_rate(mockWeth) == oracleHandler.getExchangeRate(mockWeth)
+    assert cache.requests == 2  # feed address and round, then decimals
+    for i in range(100):
+        cache.get_exchange_rate(mockWeth)
+    assert cache.requests == 2
+    assert cache.get_eth_latest_price() == 2000 * 10**8
+
+def test_newRound(oracleHandler, mockWeth, ethFeed):
+    cache = OracleCache(oracleHandler, ttl=60, weth=mockWeth)
+    cache.get_exchange_rate(mockWeth)
+    ethFeed.updateAnswer(1999_12345678, {'from': accounts[0]})
+    # still within the ttl
+    assert cache.get_exchange_rate(mockWeth) == 2000 * 10**6
+    cache.invalidate()
+    assert cache.get_exchange_rate(mockWeth) == oracleHandler.getExchangeRate(mockWeth) == 1999_123456
+    assert cache.latest_round(mockWeth).round_id == ethFeed.latestRound()
+    # decimals are not read again for the new round
+    assert cache.requests == 3
+
+def test_feedReplaced(oracleHandler, mockWeth, maticFeed):
+    cache = OracleCache(oracleHandler, ttl=0, weth=mockWeth)
+    cache.get_exchange_rate(mockWeth)
+    oracleHandler.addTokenOracle(mockWeth, maticFeed, {'from': accounts[0]})
+    assert cache.get_exchange_rate(mockWeth) == oracleHandler.getExchangeRate(mockWeth) == 8 * 10**5
+
+def test_derivedPrice(oracleHandler, ethFeed, maticFeed):
+    cache = OracleCache(oracleHandler, ttl=60)
+    for decimals in (1, 6, 8, 18):
+        assert cache.get_derived_price(ethFeed, maticFeed, decimals) == oracleHandler.getDerivedPrice(ethFeed, maticFeed, decimals)
+    with pytest.raises(ValueError):
+        cache.get_derived_price(ethFeed, maticFeed, 19)
+
+def test_maxStaleness(oracleHandler, mockWeth, ethFeed):
+    cache = OracleCache(oracleHandler, ttl=0, max_staleness=3600, clock=chain.time)
+    cache.get_exchange_rate(mockWeth)
+    chain.sleep(3601)
+    chain.mine()
+    with pytest.raises(StalePriceError):
+        cache.get_exchange_rate(mockWeth)
+    ethFeed.updateAnswer(2100 * 10**8, {'from': accounts[0]})
+    assert cache.get_exchange_rate(mockWeth) == 2100 * 10**6
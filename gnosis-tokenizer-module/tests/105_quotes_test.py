@@ -0,0 +1,64 @@
+from brownie import accounts, reverts, TokenizedShare
+import pytest
+
+from scripts.quotes import Quoter, QuoteError
+
+pytestmark = pytest.mark.require_network("development")
+
+###############
+
+@pytest.fixture(scope="module")
+def fund(deployFund, mockUsdc, mockUsdt, mockWeth, mockConnector, deposit):
+    safe = accounts[8]
+    tokenizer = deployFund(safe)
+    tokenizer.addSupportedCurrency("USDT", mockUsdt, True, {'from': accounts[0]})
+    deposit(tokenizer, mockUsdc, 100 * 10**6)
+    mockWeth.mint(safe, 3 * 10**17 + 1, {'from': accounts[0]})
+    mockConnector.setPosition(mockWeth, safe, 10**17, 3 * 10**15, {'from': accounts[0]})
+    return tokenizer
+
+def quoter(tokenizer):
+    return Quoter.load([tokenizer], ("USDC", "USDT", "WETH", "DAI"))[0]
+
+###############
+
+def test_tickersFromStorage(fund, mockUsdc, mockUsdt, mockWeth):
+    assert quoter(fund).tickers == {"USDC": mockUsdc.address, "USDT": mockUsdt.address, "WETH": mockWeth.address}
+
+def test_depositQuotes(fund, mockUsdc, mockWeth, deposit):
+    for ticker, token, amount in [("USDC", mockUsdc, 12_345_678), ("WETH", mockWeth, 4_999_999_999_999_999), ("WETH", mockWeth, 1)]:
+        quote = quoter(fund).quote_deposit(ticker, amount)
+        assert quote.price_per_share == fund.getPricePerShare()
+        tx = deposit(fund, token, amount, ticker=ticker)
+        assert tx.return_value == quote.shares
+
+def test_depositQuoteWithoutShares(deployFund, mockUsdc, mockWeth, deposit):
+    tokenizer = deployFund(accounts[6])
+    quote = quoter(tokenizer).quote_deposit("WETH", 10**15 + 7)
+    assert deposit(tokenizer, mockWeth, 10**15 + 7, ticker="WETH").return_value == quote.shares
+
+def test_unknownTicker(fund):
+    with pytest.raises(QuoteError):
+        quoter(fund).quote_deposit("DAI", 10**6)
+    with reverts():
+        fund.deposit("DAI", 10**6, {'from': accounts[1]})
+
+def test_redeemSplitsAcrossBaseCurrencies(fund, mockUsdc, mockUsdt):
+    shares = TokenizedShare.at(fund._tokenizedShare()).balanceOf(accounts[1]) // 20
+    mockUsdc.mint(fund, 5 * 10**6 + 3, {'from': accounts[0]})
+    mockUsdt.mint(fund, 100 * 10**6, {'from': accounts[0]})
+    quote = quoter(fund).quote_redeem(shares)
+    assert quote.base_amount == fund.calcBaseAmount(shares)
+    assert quote.payouts == [(mockUsdc.address, 5 * 10**6 + 3), (mockUsdt.address, quote.base_amount - 5 * 10**6 - 3)]
+    before = mockUsdc.balanceOf(accounts[1]), mockUsdt.balanceOf(accounts[1])
+    fund.redeem(shares, {'from': accounts[1]})
+    assert mockUsdc.balanceOf(accounts[1]) - before[0] == quote.payouts[0][1]
+    assert mockUsdt.balanceOf(accounts[1]) - before[1] == quote.payouts[1][1]
+
+def test_redeemShortfall(fund, mockUsdc):
+    shares = TokenizedShare.at(fund._tokenizedShare()).balanceOf(accounts[1])
+    mockUsdc.mint(fund, 10**6, {'from': accounts[0]})
+    with pytest.raises(QuoteError) as e:
+        quoter(fund).quote_redeem(shares)
+    with reverts(e.value.reason):
+        fund.redeem(shares, {'from': accounts[1]})
@@ -0,0 +1,68 @@
+from brownie import accounts, web3
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+
+from scripts.fork_snapshot import Snapshot, SnapshotProxy, SnapshotSession
+
+pytestmark = pytest.mark.require_network("development")
+
+###############
+
+UPSTREAM = {"eth_blockNumber": "0x100", "eth_chainId": "0x89", "eth_getCode": "0x6001"}
+
+class Upstream(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.calls.append(body)
+        raw = json.dumps({"jsonrpc": "2.0", "id": body["id"], "result": UPSTREAM[body["method"]]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def upstream():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Upstream)
+    server.calls = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+def rpc(proxy, method, params):
+    return requests.post(proxy.url, json={"jsonrpc": "2.0", "id": 1, "method": method, "params": params}).json()
+
+###############
+
+def test_recordAndReplay(upstream, tmp_path):
+    path = tmp_path / "snapshot.json.gz"
+    proxy = SnapshotProxy(Snapshot(path), "http://127.0.0.1:{}".format(upstream.server_address[1])).start()
+    assert rpc(proxy, "eth_getCode", [accounts[1].address, "latest"])["result"] == "0x6001"
+    # the block tag is pinned below the upstream head
+    assert upstream.calls[-1]["params"][1] == hex(0x100 - 16)
+    proxy.snapshot.save()
+    proxy.shutdown()
+    replay = SnapshotProxy(Snapshot(path)).start()
+    assert rpc(replay, "eth_blockNumber", [])["result"] == hex(0x100 - 16)
+    assert rpc(replay, "eth_getCode", [accounts[1].address.lower(), "latest"])["result"] == "0x6001"
+    assert rpc(replay, "eth_getCode", [accounts[2].address, "latest"])["result"] == "0x"
+    assert len(replay.misses) == 1
+    assert "error" in rpc(replay, "eth_getLogs", [{}])
+    replay.shutdown()
+
+def test_cachedBalance(upstream, tmp_path, mockWeth):
+    path = tmp_path / "snapshot.json.gz"
+    session = SnapshotSession(SnapshotProxy(Snapshot(path), "http://127.0.0.1:{}".format(upstream.server_address[1])).start())
+    session.web3 = web3
+    session.cached_balance("buy_weth", mockWeth, accounts[1], lambda: mockWeth.mint(accounts[1], 12345, {'from': accounts[0]}))
+    session.close()
+    mockWeth.burn(accounts[1], 12345, {'from': accounts[0]})
+    replay = SnapshotSession(SnapshotProxy(Snapshot(path)).start())
+    replay.web3 = web3
+    replay.cached_balance("buy_weth", mockWeth, accounts[1], pytest.fail)
+    assert mockWeth.balanceOf(accounts[1]) == 12345
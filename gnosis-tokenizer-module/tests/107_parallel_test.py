@@ -0,0 +1,26 @@
+import pytest
+
+from scripts.parallel import merge_gas
+
+pytestmark = pytest.mark.require_network("development")
+
+###############
+
+def profile(avg, high, low, count, count_success, avg_success):
+    return {"avg": avg, "high": high, "low": low, "count": count, "count_success": count_success, "avg_success": avg_success}
+
+###############
+
+def test_mergeWorkerGas():
+    merged = merge_gas([
+        {"DaaTokenizer.deposit": profile(100, 120, 90, 3, 3, 100), "DaaTokenizer.redeem": profile(50, 50, 50, 1, 0, 0)},
+        {"DaaTokenizer.deposit": profile(200, 210, 190, 1, 0, 0)},
+        {"DaaTokenizer.redeem": profile(70, 80, 60, 3, 3, 70)},
+    ])
+    assert merged["DaaTokenizer.deposit"] == profile(125, 210, 90, 4, 3, 100)
+    assert merged["DaaTokenizer.redeem"] == profile(65, 80, 50, 4, 3, 70)
+
+def test_mergeKeepsInputs():
+    worker = {"DaaModule.executeTransfer": profile(10, 10, 10, 1, 1, 10)}
+    merge_gas([worker, worker])
+    assert worker["DaaModule.executeTransfer"]["count"] == 1
@@ -0,0 +1,33 @@
+import pytest
+
+from scripts.benchmark import DEFAULTS, compare, points, scaling
+
+pytestmark = pytest.mark.require_network("development")
+
+###############
+
+def results(*gas):
+    keys = ["assets=1,bases=1,connectors=1", "assets=2,bases=1,connectors=1", "assets=4,bases=1,connectors=1", "assets=1,bases=2,connectors=1"]
+    return {"DaaTokenizer.deposit": {k: {"gas": g, "seconds": 0.01} for k, g in zip(keys, gas)}}
+
+###############
+
+def test_sweepPoints():
+    tokenizer = list(points("tokenizer"))
+    # the default point is measured once
+    assert tokenizer.count(DEFAULTS) == 1
+    assert all(sum(p[d] != DEFAULTS[d] for d in DEFAULTS) <= 1 for p in tokenizer)
+    assert {p["spells"] for p in points("dsa")} == {1, 2, 4, 8}
+    assert all("signatures" not in p for p in points("dsa"))
+
+def test_scaling():
+    slopes = scaling(results(100_000, 130_000, 190_000, 104_000))["DaaTokenizer.deposit"]
+    assert slopes == {"assets": 30_000, "bases": 4_000}
+
+def test_compareBaseline():
+    baseline = results(100_000, 130_000, 190_000, 104_000)
+    assert compare(results(101_000, 130_000, 190_000, 104_000), baseline) == []
+    assert compare(results(100_000, 140_000, 190_000, 104_000), baseline) == [
+        ("DaaTokenizer.deposit", "assets=2,bases=1,connectors=1", 130_000, 140_000)]
+    # points missing from the baseline are not flagged
+    assert compare(results(100_000), {}) == []
@@ -0,0 +1,100 @@
+from brownie import accounts, chain, Contract, DaaTokenizer, MockInstaIndex, MockSafe, ProxyHandler
+import pytest
+
+from scripts.benchmark import deploy_artifact
+from scripts.state_reader import StateReader, field_name, read_states
+
+pytestmark = pytest.mark.require_network("development")
+
+###############
+
+@pytest.fixture(scope="module")
+def funds(deployFund, mockUsdc, mockWeth):
+    safe = MockSafe.deploy([accounts[7], accounts[8]], {'from': accounts[0]})
+    funds = [deployFund(accounts[6], withWeth=False), deployFund(safe), deployFund(accounts[9])]
+    funds[2].addSupportedCurrency("USDC", mockUsdc, True, {'from': accounts[0]})
+    # withdrawToSafe adds the safe owners to the spenders
+    mockWeth.mint(funds[1], 10**18, {'from': accounts[0]})
+    funds[1].withdrawToSafe(mockWeth, 10**17, {'from': accounts[8]})
+    return funds
+
+@pytest.fixture(scope="module")
+def proxyFund(funds, mockWeth):
+    dev = accounts[0]
+    proxy = ProxyHandler.deploy(funds[0], {'from': dev})
+    tokenizer = Contract.from_abi("DaaTokenizer", proxy.address, DaaTokenizer.abi)
+    tokenizer.initialize(accounts[9], {'from': dev})
+    tokenizer.setTokenizedShare(funds[1]._tokenizedShare(), {'from': dev})
+    tokenizer.addSupportedCurrency("WETH", mockWeth, False, {'from': dev})
+    return proxy
+
+def assert_matches_getters(state, tokenizer):
+    assert state.error is None
+    assert state.owner == tokenizer.owner()
+    assert state.whitelisted == tokenizer._whitelisted()
+    assert state.safe == tokenizer._safe()
+    assert state.position_manager == tokenizer._positionManager()
+    assert state.tokenized_share == tokenizer._tokenizedShare()
+    assert state.oracle_handler == tokenizer._oracleHandler()
+    assert state.initialized == tokenizer.initialized()
+    assert state.base_currencies == [tokenizer.baseCurrencies(i) for i in range(len(state.base_currencies))]
+
+###############
+
+def test_fieldNames():
+    assert field_name("_positionManager") == "position_manager"
+    assert field_name("_AuthorizedCurrencyTickers") == "authorized_currency_tickers"
+    assert field_name("_erc20Contracts") == "erc20_contracts"
+    assert field_name("DOMAIN_SEPARATOR") == "domain_separator"
+
+def test_tokenizerState(funds, mockUsdc, mockWeth):
+    keys = {"_erc20Contracts": ["USDC", "WETH", "DAI"], "_AuthorizedCurrencyTickers": ["USDC", "WETH", "DAI"]}
+    states = read_states([("DaaTokenizer", f) for f in funds], keys)
+    for state, tokenizer in zip(states, funds):
+        assert_matches_getters(state, tokenizer)
+        assert state.implementation is None
+    assert states[0].allowed_assets == [mockUsdc.address]
+    assert states[1].allowed_assets == [mockUsdc.address, mockWeth.address]
+    assert states[1].spenders == [accounts[7].address, accounts[8].address]
+    assert states[2].base_currencies == [mockUsdc.address, mockUsdc.address]
+    assert states[1].erc20_contracts == {"USDC": mockUsdc.address, "WETH": mockWeth.address, "DAI": "0x" + "00" * 20}
+    assert states[1].authorized_currency_tickers == {"USDC": True, "WETH": True, "DAI": False}
+
+def test_atBlock(funds, mockWeth):
+    block = chain.height
+    funds[0].addSupportedCurrency("WETH", mockWeth, False, {'from': accounts[0]})
+    reader = StateReader([("DaaTokenizer", funds[0])])
+    assert len(reader.fetch(block)[0].allowed_assets) == 1
+    assert len(reader.fetch()[0].allowed_assets) == 2
+
+def test_throughProxy(proxyFund, funds, mockUsdc, mockWeth):
+    tokenizer = Contract.from_abi("DaaTokenizer", proxyFund.address, DaaTokenizer.abi)
+    state = read_states([("DaaTokenizer", proxyFund)])[0]
+    assert_matches_getters(state, tokenizer)
+    assert state.implementation == proxyFund.getImplementation() == funds[0].address
+    assert state.admin == proxyFund.getAdmin()
+    assert state.allowed_assets == [mockUsdc.address, mockWeth.address]
+    assert state.tokenized_share == funds[1]._tokenizedShare()
+
+def test_dsaModuleState():
+    try:
+        module = deploy_artifact("DaaDsaModule")
+    except FileNotFoundError as e:
+        pytest.skip(str(e))
+    owners = [a.address for a in accounts[:3]]
+    safe = MockSafe.deploy(owners, {'from': accounts[0]})
+    module.initialize(safe, MockInstaIndex.deploy({'from': accounts[0]}), chain.id, {'from': accounts[0]})
+    approved = "0x" + "ab" * 32
+    module.approveHash(approved, {'from': accounts[1]})
+    keys = {"approvedHashes": [(accounts[1].address, approved), (accounts[2].address, approved)]}
+    state = read_states([("DaaDsaModule", module)], keys)[0]
+    assert state.error is None
+    assert state.safe == safe.address
+    assert state.nonce == module.nonce()
+    assert state.threshold == 2
+    assert state.initialized
+    assert state.domain_separator == module.DOMAIN_SEPARATOR()
+    assert state.approved_hashes == {
+        (accounts[1].address, approved): module.approvedHashes(accounts[1], approved),
+        (accounts[2].address, approved): 0,
+    }
@@ -0,0 +1,149 @@
+from brownie import accounts, chain, web3
+from eth_utils import to_hex
+import pytest
+
+from scripts.fork_snapshot import set_code
+from scripts.nav_tracker import (
+    AAVE_ADDRESSES_PROVIDER, NavTracker, RAY, AavePosition, Reserve, compounded_interest, linear_interest, ray_div,
+)
+
+pytestmark = pytest.mark.require_network("development")
+
+# Registry.aaveProvider, read by AaveConnector
+AAVE_DATA_PROVIDER = "0x7551b5D2763519d4e37e8B81929D336De671d46d"
+
+###############
+
+@pytest.fixture(scope="module")
+def funds(deployFund, mockUsdc, mockWeth, mockConnector, deposit):
+    funds = []
+    for i in range(2):
+        safe = accounts[7 + i]
+        tokenizer = deployFund(safe)
+        deposit(tokenizer, mockUsdc, (i + 1) * 100 * 10**6)
+        mockWeth.mint(safe, (i + 1) * 10**17, {'from': accounts[0]})
+        mockConnector.setPosition(mockWeth, safe, 3 * 10**17, 10**17, {'from': accounts[0]})
+        funds.append(tokenizer)
+    return funds
+
+# a WETH reserve on a mock pool, served at the Registry addresses like the polygon one
+@pytest.fixture(scope="module")
+def aave(MockAavePool, MockAaveToken, MockAaveProvider, mockWeth):
+    pool = MockAavePool.deploy({'from': accounts[0]})
+    aToken = MockAaveToken.deploy(pool, mockWeth, False, {'from': accounts[0]})
+    debtToken = MockAaveToken.deploy(pool, mockWeth, True, {'from': accounts[0]})
+    pool.initReserve(mockWeth, aToken, debtToken, {'from': accounts[0]})
+    provider = MockAaveProvider.deploy(pool, {'from': accounts[0]})
+    for address in (AAVE_ADDRESSES_PROVIDER, AAVE_DATA_PROVIDER):
+        set_code(web3, address, to_hex(web3.eth.get_code(provider.address)))
+    return pool, aToken, debtToken
+
+@pytest.fixture(scope="module")
+def aaveFund(deployFund, aave, mockUsdc, mockWeth, AaveConnector, PositionManager, deposit):
+    safe = accounts[6]
+    tokenizer = deployFund(safe)
+    connector = AaveConnector.deploy({'from': accounts[0]})
+    positionManager = PositionManager.deploy(safe, ["AAVE-V2"], [connector], {'from': accounts[0]})
+    tokenizer.setPositionManager(positionManager, {'from': accounts[0]})
+    deposit(tokenizer, mockUsdc, 1000 * 10**6)
+    pool = aave[0]
+    pool.setRates(mockWeth, 3 * 10**25, 5 * 10**25, {'from': accounts[0]})
+    pool.deposit(mockWeth, 10**18, safe, 0, {'from': accounts[0]})
+    pool.borrow(mockWeth, 2 * 10**17, 2, 0, safe, {'from': accounts[0]})
+    return tokenizer
+
+def assert_published(published, funds):
+    # every block is published for every fund and matches calculateNav at that block
+    assert [block for block, _ in published] == list(range(published[0][0], chain.height + 1))
+    for block, results in published:
+        for tokenizer, result in zip(funds, results):
+            assert result.block == block
+            assert result.nav == tokenizer.calculateNav(block_identifier=block)
+            assert result.price_per_share == tokenizer.getPricePerShare(block_identifier=block)
+
+###############
+
+def test_interestMath():
+    assert linear_interest(5 * 10**25, 0, 365 * 24 * 3600) == RAY * 105 // 100
+    assert compounded_interest(10**26, 10, 10) == RAY
+    # compounding beats the linear rate
+    assert compounded_interest(10**26, 0, 365 * 24 * 3600) > linear_interest(10**26, 0, 365 * 24 * 3600)
+    reserve = Reserve("a", "d", RAY, RAY, 0, 0, 0)
+    assert AavePosition(ray_div(10**18, RAY), ray_div(10**17, RAY)).net(reserve, 0) == 9 * 10**17
+    assert AavePosition(0, 1).net(reserve, 0) is None
+
+def test_seedMatchesContract(funds):
+    tracker = NavTracker(funds, aave_connectors=[])
+    results = tracker.seed()
+    assert [r.nav for r in results] == [f.calculateNav() for f in funds]
+    assert tracker.reconcile() == []
+
+def test_followsTransfersRoundsAndPositions(funds, mockUsdc, mockWeth, ethFeed, mockConnector, deposit):
+    tracker = NavTracker(funds, aave_connectors=[])
+    tracker.seed()
+    start = chain.height + 1
+    deposit(funds[0], mockUsdc, 50 * 10**6)
+    mockWeth.mint(funds[1], 10**16, {'from': accounts[0]})
+    mockWeth.transfer(accounts[2], 10**16, {'from': accounts[8]})
+    ethFeed.updateAnswer(1900 * 10**8, {'from': accounts[0]})
+    mockConnector.setPosition(mockWeth, accounts[7], 4 * 10**17, 10**17, {'from': accounts[0]})
+    chain.mine()
+    published = tracker.step()
+    assert published[0][0] == start
+    assert_published(published, funds)
+    assert tracker.reconcile() == []
+
+def test_unchangedFundsAreNotRecomputed(funds, mockUsdc):
+    tracker = NavTracker(funds, aave_connectors=[])
+    tracker.seed()
+    before = tracker.recomputed
+    mockUsdc.mint(funds[0], 10**6, {'from': accounts[0]})
+    chain.mine(3)
+    assert_published(tracker.step(), funds)
+    assert tracker.recomputed == before + 1
+
+def test_configChangeReseeds(funds, mockUsdc, mockWeth):
+    tracker = NavTracker(funds, aave_connectors=[])
+    tracker.seed()
+    funds[1].addSupportedCurrency("USDT", mockUsdc, True, {'from': accounts[0]})
+    published = tracker.step()
+    assert published[-1][1][1].nav == funds[1].calculateNav()
+    assert tracker.tracks[1].state.base_currencies == [mockUsdc.address, mockUsdc.address]
+
+def test_reconcileReportsDrift(funds, mockUsdc):
+    tracker = NavTracker(funds, aave_connectors=[])
+    tracker.seed()
+    tracker.tracks[0].state.safe_balances[0] += 5
+    tracker.tracks[0].result = tracker._price(tracker.tracks[0], tracker.block)
+    (result, nav, price, drift), = tracker.reconcile(reseed=True)
+    assert result.tokenizer == funds[0].address
+    assert drift == 5
+    assert tracker.reconcile() == []
+
+def test_followsAavePositions(aaveFund, aave, mockWeth):
+    pool, aToken, debtToken = aave
+    safe = accounts[6]
+    # the AaveConnector is recognized from its compiled code
+    tracker = NavTracker([aaveFund])
+    [result] = tracker.seed()
+    assert tracker.tracks[0].aave == 1
+    assert result.nav == aaveFund.calculateNav()
+    start = chain.height + 1
+    chain.sleep(3600)
+    pool.deposit(mockWeth, 3 * 10**17, safe, 0, {'from': accounts[0]})  # aToken Mint
+    pool.withdraw(mockWeth, 10**17, accounts[0], {'from': safe})  # aToken Burn
+    aToken.transfer(accounts[2], 5 * 10**16, {'from': safe})  # BalanceTransfer
+    pool.borrow(mockWeth, 10**17, 2, 0, safe, {'from': accounts[0]})  # debt Mint
+    pool.repay(mockWeth, 5 * 10**16, 2, safe, {'from': accounts[0]})  # debt Burn
+    pool.setRates(mockWeth, 4 * 10**25, 8 * 10**25, {'from': accounts[0]})  # ReserveDataUpdated only
+    # interest accrues between blocks without any event
+    chain.sleep(24 * 3600)
+    chain.mine(2)
+    published = tracker.step()
+    assert published[0][0] == start
+    assert_published(published, [aaveFund])
+    position = tracker.positions[mockWeth.address, safe.address]
+    assert (position.scaled_value, position.scaled_debt) == (aToken.scaledBalanceOf(safe), debtToken.scaledBalanceOf(safe))
+    reserve = tracker.reserves[mockWeth.address]
+    assert (reserve.liquidity_rate, reserve.variable_rate) == (4 * 10**25, 8 * 10**25)
+    assert tracker.reconcile() == []
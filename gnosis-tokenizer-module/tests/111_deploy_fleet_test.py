@@ -0,0 +1,95 @@
+from brownie import accounts, web3
+import pytest
+
+from scripts.deploy_fleet import SHARED, FleetDeployer, Ref, create_address, plan
+
+pytestmark = pytest.mark.require_network("development")
+
+###############
+
+@pytest.fixture(scope="module")
+def manifest(mockUsdc, mockWeth, ethFeed, mockConnector):
+    return {
+        "connectors": {"MOCK": mockConnector.address},
+        "currencies": [{"ticker": "WETH", "token": mockWeth.address}],
+        "oracles": {mockWeth.address: ethFeed.address},
+        "safes": [a.address for a in accounts[5:9]],
+    }
+
+# a node-unlocked account and a local one, so both ways of sending are used
+@pytest.fixture(scope="module")
+def senders():
+    local = accounts.add()
+    accounts[0].transfer(local, "50 ether")
+    return [accounts[0], local]
+
+def nonces(senders):
+    return sum(web3.eth.get_transaction_count(s.address) for s in senders)
+
+def assert_wired(addresses, manifest, senders, DaaTokenizer, ProxyHandler):
+    for safe in manifest["safes"]:
+        deployed = addresses[safe]
+        tokenizer = DaaTokenizer.at(deployed["proxy"])
+        assert ProxyHandler.at(deployed["proxy"]).getImplementation() == addresses[SHARED]["implementation"]
+        assert tokenizer._safe() == safe
+        assert tokenizer._positionManager() == deployed["positionManager"]
+        assert tokenizer._tokenizedShare() == deployed["tokenizedShare"]
+        assert tokenizer._oracleHandler() == addresses[SHARED]["oracleHandler"]
+        assert tokenizer.owner() in senders
+        # the safe balances and the MOCK connector positions are read through the wired contracts
+        tokenizer.calculateNav()
+
+###############
+
+def test_createAddress(MockERC20):
+    nonce = accounts[0].nonce
+    token = MockERC20.deploy("Token", "TKN", 18, {'from': accounts[0]})
+    assert create_address(accounts[0].address, nonce) == token.address
+
+def test_plan(manifest, senders):
+    steps = plan(manifest, senders)
+    seen = set()
+    for step in steps:
+        # dependencies are planned first
+        assert all(dep in seen for dep in step.deps)
+        seen.add(step.id)
+    assert len(steps) == len(seen)
+    assert [s.id for s in steps if s.id.startswith(SHARED)] == [
+        "shared:implementation", "shared:oracleHandler", "shared:oracle:{}".format(manifest["currencies"][0]["token"])]
+    proxies = [s for s in steps if s.id.endswith(":proxy")]
+    assert [s.args for s in proxies] == [(Ref("shared:implementation"),)] * 4
+    assert [s.sender for s in proxies] == [a.address for a in senders] * 2
+
+def test_deployFleet(manifest, senders, tmp_path, DaaTokenizer, ProxyHandler, OracleHandler, mockWeth, ethFeed):
+    steps = plan(manifest, senders)
+    before = nonces(senders)
+    addresses = FleetDeployer(steps, senders, tmp_path / "progress.json", poll_interval=0).run()
+    assert nonces(senders) - before == len(steps)
+    assert OracleHandler.at(addresses[SHARED]["oracleHandler"]).priceFeeds(mockWeth) == ethFeed
+    assert_wired(addresses, manifest, senders, DaaTokenizer, ProxyHandler)
+    # a finished run is not sent again
+    assert FleetDeployer(steps, senders, tmp_path / "progress.json").run() == addresses
+    assert nonces(senders) - before == len(steps)
+
+def test_resume(manifest, senders, tmp_path, monkeypatch, DaaTokenizer, ProxyHandler):
+    steps = plan(manifest, senders)
+    before = nonces(senders)
+    waves = []
+    broadcast = FleetDeployer._broadcast
+
+    def crash(self, step_ids, rebroadcast=False):
+        # killed after the progress of the third wave is written, before it is sent
+        waves.append(step_ids)
+        if len(waves) == 3:
+            raise KeyboardInterrupt
+        return broadcast(self, step_ids, rebroadcast)
+
+    with monkeypatch.context() as m:
+        m.setattr(FleetDeployer, "_broadcast", crash)
+        with pytest.raises(KeyboardInterrupt):
+            FleetDeployer(steps, senders, tmp_path / "progress.json", max_pending=4, poll_interval=0).run()
+    assert 0 < nonces(senders) - before < len(steps)
+    addresses = FleetDeployer(steps, senders, tmp_path / "progress.json", max_pending=4, poll_interval=0).run()
+    # every step mined once, the wave written but not sent went out with its recorded nonces
+    assert nonces(senders) - before == len(steps)
+    assert_wired(addresses, manifest, senders, DaaTokenizer, ProxyHandler)
@@ -0,0 +1,185 @@
+import asyncio
+import sys
+from contextlib import contextmanager
+
+from brownie import accounts, chain, web3
+import pytest
+
+from scripts.artifacts import REPO_ROOT
+from scripts.benchmark import ZERO, deploy_artifact
+from scripts.relayer import Operation, Relayer, execute_transaction, execute_transfer
+from scripts.rpc import RPCError, encode, encode_call
+
+pytestmark = pytest.mark.require_network("development")
+
+# anvil and hardhat, then ganache >= 7
+AUTOMINE_OFF = (("evm_setAutomine", [False]), ("miner_stop", []))
+AUTOMINE_ON = (("evm_setAutomine", [True]), ("miner_start", []))
+
+###############
+
+@pytest.fixture(scope="module")
+def relayerKeys():
+    # a node-unlocked account and a local one
+    local = accounts.add()
+    accounts[0].transfer(local, "50 ether")
+    return [accounts[0], local]
+
+def cheatcode(calls):
+    for method, params in calls:
+        if "error" not in web3.provider.make_request(method, params):
+            return
+    pytest.skip("the dev node cannot switch automine")
+
+@contextmanager
+def blockInterval(seconds):
+    """Blocks mined every `seconds` instead of one per transaction"""
+    cheatcode(AUTOMINE_OFF)
+
+    async def mine():
+        while True:
+            await asyncio.sleep(seconds)
+            await asyncio.get_running_loop().run_in_executor(None, web3.provider.make_request, "evm_mine", [])
+
+    try:
+        yield mine
+    finally:
+        cheatcode(AUTOMINE_ON)
+        chain.mine()
+
+def relay(relayer, operations, mine=None):
+    async def run():
+        miner = asyncio.create_task(mine()) if mine else None
+        async with relayer:
+            results = await asyncio.gather(*[relayer.relay(op) for op in operations])
+        if miner:
+            miner.cancel()
+        return results
+    return asyncio.run(run())
+
+def mints(token, safes, count):
+    return [
+        Operation(safes[i % len(safes)], token.address, encode_call("mint(address,uint256)", [safes[i % len(safes)], i + 1]), "mint")
+        for i in range(count)
+    ]
+
+###############
+
+def test_relayAutomine(relayerKeys, MockERC20):
+    token = MockERC20.deploy("Token", "TKN", 18, {'from': accounts[0]})
+    safes = [a.address for a in accounts[5:9]]
+    relayer = Relayer(relayerKeys, owners={s: relayerKeys for s in safes})
+    results = relay(relayer, mints(token, safes, 20))
+    assert all(r.status for r in results)
+    # operations of a safe stay on one key, in submission order
+    for safe in safes:
+        mined = [r for r in results if r.operation.safe == safe]
+        assert len({r.sender for r in mined}) == 1
+        assert [r.nonce for r in mined] == sorted(r.nonce for r in mined)
+    assert sum(token.balanceOf(s) for s in safes) == sum(range(1, 21))
+    metrics = relayer.metrics()
+    assert metrics["mined"] == 20 and metrics["failed"] == 0
+    assert set(metrics["by_key"]) == {k.address for k in relayerKeys}
+
+def test_relayBlockInterval(relayerKeys, MockERC20):
+    token = MockERC20.deploy("Token", "TKN", 18, {'from': accounts[0]})
+    safes = [a.address for a in accounts[5:9]]
+    relayer = Relayer(relayerKeys, owners={s: relayerKeys for s in safes}, max_in_flight=8, poll_interval=0.05)
+    start = chain.height
+    with blockInterval(1) as mine:
+        results = relay(relayer, mints(token, safes, 32), mine)
+    assert all(r.status for r in results)
+    # 2 keys with 8 transactions in flight each: many operations per block
+    assert len({r.block for r in results}) <= 4
+    assert chain.height - start <= 8
+    assert relayer.metrics()["inclusion"]["max"] < 5
+
+def test_feeBump(relayerKeys, MockERC20):
+    token = MockERC20.deploy("Token", "TKN", 18, {'from': accounts[0]})
+    safe = accounts[5].address
+    relayer = Relayer(relayerKeys[1:], owners={safe: relayerKeys}, bump_after=0.3, poll_interval=0.05)
+    with blockInterval(2) as mine:
+        [result] = relay(relayer, mints(token, [safe], 1), mine)
+    assert result.status
+    assert len(result.hashes) > 1 and result.hash in result.hashes
+    assert result.gas_price > relayer.gas_price
+    assert relayer.metrics()["replacements"] == len(result.hashes) - 1
+    # the same nonce for every replacement
+    assert web3.eth.get_transaction(result.hash).nonce == result.nonce
+
+def test_pollRecovers(relayerKeys, MockERC20):
+    token = MockERC20.deploy("Token", "TKN", 18, {'from': accounts[0]})
+    safe = accounts[5].address
+    relayer = Relayer(relayerKeys, owners={safe: relayerKeys}, poll_interval=0.05)
+    poll = relayer.poll
+    failures = []
+
+    async def flaky():
+        # the first round fails like a node timeout would
+        if not failures:
+            failures.append(1)
+            raise RPCError({"code": -32000, "message": "timeout"})
+        await poll()
+
+    relayer.poll = flaky
+    with pytest.warns(UserWarning, match="relayer poll failed"):
+        results = relay(relayer, mints(token, [safe], 4))
+    assert all(r.status for r in results)
+    assert relayer.metrics()["poll_errors"] == 1
+    assert token.balanceOf(safe) == sum(range(1, 5))
+
+def test_executeTransfer(relayerKeys, MockSafe, mockUsdc):
+    try:
+        safes = [MockSafe.deploy([k.address for k in relayerKeys], {'from': accounts[0]}) for _ in range(3)]
+        modules = [deploy_artifact("DaaModule", accounts[9].address, s.address) for s in safes]
+    except FileNotFoundError as e:
+        pytest.skip(str(e))
+    for safe, module in zip(safes, modules):
+        safe.enableModule(module, {'from': accounts[0]})
+        mockUsdc.mint(safe, 10**9, {'from': accounts[0]})
+    before = mockUsdc.balanceOf(accounts[9])
+    operations = [execute_transfer(m.address, s.address, mockUsdc.address, 10**6) for s, m in zip(safes, modules)] * 3
+    # owners are read with getOwners()
+    relayer = Relayer(relayerKeys)
+    results = relay(relayer, operations)
+    assert all(r.status for r in results)
+    assert mockUsdc.balanceOf(accounts[9]) == before + 9 * 10**6
+    # a safe not owned by any relayer key is refused
+    stranger = MockSafe.deploy([accounts[3].address], {'from': accounts[0]})
+    with pytest.raises(ValueError):
+        relay(Relayer(relayerKeys), [execute_transfer(modules[0].address, stranger.address, mockUsdc.address, 1)])
+
+def test_executeTransaction(relayerKeys, MockSafe, MockInstaIndex, mockUsdc):
+    helpers = str(REPO_ROOT / "gnosis-dsa-module/src/test")
+    if helpers not in sys.path:
+        sys.path.append(helpers)
+    from signatures import sign_hash
+    from signing_service import pack_signatures
+
+    safe = MockSafe.deploy([k.address for k in relayerKeys], {'from': accounts[0]})
+    try:
+        module = deploy_artifact("DaaDsaModule")
+    except FileNotFoundError as e:
+        pytest.skip(str(e))
+    module.initialize(safe, MockInstaIndex.deploy({'from': accounts[0]}), chain.id, {'from': accounts[0]})
+    safe.enableModule(module, {'from': accounts[0]})
+    module.createAccount(2, ZERO, {'from': accounts[0]})
+    mockUsdc.mint(safe, 10**9, {'from': accounts[0]})
+    selector = web3.keccak(text="deposit(address,uint256,uint256,uint256)")[:4]
+    data = selector + encode(["address", "uint256", "uint256", "uint256"], [mockUsdc.address, 10**6, 0, 0])
+    spells, datas = ["BASIC-A"], [data]
+    # casts signed ahead for consecutive nonces, the relayer keeps them in order
+    nonce = module.nonce()
+    operations = []
+    for i in range(3):
+        tx_hash = module.getTransactionHash(spells, datas, nonce + i)
+        signatures = pack_signatures({k.address: sign_hash(k.private_key, tx_hash) for k in relayerKeys})
+        operations.append(execute_transaction(module.address, safe.address, spells, datas, signatures))
+    results = relay(Relayer(relayerKeys), operations)
+    assert all(r.status for r in results)
+    assert len({r.sender for r in results}) == 1
+    assert module.nonce() == nonce + 3
+    executed = web3.keccak(text="TransactionExecuted(bytes32)")
+    for i, result in enumerate(results):
+        logs = [l for l in web3.eth.get_transaction_receipt(result.hash).logs if l.topics[0] == executed]
+        assert [bytes(l.data) for l in logs] == [bytes(module.getTransactionHash(spells, datas, nonce + i))]
@@ -0,0 +1,81 @@
+from brownie import accounts
+import pytest
+
+# numpy is not a brownie dependency
+np = pytest.importorskip("numpy")
+
+from scripts.stress import (
+    asset_shocks, check_baseline, correlated_shocks, evaluate, parallel_shocks, report, snapshot,
+)
+
+pytestmark = pytest.mark.require_network("development")
+
+THRESHOLDS = (0.825, 0.85)  # WETH, USDC
+
+def healthFactors(wethPrice):
+    # 0.3 WETH and 200 USDC per unit supplied, 100 USDC per unit borrowed
+    return [(0.3 * wethPrice * THRESHOLDS[0] + (i + 1) * 200 * THRESHOLDS[1]) / ((i + 1) * 100) for i in range(3)]
+
+###############
+
+@pytest.fixture(scope="module")
+def thresholds(mockUsdc, mockWeth):
+    return {mockWeth.address: THRESHOLDS[0], mockUsdc.address: THRESHOLDS[1]}
+
+@pytest.fixture(scope="module")
+def funds(deployFund, mockUsdc, mockWeth, mockConnector):
+    funds = []
+    for i in range(3):
+        safe = accounts[7 + i]
+        tokenizer = deployFund(safe)
+        mockUsdc.mint(accounts[1], (i + 1) * 100 * 10**6, {'from': accounts[0]})
+        mockUsdc.approve(tokenizer, (i + 1) * 100 * 10**6, {'from': accounts[1]})
+        tokenizer.deposit("USDC", (i + 1) * 100 * 10**6, {'from': accounts[1]})
+        mockWeth.mint(safe, (i + 1) * 10**17 + 12345, {'from': accounts[0]})
+        mockWeth.mint(tokenizer, 7 + i, {'from': accounts[0]})
+        # WETH and USDC supplied, USDC borrowed on the connector
+        mockConnector.setPosition(mockWeth, safe, 3 * 10**17, 0, {'from': accounts[0]})
+        mockConnector.setPosition(mockUsdc, safe, (i + 1) * 200 * 10**6, (i + 1) * 100 * 10**6, {'from': accounts[0]})
+        funds.append(tokenizer)
+    return funds
+
+###############
+
+def test_unshockedMatchesContract(funds, thresholds):
+    state = snapshot(funds, thresholds=thresholds)
+    assert check_baseline(state) == []
+    unshocked = evaluate(state, np.ones((1, len(state.assets))))
+    assert [int(n) for n in unshocked.nav[0]] == [f.calculateNav() for f in funds]
+    assert state.price_per_share == [f.getPricePerShare() for f in funds]
+    assert np.allclose(unshocked.health_factor[0], healthFactors(2000))
+
+def test_shockMatchesRepricedContract(funds, thresholds, mockWeth, ethFeed):
+    state = snapshot(funds, thresholds=thresholds)
+    shocked = evaluate(state, asset_shocks(state, {mockWeth.address: -0.4}))
+    ethFeed.updateAnswer(1200 * 10**8, {'from': accounts[0]})
+    for i, tokenizer in enumerate(funds):
+        # only the floors of the two getTokenValueUsd of WETH differ
+        assert abs(shocked.nav[0, i] - tokenizer.calculateNav()) <= 2
+        assert abs(shocked.price_per_share[0, i] - tokenizer.getPricePerShare()) <= 1
+    assert np.allclose(shocked.health_factor[0], healthFactors(1200))
+
+def test_scenarios(funds, thresholds, mockWeth):
+    state = snapshot(funds, thresholds=thresholds)
+    moves = parallel_shocks(state, [-0.5, 0.0, 0.5])
+    weth = state.assets.index(mockWeth.address)
+    assert moves[:, weth].tolist() == [0.5, 1.0, 1.5]
+    # base currencies never move
+    assert (moves[:, state.base] == 1).all()
+    shocks = correlated_shocks(state, 5000, volatility=0.1, seed=1)
+    assert shocks.shape == (5000, len(state.assets))
+    assert (shocks[:, state.base] == 1).all()
+    result = report(state, np.vstack([moves, shocks]), chunk=2)
+    assert [f["tokenizer"] for f in result["funds"]] == [f.address for f in funds]
+    assert result["nav"] == sum(f.calculateNav() for f in funds)
+    for fund in result["funds"]:
+        quantiles = fund["nav_quantiles"]
+        assert quantiles["0.01"] <= quantiles["0.05"] <= quantiles["0.5"]
+        assert fund["min_health_factor"] < fund["health_factor"]
+        assert fund["liquidation_probability"] == 0
+    # the -50% scenario is the worst one
+    assert {f["worst_scenario"] for f in result["funds"]} == {0}
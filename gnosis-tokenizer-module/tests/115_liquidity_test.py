@@ -0,0 +1,83 @@
+from brownie import accounts, reverts
+import pytest
+
+from scripts.liquidity import LiquidityPlanner
+
+pytestmark = pytest.mark.require_network("development")
+
+###############
+
+@pytest.fixture(scope="module")
+def fund(deployFund, mockUsdc, mockUsdt):
+    safe = accounts[7]
+    tokenizer = deployFund(safe)
+    tokenizer.addSupportedCurrency("USDT", mockUsdt, True, {'from': accounts[0]})
+    for ticker, token, user, amount in (("USDC", mockUsdc, accounts[1], 500), ("USDT", mockUsdt, accounts[2], 300)):
+        token.mint(user, amount * 10**6, {'from': accounts[0]})
+        token.approve(tokenizer, amount * 10**6, {'from': user})
+        tokenizer.deposit(ticker, amount * 10**6, {'from': user})
+    # a small buffer, and some income so that the price per share is not 1
+    mockUsdc.mint(tokenizer, 50 * 10**6, {'from': accounts[0]})
+    return tokenizer
+
+@pytest.fixture
+def queue():
+    return ((accounts[1], 200 * 10**6), (accounts[2], 100 * 10**6), (accounts[1], 150 * 10**6))
+
+def balances(tokens, holder):
+    return [t.balanceOf(holder) for t in tokens]
+
+###############
+
+def test_plannedTopUpsCoverTheQueue(fund, mockUsdc, mockUsdt, queue):
+    planner = LiquidityPlanner.load(fund, preference=[mockUsdt.address, mockUsdc.address])
+    planner.extend(shares for _, shares in queue)
+    plan = planner.plan()
+    assert plan.buffer == 50 * 10**6
+    assert plan.first_failure == 0 and plan.shortfall == 0
+    # the first redemption is already short of funds
+    with reverts("Not enough funds in tokenizer"):
+        fund.redeem(queue[0][1], {'from': queue[0][0]})
+    # USDT first, the rest in USDC
+    assert [(t.token, t.amount) for t in plan.top_ups] == [
+        (mockUsdt.address, 300 * 10**6), (mockUsdc.address, plan.demand - plan.buffer - 300 * 10**6)]
+    for tx in planner.transactions(plan):
+        accounts[7].transfer(tx["to"], 0, data=tx["data"])
+    tokens = [mockUsdc, mockUsdt]
+    refreshed = LiquidityPlanner.load(fund)
+    refreshed.extend(shares for _, shares in queue)
+    payouts, failure = refreshed.simulate()
+    assert failure is None
+    for (user, shares), payout, amount in zip(queue, payouts, refreshed.amounts):
+        before = balances(tokens, user)
+        fund.redeem(shares, {'from': user})
+        assert [b + dict(payout).get(t.address, 0) for b, t in zip(before, tokens)] == balances(tokens, user)
+        assert sum(v for _, v in payout) == amount
+    # minimal: the buffer is empty once the queue went through
+    assert balances(tokens, fund) == [0, 0]
+
+def test_incrementalReplanning(fund, mockUsdc, mockUsdt, queue):
+    planner = LiquidityPlanner.load(fund)
+    planner.extend(shares for _, shares in queue)
+    amounts = planner.amounts
+    mockUsdc.transfer(fund, amounts[0], {'from': accounts[7]})
+    fund.redeem(queue[0][1], {'from': queue[0][0]})
+    planner.top_up(mockUsdc.address, amounts[0])
+    planner.executed(1)
+    # the remaining redemptions keep their price, the fund read again agrees
+    assert planner.amounts == amounts[1:]
+    planner.refresh()
+    assert planner.amounts == amounts[1:]
+    assert planner.plan().demand == sum(amounts[1:])
+    # income reprices the queue
+    mockUsdt.mint(accounts[7], 80 * 10**6, {'from': accounts[0]})
+    planner.refresh()
+    assert planner.amounts[0] > amounts[1]
+    # a cancelled redemption leaves the ones before it alone
+    first = planner.amounts[0]
+    planner.remove(1)
+    assert planner.amounts == [first]
+    # shares that cannot be redeemed are reported, not counted
+    planner.extend([0])
+    plan = planner.plan()
+    assert list(plan.reverts) == [1] and plan.demand == first
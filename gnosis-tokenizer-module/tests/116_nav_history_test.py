@@ -0,0 +1,75 @@
+from brownie import accounts, chain
+import pytest
+
+from scripts.nav_history import NavBackfill, NavHistory
+
+pytestmark = pytest.mark.require_network("development")
+
+###############
+
+@pytest.fixture(scope="module")
+def funds(deployFund):
+    return [deployFund(accounts[7 + i]) for i in range(2)]
+
+@pytest.fixture
+def history(funds, mockUsdc, mockWeth, ethFeed, mockConnector, TokenizedShare, deposit):
+    """Scripted history, returns its first and last block"""
+    start = chain.height + 1
+    chain.mine()
+    deposit(funds[0], mockUsdc, 100 * 10**6)
+    chain.mine(5)
+    deposit(funds[1], mockUsdc, 200 * 10**6, accounts[2])
+    mockWeth.mint(accounts[7], 10**17, {'from': accounts[0]})
+    chain.mine(3)
+    ethFeed.updateAnswer(1800 * 10**8, {'from': accounts[0]})
+    mockConnector.setPosition(mockWeth, accounts[8], 3 * 10**17, 10**17, {'from': accounts[0]})
+    chain.mine(10)
+    # a share transfer and a mint to an outsider leave the NAV unchanged
+    TokenizedShare.at(funds[0]._tokenizedShare()).transfer(accounts[4], 10**6, {'from': accounts[1]})
+    mockUsdc.mint(accounts[3], 10**6, {'from': accounts[0]})
+    mockWeth.transfer(accounts[2], 5 * 10**16, {'from': accounts[7]})
+    deposit(funds[0], mockUsdc, 30 * 10**6, accounts[2])
+    chain.mine(4)
+    ethFeed.updateAnswer(2100 * 10**8, {'from': accounts[0]})
+    mockConnector.setPosition(mockWeth, accounts[8], 2 * 10**17, 10**17, {'from': accounts[0]})
+    chain.mine(2)
+    return start, chain.height
+
+def onchain(tokenizer, block):
+    return (
+        tokenizer.calculateNav(block_identifier=block),
+        tokenizer.getTotalSharesOutstanding(block_identifier=block),
+        tokenizer.getPricePerShare(block_identifier=block),
+    )
+
+###############
+
+def test_backfillMatchesEveryBlock(funds, history, tmp_path):
+    start, end = history
+    backfill = NavBackfill(tmp_path, funds, start, aave_connectors=[], window=8, batch_size=4)
+    backfill.run(end)
+    store = NavHistory(tmp_path)
+    assert store.block == end
+    for tokenizer in funds:
+        series = store.series(tokenizer)
+        # only the blocks where something moved are stored
+        assert series[0].block == start and len(series) < end - start
+        for point in series:
+            assert point.values == onchain(tokenizer, point.block)
+        for block in range(start, end + 1):
+            assert store.at(tokenizer, block).values == onchain(tokenizer, block)
+    assert backfill.evaluated < len(funds) * (end - start + 1)
+
+def test_resume(funds, history, tmp_path):
+    start, end = history
+    NavBackfill(tmp_path / "once", funds, start, aave_connectors=[]).run(end)
+    middle = (start + end) // 2
+    NavBackfill(tmp_path / "resumed", funds, start, aave_connectors=[], window=5).run(middle)
+    resumed = NavBackfill(tmp_path / "resumed", funds, start, aave_connectors=[], window=5)
+    assert resumed.store.block == middle
+    resumed.run(end)
+    once, resumed = NavHistory(tmp_path / "once"), NavHistory(tmp_path / "resumed")
+    for tokenizer in funds:
+        assert once.series(tokenizer) == resumed.series(tokenizer)
+    with pytest.raises(ValueError):
+        NavBackfill(tmp_path / "resumed", funds[:1], start)
@@ -0,0 +1,85 @@
+from brownie import accounts, chain, web3
+import pytest
+
+from scripts.simulator import NATIVE, ForkBackend, Simulator, TraceBackend, balance_override, deposit, redeem
+
+pytestmark = pytest.mark.require_network("development")
+
+ZERO = "0x0000000000000000000000000000000000000000"
+
+###############
+
+@pytest.fixture(scope="module")
+def fund(deployFund, mockUsdc, TokenizedShare):
+    safe = accounts[7]
+    tokenizer = deployFund(safe)
+    for user in accounts[1:3]:
+        mockUsdc.approve(tokenizer, 2**256 - 1, {'from': user})
+    mockUsdc.mint(accounts[1], 1000 * 10**6, {'from': accounts[0]})
+    tokenizer.deposit("USDC", 500 * 10**6, {'from': accounts[1]})
+    mockUsdc.mint(tokenizer, 20 * 10**6, {'from': accounts[0]})
+    return tokenizer, safe, TokenizedShare.at(tokenizer._tokenizedShare())
+
+def candidates(fund, mockUsdc):
+    tokenizer, _, share = fund
+    return [
+        deposit(tokenizer.address, accounts[1].address, "USDC", 100 * 10**6, label="deposit"),
+        redeem(tokenizer.address, accounts[1].address, share.balanceOf(accounts[1]) // 2, label="redeem above the buffer"),
+        redeem(tokenizer.address, accounts[1].address, 10 * 10**6, label="redeem"),
+        # accounts[2] holds no USDC, the override gives it some
+        deposit(tokenizer.address, accounts[2].address, "USDC", 100 * 10**6, label="deposit with override",
+                overrides=balance_override(mockUsdc.address, accounts[2].address, 100 * 10**6)),
+    ]
+
+###############
+
+def test_forkPredictsExecution(fund, mockUsdc):
+    tokenizer, safe, share = fund
+    height = chain.height
+    simulator = Simulator(ForkBackend())
+    placed, above, redeemed, overridden = simulator.simulate(candidates(fund, mockUsdc))
+    # nothing was kept on chain
+    assert chain.height == height and mockUsdc.balanceOf(accounts[2]) == 0
+    assert not above.success and above.revert_reason == "Not enough funds in tokenizer"
+    assert overridden.success
+    assert overridden.deltas[accounts[2].address][mockUsdc.address] == -100 * 10**6
+    # the predictions match the transactions once sent
+    shares = share.balanceOf(accounts[1])
+    tx = tokenizer.deposit("USDC", 100 * 10**6, {'from': accounts[1]})
+    assert placed.success and placed.gas_used == tx.gas_used
+    assert placed.events[-1] == ("DepositReceived", dict(tx.events["DepositReceived"]))
+    assert ("Transfer", {"from": ZERO, "to": accounts[1].address, "value": share.balanceOf(accounts[1]) - shares}) in placed.events
+    assert placed.deltas[accounts[1].address][share.address] == share.balanceOf(accounts[1]) - shares
+    assert placed.deltas[safe.address] == {mockUsdc.address: 100 * 10**6}
+    chain.undo()
+    balance = mockUsdc.balanceOf(accounts[1])
+    tx = tokenizer.redeem(10 * 10**6, {'from': accounts[1]})
+    assert redeemed.gas_used == tx.gas_used
+    assert redeemed.deltas[accounts[1].address][mockUsdc.address] == mockUsdc.balanceOf(accounts[1]) - balance
+    assert redeemed.deltas[tokenizer.address][mockUsdc.address] == balance - mockUsdc.balanceOf(accounts[1])
+    assert NATIVE not in redeemed.deltas.get(accounts[1].address, {})
+
+def test_cache(fund, mockUsdc):
+    simulator = Simulator(ForkBackend())
+    first = simulator.simulate(candidates(fund, mockUsdc))
+    again = simulator.simulate(candidates(fund, mockUsdc))
+    assert simulator.simulated == 4 and simulator.hits == 4
+    assert [s.gas_used for s in again] == [s.gas_used for s in first]
+    chain.mine()
+    simulator.pin()
+    simulator.simulate(candidates(fund, mockUsdc)[:1])
+    assert simulator.simulated == 5
+
+def test_traceMatchesFork(fund, mockUsdc):
+    probe = web3.provider.make_request("debug_traceCall", [{"to": ZERO}, "latest", {"tracer": "callTracer"}])
+    if "error" in probe:
+        pytest.skip("the dev node has no debug_traceCall call tracer")
+    calls = candidates(fund, mockUsdc)
+    traced = Simulator(TraceBackend(workers=2, batch_size=1)).simulate(calls)
+    forked = Simulator(ForkBackend()).simulate(calls)
+    for trace, fork in zip(traced, forked):
+        assert (trace.success, trace.revert_reason) == (fork.success, fork.revert_reason)
+        if trace.success:
+            assert trace.events == fork.events
+            tokens = {h: {t: v for t, v in d.items() if t != NATIVE} for h, d in fork.deltas.items()}
+            assert trace.deltas == {h: d for h, d in tokens.items() if d}
@@ -0,0 +1,72 @@
+from brownie import accounts
+import json
+import pytest
+
+from scripts.profiler import Profile, Profiler, diff, report_name, save
+from scripts.rpc import encode_call
+
+pytestmark = pytest.mark.require_network("development")
+
+###############
+
+@pytest.fixture(scope="module")
+def fund(deployFund, mockUsdc):
+    tokenizer = deployFund(accounts[7])
+    mockUsdc.mint(accounts[1], 10**12, {'from': accounts[0]})
+    mockUsdc.approve(tokenizer, 2**256 - 1, {'from': accounts[1]})
+    tokenizer.deposit("USDC", 1000 * 10**6, {'from': accounts[1]})
+    return tokenizer
+
+def addAsset(tokenizer, index, MockERC20, MockV3Aggregator, OracleHandler):
+    token = MockERC20.deploy("Asset {}".format(index), "ASSET{}".format(index), 18, {'from': accounts[0]})
+    feed = MockV3Aggregator.deploy(8, 100 * 10**8, {'from': accounts[0]})
+    tokenizer.addSupportedCurrency(token.symbol(), token, False, {'from': accounts[0]})
+    OracleHandler.at(tokenizer._oracleHandler()).addTokenOracle(token, feed, {'from': accounts[0]})
+    token.mint(accounts[7], 10**18, {'from': accounts[0]})
+
+###############
+
+def test_depositProfile(fund):
+    tx = fund.deposit("USDC", 100 * 10**6, {'from': accounts[1]})
+    profile = Profiler().profile_transaction(tx.txid)
+    # every step is charged once: functions, lines and stacks add up to the executed gas
+    assert profile.gas == sum(f["gas"] for f in profile.functions.values()) == sum(profile.folded.values())
+    assert 0 < profile.gas < tx.gas_used
+    nav = profile.functions["DaaTokenizer._calculateNav"]
+    assert nav["gas"] > 0 and nav["STATICCALL"] >= 2
+    assert profile.functions["DaaTokenizer.isBaseCurrency"]["SLOAD"] > 0
+    lines = [k for k, v in profile.lines.items() if v["function"] == "DaaTokenizer.isBaseCurrency"]
+    assert lines and all(k.startswith("contracts/DaaTokenizer.sol:") for k in lines)
+    # the balanceOf calls are frames of the token under the internal function making them
+    assert any(s.startswith("DaaTokenizer;") and "DaaTokenizer._calculateNav;MockERC20" in s for s in profile.folded)
+    assert Profile.from_json(profile.to_json()) == profile
+
+def test_assetsDiff(fund, MockERC20, MockV3Aggregator, OracleHandler):
+    profiler = Profiler()
+    call = (accounts[0].address, fund.address, encode_call("calculateNav()"))
+    before = profiler.profile_call(*call)
+    for i in range(3):
+        addAsset(fund, i, MockERC20, MockV3Aggregator, OracleHandler)
+    after = profiler.profile_call(*call)
+    changes = {key: (old, new) for key, old, new in diff(before, after)}
+    for function in ("DaaTokenizer._calculateNav", "DaaTokenizer.isBaseCurrency", "DaaTokenizer.getTokenValueUsd"):
+        old, new = changes[function]
+        assert new > old
+    # the oracle is only reached for the new assets
+    assert changes["OracleHandler.getExchangeRate"][0] < changes["OracleHandler.getExchangeRate"][1]
+    assert diff(after, after) == []
+
+def test_savePointsToDistinctFiles(fund, tmp_path):
+    profiler = Profiler()
+    points = {
+        "DaaTokenizer.deposit[assets=1,bases=1,connectors=1]": fund.deposit("USDC", 10**6, {'from': accounts[1]}),
+        "DaaTokenizer.deposit[assets=2,bases=1,connectors=1]": fund.deposit("USDC", 2 * 10**6, {'from': accounts[1]}),
+    }
+    for point, tx in points.items():
+        save(profiler.profile_transaction(tx.txid), tmp_path, point)
+    names = [report_name(point) for point in points]
+    assert len(set(names)) == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(n + ext for n in names for ext in (".json", ".folded"))
+    for point, tx in points.items():
+        saved = Profile.from_json(json.loads((tmp_path / (report_name(point) + ".json")).read_text()))
+        assert saved == profiler.profile_transaction(tx.txid)
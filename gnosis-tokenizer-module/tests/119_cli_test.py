@@ -0,0 +1,49 @@
+import json
+import subprocess
+import sys
+
+from brownie import accounts, web3
+import pytest
+
+from scripts.artifacts import PROJECT_ROOT
+from scripts.cli import main
+
+pytestmark = pytest.mark.require_network("development")
+
+###############
+
+@pytest.fixture
+def cli(tmp_path):
+    def run(*args):
+        return main(["--rpc", web3.provider.endpoint_uri, "--cache-dir", str(tmp_path)] + [str(a) for a in args])
+    return run
+
+###############
+
+def test_deployAndWireProxy(cli, DaaTokenizer, TokenizedShare, OracleHandler, PositionManager, mockConnector):
+    dev, safe = accounts[0], accounts[7]
+    assert set(cli("cache", "DaaTokenizer", "ProxyHandler", "PositionManager")) == {"DaaTokenizer", "ProxyHandler", "PositionManager"}
+    implementation = cli("deploy", "DaaTokenizer", "--from", dev)
+    positionManager = cli("deploy", "PositionManager", safe, '["MOCK"]', json.dumps([mockConnector.address]), "--from", dev)
+    assert PositionManager.at(positionManager)._connectors("MOCK") == mockConnector
+    oracleHandler = OracleHandler.deploy({'from': dev})
+    proxy = cli("wire-proxy", implementation, safe, "--position-manager", positionManager,
+                "--oracle-handler", oracleHandler, "--from", dev)
+    tokenizer = DaaTokenizer.at(proxy)
+    tokenizedShare = TokenizedShare.deploy(proxy, {'from': dev})
+    tokenizer.setTokenizedShare(tokenizedShare, {'from': dev})
+    assert tokenizer.owner() == dev and tokenizer._positionManager() == positionManager
+    [result] = cli("nav", proxy)
+    assert result.error is None
+    assert (result.nav, result.total_supply, result.price_per_share) == (
+        tokenizer.calculateNav(), tokenizer.getTotalSharesOutstanding(), tokenizer.getPricePerShare())
+
+def test_signStartsWithoutBrownie():
+    script = (
+        "import sys\n"
+        "from scripts.cli import main\n"
+        "main(['sign', '--hash', '0x' + '11' * 32, '--key', '0x' + '22' * 32])\n"
+        "assert 'brownie' not in sys.modules and 'web3' not in sys.modules\n"
+    )
+    out = subprocess.run([sys.executable, "-c", script], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+    assert len(out.stdout.strip()) == 2 + 65 * 2
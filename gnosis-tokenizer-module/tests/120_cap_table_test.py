@@ -0,0 +1,85 @@
+from brownie import accounts, chain
+import pytest
+
+from scripts.cap_table import CapTable, Snapshot
+
+pytestmark = pytest.mark.require_network("development")
+
+###############
+
+@pytest.fixture(scope="module")
+def fund(deployFund, mockUsdc, TokenizedShare):
+    tokenizer = deployFund(accounts[7])
+    return tokenizer, TokenizedShare.at(tokenizer._tokenizedShare())
+
+@pytest.fixture
+def history(fund, mockUsdc, deposit):
+    """Mints, transfers and burns, returns the first and last block"""
+    tokenizer, share = fund
+    start = chain.height
+    for i, user in enumerate(accounts[1:4]):
+        deposit(tokenizer, mockUsdc, (i + 1) * 100 * 10**6, user)
+        chain.mine()
+    share.transfer(accounts[4], 20 * 10**6, {'from': accounts[1]})
+    share.transfer(accounts[5], share.balanceOf(accounts[2]), {'from': accounts[2]})
+    chain.mine(2)
+    mockUsdc.mint(tokenizer, 50 * 10**6, {'from': accounts[0]})
+    tokenizer.redeem(30 * 10**6, {'from': accounts[3]})
+    share.transfer(accounts[1], 5 * 10**6, {'from': accounts[4]})
+    deposit(tokenizer, mockUsdc, 10 * 10**6, accounts[6])
+    chain.mine(3)
+    return start, chain.height
+
+###############
+
+def test_snapshotsMatchBalances(fund, history, tmp_path):
+    tokenizer, share = fund
+    start, end = history
+    table = CapTable(tmp_path, tokenizer, start, checkpoint_every=3, window=4)
+    table.sync(end)
+    assert len(table.checkpoints) > 1
+    for block in range(start, end + 1):
+        snapshot = table.snapshot(block)
+        assert table.verify(block) == {}
+        assert snapshot.total_supply == share.totalSupply(block_identifier=block)
+        assert all(share.balanceOf(holder, block_identifier=block) == shares for holder, shares in snapshot.balances.items())
+    # accounts[2] moved everything away
+    assert accounts[2].address not in table.snapshot(end).balances
+    blocks = list(range(start, end + 1, 3))
+    for statement in table.statements(blocks):
+        assert statement.price_per_share == tokenizer.getPricePerShare(block_identifier=statement.block)
+        for holder, value in statement.values().items():
+            assert value == tokenizer.calcBaseAmount(statement.balances[holder], block_identifier=statement.block)
+        assert statement.balances == table.snapshot(statement.block).balances
+
+def test_resume(fund, history, tmp_path):
+    tokenizer, _ = fund
+    start, end = history
+    middle = (start + end) // 2
+    CapTable(tmp_path, tokenizer, start, checkpoint_every=2).sync(middle)
+    table = CapTable(tmp_path, tokenizer, start, checkpoint_every=2)
+    assert table.block == middle
+    table.sync(end)
+    once = CapTable(tmp_path / "once", tokenizer, start)
+    once.sync(end)
+    for block in range(start, end + 1):
+        assert table.snapshot(block) == once.snapshot(block)
+    with pytest.raises(ValueError):
+        CapTable(tmp_path, tokenizer, start + 1)
+
+def test_checkpointsWithinWindow(fund, history, tmp_path):
+    tokenizer, share = fund
+    start, end = history
+    # all 8 transfers in one window, still a checkpoint every 3
+    table = CapTable(tmp_path, tokenizer, start, checkpoint_every=3)
+    table.sync(end)
+    assert [row for row, _ in table.checkpoints] == [3, 6]
+    reopened = CapTable(tmp_path, tokenizer, start, checkpoint_every=3)
+    for block in range(start, end + 1):
+        assert reopened.snapshot(block).balances == table.snapshot(block).balances
+        assert reopened.snapshot(block).total_supply == share.totalSupply(block_identifier=block)
+
+def test_valuesWithoutPrice():
+    snapshot = Snapshot(1, {accounts[1].address: 10})
+    assert snapshot.value(accounts[1].address) is None
+    assert snapshot.values() == {accounts[1].address: None}
@@ -1,6 +1,16 @@
 #!/usr/bin/python3
 
+import os
+
 import pytest
+from brownie._config import CONFIG
+from eth_utils import to_hex
+
+from scripts import parallel
+from scripts.fork_snapshot import SnapshotSession, set_code, use_snapshot
+
+
+USDC = "0x2791Bca1f2de4661ED88A30C99A7a9449Aa84174"
 
 
 @pytest.fixture(scope="function", autouse=True)
@@ -10,6 +20,88 @@ def isolate(fn_isolation):
     pass
 
 
+# FORK_SNAPSHOT=<file> serves the fork from a local snapshot, FORK_SNAPSHOT_RECORD=1 records it
+# with `brownie test -n <workers>` every worker forks from its own proxy (scripts/parallel.py)
+def pytest_sessionstart(session):
+    path = os.environ.get("FORK_SNAPSHOT")
+    network = CONFIG.argv["network"] or CONFIG.settings["networks"]["default"]
+    record = os.environ.get("FORK_SNAPSHOT_RECORD") == "1"
+    parallel.check_record(session.config, path and record)
+    parallel.clear_worker_gas(session.config)
+    # the xdist controller does not connect to a node
+    active = path and not parallel.is_controller(session.config)
+    session.config.forkSnapshot = use_snapshot(CONFIG.networks, network, path, record) if active else SnapshotSession()
+
+
+def pytest_sessionfinish(session):
+    session.config.forkSnapshot.close()
+    parallel.save_worker_gas(session.config)
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    parallel.report_gas(terminalreporter, config)
+
+
+@pytest.fixture(scope="session")
+def forkSnapshot(request, web3):
+    request.config.forkSnapshot.web3 = web3
+    return request.config.forkSnapshot
+
+
+###############
+# local dev chain fixtures (mocked tokens, Chainlink feeds and connectors)
+
+# DaaTokenizer.initialize hardcodes polygon USDC, so the mock code is copied there
+@pytest.fixture(scope="module")
+def mockUsdc(MockERC20, accounts, web3):
+    token = MockERC20.deploy("USD Coin", "USDC", 6, {'from': accounts[0]})
+    set_code(web3, USDC, to_hex(web3.eth.get_code(token.address)))
+    return MockERC20.at(USDC)
+
+@pytest.fixture(scope="module")
+def mockUsdt(MockERC20, accounts):
+    return MockERC20.deploy("Tether USD", "USDT", 6, {'from': accounts[0]})
+
+@pytest.fixture(scope="module")
+def mockWeth(MockERC20, accounts):
+    return MockERC20.deploy("Wrapped Ether", "WETH", 18, {'from': accounts[0]})
+
+@pytest.fixture(scope="module")
+def ethFeed(MockV3Aggregator, accounts):
+    return MockV3Aggregator.deploy(8, 2000 * 10**8, {'from': accounts[0]})
+
+@pytest.fixture(scope="module")
+def mockConnector(MockConnector, accounts):
+    return MockConnector.deploy({'from': accounts[0]})
+
+# deploy and wire a tokenizer for `safe`, WETH is priced by `ethFeed`
+@pytest.fixture(scope="module")
+def deployFund(DaaTokenizer, TokenizedShare, OracleHandler, PositionManager, mockUsdc, mockWeth, ethFeed, mockConnector, accounts):
+    def deploy(safe, withWeth=True):
+        dev = accounts[0]
+        tokenizer = DaaTokenizer.deploy({'from': dev})
+        tokenizedShare = TokenizedShare.deploy(tokenizer, {'from': dev})
+        oracleHandler = OracleHandler.deploy({'from': dev})
+        positionManager = PositionManager.deploy(safe, ["MOCK"], [mockConnector], {'from': dev})
+        tokenizer.initialize(safe, {'from': dev})
+        tokenizer.setPositionManager(positionManager, {'from': dev})
+        tokenizer.setTokenizedShare(tokenizedShare, {'from': dev})
+        tokenizer.setOracleHandler(oracleHandler, {'from': dev})
+        if withWeth:
+            tokenizer.addSupportedCurrency("WETH", mockWeth, False, {'from': dev})
+            oracleHandler.addTokenOracle(mockWeth, ethFeed, {'from': dev})
+        return tokenizer
+    return deploy
+
+# mint `amount` of `token` to `sender` (accounts[1] by default) and deposit it as `ticker`
+@pytest.fixture(scope="session")
+def deposit(accounts):
+    def deposit(tokenizer, token, amount, sender=None, ticker="USDC"):
+        sender = sender or accounts[1]
+        token.mint(sender, amount, {'from': accounts[0]})
+        token.approve(tokenizer, amount, {'from': sender})
+        return tokenizer.deposit(ticker, amount, {'from': sender})
+    return deposit
 
 
 # @pytest.fixture(scope="module")
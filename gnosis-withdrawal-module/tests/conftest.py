@@ -1,6 +1,16 @@
 #!/usr/bin/python3
 
+import os
+import sys
+from pathlib import Path
+
 import pytest
+from brownie._config import CONFIG
+
+# record/replay proxy and xdist helpers shared with gnosis-tokenizer-module
+sys.path.append(str(Path(__file__).resolve().parents[2] / "brownie-shared"))
+import fork_snapshot  # noqa: E402
+import parallel  # noqa: E402
 
 
 @pytest.fixture(scope="function", autouse=True)
@@ -9,6 +19,26 @@ def isolate(fn_isolation):
     # https://eth-brownie.readthedocs.io/en/v1.10.3/tests-pytest-intro.html#isolation-fixtures
     pass
 
+# FORK_SNAPSHOT=<file> serves the fork from a local snapshot, FORK_SNAPSHOT_RECORD=1 records it
+# with `brownie test -n <workers>` every worker forks from its own proxy
+def pytest_sessionstart(session):
+    path = os.environ.get("FORK_SNAPSHOT")
+    network = CONFIG.argv["network"] or CONFIG.settings["networks"]["default"]
+    record = os.environ.get("FORK_SNAPSHOT_RECORD") == "1"
+    parallel.check_record(session.config, path and record)
+    parallel.clear_worker_gas(session.config)
+    # the xdist controller does not connect to a node
+    active = path and not parallel.is_controller(session.config)
+    session.config.forkSnapshot = (
+        fork_snapshot.use_snapshot(CONFIG.networks, network, path, record) if active else fork_snapshot.SnapshotSession())
+
+def pytest_sessionfinish(session):
+    session.config.forkSnapshot.close()
+    parallel.save_worker_gas(session.config)
+
+def pytest_terminal_summary(terminalreporter, config):
+    parallel.report_gas(terminalreporter, config)
+
 @pytest.fixture(scope="module")
 def daaModule(DaaModule, accounts):
     return DaaModule.deploy(accounts[0], "0x5E89f8d81C74E311458277EA1Be3d3247c7cd7D1", {'from': accounts[0]})